@@ -5,12 +5,17 @@ from decimal import Decimal, InvalidOperation
 from datetime import datetime, date, time, timedelta
 
 import requests
-from pypdf import PdfReader
 from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import func, UniqueConstraint, CheckConstraint, and_
 from sqlalchemy.exc import IntegrityError
 
+from app.services.confirmation import apply_document_movements
+from app.services.numbering import alloc_doc_number
+from app.services.pdf_service import extract_text_from_pdf
+from app.services.stock_summary import (refresh_riepilogo, register_dashboard_events, reset_dashboard,
+                                        invalidate_reports)
+
 # .env
 from dotenv import load_dotenv
 load_dotenv()
@@ -159,6 +164,27 @@ class Movimento(db.Model):
     magazzino_partenza = db.relationship('Magazzino', foreign_keys=[magazzino_partenza_id])
     magazzino_arrivo = db.relationship('Magazzino', foreign_keys=[magazzino_arrivo_id])
 
+class NumeratoreDocumento(db.Model):
+    __table_args__ = (UniqueConstraint('tipo', 'anno', name='uq_numeratore_documento_tipo_anno'),)
+    id = db.Column(db.Integer, primary_key=True)
+    tipo = db.Column(db.String(20), nullable=False)
+    anno = db.Column(db.Integer, nullable=False)
+    ultimo_numero = db.Column(db.Integer, nullable=False, default=0)
+
+class RiepilogoGiacenza(db.Model):
+    articolo_id = db.Column(db.Integer, db.ForeignKey('articolo.id'), primary_key=True)
+    quantita_totale = db.Column(db.Numeric(14, 3), nullable=False, default=0)
+    scorta_minima = db.Column(db.Numeric(14, 3), nullable=False, default=0)
+    under_min = db.Column(db.Boolean, nullable=False, default=False, index=True)
+
+class ContatoreDashboard(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    chiave = db.Column(db.String(40), unique=True, nullable=False)
+    valore = db.Column(db.Integer, nullable=False, default=0)
+
+# contatori dashboard condivisi con l'app modulare
+register_dashboard_events(Documento, Movimento)
+
 # --- Errori & Misc ---
 @app.errorhandler(404)
 def not_found(e):
@@ -234,6 +260,8 @@ def new_article():
                 last_cost=money_dec(request.form.get('last_cost'))
             )
             db.session.add(art)
+            db.session.flush()
+            refresh_riepilogo(db.session, db.metadata.tables, [art.id])
             db.session.commit()
             flash('Articolo creato con successo!', 'success')
             return redirect(url_for('articles'))
@@ -259,6 +287,8 @@ def edit_article(id):
             art.qta_scorta_minima = q_dec(request.form.get('qta_scorta_minima'), allow_zero=True, field='Scorta minima')
             art.barcode = (request.form.get('barcode') or '').strip()
             art.last_cost = money_dec(request.form.get('last_cost'))
+            db.session.flush()
+            refresh_riepilogo(db.session, db.metadata.tables, [art.id])
             db.session.commit()
             flash('Articolo aggiornato con successo!', 'success')
             return redirect(url_for('articles'))
@@ -275,6 +305,7 @@ def delete_article(id):
         if giac_tot != Decimal('0.000'):
             flash('Impossibile eliminare: esiste giacenza residua (totale != 0).', 'error')
             return redirect(url_for('articles'))
+        RiepilogoGiacenza.query.filter_by(articolo_id=art.id).delete()
         db.session.delete(art)
         db.session.commit()
         flash('Articolo eliminato con successo.', 'success')
@@ -360,6 +391,8 @@ def update_giacenza(articolo_id, magazzino_id, qty, session=None):
             raise ValueError("Impossibile creare giacenza negativa.")
         g = Giacenza(articolo_id=articolo_id, magazzino_id=magazzino_id, quantita=qty)
         db_session.add(g)
+    db_session.flush()
+    refresh_riepilogo(db_session, db.metadata.tables, [articolo_id])
     return g
 
 
@@ -372,51 +405,15 @@ def _confirm_and_apply_movements(doc: Documento, session=None):
         # già confermato: niente da fare
         return
 
-    rows = doc.righe.all()
-    if not rows:
-        raise ValueError('Nessuna riga nel documento.')
-
     # usa mezzanotte della data documento per ordinare i movimenti
     mov_time = datetime.combine(doc.data, time.min)
 
-    for r in rows:
-        if doc.tipo == 'DDT_OUT':
-            # controllo stock sufficiente
-            if get_giacenza(r.articolo_id, doc.magazzino_id, session=db_session) < r.quantita:
-                raise ValueError(f'Scarico superiore alla giacenza per articolo ID {r.articolo_id}.')
-            # aggiorna giacenza e crea movimento di scarico
-            update_giacenza(r.articolo_id, doc.magazzino_id, -r.quantita, session=db_session)
-            mov = Movimento(
-                articolo_id=r.articolo_id,
-                quantita=r.quantita,
-                tipo='scarico',
-                magazzino_partenza_id=doc.magazzino_id,
-                documento_id=doc.id,
-                data=mov_time
-            )
-        else:
-            # DDT_IN: carico a magazzino, aggiorna last_cost dal prezzo riga
-            update_giacenza(r.articolo_id, doc.magazzino_id, r.quantita, session=db_session)
-            r.articolo.last_cost = r.prezzo
-            mov = Movimento(
-                articolo_id=r.articolo_id,
-                quantita=r.quantita,
-                tipo='carico',
-                magazzino_arrivo_id=doc.magazzino_id,
-                documento_id=doc.id,
-                data=mov_time
-            )
-        db_session.add(mov)
-
-    doc.status = 'Confermato'
+    # DDT_IN aggiorna anche last_cost dal prezzo riga
+    apply_document_movements(doc, db_session, mov_time=mov_time, update_last_cost=True)
     db_session.commit()
 def next_doc_number(doc_type, year=None) -> int:
-    year = year or date.today().year
-    last = (Documento.query
-            .filter_by(tipo=doc_type, anno=year)
-            .order_by(Documento.numero.desc())
-            .first())
-    return (last.numero + 1) if last else 1
+    # contatore (tipo, anno) incrementato nella transazione corrente, vedi services/numbering
+    return alloc_doc_number(db.session, Documento, doc_type, year)
 
 @app.route('/documents/new/<string:doc_type>')
 def new_document(doc_type):
@@ -624,13 +621,11 @@ def import_pdf():
 
 # --- Parsing PDF helpers + endpoints ---
 def _extract_text_from_pdf(file_storage) -> str:
-    reader = PdfReader(file_storage)
-    text = "\n".join((page.extract_text() or "") for page in reader.pages)
+    # pagina per pagina, con i limiti PDF_MAX_PAGES / PDF_MAX_TEXT_BYTES
+    text = extract_text_from_pdf(file_storage)
     if len(text.strip()) < 10:
         raise RuntimeError("PDF senza testo estraibile. Serve PDF nativo o OCR.")
-    text = re.sub(r'[ \t]+', ' ', text)
-    text = re.sub(r'\n{3,}', '\n\n', text)
-    return text.strip()
+    return text
 
 def _coerce_json(text: str) -> dict:
     s = (text or '').strip()
@@ -905,6 +900,8 @@ def _clear_docs_by_type(tipo: str):
     db.session.query(RigaDocumento).filter(RigaDocumento.documento_id.in_(ids)).delete(synchronize_session=False)
     db.session.query(Movimento).filter(Movimento.documento_id.in_(ids)).delete(synchronize_session=False)
     db.session.query(Documento).filter(Documento.id.in_(ids)).delete(synchronize_session=False)
+    reset_dashboard(db.session, db.metadata.tables)  # ricalcolati alla prossima lettura
+    invalidate_reports(db.session, db.metadata.tables)
     db.session.commit()
     return len(ids)
 
@@ -932,7 +929,10 @@ def clear_articles():
         db.session.query(RigaDocumento).delete(synchronize_session=False)
         db.session.query(Movimento).delete(synchronize_session=False)
         db.session.query(Giacenza).delete(synchronize_session=False)
+        db.session.query(RiepilogoGiacenza).delete(synchronize_session=False)
         db.session.query(Articolo).delete(synchronize_session=False)
+        reset_dashboard(db.session, db.metadata.tables)
+        invalidate_reports(db.session, db.metadata.tables)
         db.session.commit()
         return jsonify({"ok": True, "msg": "Tutti gli articoli eliminati"})
     except Exception as e:
@@ -28,6 +28,9 @@ def create_app():
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key-change-me')
     app.config['UPLOAD_FOLDER'] = 'app/uploads'
     app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+    # offload invio allegati al proxy frontale (vedi config.Config / files.send_attachment)
+    from .config import Config
+    app.config['USE_X_SENDFILE'] = Config.USE_X_SENDFILE
     
     # Inizializza estensioni
     db.init_app(app)
@@ -35,10 +38,17 @@ def create_app():
     
     # Registra blueprint
     register_blueprints(app)
+
+    # Comandi CLI (flask init-db, flask magazzino ...)
+    from .cli import register_cli
+    register_cli(app)
     
     # Crea tabelle se non esistono
     with app.app_context():
         db.create_all()
+        # indice full-text articoli (FTS5) + trigger di allineamento
+        from .services.article_search import ensure_search_index
+        ensure_search_index(db.engine)
     
     return app
 
@@ -128,6 +138,18 @@ def register_blueprints(app):
     except ImportError as e:
         print(f"⚠️ Errore import docops_bp: {e}")
     
+    try:
+        from .blueprints.reports import reports_bp
+        app.register_blueprint(reports_bp)
+    except ImportError as e:
+        print(f"⚠️ Errore import reports_bp: {e}")
+    
+    try:
+        from .blueprints.exports import exports_bp
+        app.register_blueprint(exports_bp, url_prefix='/exports')
+    except ImportError as e:
+        print(f"⚠️ Errore import exports_bp: {e}")
+    
     # IMPORTING - Blueprint originale (mantenuto per ora)
     try:
         from .blueprints.importing import importing_bp
@@ -3,8 +3,9 @@
 API Blueprint dedicato esclusivamente alle operazioni di import.
 Responsabilità singola: endpoint API per import DDT.
 """
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, url_for
 from ...services.import_service import ImportService
+from ...services.parse_jobs import job_status, submit_upload
 from ...extensions import db
 
 import_api_bp = Blueprint("import_api", __name__, url_prefix="/api/import")
@@ -16,20 +17,27 @@ import_service = ImportService()
 @import_api_bp.route("/ddt/parse", methods=["POST"])
 def parse_ddt():
     """
-    Parsing DDT da PDF caricato.
-    Returns: {"ok": bool, "data": dict, "method": str, "note": str, "uploaded_file": str}
+    Accoda il parsing DDT del PDF caricato (job in background, vedi services/parse_jobs).
+    Returns 202: {"ok": bool, "job_id": str, "status_url": str}
+    Il risultato ({"data", "method", "note", "uploaded_file"}) arriva dallo status del job.
     """
     try:
         file = request.files.get("pdf_file")
         if not file:
             return jsonify({"ok": False, "error": "Nessun file ricevuto"}), 400
         
-        result = import_service.parse_ddt_from_upload(file)
-        
-        if result["ok"]:
-            return jsonify(result)
-        else:
-            return jsonify(result), 500
+        job_id = submit_upload(file, "ddt")
+        st = job_status(job_id)
+        resp = {
+            "ok": True,
+            "job_id": job_id,
+            "status": st["status"],
+            "status_url": url_for("importing.parse_job_status", job_id=job_id)
+        }
+        if st["status"] == "done":
+            resp["result"] = st["result"]
+            return jsonify(resp)
+        return jsonify(resp), 202
             
     except Exception as e:
         current_app.logger.exception("Errore in parse_ddt")
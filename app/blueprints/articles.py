@@ -1,8 +1,9 @@
 from decimal import Decimal
 from flask import Blueprint, render_template, request, redirect, url_for, flash
 from ..extensions import db
-from ..models import Articolo
+from ..models import Articolo, RiepilogoGiacenza
 from ..utils import required, q_dec, money_dec
+from ..services.stock_summary import refresh_riepilogo
 
 articles_bp = Blueprint("articles", __name__)
 
@@ -34,6 +35,8 @@ def new_article():
                 last_cost=money_dec(request.form.get('last_cost'))
             )
             db.session.add(art)
+            db.session.flush()
+            refresh_riepilogo(db.session, db.metadata.tables, [art.id])
             db.session.commit()
             flash('Articolo creato con successo!', 'success')
             return redirect(url_for('articles.articles'))
@@ -62,6 +65,8 @@ def edit_article(id):
             art.qta_riordino = q_dec(request.form.get('qta_riordino'), allow_zero=True, field='Q.tà riordino')
             art.barcode = (request.form.get('barcode') or '').strip()
             art.last_cost = money_dec(request.form.get('last_cost'))
+            db.session.flush()
+            refresh_riepilogo(db.session, db.metadata.tables, [art.id])
             db.session.commit()
             flash('Articolo aggiornato con successo!', 'success')
             return redirect(url_for('articles.articles'))
@@ -78,6 +83,7 @@ def delete_article(id):
         if giac_tot != Decimal('0.000'):
             flash('Impossibile eliminare: esiste giacenza residua (totale != 0).', 'error')
             return redirect(url_for('articles.articles'))
+        RiepilogoGiacenza.query.filter_by(articolo_id=art.id).delete()
         db.session.delete(art)
         db.session.commit()
         flash('Articolo eliminato con successo.', 'success')
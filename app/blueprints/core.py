@@ -2,7 +2,9 @@ from datetime import datetime, date, time, timedelta
 from flask import Blueprint, render_template, redirect, url_for, flash
 from sqlalchemy import func, and_
 from ..extensions import db
-from ..models import Articolo, Giacenza, Documento, Movimento
+from ..models import Articolo, Giacenza, Documento, Movimento, RiepilogoGiacenza
+from ..services.stock_summary import (read_dashboard, chiave_movimenti, CHIAVE_BOZZE, reset_dashboard,
+                                     invalidate_reports)
 
 core_bp = Blueprint("core", __name__)
 
@@ -20,21 +22,26 @@ def menu():
 
 @core_bp.route('/dashboard')
 def dashboard():
+    # Contatori mantenuti incrementalmente (services/stock_summary); il COUNT serve solo la prima volta
+    tables = db.metadata.tables
     start = datetime.combine(date.today(), time.min)
     end = start + timedelta(days=1)
-    movimenti_oggi = Movimento.query.filter(and_(Movimento.data >= start, Movimento.data < end)).count()
-    documenti_in_bozza = Documento.query.filter_by(status='Bozza').count()
+    movimenti_oggi = read_dashboard(
+        db.session, tables, chiave_movimenti(date.today()),
+        lambda: Movimento.query.filter(and_(Movimento.data >= start, Movimento.data < end)).count())
+    documenti_in_bozza = read_dashboard(
+        db.session, tables, CHIAVE_BOZZE,
+        lambda: Documento.query.filter_by(status='Bozza').count())
+    db.session.commit()
 
     sotto_scorta = (db.session.query(
         Articolo.id,
         Articolo.codice_interno,
         Articolo.descrizione,
         Articolo.qta_scorta_minima,
-        func.coalesce(func.sum(Giacenza.quantita), 0).label('giacenza_totale')
-    ).outerjoin(Giacenza, Giacenza.articolo_id == Articolo.id)
-     .group_by(Articolo.id, Articolo.codice_interno, Articolo.descrizione, Articolo.qta_scorta_minima)
-     .having(func.coalesce(func.sum(Giacenza.quantita), 0) < Articolo.qta_scorta_minima)
-     .having(Articolo.qta_scorta_minima > 0)
+        RiepilogoGiacenza.quantita_totale.label('giacenza_totale')
+    ).join(RiepilogoGiacenza, RiepilogoGiacenza.articolo_id == Articolo.id)
+     .filter(RiepilogoGiacenza.under_min.is_(True))
      .order_by(Articolo.codice_interno)
      .limit(50)
      .all())
@@ -48,14 +55,21 @@ def dashboard():
 def reset_all_data():
     """SOLO PER TEST - Cancella tutti i dati"""
     try:
-        from ..models import Documento, RigaDocumento, Articolo, Giacenza, Movimento
+        from ..models import Documento, RigaDocumento, Articolo, Giacenza, Movimento, GiacenzaSnapshot, LottoFifo, Valorizzazione, RiepilogoMastrino
         
         # Cancella in ordine per evitare errori FK
         db.session.query(RigaDocumento).delete()
         db.session.query(Movimento).delete() 
+        db.session.query(GiacenzaSnapshot).delete()
+        db.session.query(LottoFifo).delete()
+        db.session.query(Valorizzazione).delete()
+        db.session.query(RiepilogoMastrino).delete()
         db.session.query(Documento).delete()
         db.session.query(Giacenza).delete()
+        db.session.query(RiepilogoGiacenza).delete()
         db.session.query(Articolo).delete()
+        reset_dashboard(db.session, db.metadata.tables)
+        invalidate_reports(db.session, db.metadata.tables)
         
         db.session.commit()
         flash("Tutti i dati cancellati!", "success")
@@ -7,7 +7,10 @@ import traceback
 
 from ..extensions import db
 from ..models import Documento, RigaDocumento, Movimento, Articolo, Partner, Magazzino
-from ..utils import update_giacenza, get_giacenza, next_doc_number, required, q_dec, money_dec
+from ..utils import next_doc_number, required, q_dec, money_dec
+from ..services.confirmation import apply_document_movements
+from ..services.pdf_cache import invalidate as invalidate_pdf_cache, prerender_async
+from ..services.article_search import search_articolo_ids
 
 docops_bp = Blueprint("docops", __name__)
 
@@ -163,8 +166,7 @@ def api_confirm_document(id: int):
         })
 
     try:
-        rows = doc.righe.order_by(RigaDocumento.id).all()
-        if not rows:
+        if doc.righe.first() is None:
             return jsonify({
                 "ok": False, 
                 "error": "Nessuna riga nel documento."
@@ -176,40 +178,12 @@ def api_confirm_document(id: int):
         doc.anno = today.year
         doc.numero = next_doc_number(doc.tipo, doc.anno)
 
-        # Aggiornamento giacenze e generazione movimenti
-        for r in rows:
-            q = D(str(getattr(r, "quantita", 0) or 0))
-            if q <= 0:
-                continue
-            
-            if doc.tipo == "DDT_IN":
-                update_giacenza(r.articolo_id, doc.magazzino_id, q)
-                mv = Movimento(
-                    data=doc.data,
-                    articolo_id=r.articolo_id,
-                    tipo="carico",
-                    magazzino_arrivo_id=doc.magazzino_id,
-                    documento_id=doc.id,
-                )
-            elif doc.tipo == "DDT_OUT":
-                if get_giacenza(r.articolo_id, doc.magazzino_id) < q:
-                    raise ValueError(f"Giacenza insufficiente per l'articolo {r.articolo.codice_interno if r.articolo else 'N/A'}.")
-                update_giacenza(r.articolo_id, doc.magazzino_id, -q)
-                mv = Movimento(
-                    data=doc.data,
-                    articolo_id=r.articolo_id,
-                    quantita=q,  # La quantitÃ  nei movimenti Ã¨ sempre positiva
-                    tipo="scarico",
-                    magazzino_partenza_id=doc.magazzino_id,
-                    documento_id=doc.id,
-                )
-            else:
-                raise ValueError("Tipo documento non gestito.")
-            
-            db.session.add(mv)
+        # Aggiornamento giacenze e generazione movimenti (set-based)
+        apply_document_movements(doc, db.session)
 
-        doc.status = "Confermato"
         db.session.commit()
+        # il documento ora è immutabile: PDF (semplice e con originale) generati subito in background
+        prerender_async(doc.id)
         return jsonify({"ok": True, "status": doc.status})
         
     except Exception as e:
@@ -232,6 +206,7 @@ def api_delete_draft(id: int):
     try:
         db.session.delete(doc)
         db.session.commit()
+        invalidate_pdf_cache(id)
         return jsonify({"ok": True, "msg": "Bozza eliminata."})
     except Exception as e:
         db.session.rollback()
@@ -327,13 +302,19 @@ def api_articles_search():
         return jsonify([])
 
     try:
-        query = Articolo.query.filter(
-            or_(
-                Articolo.codice_interno.ilike(f"%{q}%"),
-                Articolo.descrizione.ilike(f"%{q}%"),
-                Articolo.codice_fornitore.ilike(f"%{q}%")
-            )
-        ).limit(limit).all()
+        ids = search_articolo_ids(db.session, q, limit)
+        if ids is not None:
+            # indice FTS5: prefisso sui token, ordine per pertinenza
+            by_id = {a.id: a for a in Articolo.query.filter(Articolo.id.in_(ids)).all()} if ids else {}
+            query = [by_id[i] for i in ids if i in by_id]
+        else:
+            query = Articolo.query.filter(
+                or_(
+                    Articolo.codice_interno.ilike(f"%{q}%"),
+                    Articolo.descrizione.ilike(f"%{q}%"),
+                    Articolo.codice_fornitore.ilike(f"%{q}%")
+                )
+            ).limit(limit).all()
 
         results = [
             {
@@ -234,53 +234,13 @@ def duplicate_to_out_save(id: int):
 def export_combined_pdf(id: int):
     """Esporta DDT + documento originale in PDF unico."""
     try:
-        from io import BytesIO
-        from flask import send_file, make_response, current_app
-        import pypdf
+        from flask import make_response
+        from ..services.pdf_cache import combined_pdf
         
         doc = Documento.query.get_or_404(id)
         
-        # Genera PDF del DDT corrente
-        from ..services.pdf_export import export_document_pdf
-        ddt_pdf = export_document_pdf(doc)
-        
-        # Trova documento originale
-        original_pdf = None
-        if doc.tipo == 'DDT_IN' and doc.allegati:
-            # DDT IN: cerca PDF allegato
-            for allegato in doc.allegati:
-                if allegato.mime == 'application/pdf':
-                    import os
-                    abs_path = os.path.join(current_app.root_path, allegato.path)
-                    if os.path.exists(abs_path):
-                        with open(abs_path, 'rb') as f:
-                            original_pdf = f.read()
-                        break
-        elif doc.tipo == 'DDT_OUT' and hasattr(doc, 'documento_origine_id'):
-            # DDT OUT: esporta DDT IN originale
-            doc_in = Documento.query.get(doc.documento_origine_id)
-            if doc_in:
-                original_pdf = export_document_pdf(doc_in)
-        
-        if not original_pdf:
-            # Solo DDT corrente
-            response = make_response(ddt_pdf)
-        else:
-            # Unisci PDF
-            merger = pypdf.PdfWriter()
-            
-            # Aggiungi DDT corrente
-            merger.append(BytesIO(ddt_pdf))
-            
-            # Aggiungi originale
-            merger.append(BytesIO(original_pdf))
-            
-            # Output finale
-            output = BytesIO()
-            merger.write(output)
-            output.seek(0)
-            
-            response = make_response(output.read())
+        # DDT corrente + originale (allegato PDF del DDT IN), dalla cache su disco se aggiornata
+        response = make_response(combined_pdf(doc))
         
         response.headers['Content-Type'] = 'application/pdf'
         response.headers['Content-Disposition'] = f'attachment; filename="DDT_{doc.id}_completo.pdf"'
@@ -0,0 +1,179 @@
+# app/blueprints/exports.py
+"""
+Export CSV/XLSX in streaming di inventario, movimenti e documenti,
+più la stampa PDF in blocco dei documenti di un periodo (PDF unico o ZIP).
+Stessi filtri (stessi parametri GET) delle pagine da cui si parte; le righe
+escono con yield_per e risposta a generatore (transfer chunked), quindi anche
+anni di movimenti vengono esportati a memoria costante.
+"""
+from datetime import datetime
+from flask import Blueprint, Response, abort, request, stream_with_context
+from sqlalchemy import func
+from sqlalchemy.orm import aliased
+from ..extensions import db
+from ..models import Articolo, Documento, Magazzino, Movimento, Partner, RigaDocumento
+from ..services.export_service import MIMETYPES, iter_export
+from ..services import batch_pdf
+from .documents import _apply_filters, _parse_date_any
+from .inventory import _filters_from_request, _inventory_query, _mag_key
+
+exports_bp = Blueprint("exports", __name__)
+
+YIELD_PER = 1000
+
+INVENTARIO_HEADER = ["Codice", "Descrizione", "Magazzino", "Nome magazzino",
+                     "Giacenza", "Scorta minima", "Ultimo costo"]
+MOVIMENTI_HEADER = ["ID", "Data", "Tipo", "Codice articolo", "Descrizione",
+                    "Quantità", "Da", "A", "Documento", "Partner"]
+DOCUMENTI_HEADER = ["Tipo", "Numero", "Anno", "Data", "Stato", "Partner", "Magazzino",
+                    "Rif. fornitore", "Commessa", "Codice articolo", "Descrizione riga",
+                    "Quantità", "Prezzo", "Mastrino"]
+
+
+def _check_fmt(fmt):
+    if fmt not in MIMETYPES:
+        abort(404)
+
+
+def _stream(fmt, header, rows, nome):
+    filename = f"{nome}_{datetime.now():%Y%m%d_%H%M}.{fmt}"
+    gen = iter_export(fmt, header, rows, sheet_title=nome.capitalize())
+    return Response(stream_with_context(gen), mimetype=MIMETYPES[fmt],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+
+# --- Inventario ---
+
+def inventario_rows(filters):
+    query = _inventory_query(filters).order_by(Articolo.codice_interno, _mag_key())
+    for r in query.yield_per(YIELD_PER):
+        yield (r.codice_interno, r.descrizione, r.magazzino_codice, r.magazzino_nome,
+               r.giacenza, r.qta_scorta_minima, r.last_cost)
+
+
+@exports_bp.get('/inventory.<fmt>')
+def export_inventory(fmt):
+    """Filtri come /inventory/inventory: magazzino_id, search, only_in_stock, under_min."""
+    _check_fmt(fmt)
+    return _stream(fmt, INVENTARIO_HEADER, inventario_rows(_filters_from_request()), 'inventario')
+
+
+# --- Movimenti ---
+
+def _movimenti_filters_from_request():
+    return {
+        'from_date': _parse_date_any(request.args.get('from_date')),
+        'to_date': _parse_date_any(request.args.get('to_date')),
+        'tipo': request.args.get('tipo', '').strip(),
+        'articolo': request.args.get('articolo', '').strip(),
+    }
+
+
+def movimenti_rows(filters):
+    """
+    Righe del registro movimenti dal più recente (stesso ordine della pagina).
+    "Da"/"A" come in movements._label_da/_label_a: magazzino oppure partner del DDT.
+    """
+    mag_da, mag_a = aliased(Magazzino), aliased(Magazzino)
+    query = db.session.query(
+        Movimento.id, Movimento.data, Movimento.tipo, Movimento.quantita,
+        Articolo.codice_interno, Articolo.descrizione,
+        mag_da.codice.label('da_codice'), mag_a.codice.label('a_codice'),
+        Documento.tipo.label('doc_tipo'), Documento.numero.label('doc_numero'),
+        Documento.anno.label('doc_anno'), Partner.nome.label('partner_nome'),
+    ).join(Articolo, Articolo.id == Movimento.articolo_id)\
+     .outerjoin(mag_da, mag_da.id == Movimento.magazzino_partenza_id)\
+     .outerjoin(mag_a, mag_a.id == Movimento.magazzino_arrivo_id)\
+     .outerjoin(Documento, Documento.id == Movimento.documento_id)\
+     .outerjoin(Partner, Partner.id == Documento.partner_id)
+
+    if filters['from_date']:
+        query = query.filter(Movimento.data >= filters['from_date'])
+    if filters['to_date']:
+        # to_date è un giorno: include tutti i movimenti fino a fine giornata
+        query = query.filter(func.date(Movimento.data) <= filters['to_date'].isoformat())
+    if filters['tipo']:
+        query = query.filter(Movimento.tipo == filters['tipo'])
+    if filters['articolo']:
+        query = query.filter(Articolo.codice_interno == filters['articolo'])
+
+    query = query.order_by(Movimento.data.desc(), Movimento.id.desc())
+    for r in query.yield_per(YIELD_PER):
+        da = r.da_codice or (r.partner_nome if r.tipo == 'carico' and r.doc_tipo == 'DDT_IN' else '')
+        a = r.a_codice or (r.partner_nome if r.tipo == 'scarico' and r.doc_tipo == 'DDT_OUT' else '')
+        doc = f"{r.doc_tipo} {r.doc_numero}/{r.doc_anno}" if r.doc_numero else (r.doc_tipo or '')
+        yield (r.id, r.data, r.tipo, r.codice_interno, r.descrizione, r.quantita,
+               da or '', a or '', doc, r.partner_nome or '')
+
+
+@exports_bp.get('/movements.<fmt>')
+def export_movements(fmt):
+    """Filtri opzionali: from_date, to_date, tipo (carico/scarico/trasferimento), articolo (codice)."""
+    _check_fmt(fmt)
+    return _stream(fmt, MOVIMENTI_HEADER, movimenti_rows(_movimenti_filters_from_request()), 'movimenti')
+
+
+# --- Documenti + righe ---
+
+def _documenti_filters_from_request():
+    return {
+        'tipo': request.args.get('tipo', '').strip(),
+        'q_text': request.args.get('q', type=str),
+        'd_from': _parse_date_any(request.args.get('from_date')),
+        'd_to': _parse_date_any(request.args.get('to_date')),
+        'status': request.args.get('status', type=str),
+    }
+
+
+def documenti_rows(filters):
+    """Una riga per RigaDocumento con l'intestazione del documento (documenti senza righe inclusi)."""
+    query = db.session.query(
+        Documento.tipo, Documento.numero, Documento.anno, Documento.data, Documento.status,
+        Documento.riferimento_fornitore, Documento.commessa_id,
+        Partner.nome.label('partner_nome'), Magazzino.codice.label('magazzino_codice'),
+        Articolo.codice_interno, RigaDocumento.descrizione.label('riga_descrizione'),
+        RigaDocumento.quantita, RigaDocumento.prezzo, RigaDocumento.mastrino_codice,
+    ).outerjoin(Partner, Partner.id == Documento.partner_id)\
+     .outerjoin(Magazzino, Magazzino.id == Documento.magazzino_id)\
+     .outerjoin(RigaDocumento, RigaDocumento.documento_id == Documento.id)\
+     .outerjoin(Articolo, Articolo.id == RigaDocumento.articolo_id)
+
+    if filters['tipo']:
+        query = query.filter(Documento.tipo == filters['tipo'])
+    query = _apply_filters(query, q_text=filters['q_text'], d_from=filters['d_from'],
+                           d_to=filters['d_to'], status=filters['status'])
+    query = query.order_by(RigaDocumento.id)
+    for r in query.yield_per(YIELD_PER):
+        yield (r.tipo, r.numero, r.anno, r.data, r.status, r.partner_nome, r.magazzino_codice,
+               r.riferimento_fornitore, r.commessa_id, r.codice_interno, r.riga_descrizione,
+               r.quantita, r.prezzo, r.mastrino_codice)
+
+
+@exports_bp.get('/documents.<fmt>')
+def export_documents(fmt):
+    """Filtri come le liste DDT: tipo (DDT_IN/DDT_OUT), q, from_date, to_date, status."""
+    _check_fmt(fmt)
+    return _stream(fmt, DOCUMENTI_HEADER, documenti_rows(_documenti_filters_from_request()), 'documenti')
+
+
+# --- PDF dei documenti (stampa di fine mese) ---
+
+@exports_bp.get('/documents-pdf.<fmt>')
+def export_documents_pdf(fmt):
+    """Filtri: from_date, to_date, tipo, status (default Confermato). fmt: pdf (unico file) | zip."""
+    if fmt not in batch_pdf.FORMATS:
+        abort(404)
+    status = request.args.get('status', type=str) or 'Confermato'
+    query = batch_pdf.documents_query(
+        d_from=_parse_date_any(request.args.get('from_date')),
+        d_to=_parse_date_any(request.args.get('to_date')),
+        tipo=request.args.get('tipo', '').strip() or None,
+        status=status if status in ("Bozza", "Confermato", "Stornato", "Annullato") else None,
+    )
+    doc_ids = [i for (i,) in query.with_entities(Documento.id)]
+    if not doc_ids:
+        abort(404, description="Nessun documento nel periodo selezionato.")
+    filename = f"documenti_{datetime.now():%Y%m%d_%H%M}.{fmt}"
+    return Response(stream_with_context(batch_pdf.iter_batch(fmt, doc_ids)),
+                    mimetype=batch_pdf.FORMATS[fmt],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
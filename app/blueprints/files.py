@@ -1,34 +1,87 @@
-from flask import Blueprint, send_from_directory, current_app, abort
+from flask import Blueprint, send_file, current_app, abort, request
+from urllib.parse import quote
+import unicodedata
+from ..config import Config
 from ..models import Allegato
+from ..services.blob_store import attachment_abs_path, upload_root
 import os
 
 files_bp = Blueprint("files", __name__)
 
-@files_bp.route('/download/<int:allegato_id>')  # ✅ CORRETTO: rimosso /files/
-def download_attachment(allegato_id: int):
-    allegato = Allegato.query.get_or_404(allegato_id)
-    
-    # Costruisci il percorso assoluto in modo sicuro
-    abs_path = os.path.join(current_app.root_path, allegato.path)
-    
-    if not os.path.exists(abs_path):
-        current_app.logger.error(f"File non trovato: {abs_path}")
+
+def _content_disposition(inline: bool, name: str):
+    """Come send_file: filename ASCII + filename* UTF-8 per i nomi accentati."""
+    disp = 'inline' if inline else 'attachment'
+    try:
+        name.encode('ascii')
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode('ascii')
+        return disp, {'filename': simple, 'filename*': f"UTF-8''{quote(name, safe='!#$&+^`|~')}"}
+    return disp, {'filename': name}
+
+
+def send_attachment(allegato, inline=False):
+    """
+    Unico punto di invio di un Allegato.
+    ETag forte = sha256 del blob, GET condizionale (304) e richieste Range (206),
+    così il viewer PDF del browser scarica solo le parti che mostra.
+    Con ATTACHMENT_ACCEL_REDIRECT (nginx) o USE_X_SENDFILE il file lo spedisce il proxy.
+    """
+    path = attachment_abs_path(allegato)
+    if not path.is_file():
+        current_app.logger.error(f"File non trovato: {path}")
         abort(404, description="File non trovato sul server.")
-        
-    directory = os.path.dirname(abs_path)
-    filename = os.path.basename(abs_path)
-    
-    return send_from_directory(directory, filename, as_attachment=True)
+
+    max_age = int(current_app.config.get('ATTACHMENT_MAX_AGE', Config.ATTACHMENT_MAX_AGE))
+    download_name = allegato.filename or path.name
+    accel = current_app.config.get('ATTACHMENT_ACCEL_REDIRECT', Config.ATTACHMENT_ACCEL_REDIRECT)
+    try:
+        accel_rel = path.relative_to(upload_root()).as_posix() if accel else None
+    except ValueError:
+        accel_rel = None  # percorso storico fuori da UPLOAD_FOLDER: lo invia Flask
+
+    if accel_rel is None:
+        # send_file gestisce If-None-Match/If-Modified-Since e Range (conditional=True);
+        # con USE_X_SENDFILE imposta lui l'header e non legge il file
+        rv = send_file(path, mimetype=allegato.mime or None, as_attachment=not inline,
+                       download_name=download_name, etag=allegato.blob_sha256 or True,
+                       conditional=True, max_age=max_age)
+    else:
+        # nginx serve il file (e i Range) dalla location interna; qui solo header e 304
+        rv = current_app.response_class(mimetype=allegato.mime or 'application/octet-stream')
+        rv.headers['X-Accel-Redirect'] = accel.rstrip('/') + '/' + quote(accel_rel)
+        disp, params = _content_disposition(inline, download_name)
+        rv.headers.set('Content-Disposition', disp, **params)
+        if allegato.blob_sha256:
+            rv.set_etag(allegato.blob_sha256)
+        rv.last_modified = int(path.stat().st_mtime)
+        rv.cache_control.max_age = max_age
+        if not max_age:
+            rv.cache_control.no_cache = True
+        rv = rv.make_conditional(request)
+    rv.cache_control.public = False
+    rv.cache_control.private = True
+    return rv
+
+
+@files_bp.route('/download/<int:allegato_id>', endpoint='download_attachment', defaults={'inline': False})
+@files_bp.route('/view/<int:allegato_id>', endpoint='view_attachment', defaults={'inline': None})
+def serve_attachment(allegato_id: int, inline=False):
+    """/download scarica sempre; /view mostra i PDF nel browser invece di scaricarli."""
+    allegato = Allegato.query.get_or_404(allegato_id)
+    if inline is None:
+        inline = bool(allegato.mime and 'pdf' in allegato.mime.lower())
+    return send_attachment(allegato, inline=inline)
 
 @files_bp.get("/export-document/<int:doc_id>.pdf")  # ✅ CORRETTO: rimosso /files/
 def export_document(doc_id: int):
     from ..models import Documento
-    from ..services.pdf_export import export_document_pdf
+    from ..services.pdf_cache import document_pdf
     from flask import make_response
-    
+
     doc = Documento.query.get_or_404(doc_id)
-    pdf_bytes = export_document_pdf(doc)
-    
+    pdf_bytes = document_pdf(doc)
+
     response = make_response(pdf_bytes)
     response.headers['Content-Type'] = 'application/pdf'
     response.headers['Content-Disposition'] = f'inline; filename=doc_{doc.id}.pdf'
@@ -37,34 +90,16 @@ def export_document(doc_id: int):
 @files_bp.route('/debug/<int:allegato_id>')
 def debug_allegato(allegato_id: int):
     allegato = Allegato.query.get_or_404(allegato_id)
-    abs_path = os.path.join(current_app.root_path, allegato.path)
-    
+    abs_path = str(attachment_abs_path(allegato))
+
     return {
         'allegato_id': allegato_id,
         'filename': allegato.filename,
         'path_db': allegato.path,
+        'blob_sha256': allegato.blob_sha256,
         'path_completo': abs_path,
         'file_esiste': os.path.exists(abs_path),
         'root_path': current_app.root_path,
         'directory': os.path.dirname(abs_path),
         'basename': os.path.basename(abs_path)
     }
-
-# Route aggiuntiva per vedere il PDF nel browser invece di scaricarlo
-@files_bp.route('/view/<int:allegato_id>')
-def view_attachment(allegato_id: int):
-    allegato = Allegato.query.get_or_404(allegato_id)
-    
-    abs_path = os.path.join(current_app.root_path, allegato.path)
-    
-    if not os.path.exists(abs_path):
-        current_app.logger.error(f"File non trovato: {abs_path}")
-        abort(404, description="File non trovato sul server.")
-        
-    directory = os.path.dirname(abs_path)
-    filename = os.path.basename(abs_path)
-    
-    # Per PDF, mostra nel browser invece di scaricare
-    as_attachment = not (allegato.mime and 'pdf' in allegato.mime.lower())
-    
-    return send_from_directory(directory, filename, as_attachment=as_attachment)
@@ -1,14 +1,23 @@
-from ..services.supplier_parsers import parse_supplier_specific
-from flask import Blueprint, render_template, request, jsonify, url_for, current_app, send_from_directory, abort
+from flask import Blueprint, render_template, request, jsonify, url_for, current_app, redirect, Response, stream_with_context
 from sqlalchemy.exc import IntegrityError
 from decimal import Decimal, InvalidOperation
 from werkzeug.utils import safe_join
+from werkzeug.exceptions import RequestEntityTooLarge
+from ..config import Config
 from ..extensions import db
-from ..models import Articolo, Magazzino, Partner, Documento, RigaDocumento, Movimento, Mastrino, Allegato
+from ..models import Articolo, Magazzino, Partner, Documento, RigaDocumento, Movimento, Mastrino, Allegato, Blob, GiacenzaSnapshot, LottoFifo, Valorizzazione, RiepilogoMastrino
 from ..utils import parse_it_date, q_dec, money_dec, next_doc_number, unify_um, supplier_prefix, gen_internal_code
-from ..services.supplier_parsers import parse_supplier_specific
-from ..services.file_service import save_upload, move_upload_to_document
-import os, re
+from ..services.import_bulk import bulk_create_righe
+from ..services.article_search import search_articolo_ids
+from ..services.file_service import save_upload
+from ..services.blob_store import attach_upload, discard_upload
+from ..services.parse_jobs import FINAL_STATUSES, job_status, submit_upload
+from ..services.bulk_import import parse_uploads
+from ..services.parse_cache import cache_stats
+from ..services.valuation import rebuild_valorizzazione
+from ..services.stock_summary import invalidate_reports, reset_dashboard
+from ..services.mastrino_rollup import rebuild_rollup
+import os, re, json, time
 
 importing_bp = Blueprint("importing", __name__)
 
@@ -77,53 +86,98 @@ def _default_ricavo_mastrino():
     db.session.flush()
     return m.codice
 
-# ===== Parsing generico (LLM / Fallback) =====
-def _parse_generic(kind: str):
+# ===== Parsing asincrono (job in background, vedi services/parse_jobs) =====
+def _submit_parse(kind: str):
+    """Salva il PDF e accoda il job: risponde subito 202 con l'id da interrogare."""
     try:
         file = request.files.get("pdf_file")
         if not file:
             return jsonify({"ok": False, "type": kind, "error": "Nessun file ricevuto"}), 400
-        file.stream.seek(0)
-        raw_text = extract_text_from_pdf(file)
-        file.stream.seek(0)
-        data = call_gemini(build_prompt(kind, raw_text))
-        return jsonify({"ok": True, "type": kind, "data": data})
+        job_id = submit_upload(file, kind)
+        st = job_status(job_id)
+        resp = {
+            "ok": True, "type": kind, "job_id": job_id, "status": st["status"],
+            "status_url": url_for("importing.parse_job_status", job_id=job_id),
+            "events_url": url_for("importing.parse_job_events", job_id=job_id),
+        }
+        if st["status"] == "done":
+            # PDF già analizzato (cache per contenuto): il risultato è già pronto
+            resp["result"] = st["result"]
+            return jsonify(resp)
+        return jsonify(resp), 202
     except Exception as e:
-        current_app.logger.exception("Errore in _parse_generic(%s)", kind)
+        current_app.logger.exception("Errore accodamento parsing %s", kind)
         return jsonify({"ok": False, "type": kind, "error": str(e)}), 500
 
 @importing_bp.route("/api/parse-ticket", methods=["POST"])
 def api_parse_ticket():
-    return _parse_generic("ticket")
+    return _submit_parse("ticket")
 
 @importing_bp.route("/api/parse-materiali", methods=["POST"])
 def api_parse_materiali():
-    return _parse_generic("materiali")
+    return _submit_parse("materiali")
 
 @importing_bp.route("/api/parse-ddt", methods=["POST"])
 def api_parse_ddt():
-    """Parse DDT + salva PDF originale per allegarlo in conferma.
-       Se l'LLM va in timeout, usa parser locale di fallback e continua."""
+    """Accoda il parsing del DDT; il PDF originale resta salvato per allegarlo in conferma.
+       A job concluso 'result' contiene data, uploaded_file, method, note; se lo stesso
+       PDF è già in cache risponde 200 con il job già 'done' e il risultato."""
+    return _submit_parse("ddt")
+
+@importing_bp.route("/api/parse-ddt-bulk", methods=["POST"])
+def api_parse_ddt_bulk():
+    """Più DDT ('pdf_files') in una richiesta: testo estratto in parallelo (processi),
+       parser in parallelo (thread) e un'anteprima create_preview per file.
+       Un file non valido ha ok=False nella sua voce, gli altri proseguono."""
     try:
-        file = request.files.get("pdf_file")
-        if not file:
+        request.max_content_length = current_app.config.get(
+            'BULK_IMPORT_MAX_CONTENT_LENGTH', Config.BULK_IMPORT_MAX_CONTENT_LENGTH)
+        files = [f for f in request.files.getlist("pdf_files") if f and f.filename]
+        if not files:
             return jsonify({"ok": False, "type": "ddt", "error": "Nessun file ricevuto"}), 400
-        file.stream.seek(0)
-        raw_text = extract_text_from_pdf(file)
-        file.stream.seek(0)
-        rel_path, abs_path = save_upload(file, category="incoming_ddt")
-
-        data, method = parse_supplier_specific(raw_text)
-        note = method
-
-        resp = {"ok": True, "type": "ddt", "data": data, "uploaded_file": rel_path, "method": method}
-        if note:
-            resp["note"] = note
-        return jsonify(resp)
+        results = parse_uploads("ddt", files)
+        return jsonify({"ok": True, "type": "ddt", "count": len(results),
+                        "errors": sum(1 for r in results if not r["ok"]), "results": results})
+    except RequestEntityTooLarge:
+        raise
     except Exception as e:
-        current_app.logger.exception("Errore in api_parse_ddt")
+        current_app.logger.exception("Errore import multiplo DDT")
         return jsonify({"ok": False, "type": "ddt", "error": str(e)}), 500
 
+@importing_bp.route("/api/parse-cache/stats", methods=["GET"])
+def parse_cache_stats():
+    return jsonify({"ok": True, **cache_stats(db.session)})
+
+@importing_bp.route("/api/jobs/<job_id>", methods=["GET"])
+def parse_job_status(job_id):
+    st = job_status(job_id)
+    if st is None:
+        return jsonify({"ok": False, "error": "Job non trovato"}), 404
+    return jsonify(st)
+
+@importing_bp.route("/api/jobs/<job_id>/events", methods=["GET"])
+def parse_job_events(job_id):
+    """Server-Sent Events: un evento 'status' a ogni cambio di stato, si chiude a job concluso."""
+    if job_status(job_id) is None:
+        return jsonify({"ok": False, "error": "Job non trovato"}), 404
+    interval = float(current_app.config.get("PARSE_JOB_SSE_INTERVAL", 0.5))
+
+    def stream():
+        last = None
+        while True:
+            db.session.expire_all()
+            st = job_status(job_id)
+            if st["status"] != last:
+                last = st["status"]
+                yield f"event: status\ndata: {json.dumps(st)}\n\n"
+            if last in FINAL_STATUSES:
+                return
+            db.session.commit()  # chiude la lettura: non tiene aperta la transazione tra i poll
+            time.sleep(interval)
+
+    return Response(stream_with_context(stream()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 # ===== Preview DDT IN =====
 @importing_bp.route("/api/import-ddt-preview", methods=["POST"])
 def import_ddt_preview():
@@ -134,18 +188,6 @@ def import_ddt_preview():
         d = payload.get("data") or {}
         righe = d.get("righe") or d.get("articoli") or []
         
-        vendor = ((d.get("fornitore") or "") or "").upper()
-            rel = (payload.get("uploaded_file") or "").lstrip("/\\")
-            if rel:
-                try:
-                    import os
-                    abs_path = os.path.join(current_app.root_path, rel)
-                    raw = extract_text_from_pdf(abs_path)
-                    vrows = vparsed.get("righe") or []
-                    if vrows:
-                        righe = vrows
-                except Exception as e:
-        
         for r in righe:
             r["um"] = unify_um(r.get("um"))
         preview = {
@@ -202,11 +244,12 @@ def import_ddt_confirm():
             commessa_id=commessa_id, 
             status='Bozza'
         )
-        # Salva riferimento DDT fornitore
+        db.session.add(doc)
         db.session.flush()
 
-        # Righe
+        # Righe: normalizzazione, poi risoluzione articoli e insert a blocchi
         pref = supplier_prefix(fornitore_nome)
+        lines = []
         for r in righe:
             sup_code = (r.get('codice') or '').strip()
             descr = (r.get('descrizione') or '').strip() or sup_code or "Articolo"
@@ -220,57 +263,28 @@ def import_ddt_confirm():
             if qty_raw in (None, ''):
                 raise ValueError(f"Quantità mancante per riga con codice fornitore '{sup_code or 'N/A'}'")
 
-            mastrino_row = (r.get('mastrino_codice') or '').strip() or mastrino_default
-
-            art = None
-            if sup_code:
-                art = Articolo.query.filter_by(codice_fornitore=sup_code, fornitore=fornitore_nome).first()
-            if not art:
-                art = Articolo.query.filter_by(codice_interno=sup_code).first()
-
-            if art is None:
-                internal = gen_internal_code(pref, supplier_code=sup_code or None)
-                art = Articolo(
-                    codice_interno=internal,
-                    codice_fornitore=sup_code or None,
-                    descrizione=descr,
-                    fornitore=fornitore_nome,
-                    last_cost=(unit_price.quantize(Decimal('0.01')) if unit_price is not None else Decimal('0.00'))
-                )
-                db.session.add(art)
-                db.session.flush()
-            else:
-                if sup_code and not art.codice_fornitore:
-                    art.codice_fornitore = sup_code
-                if not art.fornitore:
-                    art.fornitore = fornitore_nome
-                art.last_cost = (unit_price.quantize(Decimal('0.01')) if unit_price is not None else Decimal('0.00'))
-
-            riga = RigaDocumento(
-                documento_id=doc.id,
-                articolo_id=art.id,
-                descrizione=f"{descr} [{um}]",
-                quantita=q_dec(str(qty_raw)),
-                prezzo=unit_price.quantize(Decimal('0.01')) if unit_price is not None else Decimal('0.00'),
-                mastrino_codice=mastrino_row
-            )
-            db.session.add(riga)
+            lines.append({
+                "codice": sup_code,
+                "descrizione": descr,
+                "um": um,
+                "quantita": q_dec(str(qty_raw)),
+                "prezzo": unit_price.quantize(Decimal('0.01')) if unit_price is not None else Decimal('0.00'),
+                "mastrino_codice": (r.get('mastrino_codice') or '').strip() or mastrino_default,
+            })
+        bulk_create_righe(doc.id, lines, fornitore_nome, pref)
 
+        allegato = None
         if rel_upload:
             try:
-                new_rel, new_abs = move_upload_to_document(rel_upload, doc.id)
-                allegato = Allegato(
-                    documento_id=doc.id,
-                    filename=os.path.basename(new_abs),
-                    mime='application/pdf',
-                    path=new_rel,
-                    size=os.path.getsize(new_abs) if os.path.exists(new_abs) else 0
-                )
-                db.session.add(allegato)
+                # archivio per contenuto: lo stesso PDF già allegato altrove non viene ricopiato
+                allegato = attach_upload(db.session, Allegato, Blob, doc.id, rel_upload,
+                                         filename=os.path.basename(rel_upload))
             except Exception:
-                pass
+                current_app.logger.warning("Impossibile allegare %s", rel_upload, exc_info=True)
 
         db.session.commit()
+        if allegato is not None:
+            discard_upload(rel_upload)
         return jsonify({"ok": True, "document_id": doc.id, "redirect_url": url_for('documents.document_detail', id=doc.id)})
     except Exception as e:
         current_app.logger.exception("Errore in import_ddt_confirm")
@@ -367,8 +381,13 @@ def _clear_docs_by_type(tipo: str):
         return 0
     db.session.query(RigaDocumento).filter(RigaDocumento.documento_id.in_(ids)).delete(synchronize_session=False)
     db.session.query(Movimento).filter(Movimento.documento_id.in_(ids)).delete(synchronize_session=False)
+    db.session.query(GiacenzaSnapshot).delete(synchronize_session=False)  # ricalcolati dal registro
+    rebuild_valorizzazione(db.session, db.metadata.tables)  # dai movimenti rimasti
+    rebuild_rollup(db.session, db.metadata.tables)
+    invalidate_reports(db.session, db.metadata.tables)
     db.session.query(Allegato).filter(Allegato.documento_id.in_(ids)).delete(synchronize_session=False)
     db.session.query(Documento).filter(Documento.id.in_(ids)).delete(synchronize_session=False)
+    reset_dashboard(db.session, db.metadata.tables)  # ricalcolati alla prossima lettura
     db.session.commit()
     return len(ids)
 
@@ -393,12 +412,19 @@ def clear_ddt_out():
 @importing_bp.route('/test/clear-articles', methods=['POST'])
 def clear_articles():
     try:
-        from ..models import Giacenza
+        from ..models import Giacenza, RiepilogoGiacenza
         db.session.query(RigaDocumento).delete(synchronize_session=False)
         db.session.query(Movimento).delete(synchronize_session=False)
+        db.session.query(GiacenzaSnapshot).delete(synchronize_session=False)
+        db.session.query(LottoFifo).delete(synchronize_session=False)
+        db.session.query(Valorizzazione).delete(synchronize_session=False)
+        db.session.query(RiepilogoMastrino).delete(synchronize_session=False)
         db.session.query(Allegato).delete(synchronize_session=False)
         db.session.query(Giacenza).delete(synchronize_session=False)
+        db.session.query(RiepilogoGiacenza).delete(synchronize_session=False)
         db.session.query(Articolo).delete(synchronize_session=False)
+        reset_dashboard(db.session, db.metadata.tables)
+        invalidate_reports(db.session, db.metadata.tables)
         db.session.commit()
         return jsonify({"ok": True, "msg": "Tutti gli articoli eliminati"})
     except Exception as e:
@@ -410,7 +436,7 @@ def clear_articles():
 def api_inventory_search():
     try:
         from ..models import Giacenza, Articolo
-        from sqlalchemy import or_
+        from sqlalchemy import or_, func, cast, Float
     except Exception as e:
         current_app.logger.exception("Import error in api_inventory_search")
         return jsonify({"ok": False, "error": f"import error: {e}"}), 500
@@ -427,36 +453,36 @@ def api_inventory_search():
              else:
                  return jsonify({"ok": False, "error": "Nessun magazzino configurato"}), 400
 
-        # NUOVA LOGICA: Cerca in tutto il catalogo Articoli e collega opzionalmente la Giacenza
-        qry = db.session.query(Articolo, Giacenza.quantita)\
-            .outerjoin(Giacenza, (Giacenza.articolo_id == Articolo.id) & (Giacenza.magazzino_id == mag_id))
-
-        if q:
-            toks = [t for t in q.split() if t]
-            for t in toks:
-                like = f"%{t}%"
-                qry = qry.filter(
-                    or_(Articolo.codice_interno.ilike(like),
-                        Articolo.codice_fornitore.ilike(like),
-                        Articolo.descrizione.ilike(like))
-                )
-
-        rows = qry.order_by(Articolo.descrizione.asc()).limit(limit).all()
-        out = []
-        for a, g_quantita in rows:
-            try:
-                qty = float(g_quantita) if g_quantita is not None else 0.0
-            except Exception:
-                qty = 0.0
-            
-            out.append({
-                "articolo_id": a.id,
-                "codice_interno": a.codice_interno,
-                "codice_fornitore": a.codice_fornitore,
-                "descrizione": a.descrizione,
-                "giacenza": qty,
-                "last_cost": float(a.last_cost) if a.last_cost is not None else 0.0
-            })
+        # NUOVA LOGICA: Cerca in tutto il catalogo Articoli e collega opzionalmente la Giacenza.
+        # Numeri già arrotondati e convertiti nel DB (giacenza 3 decimali, costo 2): nessun
+        # Decimal per riga da riconvertire in float; il JSON resta numerico per i template.
+        qry = db.session.query(
+            Articolo.id.label("articolo_id"),
+            Articolo.codice_interno,
+            Articolo.codice_fornitore,
+            Articolo.descrizione,
+            cast(func.round(func.coalesce(Giacenza.quantita, 0), 3), Float).label("giacenza"),
+            cast(func.round(func.coalesce(Articolo.last_cost, 0), 2), Float).label("last_cost"),
+        ).outerjoin(Giacenza, (Giacenza.articolo_id == Articolo.id) & (Giacenza.magazzino_id == mag_id))
+
+        ids = search_articolo_ids(db.session, q, limit) if q else None
+        if ids is not None:
+            # indice FTS5: prefisso sui token, ordine per pertinenza
+            pos = {art_id: i for i, art_id in enumerate(ids)}
+            rows = qry.filter(Articolo.id.in_(ids)).all() if ids else []
+            rows.sort(key=lambda r: pos[r.articolo_id])
+        else:
+            if q:
+                toks = [t for t in q.split() if t]
+                for t in toks:
+                    like = f"%{t}%"
+                    qry = qry.filter(
+                        or_(Articolo.codice_interno.ilike(like),
+                            Articolo.codice_fornitore.ilike(like),
+                            Articolo.descrizione.ilike(like))
+                    )
+            rows = qry.order_by(Articolo.descrizione.asc()).limit(limit).all()
+        out = [dict(r._mapping) for r in rows]
         return jsonify(out)
     except Exception as e:
         current_app.logger.exception("Errore in api_inventory_search")
@@ -465,25 +491,5 @@ def api_inventory_search():
 # ===== GESTIONE DOWNLOAD ALLEGATI =====
 @importing_bp.route('/files/download/<int:id>')
 def download_allegato(id):
-    """
-    Permette di scaricare un file allegato a un documento.
-    """
-    # Cerca l'allegato nel database o restituisce 404 se non esiste
-    allegato = Allegato.query.get_or_404(id)
-    
-    # Costruisce in modo sicuro il percorso assoluto del file sul server,
-    # partendo dalla root del progetto (la cartella sopra 'app').
-    project_root = os.path.dirname(current_app.root_path)
-    file_path = safe_join(project_root, allegato.path)
-    
-    # Controlla se il file esiste fisicamente, altrimenti restituisce 404.
-    if not os.path.isfile(file_path):
-        current_app.logger.error(f"Tentativo di download fallito. File non trovato: {file_path}")
-        abort(404)
-        
-    # Usa send_from_directory per inviare il file in modo sicuro.
-    # Richiede la cartella e il nome del file separati.
-    directory = os.path.dirname(file_path)
-    filename = os.path.basename(file_path)
-    
-    return send_from_directory(directory, filename, as_attachment=True)
+    """Vecchio URL di download: l'invio (ETag, Range, offload) è in files.send_attachment."""
+    return redirect(url_for('files.download_attachment', allegato_id=id), code=301)
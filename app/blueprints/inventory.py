@@ -1,21 +1,36 @@
 # In app/blueprints/inventory.py
 # Sostituisci tutto il contenuto con questo:
 
-from flask import Blueprint, render_template, request
-from sqlalchemy import func
+import json
+from flask import Blueprint, render_template, request, Response, stream_with_context, jsonify
+from sqlalchemy import func, and_, or_
 from ..extensions import db
 from ..models import Articolo, Giacenza, Magazzino
+from ..services.ledger import giacenze_al
+from ..services.valuation import report_valorizzazione
+from ..utils import parse_it_date
 
 inventory_bp = Blueprint("inventory", __name__)
 
-@inventory_bp.route('/inventory')
-def inventory():
-    # Parametri filtro
-    magazzino_filter = request.args.get('magazzino_id', type=int)
-    search_query = request.args.get('search', '').strip()
-    only_in_stock = request.args.get('only_in_stock') == '1'
-    under_min = request.args.get('under_min') == '1'
-    
+PAGE_SIZE = 200
+MAX_PAGE_SIZE = 1000
+
+
+def _filters_from_request():
+    return {
+        'magazzino_id': request.args.get('magazzino_id', type=int),
+        'search': request.args.get('search', '').strip(),
+        'only_in_stock': request.args.get('only_in_stock') == '1',
+        'under_min': request.args.get('under_min') == '1',
+    }
+
+
+def _mag_key():
+    # articoli senza giacenza hanno magazzino NULL: 0 li mette per primi nella chiave
+    return func.coalesce(Giacenza.magazzino_id, 0)
+
+
+def _inventory_query(filters):
     # Query base con LEFT JOIN per includere anche articoli senza giacenze
     query = db.session.query(
         Articolo.id,
@@ -25,32 +40,87 @@ def inventory():
         Articolo.qta_scorta_minima,
         Magazzino.codice.label('magazzino_codice'),
         Magazzino.nome.label('magazzino_nome'),
-        func.coalesce(Giacenza.quantita, 0).label('giacenza')
+        func.coalesce(Giacenza.quantita, 0).label('giacenza'),
+        _mag_key().label('mag_key')
     ).outerjoin(Giacenza, Giacenza.articolo_id == Articolo.id)\
      .outerjoin(Magazzino, Magazzino.id == Giacenza.magazzino_id)
     
     # Applica filtri
-    if magazzino_filter:
-        query = query.filter(Giacenza.magazzino_id == magazzino_filter)
+    if filters['magazzino_id']:
+        query = query.filter(Giacenza.magazzino_id == filters['magazzino_id'])
     
-    if search_query:
-        like_pattern = f"%{search_query}%"
+    if filters['search']:
+        like_pattern = f"%{filters['search']}%"
         query = query.filter(
             (Articolo.codice_interno.ilike(like_pattern)) |
             (Articolo.descrizione.ilike(like_pattern))
         )
     
-    if only_in_stock:
+    if filters['only_in_stock']:
         query = query.filter(Giacenza.quantita > 0)
     
-    if under_min:
+    if filters['under_min']:
         query = query.filter(
             Giacenza.quantita < Articolo.qta_scorta_minima,
             Articolo.qta_scorta_minima > 0
         )
-    
-    # Ordina per codice interno
-    articoli = query.order_by(Articolo.codice_interno).all()
+    return query
+
+
+def encode_cursor(row) -> str:
+    return f"{row.mag_key}:{row.codice_interno}"
+
+
+def decode_cursor(cursor):
+    """'<magazzino_id>:<codice_interno>' -> (codice, mag_id); None se assente o non valido."""
+    if not cursor or ':' not in cursor:
+        return None
+    mag, codice = cursor.split(':', 1)
+    try:
+        return codice, int(mag)
+    except ValueError:
+        return None
+
+
+def fetch_page(filters, cursor=None, limit=PAGE_SIZE):
+    """
+    Pagina keyset ordinata per (codice_interno, magazzino): niente OFFSET, ogni
+    pagina parte dall'ultima chiave vista e usa l'indice su codice_interno.
+    Returns: (righe, cursore pagina successiva o None)
+    """
+    query = _inventory_query(filters)
+    after = decode_cursor(cursor)
+    if after:
+        codice, mag = after
+        query = query.filter(or_(
+            Articolo.codice_interno > codice,
+            and_(Articolo.codice_interno == codice, _mag_key() > mag)
+        ))
+    rows = query.order_by(Articolo.codice_interno, _mag_key()).limit(limit + 1).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_cursor(rows[-1])
+    return rows, None
+
+
+def _row_json(r):
+    return {
+        'id': r.id,
+        'codice_interno': r.codice_interno,
+        'descrizione': r.descrizione,
+        'magazzino_codice': r.magazzino_codice,
+        'magazzino_nome': r.magazzino_nome,
+        'giacenza': float(r.giacenza or 0),
+        'qta_scorta_minima': float(r.qta_scorta_minima or 0),
+        'last_cost': float(r.last_cost or 0),
+    }
+
+
+@inventory_bp.route('/inventory')
+def inventory():
+    filters = _filters_from_request()
+    # Solo la prima pagina: le successive le carica il template da /inventory/api/rows
+    articoli, next_cursor = fetch_page(filters)
     
     # Lista magazzini per il filtro
     magazzini = Magazzino.query.order_by(Magazzino.codice).all()
@@ -58,9 +128,69 @@ def inventory():
     return render_template('inventory.html', 
                          articoli=articoli, 
                          magazzini=magazzini,
-                         current_filters={
-                             'magazzino_id': magazzino_filter,
-                             'search': search_query,
-                             'only_in_stock': only_in_stock,
-                             'under_min': under_min
-                         })
+                         next_cursor=next_cursor,
+                         page_size=PAGE_SIZE,
+                         current_filters=filters)
+
+
+@inventory_bp.route('/api/rows')
+def inventory_rows():
+    """
+    Pagina successiva dell'inventario in JSON, scritta in streaming riga per riga:
+    {"rows": [...], "next": "<cursore>" | null}
+    Stessi filtri della pagina (magazzino_id, search, only_in_stock, under_min) + cursor, limit.
+    """
+    filters = _filters_from_request()
+    cursor = request.args.get('cursor')
+    limit = min(max(request.args.get('limit', PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+    rows, next_cursor = fetch_page(filters, cursor, limit)
+
+    def generate():
+        yield '{"rows": ['
+        for i, r in enumerate(rows):
+            yield (',' if i else '') + json.dumps(_row_json(r))
+        yield '], "next": ' + json.dumps(next_cursor) + '}'
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+
+@inventory_bp.route('/api/stock-at')
+def inventory_stock_at():
+    """
+    Giacenza a fine giornata di una data passata, dal registro movimenti
+    (snapshot mensili + movimenti successivi): ?data=gg/mm/aaaa[&magazzino_id=]
+    """
+    try:
+        giorno = parse_it_date(request.args.get('data'))
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    magazzino_id = request.args.get('magazzino_id', type=int)
+    saldi = giacenze_al(db.session, db.metadata.tables, giorno, magazzino_id=magazzino_id)
+
+    articoli = {a.id: a for a in Articolo.query.filter(Articolo.id.in_({a for a, _ in saldi})).all()} if saldi else {}
+    magazzini = {m.id: m for m in Magazzino.query.all()}
+    rows = [{
+        'articolo_id': a,
+        'codice_interno': articoli[a].codice_interno if a in articoli else None,
+        'descrizione': articoli[a].descrizione if a in articoli else None,
+        'magazzino_id': m,
+        'magazzino_codice': magazzini[m].codice if m in magazzini else None,
+        'giacenza': float(q),
+    } for (a, m), q in saldi.items()]
+    rows.sort(key=lambda r: (r['codice_interno'] or '', r['magazzino_codice'] or ''))
+    return jsonify({"ok": True, "data": giorno.isoformat(), "rows": rows})
+
+
+@inventory_bp.route('/api/valuation')
+def inventory_valuation():
+    """Valorizzazione corrente (costo medio ponderato e FIFO) per articolo e magazzino: ?magazzino_id="""
+    righe = report_valorizzazione(db.session, db.metadata.tables,
+                                  magazzino_id=request.args.get('magazzino_id', type=int))
+    rows = [{k: float(v) if k in ('quantita', 'costo_medio', 'valore_medio', 'valore_fifo') else v
+             for k, v in r.items()} for r in righe]
+    return jsonify({
+        "ok": True,
+        "rows": rows,
+        "totale_medio": float(sum(r['valore_medio'] for r in righe)),
+        "totale_fifo": float(sum(r['valore_fifo'] for r in righe)),
+    })
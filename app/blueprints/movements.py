@@ -1,13 +1,19 @@
 # In app/blueprints/movements.py
 # Sostituisci tutto il contenuto con questo:
 
+from datetime import datetime
 from flask import Blueprint, render_template, request, redirect, url_for, flash
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import joinedload
 from ..extensions import db
 from ..models import Articolo, Movimento, Magazzino, Documento, Partner
 from ..utils import required, q_dec, get_giacenza, update_giacenza
+from ..services.valuation import apply_movimenti
 
 movements_bp = Blueprint("movements", __name__)
 
+PER_PAGE = 50
+
 @movements_bp.route('/movements', methods=['GET', 'POST'])
 def movements():
     if request.method == 'POST':
@@ -45,6 +51,9 @@ def movements():
                                 magazzino_arrivo_id=id_mag)
 
             db.session.add(mov)
+            db.session.flush()
+            apply_movimenti(db.session, db.metadata.tables,
+                            [{c.name: getattr(mov, c.name) for c in Movimento.__table__.columns}])
             db.session.commit()
             flash('Movimento manuale registrato.', 'success')
         except Exception as e:
@@ -52,46 +61,98 @@ def movements():
             flash(f'Errore registrazione movimento: {e}', 'error')
         return redirect(url_for('movements.movements'))
 
-    page = request.args.get('page', 1, type=int)
-    movimenti = Movimento.query.order_by(Movimento.data.desc()).paginate(page=page, per_page=50, error_out=False)
+    before = decode_cursor(request.args.get('before'))
+    after = decode_cursor(request.args.get('after'))
+    movimenti, prev_cursor, next_cursor = fetch_movimenti(before=before, after=after)
     magazzini = Magazzino.query.all()
 
-    # 🔥 CORREZIONE: Etichetta "Da" migliorata per DDT IN e DDT OUT
-    labels_da = {}
-    labels_a = {}
-    
-    try:
-        for m in movimenti.items:
-            # Colonna "Da" (partenza)
-            label_da = ''
-            if m.magazzino_partenza:
-                label_da = m.magazzino_partenza.codice
-            elif m.tipo == 'carico' and getattr(m, 'documento_id', None):
-                # Per carichi da DDT_IN, mostra il fornitore
-                doc = Documento.query.get(m.documento_id)
-                if doc and doc.tipo == 'DDT_IN' and doc.partner:
-                    label_da = f"🏪 {doc.partner.nome}"
-            
-            # 🔥 CORREZIONE: Colonna "A" (arrivo)
-            label_a = ''
-            if m.magazzino_arrivo:
-                label_a = m.magazzino_arrivo.codice
-            elif m.tipo == 'scarico' and getattr(m, 'documento_id', None):
-                # Per scarichi da DDT_OUT, mostra il cliente
-                doc = Documento.query.get(m.documento_id)
-                if doc and doc.tipo == 'DDT_OUT' and doc.partner:
-                    label_a = f"👤 {doc.partner.nome}"
-            
-            labels_da[m.id] = label_da
-            labels_a[m.id] = label_a
-            
-    except Exception as e:
-        # Fallback in caso di errore
-        labels_da = {m.id: (m.magazzino_partenza.codice if m.magazzino_partenza else '') for m in movimenti.items}
-        labels_a = {m.id: (m.magazzino_arrivo.codice if m.magazzino_arrivo else '') for m in movimenti.items}
+    # Etichette "Da"/"A": relazioni già caricate dalla query, nessuna query per riga
+    labels_da = {m.id: _label_da(m) for m in movimenti}
+    labels_a = {m.id: _label_a(m) for m in movimenti}
 
     return render_template('movements.html', 
                          movimenti=movimenti, 
                          magazzini=magazzini, 
                          labels_da=labels_da,
-                         labels_a=labels_a)
+                         labels_a=labels_a,
+                         prev_cursor=prev_cursor,
+                         next_cursor=next_cursor)
+
+
+def encode_cursor(m) -> str:
+    # movimenti senza data: chiave '|<id>', vengono dopo tutti quelli datati
+    return f"{m.data.isoformat() if m.data else ''}|{m.id}"
+
+
+def decode_cursor(cursor):
+    """'<data iso>|<id>' -> (datetime | None, id); None se assente o non valido."""
+    if not cursor or '|' not in cursor:
+        return None
+    data, mov_id = cursor.rsplit('|', 1)
+    try:
+        return (datetime.fromisoformat(data) if data else None), int(mov_id)
+    except ValueError:
+        return None
+
+
+def fetch_movimenti(before=None, after=None, per_page=PER_PAGE):
+    """
+    Pagina di movimenti dal più recente, keyset su (data, id) invece di OFFSET:
+    - before=(data, id): pagina successiva (movimenti più vecchi della chiave)
+    - after=(data, id): pagina precedente (movimenti più recenti della chiave)
+    I movimenti senza data (data NULL) stanno in fondo, dal più recente per id.
+    Articolo, magazzini, documento e partner arrivano con la stessa query (joinedload).
+    Returns: (movimenti, cursore pagina precedente | None, cursore pagina successiva | None)
+    """
+    query = Movimento.query.options(
+        joinedload(Movimento.articolo),
+        joinedload(Movimento.magazzino_partenza),
+        joinedload(Movimento.magazzino_arrivo),
+        joinedload(Movimento.documento).joinedload(Documento.partner),
+    )
+    if after:
+        data, mov_id = after
+        if data is None:
+            query = query.filter(or_(Movimento.data.isnot(None), Movimento.id > mov_id))
+        else:
+            query = query.filter(or_(Movimento.data > data, and_(Movimento.data == data, Movimento.id > mov_id)))
+        rows = query.order_by(Movimento.data.asc().nulls_first(), Movimento.id.asc()).limit(per_page + 1).all()
+        has_more_recent = len(rows) > per_page
+        rows = list(reversed(rows[:per_page]))
+        prev_cursor = encode_cursor(rows[0]) if has_more_recent else None
+        next_cursor = encode_cursor(rows[-1]) if rows else None
+        return rows, prev_cursor, next_cursor
+
+    if before:
+        data, mov_id = before
+        if data is None:
+            query = query.filter(Movimento.data.is_(None), Movimento.id < mov_id)
+        else:
+            query = query.filter(or_(Movimento.data < data, and_(Movimento.data == data, Movimento.id < mov_id),
+                                     Movimento.data.is_(None)))
+    rows = query.order_by(Movimento.data.desc().nulls_last(), Movimento.id.desc()).limit(per_page + 1).all()
+    has_older = len(rows) > per_page
+    rows = rows[:per_page]
+    prev_cursor = encode_cursor(rows[0]) if before and rows else None
+    next_cursor = encode_cursor(rows[-1]) if has_older else None
+    return rows, prev_cursor, next_cursor
+
+
+def _label_da(m) -> str:
+    # Colonna "Da" (partenza); per carichi da DDT_IN mostra il fornitore
+    if m.magazzino_partenza:
+        return m.magazzino_partenza.codice
+    doc = m.documento
+    if m.tipo == 'carico' and doc and doc.tipo == 'DDT_IN' and doc.partner:
+        return f"🏪 {doc.partner.nome}"
+    return ''
+
+
+def _label_a(m) -> str:
+    # Colonna "A" (arrivo); per scarichi da DDT_OUT mostra il cliente
+    if m.magazzino_arrivo:
+        return m.magazzino_arrivo.codice
+    doc = m.documento
+    if m.tipo == 'scarico' and doc and doc.tipo == 'DDT_OUT' and doc.partner:
+        return f"👤 {doc.partner.nome}"
+    return ''
@@ -1,10 +1,9 @@
 # Crea file: app/blueprints/reports.py
 
 from flask import Blueprint, render_template, request
-from sqlalchemy import func, case, text
-from datetime import datetime, date
+from datetime import datetime
 from ..extensions import db
-from ..models import Documento, RigaDocumento, Mastrino, Partner
+from ..services import reporting
 
 reports_bp = Blueprint("reports", __name__)
 
@@ -13,6 +12,24 @@ def reports_index():
     """Pagina principale dei report"""
     return render_template('reports/index.html')
 
+RAGGRUPPAMENTI = [
+    ('mese', 'Mese'),
+    ('magazzino', 'Magazzino'),
+    ('partner', 'Partner'),
+    ('mastrino', 'Mastrino'),
+]
+
+
+def _parse_date(value):
+    """Data ISO dal filtro; valori non validi vengono ignorati."""
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+
 @reports_bp.route('/reports/mastrini')
 def report_mastrini():
     """Report riepilogo per mastrini acquisti e vendite"""
@@ -22,74 +39,16 @@ def report_mastrini():
     date_to = request.args.get('date_to')
     tipo_filter = request.args.get('tipo', '')  # 'ACQUISTO', 'RICAVO', o ''
     
-    # Query base: raggruppa per mastrino e calcola totali
-    query = db.session.query(
-        RigaDocumento.mastrino_codice,
-        Mastrino.descrizione.label('mastrino_descrizione'),
-        Mastrino.tipo.label('mastrino_tipo'),
-        func.count(RigaDocumento.id).label('num_righe'),
-        func.sum(
-            case(
-                (Documento.tipo == 'DDT_IN', RigaDocumento.quantita * RigaDocumento.prezzo),
-                else_=0
-            )
-        ).label('totale_acquisti'),
-        func.sum(
-            case(
-                (Documento.tipo == 'DDT_OUT', RigaDocumento.quantita * RigaDocumento.prezzo),
-                else_=0
-            )
-        ).label('totale_vendite'),
-        func.sum(
-            case(
-                (Documento.tipo == 'DDT_IN', RigaDocumento.quantita),
-                else_=-RigaDocumento.quantita
-            )
-        ).label('saldo_quantita')
-    ).join(Documento, RigaDocumento.documento_id == Documento.id)\
-     .outerjoin(Mastrino, Mastrino.codice == RigaDocumento.mastrino_codice)\
-     .filter(Documento.status == 'Confermato')\
-     .filter(RigaDocumento.mastrino_codice.isnot(None))
-    
-    # Applica filtri data
-    if date_from:
-        try:
-            date_from_obj = datetime.strptime(date_from, '%Y-%m-%d').date()
-            query = query.filter(Documento.data >= date_from_obj)
-        except ValueError:
-            pass
-    
-    if date_to:
-        try:
-            date_to_obj = datetime.strptime(date_to, '%Y-%m-%d').date()
-            query = query.filter(Documento.data <= date_to_obj)
-        except ValueError:
-            pass
-    
-    # Applica filtro tipo mastrino
-    if tipo_filter in ('ACQUISTO', 'RICAVO'):
-        query = query.filter(Mastrino.tipo == tipo_filter)
-    
-    # Raggruppa per mastrino e ordina
-    results = query.group_by(
-        RigaDocumento.mastrino_codice,
-        Mastrino.descrizione,
-        Mastrino.tipo
-    ).order_by(
-        Mastrino.tipo.desc(),  # RICAVO prima di ACQUISTO
-        RigaDocumento.mastrino_codice
-    ).all()
-    
-    # Calcola totali generali
-    totale_acquisti = sum(r.totale_acquisti or 0 for r in results)
-    totale_vendite = sum(r.totale_vendite or 0 for r in results)
-    margine_totale = totale_vendite - totale_acquisti
+    # Aggregazione per mastrino (services/reporting, in cache fino alla prossima conferma)
+    results = reporting.report_mastrini(db.session, db.metadata.tables,
+                                        _parse_date(date_from), _parse_date(date_to), tipo_filter)
+    totali = reporting.totals(results)
     
     return render_template('reports/mastrini.html',
                          results=results,
-                         totale_acquisti=totale_acquisti,
-                         totale_vendite=totale_vendite,
-                         margine_totale=margine_totale,
+                         totale_acquisti=totali['totale_acquisti'],
+                         totale_vendite=totali['totale_vendite'],
+                         margine_totale=totali['margine_totale'],
                          filters={
                              'date_from': date_from,
                              'date_to': date_to,
@@ -98,6 +57,26 @@ def report_mastrini():
 
 @reports_bp.route('/reports/movimenti-periodo')
 def report_movimenti_periodo():
-    """Report movimenti per periodo"""
-    # Da implementare in futuro
-    return "Report movimenti per periodo - Coming soon!"
+    """Report movimenti per periodo: righe confermate raggruppate per mese, magazzino, partner o mastrino"""
+    date_from = request.args.get('date_from')
+    date_to = request.args.get('date_to')
+    per = request.args.get('per', 'mese')
+    if per not in reporting.GROUPS:
+        per = 'mese'
+    
+    results = reporting.report_per(db.session, db.metadata.tables, per,
+                                   _parse_date(date_from), _parse_date(date_to))
+    totali = reporting.totals(results)
+    
+    return render_template('reports/movimenti_periodo.html',
+                         results=results,
+                         intestazione=dict(RAGGRUPPAMENTI)[per],
+                         raggruppamenti=RAGGRUPPAMENTI,
+                         totale_acquisti=totali['totale_acquisti'],
+                         totale_vendite=totali['totale_vendite'],
+                         num_righe=totali['num_righe'],
+                         filters={
+                             'date_from': date_from,
+                             'date_to': date_to,
+                             'per': per
+                         })
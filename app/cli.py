@@ -1,15 +1,248 @@
+import sys
 from decimal import Decimal
+import click
 from flask import current_app
+from flask.cli import AppGroup
 from .extensions import db
-from .models import Mastrino, Magazzino, Partner, Articolo
+from .config import Config
+from .models import Mastrino, Magazzino, Partner, Articolo, ParseCache, Allegato, Blob, Documento
+from .services import parse_cache
+from .services.blob_store import migrate_attachments, gc_blobs, remove_gc_files, blob_stats
+from .services import batch_pdf
+from .services.inbox_watcher import InboxWatcher
+from .services.parser_corpus import evaluate_corpus
+from .services.stock_summary import rebuild_riepilogo, verify_riepilogo
+from .services.ledger import build_snapshots, rebuild_snapshots, verify_giacenze, rebuild_giacenze
+from .services.valuation import rebuild_valorizzazione, report_valorizzazione
+from .services.mastrino_rollup import rebuild_rollup, verify_rollup
+from .services.article_search import ensure_search_index, rebuild_search_index
+
+magazzino_cli = AppGroup('magazzino', help='Comandi di manutenzione del magazzino.')
+
+@magazzino_cli.command('rebuild-riepilogo')
+def rebuild_riepilogo_command():
+    """Ricostruisce da zero il riepilogo giacenze e i contatori della dashboard."""
+    n = rebuild_riepilogo(db.session, db.metadata.tables)
+    db.session.commit()
+    click.echo(f'Riepilogo ricostruito: {n} articoli.')
+
+@magazzino_cli.command('verify-riepilogo')
+@click.option('--fix', is_flag=True, help='Ricostruisce il riepilogo se trova differenze.')
+def verify_riepilogo_command(fix):
+    """Confronta il riepilogo giacenze con la tabella Giacenza (exit code 1 se differiscono)."""
+    errori = verify_riepilogo(db.session, db.metadata.tables)
+    for e in errori[:50]:
+        click.echo(f'[DIFF] {e}')
+    if len(errori) > 50:
+        click.echo(f'... altre {len(errori) - 50} differenze')
+    if not errori:
+        click.echo('Riepilogo allineato.')
+        return
+    if fix:
+        n = rebuild_riepilogo(db.session, db.metadata.tables)
+        db.session.commit()
+        click.echo(f'Riepilogo ricostruito: {n} articoli.')
+        return
+    sys.exit(1)
+
+@magazzino_cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """Ricrea (se serve) e ricostruisce l'indice full-text degli articoli."""
+    if not ensure_search_index(db.engine):
+        click.echo('FTS5 non disponibile su questo database: la ricerca usa ILIKE.')
+        return
+    rebuild_search_index(db.session)
+    db.session.commit()
+    click.echo('Indice ricerca articoli ricostruito.')
+
+@magazzino_cli.command('parse-cache')
+@click.option('--evict', is_flag=True, help='Applica subito i limiti di età e dimensione.')
+@click.option('--clear', is_flag=True, help='Svuota la cache dei risultati di parsing.')
+def parse_cache_command(evict, clear):
+    """Statistiche (ed eventuale pulizia) della cache dei PDF analizzati."""
+    if clear:
+        n = ParseCache.query.delete()
+        db.session.commit()
+        click.echo(f'Cache svuotata: {n} righe.')
+    elif evict:
+        n = parse_cache.evict(db.session,
+                              int(current_app.config.get('PARSE_CACHE_MAX_BYTES', Config.PARSE_CACHE_MAX_BYTES)),
+                              int(current_app.config.get('PARSE_CACHE_MAX_AGE_DAYS', Config.PARSE_CACHE_MAX_AGE_DAYS)))
+        db.session.commit()
+        click.echo(f'Eviction: {n} righe eliminate.')
+    st = parse_cache.cache_stats(db.session)
+    click.echo(f"Righe: {st['entries']}  Dimensione: {st['size_bytes'] / 1024:.1f} KiB  "
+               f"Hit registrati: {st['stored_hits']}")
+
+@magazzino_cli.command('migrate-blobs')
+def migrate_blobs_command():
+    """Sposta gli allegati esistenti nell'archivio per contenuto (sha256/aa/bb/...)."""
+    migrati, mancanti, risparmiati, originali = migrate_attachments(db.session, Allegato, Blob)
+    db.session.commit()
+    # gli originali si cancellano solo a commit avvenuto
+    for path in originali:
+        path.unlink(missing_ok=True)
+    click.echo(f'Allegati migrati: {migrati}  File mancanti: {mancanti}  '
+               f'Duplicati eliminati: {risparmiati / 1024:.1f} KiB')
+
+@magazzino_cli.command('gc-blobs')
+@click.option('--dry-run', is_flag=True, help='Mostra cosa verrebbe eliminato senza toccare nulla.')
+def gc_blobs_command(dry_run):
+    """Riallinea i refcount ed elimina i file allegato non più referenziati."""
+    res = gc_blobs(db.session, Allegato, Blob, dry_run=dry_run)
+    if dry_run:
+        db.session.rollback()
+    else:
+        db.session.commit()
+        # i file si cancellano solo a commit avvenuto
+        remove_gc_files(res)
+    st = blob_stats(db.session, Blob)
+    click.echo(f"{'[DRY-RUN] ' if dry_run else ''}Refcount riallineati: {res['refcount_riallineati']}  "
+               f"Blob eliminati: {res['blob_eliminati']}  File orfani: {res['file_orfani']}  "
+               f"Liberati: {res['byte_liberati'] / 1024:.1f} KiB")
+    click.echo(f"Blob: {st['blob']}  Su disco: {st['byte_su_disco'] / 1024:.1f} KiB  "
+               f"Senza dedup: {st['byte_logici'] / 1024:.1f} KiB")
+
+@magazzino_cli.command('export-pdf')
+@click.option('--from', 'd_from', type=click.DateTime(['%Y-%m-%d', '%d/%m/%Y']), help='Data iniziale.')
+@click.option('--to', 'd_to', type=click.DateTime(['%Y-%m-%d', '%d/%m/%Y']), help='Data finale (inclusa).')
+@click.option('--tipo', type=click.Choice(['DDT_IN', 'DDT_OUT']), help='Solo un tipo di documento.')
+@click.option('--status', default='Confermato', show_default=True, help="Stato ('' = tutti).")
+@click.option('--format', 'fmt', type=click.Choice(sorted(batch_pdf.FORMATS)), default='zip', show_default=True)
+@click.option('--workers', type=int, help='Processi di rendering (default PDF_BATCH_WORKERS).')
+@click.option('-o', '--output', type=click.Path(dir_okay=False, writable=True), required=True)
+def export_pdf_command(d_from, d_to, tipo, status, fmt, workers, output):
+    """Stampa in blocco i documenti di un periodo (DDT + originale) in un PDF unico o in uno ZIP."""
+    query = batch_pdf.documents_query(d_from.date() if d_from else None, d_to.date() if d_to else None,
+                                      tipo, status or None)
+    doc_ids = [i for (i,) in query.with_entities(Documento.id)]
+    if not doc_ids:
+        click.echo('Nessun documento nel periodo selezionato.')
+        return
+    with open(output, 'wb') as fh:
+        for chunk in batch_pdf.iter_batch(fmt, doc_ids, workers):
+            fh.write(chunk)
+    click.echo(f'{len(doc_ids)} documenti esportati in {output}.')
+
+@magazzino_cli.command('watch-inbox')
+@click.argument('directory', type=click.Path(file_okay=False, exists=True))
+@click.option('--workers', default=2, show_default=True, help='Import in parallelo (transazioni aperte insieme).')
+@click.option('--queue-size', default=10, show_default=True, help='File in attesa oltre i quali lo scanner si ferma.')
+@click.option('--interval', default=5.0, show_default=True, help='Secondi tra due scansioni della cartella.')
+@click.option('--magazzino-id', type=int, help='Magazzino di destinazione (default: il primo).')
+@click.option('--once', is_flag=True, help="Importa l'arretrato ed esce.")
+def watch_inbox_command(directory, workers, queue_size, interval, magazzino_id, once):
+    """Importa come DDT_IN in bozza i PDF che arrivano nella cartella (importati/, scartati/, duplicati/)."""
+    watcher = InboxWatcher(current_app._get_current_object(), directory, workers=workers,
+                           queue_size=queue_size, interval=interval, magazzino_id=magazzino_id,
+                           log=click.echo)
+    click.echo(f'In ascolto su {directory} ({workers} worker).' if not once else f'Import di {directory}...')
+    st = watcher.run(once=once)
+    click.echo(f"Importati: {st['importati']}  Duplicati: {st['duplicati']}  Scartati: {st['scartati']}")
+
+@magazzino_cli.command('parser-corpus')
+@click.argument('directory', type=click.Path(file_okay=False, exists=True))
+@click.option('--repeat', default=1, show_default=True, help='Ripetizioni del parsing per misurare la velocità.')
+def parser_corpus_command(directory, repeat):
+    """Accuratezza e velocità dei parser fornitore su un corpus di DDT con risultato atteso."""
+    res = evaluate_corpus(directory, repeat=repeat)
+    click.echo(f"{'Parser':<14}{'Doc':>5}{'Ricon.':>8}{'Righe':>12}{'Accur.':>9}{'Doc/s':>10}")
+    for name, r in sorted(res['parsers'].items()):
+        speed = f"{r['doc_al_secondo']:.0f}" if r['doc_al_secondo'] else '-'
+        click.echo(f"{name:<14}{r['documenti']:>5}{r['riconosciuti']:>8}"
+                   f"{r['righe_corrette']:>6}/{r['righe_attese']:<5}{r['accuratezza']:>9.1%}{speed:>10}")
+    for name, err in res['errori']:
+        click.echo(f'[ERRORE] {name}: {err}')
+    if res['errori']:
+        sys.exit(1)
+
+@magazzino_cli.command('rebuild-riepilogo-mastrini')
+def rebuild_riepilogo_mastrini_command():
+    """Ricostruisce da zero il riepilogo mensile per mastrino dalle righe confermate."""
+    n = rebuild_rollup(db.session, db.metadata.tables)
+    db.session.commit()
+    click.echo(f'Riepilogo mastrini ricostruito: {n} righe.')
+
+@magazzino_cli.command('verify-riepilogo-mastrini')
+@click.option('--fix', is_flag=True, help='Ricostruisce il riepilogo se trova differenze.')
+def verify_riepilogo_mastrini_command(fix):
+    """Confronta il riepilogo mensile per mastrino con le righe dei documenti (exit code 1 se differiscono)."""
+    errori = verify_rollup(db.session, db.metadata.tables)
+    for e in errori[:50]:
+        click.echo(f'[DIFF] {e}')
+    if len(errori) > 50:
+        click.echo(f'... altre {len(errori) - 50} differenze')
+    if not errori:
+        click.echo('Riepilogo mastrini allineato.')
+        return
+    if fix:
+        n = rebuild_rollup(db.session, db.metadata.tables)
+        db.session.commit()
+        click.echo(f'Riepilogo mastrini ricostruito: {n} righe.')
+        return
+    sys.exit(1)
+
+@magazzino_cli.command('snapshot-giacenze')
+@click.option('--rebuild', is_flag=True, help='Ricalcola tutti gli snapshot invece dei soli mancanti.')
+def snapshot_giacenze_command(rebuild):
+    """Scrive gli snapshot di fine mese delle giacenze per i mesi chiusi (da cron a inizio mese)."""
+    fn = rebuild_snapshots if rebuild else build_snapshots
+    n = fn(db.session, db.metadata.tables)
+    db.session.commit()
+    click.echo(f'Snapshot scritti: {n} righe.')
+
+@magazzino_cli.command('rebuild-giacenze')
+@click.option('--dry-run', is_flag=True, help='Elenca le differenze senza correggerle.')
+def rebuild_giacenze_command(dry_run):
+    """Confronta Giacenza con il registro movimenti e la riallinea (exit code 1 se restano differenze)."""
+    drift = verify_giacenze(db.session, db.metadata.tables)
+    for d in drift[:50]:
+        click.echo(f"[DIFF] articolo {d['articolo_id']} magazzino {d['magazzino_id']}: "
+                   f"giacenza {d['giacenza']} registro {d['registro']}")
+    if len(drift) > 50:
+        click.echo(f'... altre {len(drift) - 50} differenze')
+    if not drift:
+        click.echo('Giacenze allineate al registro.')
+        return
+    if dry_run:
+        sys.exit(1)
+    non_applicabili = rebuild_giacenze(db.session, db.metadata.tables, drift)
+    db.session.commit()
+    click.echo(f'Giacenze corrette: {len(drift) - len(non_applicabili)}.')
+    for d in non_applicabili:
+        click.echo(f"[NEGATIVO] articolo {d['articolo_id']} magazzino {d['magazzino_id']}: registro {d['registro']}")
+    if non_applicabili:
+        sys.exit(1)
+
+@magazzino_cli.command('rebuild-valorizzazione')
+def rebuild_valorizzazione_command():
+    """Ricalcola costo medio e lotti FIFO rigiocando i movimenti in ordine di data."""
+    n = rebuild_valorizzazione(db.session, db.metadata.tables)
+    db.session.commit()
+    click.echo(f'Valorizzazione ricostruita: {n} coppie articolo/magazzino.')
+
+@magazzino_cli.command('valorizzazione')
+@click.option('--magazzino-id', type=int, help='Solo questo magazzino.')
+def valorizzazione_command(magazzino_id):
+    """Valore di magazzino a costo medio ponderato e FIFO."""
+    righe = report_valorizzazione(db.session, db.metadata.tables, magazzino_id=magazzino_id)
+    click.echo(f"{'Articolo':<20}{'Mag':<8}{'Quantità':>12}{'Costo medio':>14}{'Valore medio':>16}{'Valore FIFO':>16}")
+    for r in righe:
+        click.echo(f"{r['codice_interno']:<20}{r['magazzino_codice']:<8}{r['quantita']:>12}"
+                   f"{r['costo_medio']:>14}{r['valore_medio']:>16.2f}{r['valore_fifo']:>16.2f}")
+    click.echo(f"Totale: medio {sum(r['valore_medio'] for r in righe):.2f}  "
+               f"FIFO {sum(r['valore_fifo'] for r in righe):.2f}")
 
 def register_cli(app):
+    app.cli.add_command(magazzino_cli)
+
     @app.cli.command('init-db')
     def init_db_command():
         """Drop + Create + seed minimi."""
         with app.app_context():
             db.drop_all()
             db.create_all()
+            ensure_search_index(db.engine)
             if not Mastrino.query.first():
                 for m in [
                     {'codice': '0590001003', 'descrizione': 'ACQUISTO MATERIALE DI CONSUMO', 'tipo': 'ACQUISTO'},
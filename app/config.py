@@ -27,6 +27,14 @@ class Config:
     MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH_MB', '32')) * 1024 * 1024
     UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', str(basedir / 'instance' / 'uploads'))
     ALLOWED_EXTENSIONS = {'pdf', 'csv', 'xlsx', 'xls', 'txt', 'png', 'jpg', 'jpeg'}
+    # limite della singola richiesta di import multiplo (importing.api_parse_ddt_bulk)
+    BULK_IMPORT_MAX_CONTENT_LENGTH = int(os.environ.get('BULK_IMPORT_MAX_MB', '256')) * 1024 * 1024
+    # Invio allegati (blueprints/files.send_attachment): offload al proxy frontale.
+    # X-Sendfile (Apache/lighttpd) oppure prefisso di una location 'internal' nginx
+    # che punta a UPLOAD_FOLDER, es. '/_protected_uploads/'
+    USE_X_SENDFILE = os.environ.get('USE_X_SENDFILE', '').lower() in ('1', 'true', 'yes')
+    ATTACHMENT_ACCEL_REDIRECT = os.environ.get('ATTACHMENT_ACCEL_REDIRECT', '')
+    ATTACHMENT_MAX_AGE = int(os.environ.get('ATTACHMENT_MAX_AGE', '0'))
     
     # API Keys
     GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY')
@@ -38,6 +46,22 @@ class Config:
     LLM_MAX_RETRIES = int(os.environ.get('LLM_MAX_RETRIES', '3'))
     LLM_MIN_INTERVAL_SECONDS = float(os.environ.get('LLM_MIN_INTERVAL_SECONDS', '1.2'))
     
+    # Job di parsing PDF in background (services/parse_jobs)
+    PARSE_JOB_WORKERS = int(os.environ.get('PARSE_JOB_WORKERS', '2'))
+    PARSE_JOB_POLL_SECONDS = float(os.environ.get('PARSE_JOB_POLL_SECONDS', '2'))
+    # job 'running' da più di così tornano in coda (processo terminato a metà parsing)
+    PARSE_JOB_TIMEOUT_SECONDS = float(os.environ.get('PARSE_JOB_TIMEOUT_SECONDS', '900'))
+    # Cache risultati di parsing per contenuto (services/parse_cache)
+    PARSE_CACHE_MAX_BYTES = int(os.environ.get('PARSE_CACHE_MAX_MB', '64')) * 1024 * 1024
+    PARSE_CACHE_MAX_AGE_DAYS = int(os.environ.get('PARSE_CACHE_MAX_AGE_DAYS', '90'))
+    # Estrazione testo dai PDF caricati (services/pdf_service): oltre questi limiti il testo è troncato
+    PDF_MAX_PAGES = int(os.environ.get('PDF_MAX_PAGES', '50'))
+    PDF_MAX_TEXT_BYTES = int(os.environ.get('PDF_MAX_TEXT_KB', '2048')) * 1024
+    # Testo per pagina dei PDF già letti (services/text_cache): limite della LRU in memoria
+    TEXT_CACHE_MAX_BYTES = int(os.environ.get('TEXT_CACHE_MAX_MB', '32')) * 1024 * 1024
+    # Export PDF di molti documenti: processi per il rendering ReportLab (services/batch_pdf)
+    PDF_BATCH_WORKERS = int(os.environ.get('PDF_BATCH_WORKERS', str(os.cpu_count() or 2)))
+    
     # App Settings
     TEMPLATES_AUTO_RELOAD = True
     JSON_AS_ASCII = False
@@ -2,6 +2,10 @@ from datetime import datetime
 from decimal import Decimal
 from sqlalchemy import UniqueConstraint, CheckConstraint, Index, func
 from .extensions import db
+from .services.stock_summary import register_dashboard_events
+from .services.blob_store import register_blob_events
+from .services.ledger import register_ledger_events
+from .services.mastrino_rollup import register_rollup_events
 
 # Modelli
 
@@ -21,6 +25,8 @@ class Articolo(db.Model):
 
     __table_args__ = (
         Index('ix_articolo_codice_fornitore', 'codice_fornitore'),
+        # lookup dell'import: codici del fornitore della bolla (services/import_bulk.resolve_articoli)
+        Index('ix_articolo_fornitore_codice', 'fornitore', 'codice_fornitore'),
     )
 
 class Magazzino(db.Model):
@@ -32,6 +38,8 @@ class Giacenza(db.Model):
     __table_args__ = (
         UniqueConstraint('articolo_id', 'magazzino_id', name='uq_giacenza_art_mag'),
         CheckConstraint('quantita >= 0', name='ck_giacenza_nonneg'),
+        # filtro per magazzino dell'inventario, coprente per il join con articolo
+        Index('ix_giacenza_magazzino_articolo', 'magazzino_id', 'articolo_id', 'quantita'),
     )
     id = db.Column(db.Integer, primary_key=True)
     articolo_id = db.Column(db.Integer, db.ForeignKey('articolo.id'), nullable=False)
@@ -54,6 +62,10 @@ class Documento(db.Model):
     __table_args__ = (
         UniqueConstraint('tipo', 'anno', 'numero', name='uq_documento_tipo_anno_numero'),
         Index('ix_doc_anno_tipo_num', 'anno', 'tipo', 'numero'),
+        # conteggio bozze della dashboard e liste documenti filtrate per stato
+        Index('ix_documento_status_tipo_anno_num', 'status', 'tipo', 'anno', 'numero'),
+        Index('ix_documento_partner_id', 'partner_id'),
+        Index('ix_documento_data', 'data'),
     )
     id = db.Column(db.Integer, primary_key=True)
     tipo = db.Column(db.String(20), nullable=False)
@@ -78,6 +90,10 @@ class Documento(db.Model):
     movimenti = db.relationship('Movimento', backref='documento', lazy=True)
 
 class RigaDocumento(db.Model):
+    __table_args__ = (
+        Index('ix_riga_documento_documento_id', 'documento_id'),
+        Index('ix_riga_documento_articolo_id', 'articolo_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     documento_id = db.Column(db.Integer, db.ForeignKey('documento.id'), nullable=False)
     articolo_id = db.Column(db.Integer, db.ForeignKey('articolo.id'), nullable=False)
@@ -88,7 +104,11 @@ class RigaDocumento(db.Model):
     articolo = db.relationship('Articolo')
 
 class Movimento(db.Model):
-    __table_args__ = (Index('ix_movimento_data', 'data'),)
+    __table_args__ = (
+        Index('ix_movimento_data', 'data'),
+        Index('ix_movimento_articolo_data', 'articolo_id', 'data'),
+        Index('ix_movimento_documento_id', 'documento_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     data = db.Column(db.DateTime, default=datetime.now)
     articolo_id = db.Column(db.Integer, db.ForeignKey('articolo.id'), nullable=False)
@@ -109,3 +129,142 @@ class Allegato(db.Model):
     path = db.Column(db.String(400), nullable=False)
     size = db.Column(db.Integer, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # contenuto nell'archivio blob (services/blob_store); NULL = file nel percorso storico
+    blob_sha256 = db.Column(db.String(64), db.ForeignKey('blob.sha256'), index=True)
+
+class Blob(db.Model):
+    """File allegato memorizzato una sola volta per contenuto: UPLOAD_FOLDER/sha256/aa/bb/<sha256>.
+    refcount = Allegato che lo puntano (eventi in services/blob_store, riallineato da gc-blobs)."""
+    sha256 = db.Column(db.String(64), primary_key=True)
+    size = db.Column(db.Integer, nullable=False, default=0)
+    refcount = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class SequenzaCodice(db.Model):
+    """Contatore persistente per la generazione dei codici articolo.
+    ambito 'interno': progressivo PREFISSO + 6 cifre (gen_internal_code)
+    ambito 'descr': suffisso a 2 cifre dei codici da descrizione (gen_code_from_descr)"""
+    __table_args__ = (
+        UniqueConstraint('ambito', 'prefisso', name='uq_sequenza_codice_ambito_prefisso'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    ambito = db.Column(db.String(10), nullable=False)
+    prefisso = db.Column(db.String(20), nullable=False)
+    ultimo = db.Column(db.Integer, nullable=False, default=0)
+
+class NumeratoreDocumento(db.Model):
+    """Ultimo numero assegnato per (tipo, anno): incrementato nella transazione di conferma
+    (vedi services/numbering.alloc_doc_number) invece di calcolare MAX(numero)+1."""
+    __table_args__ = (
+        UniqueConstraint('tipo', 'anno', name='uq_numeratore_documento_tipo_anno'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    tipo = db.Column(db.String(20), nullable=False)
+    anno = db.Column(db.Integer, nullable=False)
+    ultimo_numero = db.Column(db.Integer, nullable=False, default=0)
+
+class RiepilogoGiacenza(db.Model):
+    """Giacenza totale per articolo (somma su tutti i magazzini) con flag sotto scorta.
+    Mantenuta da services/stock_summary.refresh_riepilogo; ricostruibile con
+    `flask magazzino rebuild-riepilogo`."""
+    articolo_id = db.Column(db.Integer, db.ForeignKey('articolo.id'), primary_key=True)
+    quantita_totale = db.Column(db.Numeric(14, 3), nullable=False, default=0)
+    scorta_minima = db.Column(db.Numeric(14, 3), nullable=False, default=0)
+    under_min = db.Column(db.Boolean, nullable=False, default=False, index=True)
+    articolo = db.relationship('Articolo')
+
+class RiepilogoMastrino(db.Model):
+    """Totali mensili per mastrino e tipo documento delle righe confermate
+    (services/mastrino_rollup): quantità in millesimi, importo in 1e-5 euro.
+    Ricostruibile con `flask magazzino rebuild-riepilogo-mastrini`."""
+    __tablename__ = 'riepilogo_mastrino'
+    anno = db.Column(db.Integer, primary_key=True)
+    mese = db.Column(db.Integer, primary_key=True)
+    mastrino_codice = db.Column(db.String(20), primary_key=True)
+    tipo_documento = db.Column(db.String(20), primary_key=True)
+    num_righe = db.Column(db.Integer, nullable=False, default=0)
+    quantita_m = db.Column(db.BigInteger, nullable=False, default=0)
+    importo_e5 = db.Column(db.BigInteger, nullable=False, default=0)
+
+class GiacenzaSnapshot(db.Model):
+    """Saldo di fine mese per (articolo, magazzino) calcolato dal registro Movimento
+    (services/ledger). mese = primo giorno del mese; coppia assente = saldo 0.
+    Aggiornato da `flask magazzino snapshot-giacenze`."""
+    __tablename__ = 'giacenza_snapshot'
+    __table_args__ = (Index('ix_giacenza_snapshot_mese', 'mese'),)
+    articolo_id = db.Column(db.Integer, db.ForeignKey('articolo.id'), primary_key=True)
+    magazzino_id = db.Column(db.Integer, db.ForeignKey('magazzino.id'), primary_key=True)
+    mese = db.Column(db.Date, primary_key=True)
+    quantita = db.Column(db.Numeric(14, 3), nullable=False, default=0)
+
+class Valorizzazione(db.Model):
+    """Valore di magazzino per (articolo, magazzino): costo medio ponderato e
+    valore FIFO, mantenuti alla conferma da services/valuation (un report di
+    valorizzazione legge solo questa tabella). Ricostruibile con
+    `flask magazzino rebuild-valorizzazione`."""
+    articolo_id = db.Column(db.Integer, db.ForeignKey('articolo.id'), primary_key=True)
+    magazzino_id = db.Column(db.Integer, db.ForeignKey('magazzino.id'), primary_key=True)
+    quantita = db.Column(db.Numeric(14, 3), nullable=False, default=0)
+    costo_medio = db.Column(db.Numeric(14, 4), nullable=False, default=0)
+    valore_medio = db.Column(db.Numeric(16, 4), nullable=False, default=0)
+    valore_fifo = db.Column(db.Numeric(16, 4), nullable=False, default=0)
+
+class LottoFifo(db.Model):
+    """Strato FIFO: quantità caricata a un costo unitario; residuo scende con gli
+    scarichi, dal lotto più vecchio (services/valuation)."""
+    __tablename__ = 'lotto_fifo'
+    __table_args__ = (Index('ix_lotto_fifo_aperti', 'articolo_id', 'magazzino_id', 'aperto', 'data', 'id'),)
+    id = db.Column(db.Integer, primary_key=True)
+    articolo_id = db.Column(db.Integer, db.ForeignKey('articolo.id'), nullable=False)
+    magazzino_id = db.Column(db.Integer, db.ForeignKey('magazzino.id'), nullable=False)
+    documento_id = db.Column(db.Integer, db.ForeignKey('documento.id'))
+    data = db.Column(db.DateTime, nullable=False)
+    quantita = db.Column(db.Numeric(14, 3), nullable=False)
+    residuo = db.Column(db.Numeric(14, 3), nullable=False)
+    costo_unitario = db.Column(db.Numeric(14, 4), nullable=False, default=0)
+    aperto = db.Column(db.Boolean, nullable=False, default=True)  # residuo > 0
+
+class ContatoreDashboard(db.Model):
+    """Contatori della dashboard ('bozze', 'movimenti:AAAA-MM-GG'), vedi services/stock_summary."""
+    id = db.Column(db.Integer, primary_key=True)
+    chiave = db.Column(db.String(40), unique=True, nullable=False)
+    valore = db.Column(db.Integer, nullable=False, default=0)
+
+class ParseJob(db.Model):
+    """Job di estrazione/parsing PDF eseguito in background (services/parse_jobs).
+    status: 'queued' -> 'running' -> 'done' | 'error'; result è il JSON che prima
+    restituiva direttamente /importing/api/parse-*."""
+    __table_args__ = (Index('ix_parse_job_status_created', 'status', 'created_at'),)
+    id = db.Column(db.String(32), primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)
+    status = db.Column(db.String(10), nullable=False, default='queued')
+    filename = db.Column(db.String(255))
+    file_path = db.Column(db.String(400), nullable=False)      # percorso assoluto da analizzare
+    sha256 = db.Column(db.String(64))                           # chiave della cache dei risultati
+    uploaded_file = db.Column(db.String(400))                   # relativo, come da save_upload
+    result = db.Column(db.Text)
+    error = db.Column(db.Text)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+class ParseCache(db.Model):
+    """Risultati di parsing per contenuto: SHA-256 del PDF + parser/versione
+    (services/parse_cache). Eviction per età e dimensione totale."""
+    __table_args__ = (
+        UniqueConstraint('sha256', 'parser_key', name='uq_parse_cache_sha_parser'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    sha256 = db.Column(db.String(64), nullable=False)
+    parser_key = db.Column(db.String(60), nullable=False)
+    result = db.Column(db.Text, nullable=False)
+    size = db.Column(db.Integer, nullable=False, default=0)
+    hits = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_hit_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+register_dashboard_events(Documento, Movimento)
+register_blob_events(Allegato, Blob)
+register_ledger_events(Movimento)
+register_rollup_events(Documento)
@@ -0,0 +1,108 @@
+# app/services/article_search.py
+"""
+Ricerca articoli full-text con SQLite FTS5.
+Indice 'articolo_fts' a contenuto esterno (content='articolo'): contiene solo i
+token di codice_interno, codice_fornitore e descrizione, ed è tenuto allineato
+da trigger su INSERT/UPDATE/DELETE di articolo, quindi vale per ogni scrittura
+(ORM, insert massivi dell'import, app.py legacy, script sqlite3).
+Se FTS5 non è disponibile (altro database o SQLite compilato senza FTS5) il
+chiamante ricade sulla ricerca ILIKE.
+"""
+import re
+from typing import List, Optional
+
+from sqlalchemy import text
+
+FTS_TABLE = "articolo_fts"
+
+# pesi bm25 per colonna: i codici contano più della descrizione
+_BM25 = f"bm25({FTS_TABLE}, 10.0, 5.0, 1.0)"
+
+_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        codice_interno, codice_fornitore, descrizione,
+        content='articolo', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3')""",
+    f"""CREATE TRIGGER IF NOT EXISTS articolo_fts_ai AFTER INSERT ON articolo BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, codice_interno, codice_fornitore, descrizione)
+        VALUES (new.id, new.codice_interno, new.codice_fornitore, new.descrizione);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS articolo_fts_ad AFTER DELETE ON articolo BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, codice_interno, codice_fornitore, descrizione)
+        VALUES ('delete', old.id, old.codice_interno, old.codice_fornitore, old.descrizione);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS articolo_fts_au
+        AFTER UPDATE OF codice_interno, codice_fornitore, descrizione ON articolo BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, codice_interno, codice_fornitore, descrizione)
+        VALUES ('delete', old.id, old.codice_interno, old.codice_fornitore, old.descrizione);
+        INSERT INTO {FTS_TABLE}(rowid, codice_interno, codice_fornitore, descrizione)
+        VALUES (new.id, new.codice_interno, new.codice_fornitore, new.descrizione);
+    END""",
+]
+
+_OGGETTI = (FTS_TABLE, "articolo_fts_ai", "articolo_fts_ad", "articolo_fts_au")
+
+
+def _oggetti_presenti(conn) -> int:
+    return conn.execute(
+        text("SELECT COUNT(*) FROM sqlite_master WHERE name IN (:a, :b, :c, :d)"),
+        dict(zip("abcd", _OGGETTI)),
+    ).scalar_one()
+
+
+def ensure_search_index(engine) -> bool:
+    """Crea indice e trigger se mancano e, se ha creato qualcosa, ricostruisce
+    l'indice dagli articoli esistenti. Returns: True se FTS5 è attivo."""
+    if engine.dialect.name != "sqlite":
+        return False
+    from sqlalchemy.exc import OperationalError
+    try:
+        with engine.begin() as conn:
+            if _oggetti_presenti(conn) == len(_OGGETTI):
+                return True
+            for ddl in _DDL:
+                conn.exec_driver_sql(ddl)
+            conn.exec_driver_sql(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    except OperationalError:
+        # SQLite senza modulo fts5
+        return False
+    return True
+
+
+def rebuild_search_index(session) -> None:
+    session.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+
+
+def search_available(session) -> bool:
+    if session.get_bind().dialect.name != "sqlite":
+        return False
+    return session.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type='table' AND name=:n"), {"n": FTS_TABLE}
+    ).first() is not None
+
+
+def fts_query(q: str) -> Optional[str]:
+    """'tubo rame 12' -> '"tubo"* AND "rame"* AND "12"*' (ogni token in prefisso).
+    La punteggiatura separa i token come fa il tokenizer (ART-001 -> ART, 001)."""
+    toks = re.findall(r"\w+", q or "", flags=re.UNICODE)
+    if not toks:
+        return None
+    return " AND ".join(f'"{t}"*' for t in toks)
+
+
+def search_articolo_ids(session, q: str, limit: int) -> Optional[List[int]]:
+    """
+    Id articolo ordinati per pertinenza (bm25).
+    Returns: None se l'indice FTS non è disponibile (usare la ricerca ILIKE).
+    """
+    if not search_available(session):
+        return None
+    match = fts_query(q)
+    if match is None:
+        return []
+    rows = session.execute(
+        text(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :q "
+             f"ORDER BY {_BM25} LIMIT :limit"),
+        {"q": match, "limit": limit},
+    ).all()
+    return [r[0] for r in rows]
@@ -0,0 +1,174 @@
+# app/services/batch_pdf.py
+"""
+Export PDF di molti documenti (stampa di fine mese): un unico PDF unito o uno ZIP
+con un PDF per documento (DDT + originale del fornitore, come export-combined-pdf).
+
+- I PDF dei DDT mancanti in cache (services/pdf_cache) vengono generati in
+  parallelo su un pool di processi: ReportLab è CPU-bound e nel processo web
+  il GIL li serializzerebbe. Ai processi arriva solo document_snapshot (dati
+  semplici), il database resta nel processo principale.
+- I documenti si leggono a blocchi di BATCH_SIZE e ogni PDF pronto passa dal
+  disco (cache), mai da una lista di BytesIO in memoria.
+- ZIP: scritto direttamente nello stream della risposta, un documento alla volta.
+- PDF unico: pypdf deve tenere l'albero delle pagine dell'output finché non scrive;
+  il file va su un temporaneo e viene inviato a pezzi. Per periodi molto lunghi
+  lo ZIP resta la scelta a memoria costante.
+"""
+import multiprocessing
+import os
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+from flask import current_app
+
+from ..config import Config
+from ..models import Documento
+from . import pdf_cache
+from .pdf_export import document_snapshot, render_document_pdf
+
+BATCH_SIZE = 50
+CHUNK_BYTES = 64 * 1024
+
+FORMATS = {
+    'pdf': 'application/pdf',
+    'zip': 'application/zip',
+}
+
+
+def documents_query(d_from=None, d_to=None, tipo=None, status='Confermato'):
+    """Documenti del periodo in ordine di stampa (data, tipo, numero)."""
+    q = Documento.query
+    if tipo:
+        q = q.filter(Documento.tipo == tipo)
+    if status:
+        q = q.filter(Documento.status == status)
+    if d_from:
+        q = q.filter(Documento.data >= d_from)
+    if d_to:
+        q = q.filter(Documento.data <= d_to)
+    return q.order_by(Documento.data, Documento.tipo, Documento.numero, Documento.id)
+
+
+def archive_name(doc) -> str:
+    if doc.numero:
+        return f"{doc.tipo}_{doc.anno}_{doc.numero:05d}.pdf"
+    return f"{doc.tipo}_bozza_{doc.id}.pdf"
+
+
+def _workers(workers):
+    if workers is None:
+        workers = current_app.config.get('PDF_BATCH_WORKERS', Config.PDF_BATCH_WORKERS)
+    return max(1, int(workers))
+
+
+def _render_missing(docs, pool):
+    """Genera (nel pool se c'è) i PDF dei DDT non ancora in cache."""
+    todo = []
+    for doc in docs:
+        if pdf_cache.cached_file(doc, 'completo') or pdf_cache.cached_file(doc, 'ddt'):
+            continue
+        todo.append(doc)
+    if not todo:
+        return
+    snapshots = [document_snapshot(d) for d in todo]
+    rendered = pool.map(render_document_pdf, snapshots) if pool else map(render_document_pdf, snapshots)
+    for doc, data in zip(todo, rendered):
+        pdf_cache.store(doc, 'ddt', data)
+
+
+def iter_combined_files(doc_ids, workers=None):
+    """
+    Per ogni documento (nell'ordine dato) restituisce (doc, percorso del PDF combinato).
+    Il pool di processi si crea solo con più documenti e più di un worker.
+    """
+    workers = _workers(workers)
+    pool = None
+    if workers > 1 and len(doc_ids) > 1:
+        # spawn: il processo web ha thread attivi (job di parsing), fork non è sicuro
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+    try:
+        for start in range(0, len(doc_ids), BATCH_SIZE):
+            ids = doc_ids[start:start + BATCH_SIZE]
+            by_id = {d.id: d for d in Documento.query.filter(Documento.id.in_(ids))}
+            docs = [by_id[i] for i in ids if i in by_id]
+            _render_missing(docs, pool)
+            for doc in docs:
+                path = pdf_cache.cached_file(doc, 'completo')
+                if path is None:
+                    data = pdf_cache.combined_pdf(doc)
+                    path = pdf_cache.cached_file(doc, 'completo')
+                    if path is None:  # cache non scrivibile: file temporaneo
+                        fd, tmp = tempfile.mkstemp(suffix='.pdf')
+                        with os.fdopen(fd, 'wb') as f:
+                            f.write(data)
+                        try:
+                            yield doc, tmp
+                        finally:
+                            os.remove(tmp)
+                        continue
+                yield doc, path
+    finally:
+        if pool:
+            pool.shutdown()
+
+
+class _StreamSink:
+    """File-like non posizionabile per zipfile: accumula i byte scritti finché il generatore li preleva."""
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, b):
+        self.parts.append(bytes(b))
+        return len(b)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+def iter_zip(doc_ids, workers=None):
+    sink = _StreamSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        for doc, path in iter_combined_files(doc_ids, workers):
+            zf.write(path, arcname=archive_name(doc))
+            data = sink.drain()
+            if data:
+                yield data
+    yield sink.drain()
+
+
+def iter_merged_pdf(doc_ids, workers=None, chunk_bytes=CHUNK_BYTES):
+    import pypdf
+
+    writer = pypdf.PdfWriter()
+    for doc, path in iter_combined_files(doc_ids, workers):
+        writer.append(str(path), outline_item=archive_name(doc)[:-4])
+    fd, out = tempfile.mkstemp(suffix='.pdf')
+    os.close(fd)
+    try:
+        with open(out, 'wb') as fh:
+            writer.write(fh)
+        writer.close()
+        with open(out, 'rb') as fh:
+            while True:
+                chunk = fh.read(chunk_bytes)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        os.remove(out)
+
+
+def iter_batch(fmt, doc_ids, workers=None):
+    """Dispatch sul formato ('pdf' | 'zip')."""
+    if fmt == 'zip':
+        return iter_zip(doc_ids, workers)
+    if fmt == 'pdf':
+        return iter_merged_pdf(doc_ids, workers)
+    raise ValueError(f"Formato export non supportato: {fmt}")
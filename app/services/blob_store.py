@@ -0,0 +1,264 @@
+# app/services/blob_store.py
+"""
+Archivio allegati indirizzato per contenuto.
+
+Ogni file finisce una sola volta sotto UPLOAD_FOLDER/sha256/aa/bb/<sha256>
+(aa, bb = primi due byte dell'hash); la tabella 'blob' tiene dimensione e
+refcount, mantenuto dagli eventi ORM su Allegato (register_blob_events):
+lo stesso PDF allegato a un DDT_IN e al suo DDT_OUT, o caricato due volte,
+occupa spazio una volta sola.
+
+I file senza più riferimenti non vengono cancellati subito (la transazione
+potrebbe ancora fallire): li elimina gc_blobs (`flask magazzino gc-blobs`),
+che ricalcola anche i refcount da Allegato e cancella le righe; i file si
+rimuovono con remove_gc_files solo dopo il commit.
+"""
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from flask import current_app
+from sqlalchemy import event, delete, func, insert, inspect, select, update
+from sqlalchemy.exc import IntegrityError
+
+from .file_service import get_file_hash
+
+BLOB_DIR = "sha256"
+# file/righe più giovani di così non vengono toccati dal GC (upload in corso)
+GC_GRACE_SECONDS = 3600
+
+
+def upload_root() -> Path:
+    return Path(current_app.config.get('UPLOAD_FOLDER', 'instance/uploads')).resolve()
+
+
+def blob_abs_path(sha256: str) -> Path:
+    return upload_root() / BLOB_DIR / sha256[:2] / sha256[2:4] / sha256
+
+
+def blob_rel_path(sha256: str) -> str:
+    """Percorso da salvare in Allegato.path: relativo al padre di UPLOAD_FOLDER, come save_upload."""
+    root = upload_root()
+    return str(blob_abs_path(sha256).relative_to(root.parent))
+
+
+def upload_abs_path(rel_path: str) -> Path:
+    """Percorso assoluto di un file restituito da save_upload (relativo al padre di UPLOAD_FOLDER)."""
+    base = upload_root().parent
+    abs_path = (base / rel_path.lstrip('/\\')).resolve()
+    abs_path.relative_to(base)  # ValueError se esce dalla cartella upload
+    return abs_path
+
+
+def attachment_abs_path(allegato) -> Path:
+    """Percorso su disco di un Allegato: blob se presente, altrimenti il path storico."""
+    if getattr(allegato, 'blob_sha256', None):
+        return blob_abs_path(allegato.blob_sha256)
+    return Path(current_app.root_path) / allegato.path
+
+
+def put_file(session, blob_table, src_path, keep_source=False):
+    """
+    Porta src_path nell'archivio e ritorna (sha256, size).
+    Se il contenuto c'è già il sorgente viene solo eliminato (o lasciato con keep_source).
+    La riga 'blob' viene creata se manca, nella transazione del chiamante.
+    """
+    src_path = Path(src_path)
+    sha256 = get_file_hash(str(src_path))
+    size = src_path.stat().st_size
+    # prima la riga, poi il file: gc_blobs cancella la riga orfana e solo dopo il file,
+    # quindi un blob ripreso qui non può perdere il file dopo il controllo su target
+    nuovo = False
+    ripreso = session.execute(update(blob_table)
+                              .where(blob_table.c.sha256 == sha256, blob_table.c.refcount <= 0)
+                              # blob orfano che torna in uso: riparte il periodo di grazia del GC
+                              .values(created_at=datetime.utcnow())).rowcount
+    if not ripreso:
+        esistente = session.execute(select(blob_table.c.sha256)
+                                    .where(blob_table.c.sha256 == sha256)).first()
+        if esistente is None:
+            try:
+                with session.begin_nested():
+                    session.execute(insert(blob_table).values(sha256=sha256, size=size, refcount=0,
+                                                              created_at=datetime.utcnow()))
+                nuovo = True
+            except IntegrityError:
+                pass
+    target = blob_abs_path(sha256)
+    # riga appena creata: il file presente può essere di un blob che gc_blobs sta
+    # rimuovendo (riga già cancellata, file non ancora), quindi si riscrive
+    if target.exists() and not nuovo:
+        if not keep_source:
+            src_path.unlink()
+    else:
+        target.parent.mkdir(parents=True, exist_ok=True)
+        # copia/spostamento su file temporaneo nella stessa cartella + rename atomico
+        fd, tmp = tempfile.mkstemp(dir=target.parent, prefix='.tmp-')
+        os.close(fd)
+        if keep_source:
+            shutil.copyfile(src_path, tmp)
+        else:
+            shutil.move(str(src_path), tmp)
+        os.utime(tmp)  # più recente dell'avvio di un GC in corso: remove_gc_files non lo tocca
+        os.replace(tmp, target)
+    return sha256, size
+
+
+def attach_upload(session, allegato_cls, blob_cls, documento_id, rel_upload, filename=None,
+                  mime='application/pdf'):
+    """Allega al documento un file caricato con save_upload, passando dall'archivio blob.
+    Il file caricato resta dov'è: il chiamante lo rimuove dopo il commit (discard_upload),
+    così un rollback non lascia l'upload senza file."""
+    src = upload_abs_path(rel_upload)
+    if not src.exists():
+        raise FileNotFoundError(f"File non trovato: {rel_upload}")
+    sha256, size = put_file(session, blob_cls.__table__, src, keep_source=True)
+    allegato = allegato_cls(documento_id=documento_id, filename=filename or src.name, mime=mime,
+                            path=blob_rel_path(sha256), size=size, blob_sha256=sha256)
+    session.add(allegato)
+    return allegato
+
+
+def discard_upload(rel_upload):
+    """Rimuove un file caricato già copiato nell'archivio (dopo il commit)."""
+    try:
+        upload_abs_path(rel_upload).unlink(missing_ok=True)
+    except (OSError, ValueError) as e:
+        current_app.logger.warning(f"Impossibile rimuovere l'upload {rel_upload}: {e}")
+
+
+def register_blob_events(allegato_cls, blob_cls):
+    """refcount di 'blob' = numero di Allegato che lo puntano (insert/delete/cambio blob)."""
+    blob = blob_cls.__table__
+
+    def _bump(conn, sha256, delta):
+        if sha256:
+            conn.execute(update(blob).where(blob.c.sha256 == sha256)
+                         .values(refcount=blob.c.refcount + delta))
+
+    @event.listens_for(allegato_cls, "after_insert")
+    def _allegato_inserito(mapper, conn, target):
+        _bump(conn, target.blob_sha256, +1)
+
+    @event.listens_for(allegato_cls, "after_delete")
+    def _allegato_eliminato(mapper, conn, target):
+        _bump(conn, target.blob_sha256, -1)
+
+    # carica il valore precedente di blob_sha256 anche se scaduto, serve a after_update
+    event.listen(allegato_cls.blob_sha256, "set", lambda target, value, old, initiator: value,
+                 active_history=True, retval=True)
+
+    @event.listens_for(allegato_cls, "after_update")
+    def _allegato_aggiornato(mapper, conn, target):
+        hist = inspect(target).attrs.blob_sha256.history
+        if not hist.has_changes():
+            return
+        for prev in hist.deleted or ():
+            _bump(conn, prev, -1)
+        _bump(conn, target.blob_sha256, +1)
+
+
+def migrate_attachments(session, allegato_cls, blob_cls):
+    """
+    Copia nell'archivio gli allegati ancora nei percorsi storici (documents/<id>/...)
+    e aggiorna le righe. Gli originali vanno rimossi dopo il commit.
+    Ritorna (migrati, mancanti, byte risparmiati, percorsi originali).
+    """
+    migrati = mancanti = risparmiati = 0
+    originali = []
+    for allegato in allegato_cls.query.filter(allegato_cls.blob_sha256.is_(None)).all():
+        src = Path(current_app.root_path) / allegato.path
+        if not src.exists():
+            mancanti += 1
+            continue
+        gia_presente = blob_abs_path(get_file_hash(str(src))).exists()
+        sha256, size = put_file(session, blob_cls.__table__, src, keep_source=True)
+        if gia_presente:
+            risparmiati += size
+        allegato.blob_sha256 = sha256
+        allegato.path = blob_rel_path(sha256)
+        allegato.size = size
+        originali.append(src)
+        migrati += 1
+    return migrati, mancanti, risparmiati, originali
+
+
+def gc_blobs(session, allegato_cls, blob_cls, dry_run=False, grace_seconds=GC_GRACE_SECONDS):
+    """
+    Riallinea i refcount a partire da Allegato, elimina le righe dei blob non
+    referenziati e individua i file orfani sotto sha256/ (più vecchi di grace_seconds).
+    Non tocca i file: dopo il commit vanno rimossi con remove_gc_files(risultato).
+    Ritorna un dict con i conteggi.
+    """
+    blob, allegato = blob_cls.__table__, allegato_cls.__table__
+    avvio = time.time()
+    refs = (select(func.count(allegato.c.id)).where(allegato.c.blob_sha256 == blob.c.sha256)
+            .scalar_subquery())
+    riallineati = session.execute(update(blob).where(blob.c.refcount != refs)
+                                  .values(refcount=refs)).rowcount or 0
+
+    limite = datetime.utcnow() - timedelta(seconds=grace_seconds)
+    orfani = session.execute(select(blob.c.sha256, blob.c.size)
+                             .where(blob.c.refcount <= 0, blob.c.created_at < limite)).all()
+
+    liberati = 0
+    eliminati = []
+    for sha256, size in orfani:
+        if not dry_run:
+            # ricontrolla il refcount nella DELETE: un attach_upload concorrente può aver
+            # ripreso il blob dopo la select; il file si toglie solo se la riga è sparita davvero
+            rimossa = session.execute(delete(blob).where(blob.c.sha256 == sha256, blob.c.refcount <= 0,
+                                                         blob.c.created_at < limite)).rowcount
+            if not rimossa:
+                continue
+        eliminati.append(sha256)
+        liberati += size or 0
+
+    # file sotto sha256/ senza riga in 'blob' (transazioni fallite, copie a mano)
+    noti = set(session.execute(select(blob.c.sha256)).scalars()) | set(eliminati)
+    file_orfani = []
+    root = upload_root() / BLOB_DIR
+    soglia = time.time() - grace_seconds
+    if root.exists():
+        for path in root.glob('*/*/*'):
+            if path.name in noti or path.stat().st_mtime > soglia:
+                continue
+            file_orfani.append(path)
+            liberati += path.stat().st_size
+    return {'refcount_riallineati': riallineati, 'blob_eliminati': len(eliminati),
+            'file_orfani': len(file_orfani), 'byte_liberati': liberati,
+            'sha256_eliminati': [] if dry_run else eliminati,
+            'file_da_rimuovere': [] if dry_run else file_orfani, 'avvio': avvio}
+
+
+def remove_gc_files(res):
+    """
+    Rimuove i file dei blob eliminati da gc_blobs e quelli orfani: da chiamare
+    solo a commit avvenuto. Salta i file riscritti da put_file dopo l'avvio del GC
+    (contenuto ricaricato nel frattempo).
+    """
+    from .text_cache import discard as discard_text
+
+    paths = [blob_abs_path(sha256) for sha256 in res['sha256_eliminati']] + res['file_da_rimuovere']
+    for path in paths:
+        try:
+            if path.stat().st_mtime < res['avvio']:
+                path.unlink()
+        except FileNotFoundError:
+            pass
+    for sha256 in res['sha256_eliminati']:
+        discard_text(sha256)
+
+
+def blob_stats(session, blob_cls):
+    """Spazio su disco dell'archivio vs spazio che occuperebbero le copie per allegato."""
+    blob = blob_cls.__table__
+    n, fisici, logici = session.execute(select(
+        func.count(blob.c.sha256),
+        func.coalesce(func.sum(blob.c.size), 0),
+        func.coalesce(func.sum(blob.c.size * blob.c.refcount), 0),
+    )).one()
+    return {'blob': n, 'byte_su_disco': fisici, 'byte_logici': logici}
@@ -0,0 +1,171 @@
+# app/services/bulk_import.py
+"""
+Import di molti PDF in una sola richiesta (es. i DDT del lunedì mattina).
+
+1. tutti i file vengono salvati come nell'upload singolo (save_upload) e
+   cercati nella cache per contenuto (services/parse_cache);
+2. per quelli mancanti il testo viene dalla cache del testo (services/text_cache)
+   oppure dall'estrazione (pypdf, puro Python e CPU-bound) su un pool di
+   processi; le pagine estratte finiscono in cache;
+3. il parser del tipo (ParserSpec.text_fn: parser fornitore o LLM) gira su un
+   pool di thread, passando dal token bucket della coda se chiama l'LLM;
+4. ogni risultato passa da ImportService.create_preview come l'anteprima singola.
+
+Il database si usa solo nel thread della richiesta. Un file illeggibile produce
+una voce con ok=False e non interrompe gli altri.
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from flask import current_app
+
+from ..config import Config
+from ..extensions import db
+from . import parse_cache, text_cache
+from .file_service import get_file_hash, save_upload
+from .parse_jobs import get_parse_queue
+from .pdf_service import join_pages, read_pages
+
+
+def _extract(abs_path, until=None):
+    """Eseguito nei processi del pool: ((pagine, completo), errore)."""
+    try:
+        return read_pages(abs_path, until), None
+    except Exception as e:
+        return None, f"PDF illeggibile: {e}"
+
+
+def extract_texts(paths, workers, until=None):
+    """Pagine di ogni PDF, nell'ordine; pool di processi solo se serve davvero.
+    until: funzione di modulo (deve arrivare ai processi via pickle), vedi ParserSpec.until."""
+    if workers <= 1 or len(paths) <= 1:
+        return [_extract(p, until) for p in paths]
+    # spawn: il processo web ha thread attivi (job di parsing), fork non è sicuro
+    with ProcessPoolExecutor(max_workers=min(workers, len(paths)),
+                             mp_context=multiprocessing.get_context('spawn')) as pool:
+        return list(pool.map(_extract, paths, [until] * len(paths)))
+
+
+def _set_text(item, read):
+    pages, complete = read
+    item["raw_text"] = join_pages(pages)
+    # lettura fermata da until con altre pagine nel PDF: il parser lo annota nel risultato
+    item["pagine_lette"] = None if complete else len(pages)
+
+
+def _workers(workers):
+    if workers is None:
+        workers = current_app.config.get('PDF_BATCH_WORKERS', Config.PDF_BATCH_WORKERS)
+    return max(1, int(workers))
+
+
+def parse_uploads(kind, files, workers=None, preview=None):
+    """
+    Salva e analizza tutti i file (FileStorage) ricevuti.
+    preview(result, uploaded_file, raw_text) -> {"ok", "preview"|"error"}; default: ImportService.create_preview.
+    Ritorna una lista, nello stesso ordine dei file, di
+    {"filename", "ok", "preview"|"error", "uploaded_file", "cached"}.
+    """
+    queue = get_parse_queue()
+    spec = queue.parsers.get(kind)
+    if spec is None or spec.text_fn is None:
+        raise ValueError(f"Tipo di parsing non supportato per l'import multiplo: {kind}")
+    if preview is None:
+        from .import_service import ImportService
+        preview = ImportService().create_preview
+    workers = _workers(workers)
+    key = parse_cache.parser_key(kind, spec.version)
+    category = "incoming_ddt" if kind == "ddt" else f"incoming_{kind}"
+
+    items = []
+    for f in files:
+        item = {"filename": f.filename, "ok": False, "cached": False}
+        items.append(item)
+        try:
+            item["uploaded_file"], item["abs_path"] = save_upload(f, category=category)
+            item["sha256"] = get_file_hash(item["abs_path"])
+            result = parse_cache.lookup(db.session, item["sha256"], key)
+            if result is not None:
+                result["uploaded_file"] = item["uploaded_file"]
+                item["result"], item["cached"] = result, True
+        except Exception as e:
+            current_app.logger.warning(f"Upload {f.filename} non salvato: {e}")
+            item["error"] = str(e)
+    db.session.commit()
+
+    # stesso contenuto più volte nella richiesta: si analizza solo il primo
+    todo, duplicati = [], []
+    primi = {}
+    for it in items:
+        if "abs_path" not in it or "result" in it:
+            continue
+        if it["sha256"] in primi:
+            duplicati.append((it, primi[it["sha256"]]))
+        else:
+            primi[it["sha256"]] = it
+            todo.append(it)
+    to_extract = []
+    for it in todo:
+        read = text_cache.cached_pages(it["sha256"], spec.until)
+        if read is None:
+            to_extract.append(it)
+        else:
+            _set_text(it, read)
+    for it, (read, err) in zip(to_extract, extract_texts([it["abs_path"] for it in to_extract],
+                                                         workers, spec.until)):
+        if err:
+            it["error"] = err
+        else:
+            text_cache.store(it["sha256"], *read)
+            _set_text(it, read)
+
+    def run(it):
+        if spec.rate_limited and queue.bucket is not None:
+            queue.bucket.acquire()
+        extra = {"pagine_lette": it["pagine_lette"]} if it["pagine_lette"] else {}
+        return spec.text_fn(it["raw_text"], it["uploaded_file"], **extra)
+
+    to_parse = [it for it in todo if "error" not in it]
+    if to_parse:
+        with ThreadPoolExecutor(max_workers=min(workers, len(to_parse))) as pool:
+            futures = [(it, pool.submit(run, it)) for it in to_parse]
+            for it, fut in futures:
+                try:
+                    it["result"] = fut.result()
+                except Exception as e:
+                    current_app.logger.warning(f"Parsing {it['filename']} fallito: {e}")
+                    it["error"] = str(e)
+        for it in to_parse:
+            if isinstance(it.get("result"), dict):
+                parse_cache.store(db.session, it["sha256"], key, it["result"])
+        parse_cache.evict(db.session, queue.cache_max_bytes, queue.cache_max_age_days)
+        db.session.commit()
+
+    for it, primo in duplicati:
+        it["raw_text"] = primo.get("raw_text")
+        if "result" in primo:
+            it["result"] = dict(primo["result"], uploaded_file=it["uploaded_file"])
+        else:
+            it["error"] = primo.get("error")
+
+    out = []
+    for it in items:
+        entry = {"filename": it["filename"], "ok": False, "cached": it["cached"],
+                 "uploaded_file": it.get("uploaded_file")}
+        if "result" in it:
+            res = it["result"]
+            pv = preview(res, it["uploaded_file"], it.get("raw_text"))
+            entry.update(pv)
+            if pv.get("ok"):
+                entry["method"] = res.get("method")
+                entry["note"] = res.get("note") or ""
+        else:
+            entry["error"] = it.get("error") or "Errore sconosciuto"
+        if not spec.keep_upload and it.get("abs_path"):
+            try:
+                os.remove(it["abs_path"])
+            except OSError:
+                pass
+        out.append(entry)
+    return out
@@ -0,0 +1,175 @@
+# app/services/confirmation.py
+"""
+Motore di conferma documenti "set-based".
+Invece di leggere/scrivere la giacenza riga per riga, aggrega le righe per
+(articolo, magazzino), carica tutte le giacenze coinvolte con una sola query,
+verifica la disponibilità in memoria e applica i delta con un upsert massivo.
+Lavora a livello di tabelle (Core) così può essere usato sia dai modelli di
+`app.models` sia da quelli legacy definiti in `app.py`.
+"""
+from collections import OrderedDict
+from datetime import datetime, time
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select, insert, update, bindparam
+
+from .ledger import invalidate_snapshots
+from .mastrino_rollup import apply_documento
+from .stock_summary import refresh_riepilogo, bump_dashboard, chiave_movimenti, invalidate_reports
+from .valuation import apply_movimenti
+
+Q3 = Decimal('0.001')
+
+
+def _tables(doc):
+    t = type(doc).metadata.tables
+    return t['riga_documento'], t['giacenza'], t['movimento'], t['articolo']
+
+
+def _dec(x) -> Decimal:
+    if x is None:
+        return Decimal('0.000')
+    return (x if isinstance(x, Decimal) else Decimal(str(x))).quantize(Q3)
+
+
+def _upsert_giacenze(session, giacenza, deltas: Dict[Tuple[int, int], Decimal],
+                     existing: Dict[Tuple[int, int], Decimal]):
+    """Applica i delta di giacenza in blocco: un executemany di UPDATE per le
+    righe già presenti e un INSERT (ON CONFLICT se il dialetto lo supporta)
+    per quelle nuove. I delta negativi non passano mai dall'INSERT perché il
+    CHECK quantita >= 0 viene valutato sulla riga proposta."""
+    to_update = [{"b_art": a, "b_mag": m, "b_qty": q}
+                 for (a, m), q in deltas.items() if (a, m) in existing and q != 0]
+    to_insert = [{"articolo_id": a, "magazzino_id": m, "quantita": q}
+                 for (a, m), q in deltas.items() if (a, m) not in existing]
+    if to_update:
+        session.execute(
+            update(giacenza)
+            .where(giacenza.c.articolo_id == bindparam("b_art"),
+                   giacenza.c.magazzino_id == bindparam("b_mag"))
+            .values(quantita=giacenza.c.quantita + bindparam("b_qty")),
+            to_update,
+        )
+    if not to_insert:
+        return
+    if any(r["quantita"] < 0 for r in to_insert):
+        raise ValueError("Impossibile creare giacenza negativa.")
+    dialect = session.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        # ON CONFLICT copre un'eventuale giacenza creata da una conferma concorrente
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        stmt = dialect_insert(giacenza)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[giacenza.c.articolo_id, giacenza.c.magazzino_id],
+            set_={"quantita": giacenza.c.quantita + stmt.excluded.quantita},
+        )
+        session.execute(stmt, to_insert)
+    else:
+        session.execute(insert(giacenza), to_insert)
+
+
+def apply_document_movements(doc, session, *, mov_time: Optional[datetime] = None,
+                             update_last_cost: bool = False) -> int:
+    """
+    Applica giacenze e movimenti di un documento in bozza e lo marca 'Confermato'.
+    Non esegue commit: la transazione resta in mano al chiamante.
+    - DDT_IN: carico su doc.magazzino_id al prezzo riga (opzionalmente aggiorna anche last_cost)
+    - DDT_OUT: verifica disponibilità e scarica da doc.magazzino_id
+    Le righe con quantità <= 0 non generano movimenti; se lo sono tutte il
+    documento viene confermato senza movimenti.
+    Returns: numero di movimenti generati.
+    """
+    riga, giacenza, movimento, articolo = _tables(doc)
+    if doc.tipo not in ("DDT_IN", "DDT_OUT"):
+        raise ValueError("Tipo documento non gestito.")
+
+    # Assicura che id documento e righe appena aggiunte siano sul DB
+    session.flush()
+
+    rows = session.execute(
+        select(riga.c.articolo_id, riga.c.quantita, riga.c.prezzo, articolo.c.codice_interno)
+        .join(articolo, articolo.c.id == riga.c.articolo_id)
+        .where(riga.c.documento_id == doc.id)
+        .order_by(riga.c.id)
+    ).all()
+    if not rows:
+        raise ValueError("Nessuna riga nel documento.")
+
+    if mov_time is None:
+        mov_time = datetime.combine(doc.data, time.min) if doc.data else datetime.now()
+    mag_id = doc.magazzino_id
+    sign = Decimal(1) if doc.tipo == "DDT_IN" else Decimal(-1)
+
+    # Aggregazione per (articolo, magazzino)
+    deltas: "OrderedDict[Tuple[int, int], Decimal]" = OrderedDict()
+    codici: Dict[int, str] = {}
+    last_costs: Dict[int, Decimal] = {}
+    movimenti: List[dict] = []
+    costi: List[Optional[Decimal]] = []
+    for art_id, qta, prezzo, codice in rows:
+        q = _dec(qta)
+        if q <= 0:
+            continue
+        key = (art_id, mag_id)
+        deltas[key] = deltas.get(key, Decimal('0.000')) + sign * q
+        codici[art_id] = codice
+        if update_last_cost and doc.tipo == "DDT_IN":
+            last_costs[art_id] = prezzo
+        mv = {
+            "data": mov_time,
+            "articolo_id": art_id,
+            "quantita": q,  # la quantità nei movimenti è sempre positiva
+            "tipo": "carico" if doc.tipo == "DDT_IN" else "scarico",
+            "magazzino_partenza_id": mag_id if doc.tipo == "DDT_OUT" else None,
+            "magazzino_arrivo_id": mag_id if doc.tipo == "DDT_IN" else None,
+            "documento_id": doc.id,
+        }
+        movimenti.append(mv)
+        costi.append(prezzo if doc.tipo == "DDT_IN" else None)
+
+    # Giacenze coinvolte: una sola query
+    existing = {
+        (a, m): _dec(q)
+        for a, m, q in session.execute(
+            select(giacenza.c.articolo_id, giacenza.c.magazzino_id, giacenza.c.quantita)
+            .where(giacenza.c.magazzino_id == mag_id,
+                   giacenza.c.articolo_id.in_([a for a, _ in deltas]))
+        ).all()
+    }
+
+    if doc.tipo == "DDT_OUT":
+        for (art_id, m), delta in deltas.items():
+            if existing.get((art_id, m), Decimal('0.000')) + delta < 0:
+                raise ValueError(f"Giacenza insufficiente per l'articolo {codici.get(art_id) or art_id}.")
+
+    _upsert_giacenze(session, giacenza, deltas, existing)
+    tables = type(doc).metadata.tables
+    if movimenti:
+        session.execute(insert(movimento), movimenti)
+        # documento con data in un mese già fotografato (services/ledger)
+        invalidate_snapshots(session, tables, mov_time)
+    # costo medio e lotti FIFO dal prezzo delle righe (services/valuation)
+    apply_movimenti(session, tables, movimenti, costi)
+
+    # Riepilogo dashboard: solo gli articoli toccati, nella stessa transazione
+    refresh_riepilogo(session, tables, [a for a, _ in deltas])
+    bump_dashboard(session, tables, chiave_movimenti(mov_time.date()), len(movimenti))
+    invalidate_reports(session, tables)
+    apply_documento(session, tables, doc.id, doc.data, 1)
+
+    if last_costs:
+        session.execute(
+            update(articolo).where(articolo.c.id == bindparam("b_id")).values(last_cost=bindparam("b_cost")),
+            [{"b_id": a, "b_cost": c} for a, c in last_costs.items()],
+        )
+
+    doc.status = "Confermato"
+    # Gli oggetti Giacenza/Articolo eventualmente in sessione sono ora obsoleti
+    for obj in list(session.identity_map.values()):
+        if obj.__table__ is giacenza or obj.__table__ is articolo:
+            session.expire(obj)
+    return len(movimenti)
@@ -0,0 +1,96 @@
+# app/services/export_service.py
+"""
+Export tabellari in streaming (CSV / XLSX).
+
+Le righe arrivano da un iteratore (query con yield_per) e vengono scritte a
+blocchi: né il CSV né l'XLSX vengono mai tenuti interi in memoria.
+- CSV: separatore ';' e BOM UTF-8, come li apre Excel in italiano
+  (e come li legge l'import di settings); decimali con la virgola.
+- XLSX: openpyxl in modalità write-only (le righe finiscono su file temporaneo),
+  il file viene poi inviato a pezzi e cancellato.
+"""
+import csv
+import io
+import os
+import tempfile
+from datetime import date, datetime
+from decimal import Decimal
+
+CSV_CHUNK_ROWS = 500
+XLSX_CHUNK_BYTES = 64 * 1024
+
+MIMETYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+def _csv_value(v):
+    if v is None:
+        return ''
+    if isinstance(v, datetime):
+        return v.strftime('%d/%m/%Y %H:%M')
+    if isinstance(v, date):
+        return v.strftime('%d/%m/%Y')
+    if isinstance(v, (Decimal, float)):
+        return str(v).replace('.', ',')
+    return v
+
+
+def iter_csv(header, rows, chunk_rows=CSV_CHUNK_ROWS):
+    """Genera il CSV a blocchi di `chunk_rows` righe (stringhe)."""
+    buf = io.StringIO()
+    writer = csv.writer(buf, delimiter=';', lineterminator='\r\n')
+    buf.write('\ufeff')
+    writer.writerow(header)
+    n = 0
+    for row in rows:
+        writer.writerow([_csv_value(v) for v in row])
+        n += 1
+        if n % chunk_rows == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+
+def _xlsx_value(v):
+    # openpyxl non gestisce datetime con tzinfo né tipi sconosciuti
+    if isinstance(v, Decimal):
+        return float(v)
+    if isinstance(v, datetime) and v.tzinfo is not None:
+        return v.replace(tzinfo=None)
+    return v
+
+
+def iter_xlsx(header, rows, sheet_title='Export', chunk_bytes=XLSX_CHUNK_BYTES):
+    """Genera l'XLSX a blocchi di bytes; il workbook è in modalità write-only."""
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title=sheet_title[:31])
+    ws.append(list(header))
+    for row in rows:
+        ws.append([_xlsx_value(v) for v in row])
+
+    fd, path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(fd)
+    try:
+        wb.save(path)
+        with open(path, 'rb') as fh:
+            while True:
+                chunk = fh.read(chunk_bytes)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        os.remove(path)
+
+
+def iter_export(fmt, header, rows, sheet_title='Export'):
+    """Dispatch sul formato ('csv' | 'xlsx')."""
+    if fmt == 'xlsx':
+        return iter_xlsx(header, rows, sheet_title=sheet_title)
+    if fmt == 'csv':
+        return iter_csv(header, rows)
+    raise ValueError(f"Formato export non supportato: {fmt}")
@@ -0,0 +1,120 @@
+# app/services/import_bulk.py
+"""
+Stage di import a blocchi per le righe di un DDT IN.
+Risolve tutti i codici fornitore del payload con una sola query, riserva i
+codici interni dei nuovi articoli in un blocco e inserisce Articolo e
+RigaDocumento con insert massivi, invece di 2 query + flush per riga.
+"""
+from decimal import Decimal
+from typing import Dict, List, Tuple
+
+from sqlalchemy import select, insert, update, bindparam, or_, and_
+
+from ..extensions import db
+from ..models import Articolo, RigaDocumento
+from ..utils import reserve_internal_codes
+
+
+def resolve_articoli(fornitore_nome: str, sup_codes) -> Tuple[Dict[str, dict], Dict[str, dict]]:
+    """
+    Una sola query IN (...) per tutti i codici della bolla.
+    Returns: (per (codice_fornitore) del fornitore, per codice_interno) -> riga articolo
+    """
+    codes = sorted({c for c in sup_codes if c})
+    by_supplier: Dict[str, dict] = {}
+    by_internal: Dict[str, dict] = {}
+    if not codes:
+        return by_supplier, by_internal
+    a = Articolo.__table__
+    rows = db.session.execute(
+        select(a.c.id, a.c.codice_interno, a.c.codice_fornitore, a.c.fornitore)
+        .where(or_(and_(a.c.codice_fornitore.in_(codes), a.c.fornitore == fornitore_nome),
+                   a.c.codice_interno.in_(codes)))
+        .order_by(a.c.id)
+    ).mappings().all()
+    for r in rows:
+        r = dict(r)
+        if r["fornitore"] == fornitore_nome and r["codice_fornitore"] in codes:
+            by_supplier.setdefault(r["codice_fornitore"], r)
+        if r["codice_interno"] in codes:
+            by_internal.setdefault(r["codice_interno"], r)
+    return by_supplier, by_internal
+
+
+def bulk_create_righe(documento_id: int, lines: List[dict], fornitore_nome: str, prefix: str) -> int:
+    """
+    Crea le righe del documento a partire da righe già normalizzate:
+    {"codice", "descrizione", "um", "quantita", "prezzo", "mastrino_codice"}.
+    Articoli esistenti: completa codice_fornitore/fornitore e aggiorna last_cost.
+    Articoli nuovi: uno per codice fornitore distinto (uno per riga se senza codice).
+    Returns: numero di righe inserite.
+    """
+    if not lines:
+        return 0
+    by_supplier, by_internal = resolve_articoli(fornitore_nome, [l["codice"] for l in lines])
+
+    # Assegna ad ogni riga l'articolo esistente o una "chiave" di nuovo articolo
+    existing_updates: Dict[int, dict] = {}
+    new_keys: List[object] = []        # chiavi dei nuovi articoli, in ordine di apparizione
+    new_data: Dict[object, dict] = {}
+    line_target: List[Tuple[str, object]] = []
+    for idx, l in enumerate(lines):
+        code = l["codice"]
+        art = (by_supplier.get(code) or by_internal.get(code)) if code else None
+        if art is not None:
+            upd = existing_updates.setdefault(art["id"], {
+                "b_id": art["id"],
+                "b_cf": art["codice_fornitore"],
+                "b_forn": art["fornitore"] or fornitore_nome,
+            })
+            if code and not upd["b_cf"]:
+                upd["b_cf"] = code
+            upd["b_cost"] = l["prezzo"]
+            line_target.append(("id", art["id"]))
+            continue
+        key = code if code else ("__riga__", idx)
+        if key not in new_data:
+            new_keys.append(key)
+            new_data[key] = {
+                "codice_fornitore": code or None,
+                "descrizione": l["descrizione"],
+                "fornitore": fornitore_nome,
+            }
+        new_data[key]["last_cost"] = l["prezzo"]
+        line_target.append(("new", key))
+
+    a = Articolo.__table__
+    if existing_updates:
+        db.session.execute(
+            update(a).where(a.c.id == bindparam("b_id"))
+            .values(codice_fornitore=bindparam("b_cf"), fornitore=bindparam("b_forn"),
+                    last_cost=bindparam("b_cost")),
+            list(existing_updates.values()),
+        )
+
+    new_ids: Dict[object, int] = {}
+    if new_keys:
+        codes = reserve_internal_codes(prefix, [k if isinstance(k, str) else None for k in new_keys])
+        rows = []
+        for key, internal in zip(new_keys, codes):
+            row = dict(new_data[key])
+            row["codice_interno"] = internal
+            rows.append(row)
+        db.session.execute(insert(a), rows)
+        ids = dict(db.session.execute(
+            select(a.c.codice_interno, a.c.id).where(a.c.codice_interno.in_(codes))
+        ).all())
+        new_ids = {key: ids[internal] for key, internal in zip(new_keys, codes)}
+
+    righe = []
+    for l, (kind, ref) in zip(lines, line_target):
+        righe.append({
+            "documento_id": documento_id,
+            "articolo_id": ref if kind == "id" else new_ids[ref],
+            "descrizione": f"{l['descrizione']} [{l['um']}]",
+            "quantita": l["quantita"],
+            "prezzo": l["prezzo"] if l["prezzo"] is not None else Decimal('0.00'),
+            "mastrino_codice": l["mastrino_codice"],
+        })
+    db.session.execute(insert(RigaDocumento.__table__), righe)
+    return len(righe)
@@ -7,41 +7,35 @@ from typing import Dict, Any, Tuple, Optional, List
 from decimal import Decimal
 from flask import current_app
 from ..extensions import db
-from ..models import Articolo, Magazzino, Partner, Documento, RigaDocumento, Allegato, Mastrino
-from ..utils import q_dec, money_dec, supplier_prefix, gen_internal_code, unify_um
-from .pdf_service import PDFService
-from .parsing_service import ParsingService  
-from .file_service import FileService
+from ..models import Articolo, Magazzino, Partner, Documento, RigaDocumento, Allegato, Mastrino, Blob
+from ..utils import q_dec, money_dec, supplier_prefix, unify_um
+from .import_bulk import bulk_create_righe
+from .file_service import save_upload
+from .parse_jobs import parse_file
+from .blob_store import attach_upload, discard_upload
 
 
 class ImportService:
     """Servizio per import DDT da PDF"""
     
-    def __init__(self):
-        self.pdf_service = PDFService()
-        self.parsing_service = ParsingService()
-        self.file_service = FileService()
-    
     def parse_ddt_from_upload(self, file_storage) -> Dict[str, Any]:
         """
         Estrae dati da PDF caricato.
         Returns: {"ok": bool, "data": dict, "method": str, "note": str, "uploaded_file": str}
         """
         try:
-            # Estrai testo PDF
-            raw_text = self.pdf_service.extract_text(file_storage)
-            
             # Salva file per allegarlo successivamente
             file_storage.stream.seek(0)
-            rel_path, abs_path = self.file_service.save_upload(file_storage, category="incoming_ddt")
+            rel_path, abs_path = save_upload(file_storage, category="incoming_ddt")
             
-            # Parsing con fallback
+            # Estrazione + parsing, saltati se lo stesso PDF è già in cache
+            result = parse_file("ddt", abs_path, rel_path)
             
             return {
                 "ok": True,
-                "data": data,
-                "method": method,
-                "note": note or "",
+                "data": result.get("data"),
+                "method": result.get("method"),
+                "note": result.get("note") or "",
                 "uploaded_file": rel_path
             }
             
@@ -52,9 +46,11 @@ class ImportService:
                 "error": str(e)
             }
     
-    def create_preview(self, parsed_data: Dict, uploaded_file: str) -> Dict[str, Any]:
+    def create_preview(self, parsed_data: Dict, uploaded_file: str, raw_text: str = None) -> Dict[str, Any]:
         """
         Crea preview normalizzata per l'UI.
+        raw_text: testo del PDF se già estratto (import multiplo); il parser del
+        fornitore è già stato scelto in fase di parsing (services/supplier_parsers).
         """
         try:
             d = parsed_data.get("data", {})
@@ -64,14 +60,6 @@ class ImportService:
             for r in righe:
                 r["um"] = unify_um(r.get("um"))
             
-            # Gestione speciale DUOTERMICA
-            vendor = (d.get("fornitore", "") or "").upper()
-            if "DUOTERMICA" in vendor and uploaded_file:
-                try:
-                    righe = self._apply_duotermica_override(uploaded_file, righe)
-                except Exception as e:
-                    current_app.logger.warning(f"DUOTERMICA override fallito: {e}")
-            
             preview = {
                 "fornitore": d.get("fornitore"),
                 "righe": righe,
@@ -123,15 +111,17 @@ class ImportService:
             mastrino_default = self._get_default_acquisto_mastrino()
             pref = supplier_prefix(fornitore_nome)
             
-            for r in righe:
-                riga_doc = self._create_riga_from_import(doc.id, r, fornitore_nome, pref, mastrino_default)
-                db.session.add(riga_doc)
+            lines = [self._normalize_riga(r, mastrino_default) for r in righe]
+            bulk_create_righe(doc.id, lines, fornitore_nome, pref)
             
             # Allegato
+            allegato = None
             if uploaded_file:
-                self._attach_uploaded_file(doc.id, uploaded_file)
+                allegato = self._attach_uploaded_file(doc.id, uploaded_file)
             
             db.session.commit()
+            if allegato is not None:
+                discard_upload(uploaded_file)
             
             return {
                 "ok": True,
@@ -146,17 +136,6 @@ class ImportService:
     
     # ===== METODI PRIVATI =====
     
-    def _apply_duotermica_override(self, uploaded_file: str, default_righe: List) -> List:
-        """Applica parsing specifico DUOTERMICA"""
-        rel = uploaded_file.lstrip("/\\")
-        if not rel:
-            return default_righe
-            
-        abs_path = self.file_service.get_absolute_path(rel)
-        raw = self.pdf_service.extract_text_from_file(abs_path)
-        parsed = self.parsing_service.parse_ddt_duotermica(raw) or {}
-        return parsed.get("righe", []) or default_righe
-    
     def _get_or_create_partner(self, nome: str, tipo: str) -> Partner:
         """Ottieni o crea partner"""
         partner = Partner.query.filter_by(nome=nome).first()
@@ -185,9 +164,8 @@ class ImportService:
         db.session.flush()
         return m.codice
     
-    def _create_riga_from_import(self, documento_id: int, riga_data: Dict, 
-                               fornitore_nome: str, prefix: str, mastrino_default: str) -> RigaDocumento:
-        """Crea riga documento da dati import"""
+    def _normalize_riga(self, riga_data: Dict, mastrino_default: str) -> Dict[str, Any]:
+        """Normalizza una riga di import per bulk_create_righe"""
         sup_code = (riga_data.get('codice') or '').strip()
         descr = (riga_data.get('descrizione') or '').strip() or sup_code or "Articolo"
         
@@ -205,47 +183,14 @@ class ImportService:
         unit_price = self._extract_unit_price(riga_data, qty_dec)
         mastrino_row = (riga_data.get('mastrino_codice') or '').strip() or mastrino_default
         
-        # Articolo
-        art = self._get_or_create_articolo(sup_code, descr, fornitore_nome, prefix, unit_price)
-        
-        return RigaDocumento(
-            documento_id=documento_id,
-            articolo_id=art.id,
-            descrizione=f"{descr} [{um}]",
-            quantita=q_dec(str(qty_raw)),
-            prezzo=unit_price.quantize(Decimal('0.01')) if unit_price is not None else Decimal('0.00'),
-            mastrino_codice=mastrino_row
-        )
-    
-    def _get_or_create_articolo(self, sup_code: str, descr: str, 
-                              fornitore_nome: str, prefix: str, unit_price: Decimal) -> Articolo:
-        """Ottieni o crea articolo"""
-        art = None
-        if sup_code:
-            art = Articolo.query.filter_by(codice_fornitore=sup_code, fornitore=fornitore_nome).first()
-        if not art:
-            art = Articolo.query.filter_by(codice_interno=sup_code).first()
-        
-        if art is None:
-            internal = gen_internal_code(prefix, supplier_code=sup_code or None)
-            art = Articolo(
-                codice_interno=internal,
-                codice_fornitore=sup_code or None,
-                descrizione=descr,
-                fornitore=fornitore_nome,
-                last_cost=(unit_price.quantize(Decimal('0.01')) if unit_price is not None else Decimal('0.00'))
-            )
-            db.session.add(art)
-            db.session.flush()
-        else:
-            # Aggiorna articolo esistente
-            if sup_code and not art.codice_fornitore:
-                art.codice_fornitore = sup_code
-            if not art.fornitore:
-                art.fornitore = fornitore_nome
-            art.last_cost = (unit_price.quantize(Decimal('0.01')) if unit_price is not None else Decimal('0.00'))
-        
-        return art
+        return {
+            "codice": sup_code,
+            "descrizione": descr,
+            "um": um,
+            "quantita": q_dec(str(qty_raw)),
+            "prezzo": unit_price.quantize(Decimal('0.01')) if unit_price is not None else Decimal('0.00'),
+            "mastrino_codice": mastrino_row,
+        }
     
     def _to_decimal(self, x) -> Optional[Decimal]:
         """Converte valore in Decimal"""
@@ -288,15 +233,10 @@ class ImportService:
     def _attach_uploaded_file(self, doc_id: int, uploaded_file: str):
         """Allega file caricato al documento"""
         try:
-            new_rel, new_abs = self.file_service.move_upload_to_document(uploaded_file, doc_id)
             import os
-            allegato = Allegato(
-                documento_id=doc_id,
-                filename=os.path.basename(new_abs),
-                mime='application/pdf',
-                path=new_rel,
-                size=os.path.getsize(new_abs) if os.path.exists(new_abs) else 0
-            )
-            db.session.add(allegato)
+            # archivio per contenuto; l'upload originale si rimuove dopo il commit (discard_upload)
+            return attach_upload(db.session, Allegato, Blob, doc_id, uploaded_file,
+                                 filename=os.path.basename(uploaded_file))
         except Exception as e:
-            current_app.logger.warning(f"Impossibile allegare file: {e}")
\ No newline at end of file
+            current_app.logger.warning(f"Impossibile allegare file: {e}")
+            return None
\ No newline at end of file
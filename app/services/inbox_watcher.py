@@ -0,0 +1,270 @@
+# app/services/inbox_watcher.py
+"""
+Cartella di arrivo dei DDT fornitore (`flask magazzino watch-inbox <dir>`).
+
+Ogni PDF che compare nella cartella (e non cambia più per SETTLE_SECONDS: la
+copia via rete è finita) viene:
+- confrontato per SHA-256 con gli allegati già archiviati (tabella 'blob'): i
+  duplicati finiscono in duplicati/; se lo stesso contenuto è in lavorazione su
+  un altro worker il file resta nella cartella e viene ripreso alla scansione
+  successiva, quando l'esito del primo è noto (importato: duplicato; scartato:
+  viene importato lui);
+- analizzato con ImportService.parse_ddt_from_upload + create_preview e
+  trasformato in un DDT_IN in bozza con import_ddt_in (PDF allegato);
+- spostato in importati/ oppure, con un file .txt con l'errore, in scartati/.
+
+Scansione a polling (ogni `interval` secondi); se il pacchetto opzionale
+watchdog è installato la scansione parte subito all'arrivo di un file (inotify).
+La coda verso i worker è limitata (queue_size): lo scanner si ferma finché i
+worker non la svuotano, così un arretrato di centinaia di PDF dopo le ferie
+scorre a ritmo costante con al massimo `workers` connessioni/transazioni
+aperte, ciascuna breve (un commit per file).
+"""
+import hashlib
+import queue as queue_mod
+import shutil
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from sqlalchemy import select
+
+from ..extensions import db
+from ..models import Blob
+
+SETTLE_SECONDS = 2.0
+DONE_DIR = "importati"
+FAILED_DIR = "scartati"
+DUPLICATE_DIR = "duplicati"
+
+_STOP = object()
+
+
+def file_sha256(path) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(64 * 1024), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+class InboxWatcher:
+    """Scanner + pool limitato di worker che importano i PDF di `inbox`."""
+
+    def __init__(self, app, inbox, workers=2, queue_size=10, interval=5.0,
+                 settle_seconds=SETTLE_SECONDS, magazzino_id=None, importer=None, log=print):
+        self.app = app
+        self.inbox = Path(inbox)
+        self.workers = max(1, int(workers))
+        self.interval = interval
+        self.settle_seconds = settle_seconds
+        self.magazzino_id = magazzino_id
+        self.importer = importer or self.import_pdf
+        self.log = log
+        self.queue = queue_mod.Queue(maxsize=max(1, int(queue_size)))
+        self.stats = {'importati': 0, 'duplicati': 0, 'scartati': 0}
+        self._in_progress = set()   # nomi file in coda o in lavorazione
+        self._hashes = set()        # sha256 in lavorazione
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._sizes = {}
+
+    # --- ciclo di vita ---
+
+    def start(self):
+        for d in (DONE_DIR, FAILED_DIR, DUPLICATE_DIR):
+            (self.inbox / d).mkdir(parents=True, exist_ok=True)
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker_loop, name=f"inbox-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        self._observer = self._start_observer()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        for _ in self._threads:
+            self.queue.put(_STOP)
+        for t in self._threads:
+            t.join()
+        self._threads = []
+        if self._observer is not None:
+            self._observer.stop()
+
+    def run(self, once=False):
+        """Scansione continua (Ctrl+C per uscire); con once=True svuota l'arretrato ed esce."""
+        self.start()
+        try:
+            while not self._stop.is_set():
+                pending = self.scan()
+                if once and not pending:
+                    self.queue.join()
+                    if not self._pending_files():
+                        break
+                self._wake.wait(0.1 if once else self.interval)
+                self._wake.clear()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+        return self.stats
+
+    def _start_observer(self):
+        try:
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer
+        except ImportError:
+            return None
+        watcher = self
+
+        class _Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                watcher._wake.set()
+
+        observer = Observer()
+        observer.schedule(_Handler(), str(self.inbox), recursive=False)
+        observer.start()
+        return observer
+
+    # --- scansione ---
+
+    def _pending_files(self):
+        return [p for p in self.inbox.iterdir()
+                if p.is_file() and p.suffix.lower() == '.pdf' and not p.name.startswith('.')]
+
+    @staticmethod
+    def _stat(path):
+        # il file può sparire tra il listing e lo stat (un worker lo ha appena spostato)
+        try:
+            return path.stat()
+        except FileNotFoundError:
+            return None
+
+    def scan(self):
+        """Accoda i PDF stabili; ritorna quanti file restano da accodare (in copia o coda piena)."""
+        pending = 0
+        now = time.time()
+        with self._lock:
+            in_progress = set(self._in_progress)
+        candidati = []
+        for path in self._pending_files():
+            if path.name in in_progress:
+                continue
+            st = self._stat(path)
+            if st is not None:
+                candidati.append((st.st_mtime, path))
+        candidati.sort(key=lambda c: c[0])
+        for _, path in candidati:
+            with self._lock:
+                if path.name in self._in_progress:
+                    continue
+            st = self._stat(path)
+            if st is None:
+                continue
+            stable = (self._sizes.get(path.name) == st.st_size
+                      and now - st.st_mtime >= self.settle_seconds)
+            self._sizes[path.name] = st.st_size
+            if not stable:
+                pending += 1
+                continue
+            with self._lock:
+                self._in_progress.add(path.name)
+            # put bloccante: con la coda piena lo scanner aspetta i worker (backpressure)
+            while not self._stop.is_set():
+                try:
+                    self.queue.put(path, timeout=0.5)
+                    break
+                except queue_mod.Full:
+                    continue
+        return pending
+
+    # --- worker ---
+
+    def _worker_loop(self):
+        while True:
+            path = self.queue.get()
+            try:
+                if path is _STOP:
+                    return
+                self.process(path)
+            except Exception as e:
+                self.log(f"[ERRORE] {path.name}: {e}")
+            finally:
+                if path is not _STOP:
+                    with self._lock:
+                        self._in_progress.discard(path.name)
+                        self._sizes.pop(path.name, None)
+                self.queue.task_done()
+
+    def process(self, path):
+        sha256 = file_sha256(path)
+        with self._lock:
+            if sha256 in self._hashes:
+                # stesso contenuto in lavorazione su un altro worker: il file resta nella
+                # cartella e si decide alla prossima scansione, a esito del primo noto
+                self.log(f"[ATTESA] {path.name}: stesso contenuto in lavorazione")
+                return
+            self._hashes.add(sha256)
+        try:
+            with self.app.app_context():
+                try:
+                    row = db.session.execute(select(Blob.refcount).where(Blob.sha256 == sha256)).first()
+                    if row is not None and row.refcount > 0:
+                        self._move(path, DUPLICATE_DIR)
+                        self._count('duplicati', f"{path.name}: già importato")
+                        return
+                    try:
+                        result = self.importer(path)
+                    except Exception as e:
+                        db.session.rollback()
+                        result = {'ok': False, 'error': str(e)}
+                finally:
+                    db.session.remove()
+        finally:
+            with self._lock:
+                self._hashes.discard(sha256)
+        if result.get('ok'):
+            self._move(path, DONE_DIR)
+            self._count('importati', f"{path.name}: bozza DDT_IN #{result.get('document_id')}")
+        else:
+            dest = self._move(path, FAILED_DIR)
+            dest.with_name(dest.name + '.txt').write_text(str(result.get('error')), encoding='utf-8')
+            self._count('scartati', f"{path.name}: {result.get('error')}")
+
+    def import_pdf(self, path):
+        """parse_ddt_from_upload → create_preview → import_ddt_in (in app context)."""
+        from werkzeug.datastructures import FileStorage
+        from .blob_store import discard_upload
+        from .import_service import ImportService
+
+        service = ImportService()
+        with open(path, 'rb') as fh:
+            parsed = service.parse_ddt_from_upload(FileStorage(fh, filename=path.name,
+                                                               content_type='application/pdf'))
+        if not parsed.get('ok'):
+            return parsed
+        preview = service.create_preview(parsed, parsed['uploaded_file'])
+        result = preview
+        if preview.get('ok'):
+            p = preview['preview']
+            result = service.import_ddt_in(p.get('fornitore'), p.get('righe'), uploaded_file=p.get('uploaded_file'),
+                                           magazzino_id=self.magazzino_id)
+        if not result.get('ok'):
+            # la copia in incoming_ddt non serve più: il PDF resta in scartati/
+            discard_upload(parsed['uploaded_file'])
+        return result
+
+    def _move(self, path, subdir):
+        dest = self.inbox / subdir / path.name
+        if dest.exists():
+            dest = dest.with_name(f"{dest.stem}_{datetime.now():%Y%m%d_%H%M%S_%f}{dest.suffix}")
+        shutil.move(str(path), str(dest))
+        return dest
+
+    def _count(self, name, msg):
+        with self._lock:
+            self.stats[name] += 1
+        self.log(f"[{name.upper()}] {msg}")
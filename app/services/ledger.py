@@ -0,0 +1,227 @@
+# app/services/ledger.py
+"""
+Registro di magazzino: Movimento è la fonte di verità delle giacenze.
+
+Ogni movimento vale +quantita sul magazzino di arrivo e -quantita su quello
+di partenza (un trasferimento produce entrambe le voci): ledger_entries ne
+dà la vista con segno per (articolo, magazzino). Giacenza è una proiezione
+del registro, verificabile e ricostruibile (`flask magazzino rebuild-giacenze`).
+
+giacenza_snapshot: saldo di fine mese per (articolo, magazzino), solo per mesi
+chiusi. Un mese si costruisce dal precedente più i movimenti del mese; una
+coppia assente in uno snapshot ha saldo 0 a quella data. La giacenza a una data
+(giacenze_al) = ultimo snapshot chiuso prima della data + movimenti successivi,
+quindi al più poco più di un mese di movimenti da sommare se gli snapshot sono
+aggiornati (`flask magazzino snapshot-giacenze`, da cron a inizio mese).
+
+Un movimento con data in un mese già fotografato (es. DDT confermato con data
+del mese scorso) invalida gli snapshot da quel mese in poi: invalidate_snapshots,
+chiamata dal motore di conferma e dagli eventi ORM su Movimento.
+I movimenti senza data (data NULL, righe storiche) valgono da sempre: entrano
+nel primo mese fotografato e in ogni giacenza a una data, e scriverne uno
+invalida tutti gli snapshot.
+Lavora a livello di tabelle (Core), come stock_summary.
+"""
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select, insert, update, delete, func, event, inspect, union_all, literal_column
+
+from .stock_summary import refresh_riepilogo
+
+Q3 = Decimal('0.001')
+
+
+def _dec(x) -> Decimal:
+    return Decimal(str(x or 0)).quantize(Q3)
+
+
+def month_start(d) -> date:
+    if isinstance(d, datetime):
+        d = d.date()
+    return d.replace(day=1)
+
+
+def next_month(m: date) -> date:
+    return (m.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def ledger_entries(tables, since=None, before=None):
+    """Subquery (articolo_id, magazzino_id, data, delta) del registro con segno, data in [since, before).
+    I movimenti senza data stanno prima di ogni data: esclusi con since, inclusi con before."""
+    mv = tables['movimento']
+
+    def side(mag_col, sign):
+        q = select(mv.c.articolo_id, mag_col.label('magazzino_id'), mv.c.data,
+                   (mv.c.quantita * literal_column(sign)).label('delta')).where(mag_col.isnot(None))
+        if since is not None:
+            q = q.where(mv.c.data >= since)
+        if before is not None:
+            q = q.where((mv.c.data < before) | mv.c.data.is_(None))
+        return q
+
+    return union_all(side(mv.c.magazzino_arrivo_id, '1'), side(mv.c.magazzino_partenza_id, '-1')).subquery()
+
+
+def _deltas(session, tables, since=None, before=None, magazzino_id=None, articolo_ids=None):
+    e = ledger_entries(tables, since, before)
+    q = select(e.c.articolo_id, e.c.magazzino_id, func.sum(e.c.delta)).group_by(e.c.articolo_id, e.c.magazzino_id)
+    if magazzino_id is not None:
+        q = q.where(e.c.magazzino_id == magazzino_id)
+    if articolo_ids is not None:
+        q = q.where(e.c.articolo_id.in_(list(articolo_ids)))
+    return {(a, m): _dec(d) for a, m, d in session.execute(q)}
+
+
+# --- snapshot mensili ---
+
+def invalidate_snapshots(conn, tables, since) -> None:
+    """Elimina gli snapshot dal mese di `since` in poi (movimento retrodatato o cancellato)."""
+    if 'giacenza_snapshot' not in tables or since is None:
+        return
+    s = tables['giacenza_snapshot']
+    conn.execute(delete(s).where(s.c.mese >= month_start(since)))
+
+
+def build_snapshots(session, tables, until: Optional[date] = None) -> int:
+    """
+    Costruisce gli snapshot mancanti dei mesi chiusi prima del mese di `until`
+    (default oggi). Non esegue commit. Returns: righe scritte.
+    """
+    s, mv = tables['giacenza_snapshot'], tables['movimento']
+    limite = month_start(until or date.today())
+    ultimo = session.execute(select(func.max(s.c.mese))).scalar()
+    if ultimo is not None:
+        if isinstance(ultimo, str):
+            ultimo = date.fromisoformat(ultimo)
+        saldo = {(a, m): _dec(q) for a, m, q in session.execute(
+            select(s.c.articolo_id, s.c.magazzino_id, s.c.quantita).where(s.c.mese == ultimo))}
+        mese = next_month(ultimo)
+    else:
+        primo = session.execute(select(func.min(mv.c.data))).scalar()
+        if primo is None:
+            return 0
+        if isinstance(primo, str):
+            primo = datetime.fromisoformat(primo)
+        saldo, mese = {}, month_start(primo)
+
+    # il primo mese fotografato comprende anche i movimenti senza data
+    da_sempre = ultimo is None
+    scritte = 0
+    while mese < limite:
+        fine = next_month(mese)
+        mossi = _deltas(session, tables, since=None if da_sempre else datetime.combine(mese, datetime.min.time()),
+                        before=datetime.combine(fine, datetime.min.time()))
+        da_sempre = False
+        for key, d in mossi.items():
+            saldo[key] = saldo.get(key, Decimal('0.000')) + d
+        # le coppie a zero senza movimenti nel mese escono dallo snapshot (assente = 0)
+        saldo = {k: q for k, q in saldo.items() if q != 0 or k in mossi}
+        rows = [{"articolo_id": a, "magazzino_id": m, "mese": mese, "quantita": q}
+                for (a, m), q in saldo.items()]
+        if rows:
+            session.execute(insert(s), rows)
+            scritte += len(rows)
+        mese = fine
+    return scritte
+
+
+def rebuild_snapshots(session, tables, until: Optional[date] = None) -> int:
+    session.execute(delete(tables['giacenza_snapshot']))
+    return build_snapshots(session, tables, until)
+
+
+# --- giacenza a una data ---
+
+def giacenze_al(session, tables, giorno: Optional[date] = None, magazzino_id=None,
+                articolo_ids: Optional[Iterable[int]] = None) -> Dict[Tuple[int, int], Decimal]:
+    """
+    Giacenza a fine giornata di `giorno` (None = tutti i movimenti registrati)
+    per (articolo_id, magazzino_id); le coppie a zero sono omesse.
+    """
+    s = tables['giacenza_snapshot']
+    if articolo_ids is not None:
+        articolo_ids = list(articolo_ids)
+    before = datetime.combine(giorno + timedelta(days=1), datetime.min.time()) if giorno else None
+
+    # ultimo mese chiuso entro la data: fine mese <= giorno
+    q = select(func.max(s.c.mese))
+    if giorno is not None:
+        q = q.where(s.c.mese < month_start(giorno + timedelta(days=1)))
+    mese = session.execute(q).scalar()
+
+    saldo: Dict[Tuple[int, int], Decimal] = {}
+    since = None
+    if mese is not None:
+        if isinstance(mese, str):
+            mese = date.fromisoformat(mese)
+        q = select(s.c.articolo_id, s.c.magazzino_id, s.c.quantita).where(s.c.mese == mese)
+        if magazzino_id is not None:
+            q = q.where(s.c.magazzino_id == magazzino_id)
+        if articolo_ids is not None:
+            q = q.where(s.c.articolo_id.in_(articolo_ids))
+        saldo = {(a, m): _dec(v) for a, m, v in session.execute(q)}
+        since = datetime.combine(next_month(mese), datetime.min.time())
+
+    for key, d in _deltas(session, tables, since, before, magazzino_id, articolo_ids).items():
+        saldo[key] = saldo.get(key, Decimal('0.000')) + d
+    return {k: q for k, q in saldo.items() if q != 0}
+
+
+# --- Giacenza come proiezione del registro ---
+
+def verify_giacenze(session, tables) -> List[dict]:
+    """Differenze tra Giacenza e saldo del registro: [{articolo_id, magazzino_id, giacenza, registro}]."""
+    g = tables['giacenza']
+    attese = giacenze_al(session, tables)
+    presenti = {(a, m): _dec(q) for a, m, q in session.execute(
+        select(g.c.articolo_id, g.c.magazzino_id, g.c.quantita))}
+    drift = []
+    for key in sorted(attese.keys() | presenti.keys()):
+        atteso, attuale = attese.get(key, Decimal('0.000')), presenti.get(key, Decimal('0.000'))
+        if atteso != attuale:
+            drift.append({"articolo_id": key[0], "magazzino_id": key[1], "giacenza": attuale, "registro": atteso})
+    return drift
+
+
+def rebuild_giacenze(session, tables, drift=None) -> List[dict]:
+    """
+    Riporta Giacenza al saldo del registro per le coppie in `drift` (default:
+    verify_giacenze). I saldi negativi non si possono scrivere (CHECK) e
+    restano nell'elenco ritornato. Non esegue commit.
+    """
+    g = tables['giacenza']
+    drift = verify_giacenze(session, tables) if drift is None else drift
+    presenti = {(a, m) for a, m in session.execute(select(g.c.articolo_id, g.c.magazzino_id))}
+    non_applicabili = []
+    toccati = set()
+    for d in drift:
+        key = (d["articolo_id"], d["magazzino_id"])
+        if d["registro"] < 0:
+            non_applicabili.append(d)
+            continue
+        if key in presenti:
+            session.execute(update(g).where(g.c.articolo_id == key[0], g.c.magazzino_id == key[1])
+                            .values(quantita=d["registro"]))
+        else:
+            session.execute(insert(g).values(articolo_id=key[0], magazzino_id=key[1], quantita=d["registro"]))
+        toccati.add(key[0])
+    refresh_riepilogo(session, tables, toccati)
+    return non_applicabili
+
+
+def register_ledger_events(movimento_cls) -> None:
+    """Snapshot invalidati dalle scritture ORM di Movimento (le insert in blocco
+    del motore di conferma chiamano invalidate_snapshots direttamente)."""
+    tables = movimento_cls.metadata.tables
+
+    def _invalida(mapper, conn, target):
+        # spostamento di data: conta anche quella precedente
+        date_toccate = [target.data, *(inspect(target).attrs.data.history.deleted or ())]
+        # senza data il movimento sta nel primo mese fotografato: vanno rifatti tutti
+        invalidate_snapshots(conn, tables, datetime.min if None in date_toccate else min(date_toccate))
+
+    event.listen(movimento_cls, "after_insert", _invalida)
+    event.listen(movimento_cls, "after_update", _invalida)
+    event.listen(movimento_cls, "after_delete", _invalida)
@@ -0,0 +1,164 @@
+# app/services/mastrino_rollup.py
+"""
+Riepilogo mensile per mastrino dei documenti confermati.
+
+riepilogo_mastrino: una riga per (anno, mese, mastrino_codice, tipo_documento)
+con numero righe, quantità in millesimi e importo in unità da 1e-5 euro
+(quantità in millesimi * prezzo in centesimi, come services/reporting): interi,
+quindi somme esatte anche su SQLite.
+
+Aggiornato nella stessa transazione che cambia lo stato del documento:
+- apply_documento(+1) dal motore di conferma;
+- apply_documento(-1) quando un documento confermato cambia stato (storno,
+  annullamento) o viene cancellato, da un before_flush sulla sessione, prima
+  che le righe vengano toccate.
+Contano le righe con mastrino e documento datato (data del documento, non
+della conferma). Le cancellazioni in blocco (rotte di test) ricostruiscono.
+`flask magazzino verify-riepilogo-mastrini` confronta con le righe grezze.
+"""
+from datetime import date
+from typing import List, Optional
+
+from sqlalchemy import select, insert, update, delete, func, cast, event, inspect, Integer
+from sqlalchemy.orm import Session
+
+
+def _amounts(riga):
+    qta_m = cast(func.round(riga.c.quantita * 1000), Integer)
+    return qta_m, qta_m * cast(func.round(riga.c.prezzo * 100), Integer)
+
+
+def _righe_query(tables, documento_id=None):
+    """Aggregato delle righe per (anno, mese, mastrino, tipo) dei documenti confermati (o di uno solo)."""
+    r, d = tables['riga_documento'], tables['documento']
+    qta_m, importo = _amounts(r)
+    q = (select(d.c.data, r.c.mastrino_codice, d.c.tipo,
+                func.count(r.c.id), func.sum(qta_m), func.sum(importo))
+         .join(d, d.c.id == r.c.documento_id)
+         .where(r.c.mastrino_codice.isnot(None), r.c.mastrino_codice != '')
+         .group_by(d.c.data, r.c.mastrino_codice, d.c.tipo))
+    if documento_id is not None:
+        return q.where(r.c.documento_id == documento_id)
+    return q.where(d.c.status == 'Confermato', d.c.data.isnot(None))
+
+
+def _fold(rows, sign=1) -> dict:
+    """(data, mastrino, tipo, n, qta, importo) -> {(anno, mese, mastrino, tipo): [n, qta, importo]}"""
+    out = {}
+    for giorno, mastrino, tipo, n, qta, importo in rows:
+        if isinstance(giorno, str):
+            giorno = date.fromisoformat(giorno[:10])
+        key = (giorno.year, giorno.month, mastrino, tipo)
+        acc = out.setdefault(key, [0, 0, 0])
+        acc[0] += sign * int(n or 0)
+        acc[1] += sign * int(qta or 0)
+        acc[2] += sign * int(importo or 0)
+    return out
+
+
+def apply_documento(conn, tables, documento_id: int, giorno: Optional[date], sign: int) -> None:
+    """Aggiunge (+1) o toglie (-1) le righe di un documento al riepilogo del mese di `giorno`. Non esegue commit."""
+    if 'riepilogo_mastrino' not in tables or giorno is None:
+        return
+    rows = [(giorno,) + tuple(r[1:]) for r in conn.execute(_righe_query(tables, documento_id))]
+    deltas = _fold(rows, sign)
+    if not deltas:
+        return
+    rm = tables['riepilogo_mastrino']
+    params = [{"anno": a, "mese": m, "mastrino_codice": c, "tipo_documento": t,
+               "num_righe": n, "quantita_m": q, "importo_e5": i}
+              for (a, m, c, t), (n, q, i) in deltas.items()]
+    dialect = (conn.get_bind() if hasattr(conn, 'get_bind') else conn).dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        stmt = dialect_insert(rm)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[rm.c.anno, rm.c.mese, rm.c.mastrino_codice, rm.c.tipo_documento],
+            set_={"num_righe": rm.c.num_righe + stmt.excluded.num_righe,
+                  "quantita_m": rm.c.quantita_m + stmt.excluded.quantita_m,
+                  "importo_e5": rm.c.importo_e5 + stmt.excluded.importo_e5},
+        )
+        conn.execute(stmt, params)
+        return
+    for p in params:
+        res = conn.execute(
+            update(rm).where(rm.c.anno == p["anno"], rm.c.mese == p["mese"],
+                             rm.c.mastrino_codice == p["mastrino_codice"],
+                             rm.c.tipo_documento == p["tipo_documento"])
+            .values(num_righe=rm.c.num_righe + p["num_righe"], quantita_m=rm.c.quantita_m + p["quantita_m"],
+                    importo_e5=rm.c.importo_e5 + p["importo_e5"]))
+        if res.rowcount == 0:
+            conn.execute(insert(rm), [p])
+
+
+def _attese(session, tables) -> dict:
+    return {k: v for k, v in _fold(session.execute(_righe_query(tables))).items() if v[0]}
+
+
+def rebuild_rollup(session, tables) -> int:
+    """Ricalcola da zero riepilogo_mastrino dalle righe confermate. Non esegue commit. Returns: righe scritte."""
+    rm = tables['riepilogo_mastrino']
+    rows = [{"anno": a, "mese": m, "mastrino_codice": c, "tipo_documento": t,
+             "num_righe": n, "quantita_m": q, "importo_e5": i}
+            for (a, m, c, t), (n, q, i) in sorted(_attese(session, tables).items())]
+    session.execute(delete(rm))
+    if rows:
+        session.execute(insert(rm), rows)
+    return len(rows)
+
+
+def verify_rollup(session, tables) -> List[str]:
+    """Confronta riepilogo_mastrino con le righe grezze. Returns: descrizione delle differenze."""
+    rm = tables['riepilogo_mastrino']
+    attese = _attese(session, tables)
+    presenti = {(a, m, c, t): [n, q, i] for a, m, c, t, n, q, i in session.execute(
+        select(rm.c.anno, rm.c.mese, rm.c.mastrino_codice, rm.c.tipo_documento,
+               rm.c.num_righe, rm.c.quantita_m, rm.c.importo_e5))}
+    errori = []
+    for key in sorted(attese.keys() | presenti.keys()):
+        exp = attese.get(key, [0, 0, 0])
+        got = presenti.get(key, [0, 0, 0])
+        if exp != got:
+            a, m, c, t = key
+            errori.append(f"{a}-{m:02d} {c} {t}: riepilogo righe/qta/importo {got}, atteso {exp}")
+    return errori
+
+
+def register_rollup_events(documento_cls) -> None:
+    """Toglie dal riepilogo i documenti che escono da 'Confermato' o vengono cancellati.
+    before_flush: le righe sono ancora sul DB anche quando la cancellazione le porta con sé."""
+    tables = documento_cls.metadata.tables
+
+    # data precedente disponibile anche se l'attributo era scaduto (cambio di mese)
+    event.listen(documento_cls.data, "set", lambda target, value, old, initiator: value,
+                 active_history=True, retval=True)
+
+    @event.listens_for(Session, "before_flush")
+    def _storno(session, flush_context, instances):
+        for obj in list(session.dirty):
+            if not isinstance(obj, documento_cls):
+                continue
+            state = inspect(obj)
+            status, data = state.attrs.status.history, state.attrs.data.history
+            era_confermato = 'Confermato' in (status.deleted or ()) or (
+                not status.has_changes() and obj.status == 'Confermato')
+            if not era_confermato:
+                continue
+            giorno_prima = (data.deleted or [obj.data])[0]
+            if obj.status != 'Confermato':
+                apply_documento(session, tables, obj.id, giorno_prima, -1)
+            elif data.has_changes():
+                # documento confermato spostato di data: cambia mese
+                apply_documento(session, tables, obj.id, giorno_prima, -1)
+                apply_documento(session, tables, obj.id, obj.data, 1)
+        for obj in list(session.deleted):
+            if not isinstance(obj, documento_cls):
+                continue
+            state = inspect(obj)
+            stato_db = (state.attrs.status.history.deleted or [obj.status])[0]
+            if stato_db == 'Confermato':
+                giorno = (state.attrs.data.history.deleted or [obj.data])[0]
+                apply_documento(session, tables, obj.id, giorno, -1)
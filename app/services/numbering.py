@@ -0,0 +1,68 @@
+# app/services/numbering.py
+"""
+Contatori persistenti (righe "chiave -> ultimo valore") incrementati con un
+UPDATE atomico dentro la transazione del chiamante.
+Usati per la numerazione documenti (tipo, anno) e per i codici articolo.
+Lavora a livello di tabelle (Core) come il motore di conferma, così serve
+sia i modelli di `app.models` sia quelli legacy di `app.py`.
+"""
+from datetime import date
+
+from sqlalchemy import select, insert, update, and_, func
+from sqlalchemy.exc import IntegrityError
+
+
+def ensure_counter(session, table, keys: dict, column: str, seed_fn) -> None:
+    """Crea la riga contatore se manca, inizializzata a seed_fn().
+    ON CONFLICT DO NOTHING: se una transazione concorrente la crea prima, vince la sua."""
+    cond = and_(*[table.c[k] == v for k, v in keys.items()])
+    if session.execute(select(table.c.id).where(cond)).first():
+        return
+    row = dict(keys)
+    row[column] = seed_fn()
+    dialect = session.get_bind().dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        try:
+            with session.begin_nested():
+                session.execute(insert(table), [row])
+        except IntegrityError:
+            pass
+        return
+    session.execute(dialect_insert(table).on_conflict_do_nothing(
+        index_elements=[table.c[k] for k in keys]), [row])
+
+
+def bump_counter(session, table, keys: dict, column: str, n: int = 1, seed_fn=lambda: 0) -> range:
+    """
+    Riserva n valori consecutivi. L'UPDATE è la prima scrittura della transazione:
+    su SQLite attende il lock di scrittura (busy timeout) invece di fallire, e il
+    valore letto subito dopo è già protetto dal lock fino al commit/rollback.
+    Un rollback annulla anche l'incremento, quindi non lascia buchi.
+    Returns: range dei valori riservati.
+    """
+    ensure_counter(session, table, keys, column, seed_fn)
+    cond = and_(*[table.c[k] == v for k, v in keys.items()])
+    session.execute(update(table).where(cond).values({column: table.c[column] + n}))
+    last = session.execute(select(table.c[column]).where(cond)).scalar_one()
+    return range(last - n + 1, last + 1)
+
+
+def alloc_doc_number(session, documento_cls, doc_type: str, year: int = None) -> int:
+    """Prossimo numero per (tipo, anno) dal contatore numeratore_documento.
+    Il contatore viene inizializzato una sola volta da MAX(numero) dei documenti esistenti."""
+    year = year or date.today().year
+    documento = documento_cls.__table__
+    numeratore = documento.metadata.tables['numeratore_documento']
+
+    def _seed():
+        return session.execute(
+            select(func.coalesce(func.max(documento.c.numero), 0))
+            .where(documento.c.tipo == doc_type, documento.c.anno == year)
+        ).scalar_one()
+
+    return bump_counter(session, numeratore, {"tipo": doc_type, "anno": year},
+                        "ultimo_numero", seed_fn=_seed)[0]
@@ -0,0 +1,105 @@
+# app/services/parse_cache.py
+"""
+Cache dei risultati di parsing PDF indirizzata per contenuto.
+
+Chiave: SHA-256 dei byte del PDF + parser_key ('<kind>:<versione parser/prompt>'),
+così lo stesso file ricaricato (retry, nuova anteprima, altro operatore) non
+ripete né l'estrazione con PdfReader né la chiamata LLM; cambiando versione del
+parser le vecchie righe smettono di essere lette e spariscono con l'eviction.
+
+Eviction: righe più vecchie di PARSE_CACHE_MAX_AGE_DAYS (dall'ultimo uso) e,
+oltre PARSE_CACHE_MAX_BYTES di risultati, le meno usate di recente.
+Contatori hit/miss del processo in `STATS`; per riga `hits` e `last_hit_at`.
+"""
+import json
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from ..models import ParseCache
+
+MAX_AGE_DAYS = 90
+MAX_BYTES = 64 * 1024 * 1024
+
+# campi della risposta che dipendono dal singolo upload, non dal contenuto
+UPLOAD_FIELDS = ('uploaded_file',)
+
+STATS = {'hits': 0, 'misses': 0}
+_stats_lock = threading.Lock()
+
+
+def _count(name):
+    with _stats_lock:
+        STATS[name] += 1
+
+
+def parser_key(kind, version):
+    return f"{kind}:{version}"
+
+
+def lookup(session, sha256, key):
+    """Risultato in cache (dict) o None; su hit aggiorna hits/last_hit_at."""
+    t = ParseCache.__table__
+    row = session.execute(
+        select(t.c.id, t.c.result).where(t.c.sha256 == sha256, t.c.parser_key == key)
+    ).first()
+    if row is None:
+        _count('misses')
+        return None
+    session.execute(update(t).where(t.c.id == row.id)
+                    .values(hits=t.c.hits + 1, last_hit_at=datetime.utcnow()))
+    _count('hits')
+    return json.loads(row.result)
+
+
+def store(session, sha256, key, result):
+    """Salva il risultato (senza i campi legati all'upload); se c'è già, vince la riga esistente."""
+    payload = json.dumps({k: v for k, v in result.items() if k not in UPLOAD_FIELDS}, default=str)
+    t = ParseCache.__table__
+    now = datetime.utcnow()
+    try:
+        with session.begin_nested():
+            session.execute(insert(t).values(sha256=sha256, parser_key=key, result=payload,
+                                             size=len(payload), hits=0, created_at=now, last_hit_at=now))
+    except IntegrityError:
+        pass
+
+
+def evict(session, max_bytes=MAX_BYTES, max_age_days=MAX_AGE_DAYS):
+    """Elimina le righe scadute e poi le meno usate finché la cache sta in max_bytes. Ritorna il numero di righe eliminate."""
+    t = ParseCache.__table__
+    n = session.execute(delete(t).where(
+        t.c.last_hit_at < datetime.utcnow() - timedelta(days=max_age_days))).rowcount or 0
+    total = session.execute(select(func.coalesce(func.sum(t.c.size), 0))).scalar()
+    if total <= max_bytes:
+        return n
+    to_delete = []
+    for row in session.execute(select(t.c.id, t.c.size).order_by(t.c.last_hit_at, t.c.id)):
+        if total <= max_bytes:
+            break
+        to_delete.append(row.id)
+        total -= row.size
+    if to_delete:
+        session.execute(delete(t).where(t.c.id.in_(to_delete)))
+    return n + len(to_delete)
+
+
+def cache_stats(session):
+    """Contatori del processo + totali persistiti in tabella."""
+    t = ParseCache.__table__
+    entries, size, stored_hits = session.execute(
+        select(func.count(t.c.id), func.coalesce(func.sum(t.c.size), 0), func.coalesce(func.sum(t.c.hits), 0))
+    ).one()
+    with _stats_lock:
+        hits, misses = STATS['hits'], STATS['misses']
+    lookups = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / lookups, 3) if lookups else None,
+        'entries': entries,
+        'size_bytes': size,
+        'stored_hits': stored_hits,
+    }
@@ -0,0 +1,355 @@
+# app/services/parse_jobs.py
+"""
+Coda di job per estrazione testo + parsing dei PDF caricati (DDT, ticket, materiali).
+
+L'upload salva il file, inserisce una riga in 'parse_job' e ritorna subito l'id;
+un pool di thread worker (per processo) preleva i job dalla tabella, esegue il
+parser e scrive il risultato. La UI interroga /importing/api/jobs/<id> oppure
+ascolta /importing/api/jobs/<id>/events (SSE).
+
+Le chiamate LLM passano da un token bucket con rate 1 / LLM_MIN_INTERVAL_SECONDS,
+condiviso da tutti i worker del processo.
+
+I parser sono registrati per 'kind' (register_parser / PARSERS) e ricevono
+(percorso assoluto, percorso relativo): nei test si passano parser finti a ParseJobQueue.
+Prima di parsare si consulta la cache per contenuto (services/parse_cache): un PDF
+già visto con la stessa versione del parser produce subito un job 'done'.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import or_, select, update
+from sqlalchemy.orm import Session
+
+from ..config import Config
+from ..extensions import db
+from ..models import ParseJob
+from . import parse_cache
+from .supplier_parsers import ddt_complete
+
+FINAL_STATUSES = ('done', 'error')
+
+# fn(abs_path, rel_path) -> dict serializzabile (il vecchio corpo della risposta);
+# version entra nella chiave della cache: va cambiata quando cambiano parser o prompt;
+# text_fn(testo, rel_path): stesso parser a testo già estratto (import multiplo, services/bulk_import);
+# con until riceve anche pagine_lette=N se l'estrazione si è fermata dopo N pagine su più;
+# until(pagine_lette) -> True: l'estrazione del testo per text_fn può fermarsi (pdf_service)
+ParserSpec = namedtuple('ParserSpec', 'fn rate_limited keep_upload version text_fn until',
+                        defaults=('1', None, None))
+
+PARSERS = {}
+
+
+def register_parser(kind, fn, rate_limited=False, keep_upload=False, version='1', text_fn=None, until=None):
+    """rate_limited: il parser chiama l'LLM; keep_upload: il file serve anche dopo (allegato DDT)."""
+    PARSERS[kind] = ParserSpec(fn, rate_limited, keep_upload, version, text_fn, until)
+
+
+class TokenBucket:
+    """Token bucket thread-safe: `rate` token al secondo, al massimo `capacity` accumulati."""
+
+    def __init__(self, rate, capacity=1.0, clock=time.monotonic, sleep=time.sleep):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self, n=1.0):
+        while True:
+            with self._lock:
+                now = self._clock()
+                self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self.tokens >= n - 1e-9:  # tolleranza sugli arrotondamenti float
+                    self.tokens = max(0.0, self.tokens - n)
+                    return
+                wait = (n - self.tokens) / self.rate
+            self._sleep(wait)
+
+
+def bucket_from_config(config):
+    interval = float(config.get('LLM_MIN_INTERVAL_SECONDS', Config.LLM_MIN_INTERVAL_SECONDS))
+    if interval <= 0:
+        return None
+    return TokenBucket(rate=1.0 / interval, capacity=1.0)
+
+
+class ParseJobQueue:
+    """Pool di worker che esegue i ParseJob di questo processo."""
+
+    def __init__(self, app, workers=2, parsers=None, bucket=None, poll_interval=2.0,
+                 cache_max_bytes=parse_cache.MAX_BYTES, cache_max_age_days=parse_cache.MAX_AGE_DAYS,
+                 job_timeout=Config.PARSE_JOB_TIMEOUT_SECONDS):
+        self.app = app
+        self.workers = workers
+        self.parsers = PARSERS if parsers is None else parsers
+        self.bucket = bucket
+        self.poll_interval = poll_interval
+        self.job_timeout = job_timeout
+        self.cache_max_bytes = cache_max_bytes
+        self.cache_max_age_days = cache_max_age_days
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._threads = []
+        self._start_lock = threading.Lock()
+
+    # --- ciclo di vita ---
+
+    def start(self):
+        with self._start_lock:
+            if self._threads:
+                return
+            with self.app.app_context():
+                self._requeue_stale()
+            self._stop.clear()
+            for i in range(self.workers):
+                t = threading.Thread(target=self._worker_loop, name=f"parse-job-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    def notify(self):
+        with self._cond:
+            self._cond.notify()
+
+    # --- accodamento ---
+
+    def enqueue(self, kind, file_path, uploaded_file=None, filename=None, sha256=None):
+        """Inserisce il job (commit incluso) e ritorna l'id. Con sha256 in cache il job
+        nasce già 'done' e nessun worker viene coinvolto."""
+        spec = self.parsers.get(kind)
+        if spec is None:
+            raise ValueError(f"Tipo di parsing non supportato: {kind}")
+        job = ParseJob(id=uuid.uuid4().hex, kind=kind, status='queued', filename=filename,
+                       file_path=file_path, uploaded_file=uploaded_file, sha256=sha256)
+        cached = self._cached(db.session, spec, kind, sha256, uploaded_file)
+        if cached is not None:
+            now = datetime.utcnow()
+            job.status, job.result, job.started_at, job.finished_at = 'done', json.dumps(cached, default=str), now, now
+            self._discard_upload(spec, file_path)
+        db.session.add(job)
+        db.session.commit()
+        if cached is None:
+            self.start()
+            self.notify()
+        return job.id
+
+    # --- parsing (con cache) ---
+
+    def _cached(self, session, spec, kind, sha256, uploaded_file):
+        if not sha256:
+            return None
+        cached = parse_cache.lookup(session, sha256, parse_cache.parser_key(kind, spec.version))
+        if cached is not None and uploaded_file is not None:
+            cached['uploaded_file'] = uploaded_file
+        return cached
+
+    def parse(self, kind, file_path, uploaded_file=None, sha256=None):
+        """Parsing sincrono con cache: usato dai worker e da chi non passa dalla coda.
+        La cache si legge e si scrive con una sessione propria, fuori dalla transazione
+        del chiamante (che non viene né chiusa né committata)."""
+        spec = self.parsers.get(kind)
+        if spec is None:
+            raise ValueError(f"Tipo di parsing non supportato: {kind}")
+        with Session(db.engine) as session, session.begin():
+            cached = self._cached(session, spec, kind, sha256, uploaded_file)
+        if cached is not None:
+            return cached
+        if spec.rate_limited and self.bucket is not None:
+            self.bucket.acquire()
+        result = spec.fn(file_path, uploaded_file)
+        if sha256 and isinstance(result, dict):
+            with Session(db.engine) as session, session.begin():
+                parse_cache.store(session, sha256, parse_cache.parser_key(kind, spec.version), result)
+                parse_cache.evict(session, self.cache_max_bytes, self.cache_max_age_days)
+        return result
+
+    @staticmethod
+    def _discard_upload(spec, file_path):
+        if spec.keep_upload:
+            return
+        try:
+            os.remove(file_path)
+        except OSError:
+            pass
+
+    # --- worker ---
+
+    def _requeue_stale(self):
+        # job 'running' da oltre job_timeout: il processo che li aveva presi è terminato.
+        # Quelli più recenti possono essere di un altro processo web ancora al lavoro
+        t = ParseJob.__table__
+        limite = datetime.utcnow() - timedelta(seconds=self.job_timeout)
+        db.session.execute(update(t).where(t.c.status == 'running',
+                                           or_(t.c.started_at < limite, t.c.started_at.is_(None)))
+                           .values(status='queued'))
+        db.session.commit()
+
+    def _claim(self):
+        """Prende il job in coda più vecchio con un UPDATE condizionato: un solo worker lo ottiene."""
+        t = ParseJob.__table__
+        oldest = select(t.c.id).where(t.c.status == 'queued') \
+            .order_by(t.c.created_at, t.c.id).limit(1).scalar_subquery()
+        job_id = db.session.execute(
+            update(t).where(t.c.id == oldest, t.c.status == 'queued')
+            .values(status='running', started_at=datetime.utcnow(), attempts=t.c.attempts + 1)
+            .returning(t.c.id)
+        ).scalar()
+        db.session.commit()
+        return job_id
+
+    def _worker_loop(self):
+        while not self._stop.is_set():
+            try:
+                with self.app.app_context():
+                    job_id = self._claim()
+                    if job_id:
+                        self.run_job(job_id)
+                        continue
+                    self._requeue_stale()
+            except Exception:
+                self.app.logger.exception("Errore nel worker dei parse job")
+            with self._cond:
+                self._cond.wait(self.poll_interval)
+
+    def run_job(self, job_id):
+        """Esegue un job già 'running' (in app context). Il parser gira fuori da transazioni."""
+        job = db.session.get(ParseJob, job_id)
+        kind, file_path, uploaded_file, sha256 = job.kind, job.file_path, job.uploaded_file, job.sha256
+        db.session.commit()
+
+        spec = self.parsers.get(kind)
+        values = {}
+        try:
+            # un duplicato accodato mentre l'originale era in corso qui trova già la cache
+            result = self.parse(kind, file_path, uploaded_file, sha256=sha256)
+            values.update(status='done', result=json.dumps(result, default=str), error=None)
+        except Exception as e:
+            db.session.rollback()
+            self.app.logger.exception("Parse job %s (%s) fallito", job_id, kind)
+            values.update(status='error', error=str(e))
+        finally:
+            if spec is not None:
+                self._discard_upload(spec, file_path)
+        values['finished_at'] = datetime.utcnow()
+        t = ParseJob.__table__
+        db.session.execute(update(t).where(t.c.id == job_id).values(**values))
+        db.session.commit()
+
+
+def get_parse_queue(app=None):
+    """Coda del processo, creata alla prima richiesta con PARSE_JOB_WORKERS worker."""
+    app = app or current_app._get_current_object()
+    queue = app.extensions.get('parse_jobs')
+    if queue is None:
+        queue = ParseJobQueue(
+            app,
+            workers=int(app.config.get('PARSE_JOB_WORKERS', Config.PARSE_JOB_WORKERS)),
+            bucket=bucket_from_config(app.config),
+            poll_interval=float(app.config.get('PARSE_JOB_POLL_SECONDS', Config.PARSE_JOB_POLL_SECONDS)),
+            cache_max_bytes=int(app.config.get('PARSE_CACHE_MAX_BYTES', Config.PARSE_CACHE_MAX_BYTES)),
+            cache_max_age_days=int(app.config.get('PARSE_CACHE_MAX_AGE_DAYS', Config.PARSE_CACHE_MAX_AGE_DAYS)),
+            job_timeout=float(app.config.get('PARSE_JOB_TIMEOUT_SECONDS', Config.PARSE_JOB_TIMEOUT_SECONDS)),
+        )
+        app.extensions['parse_jobs'] = queue
+    return queue
+
+
+def submit_upload(file_storage, kind):
+    """Salva il PDF caricato e accoda il job (o lo chiude subito da cache); ritorna l'id."""
+    from .file_service import save_upload, get_file_hash
+    category = "incoming_ddt" if kind == "ddt" else f"incoming_{kind}"
+    rel_path, abs_path = save_upload(file_storage, category=category)
+    return get_parse_queue().enqueue(kind, abs_path, uploaded_file=rel_path,
+                                     filename=file_storage.filename, sha256=get_file_hash(abs_path))
+
+
+def parse_file(kind, file_path, uploaded_file=None):
+    """Parsing sincrono di un file già salvato, con cache per contenuto."""
+    from .file_service import get_file_hash
+    return get_parse_queue().parse(kind, file_path, uploaded_file, sha256=get_file_hash(file_path))
+
+
+def job_status(job_id):
+    """Stato del job in forma JSON-friendly, None se non esiste."""
+    job = db.session.get(ParseJob, job_id)
+    if job is None:
+        return None
+    return {
+        'ok': job.status != 'error',
+        'job_id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'filename': job.filename,
+        'result': json.loads(job.result) if job.result else None,
+        'error': job.error,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+# --- parser predefiniti ---
+
+def _parse_ddt_text(raw_text, uploaded_file, pagine_lette=None):
+    from .supplier_parsers import parse_supplier_specific
+    data, method = parse_supplier_specific(raw_text)
+    if pagine_lette:
+        # le pagine successive non sono state lette: va detto, se mancano righe si vede perché
+        motivo = "fine DDT" if ddt_complete([raw_text]) else "limite di lettura del PDF"
+        method = f"{method}; testo letto fino a pagina {pagine_lette} ({motivo}), pagine successive saltate"
+    resp = {"ok": True, "type": "ddt", "data": data, "uploaded_file": uploaded_file, "method": method}
+    if method:
+        resp["note"] = method
+    if pagine_lette:
+        resp["pagine_lette"] = pagine_lette
+    return resp
+
+
+def _parse_ddt(file_path, uploaded_file):
+    from .pdf_service import join_pages
+    from .text_cache import extract_pages
+    pages, complete = extract_pages(file_path, until=ddt_complete)
+    return _parse_ddt_text(join_pages(pages), uploaded_file, None if complete else len(pages))
+
+
+def _llm_parser_text(kind):
+    def parse(raw_text, uploaded_file):
+        try:
+            from .parsing_service import build_prompt, call_gemini
+        except ImportError as e:
+            raise RuntimeError(f"Parsing LLM non disponibile: {e}")
+        return {"ok": True, "type": kind, "data": call_gemini(build_prompt(kind, raw_text))}
+    return parse
+
+
+def _llm_parser(kind):
+    parse_text = _llm_parser_text(kind)
+
+    def parse(file_path, uploaded_file):
+        from .text_cache import extract_text
+        return parse_text(extract_text(file_path), uploaded_file)
+    return parse
+
+
+register_parser("ddt", _parse_ddt, keep_upload=True, version="supplier-5", text_fn=_parse_ddt_text,
+                until=ddt_complete)
+register_parser("ticket", _llm_parser("ticket"), rate_limited=True, version="llm-1",
+                text_fn=_llm_parser_text("ticket"))
+register_parser("materiali", _llm_parser("materiali"), rate_limited=True, version="llm-1",
+                text_fn=_llm_parser_text("materiali"))
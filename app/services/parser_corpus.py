@@ -0,0 +1,98 @@
+# app/services/parser_corpus.py
+"""
+Banco di prova dei parser fornitore (`flask magazzino parser-corpus <dir>`).
+
+Il corpus è una cartella di coppie <nome>.json + <nome>.txt (testo già estratto)
+oppure <nome>.pdf. Il JSON contiene il risultato atteso:
+    {"parser": "duotermica" | null, "righe": [{"codice", "quantita", "prezzo_unitario"}, ...]}
+("parser": null = fornitore non registrato, deve finire nel parser generico).
+
+Per ogni parser atteso il report indica quanti documenti sono stati
+riconosciuti, le righe corrette (codice, quantità e prezzo uguali; le righe in
+più contano come errori) e la velocità, misurata sul solo parsing del testo.
+"""
+import json
+import time
+from pathlib import Path
+
+from .supplier_parsers import detect_supplier, parse_supplier_specific
+
+GENERIC = "generico"
+TOLERANCE = 0.005
+
+
+def load_corpus(directory):
+    """Lista di (nome, testo, atteso) ordinata per nome."""
+    from .pdf_service import extract_text_from_pdf
+
+    out = []
+    for spec in sorted(Path(directory).glob('*.json')):
+        txt, pdf = spec.with_suffix('.txt'), spec.with_suffix('.pdf')
+        if txt.exists():
+            text = txt.read_text(encoding='utf-8')
+        elif pdf.exists():
+            text = extract_text_from_pdf(str(pdf))
+        else:
+            continue
+        out.append((spec.stem, text, json.loads(spec.read_text(encoding='utf-8'))))
+    return out
+
+
+def _same(a, b):
+    try:
+        return abs(float(a) - float(b)) <= TOLERANCE
+    except (TypeError, ValueError):
+        return a == b
+
+
+def match_rows(expected, got):
+    """Righe attese ritrovate (ognuna al più una volta) nell'output del parser."""
+    remaining = list(got)
+    found = 0
+    for e in expected:
+        for i, g in enumerate(remaining):
+            if (str(g.get('codice')) == str(e.get('codice'))
+                    and _same(g.get('quantita'), e.get('quantita'))
+                    and _same(g.get('prezzo_unitario'), e.get('prezzo_unitario'))):
+                found += 1
+                del remaining[i]
+                break
+    return found
+
+
+def evaluate_corpus(directory, repeat=1):
+    """
+    Report per parser atteso:
+    {nome: {"documenti", "riconosciuti", "righe_attese", "righe_estratte", "righe_corrette",
+            "accuratezza", "secondi", "doc_al_secondo"}} + "errori": [(file, motivo)].
+    """
+    repeat = max(1, int(repeat))
+    report, errori = {}, []
+    for name, text, expected in load_corpus(directory):
+        atteso = expected.get('parser') or GENERIC
+        row = report.setdefault(atteso, {'documenti': 0, 'riconosciuti': 0, 'righe_attese': 0,
+                                         'righe_estratte': 0, 'righe_corrette': 0, 'secondi': 0.0})
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            data, _method = parse_supplier_specific(text)
+        row['secondi'] += (time.perf_counter() - t0) / repeat
+
+        rilevato = detect_supplier(text) or GENERIC
+        righe = data.get('righe') or []
+        corrette = match_rows(expected.get('righe') or [], righe)
+        row['documenti'] += 1
+        row['riconosciuti'] += rilevato == atteso
+        row['righe_attese'] += len(expected.get('righe') or [])
+        row['righe_estratte'] += len(righe)
+        row['righe_corrette'] += corrette
+        if rilevato != atteso:
+            errori.append((name, f"riconosciuto {rilevato}, atteso {atteso}"))
+        elif corrette != len(expected.get('righe') or []) or len(righe) != corrette:
+            errori.append((name, f"{corrette} righe corrette su {len(expected.get('righe') or [])} "
+                                 f"(estratte {len(righe)})"))
+
+    for row in report.values():
+        den = max(row['righe_attese'], row['righe_estratte'])
+        row['accuratezza'] = row['righe_corrette'] / den if den else 1.0
+        row['doc_al_secondo'] = row['documenti'] / row['secondi'] if row['secondi'] else None
+    return {'parsers': report, 'errori': errori}
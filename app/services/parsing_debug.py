@@ -1,6 +1,10 @@
 import json
 from flask import current_app
 
+from .blob_store import upload_abs_path
+from .supplier_parsers import detect_supplier, parse_supplier_specific
+from .text_cache import extract_text
+
 def debug_parse_result(raw_text, parsed_data):
     """Debug helper per capire cosa viene estratto"""
     debug_info = {
@@ -16,3 +20,12 @@ def debug_parse_result(raw_text, parsed_data):
         json.dump(debug_info, f, indent=2, default=str)
     
     return debug_info
+
+
+def debug_upload(rel_upload):
+    """Debug di un PDF già caricato: testo dalla cache (services/text_cache), senza rileggere il PDF."""
+    raw_text = extract_text(upload_abs_path(rel_upload))
+    parsed_data, method = parse_supplier_specific(raw_text)
+    info = debug_parse_result(raw_text, parsed_data)
+    info.update({"uploaded_file": rel_upload, "supplier": detect_supplier(raw_text), "method": method})
+    return info
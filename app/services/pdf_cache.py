@@ -0,0 +1,187 @@
+# app/services/pdf_cache.py
+"""
+Cache su disco dei PDF generati da pdf_export (DDT semplice e DDT + originale).
+
+Chiave: id documento + versione del contenuto, cioè un hash di tutto ciò che
+finisce nel PDF (intestazione, partner, magazzino, righe, allegati) più
+RENDER_VERSION. Un documento confermato non cambia più, quindi il PDF si genera
+una volta; su una bozza ogni modifica alle righe cambia la versione e il file
+vecchio viene sostituito alla scrittura successiva.
+
+Alla conferma (docops.api_confirm_document) prerender_async genera in background
+entrambi i PDF, così la ristampa di un mese di DDT legge solo file già pronti.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from io import BytesIO
+from pathlib import Path
+
+from flask import current_app
+from sqlalchemy import select
+
+from ..extensions import db
+from ..models import Articolo, Documento, RigaDocumento
+from .blob_store import attachment_abs_path, upload_root
+from .pdf_export import export_document_pdf
+
+# da incrementare quando cambia il layout di pdf_export
+RENDER_VERSION = '1'
+
+STATS = {'hits': 0, 'misses': 0}
+_stats_lock = threading.Lock()
+
+
+def _count(name):
+    with _stats_lock:
+        STATS[name] += 1
+
+
+def cache_root() -> Path:
+    folder = current_app.config.get('PDF_CACHE_FOLDER')
+    return Path(folder) if folder else upload_root() / 'pdf_cache'
+
+
+def content_version(doc, kind='ddt') -> str:
+    """Hash (16 hex) dei dati che compaiono nel PDF del documento."""
+    riga, articolo = RigaDocumento.__table__, Articolo.__table__
+    h = hashlib.sha256()
+
+    def feed(*values):
+        h.update(repr(values).encode('utf-8'))
+
+    feed(RENDER_VERSION, kind, doc.id, doc.tipo, doc.numero, doc.anno, doc.data,
+         doc.partner.nome if doc.partner else None,
+         doc.magazzino.codice if doc.magazzino else None,
+         doc.magazzino.nome if doc.magazzino else None)
+    for a in sorted(doc.allegati, key=lambda a: a.id):
+        feed(a.id, a.filename, a.mime, a.blob_sha256 if kind == 'completo' else None)
+    rows = db.session.execute(
+        select(riga.c.id, articolo.c.codice_interno, riga.c.descrizione, riga.c.quantita,
+               riga.c.prezzo, riga.c.mastrino_codice)
+        .join(articolo, articolo.c.id == riga.c.articolo_id, isouter=True)
+        .where(riga.c.documento_id == doc.id)
+        .order_by(riga.c.id)
+    )
+    for r in rows:
+        feed(*r)
+    return h.hexdigest()[:16]
+
+
+def _doc_dir(doc_id) -> Path:
+    return cache_root() / str(doc_id)
+
+
+def _write(doc_id, kind, version, data: bytes):
+    """Scrittura atomica; elimina le versioni precedenti dello stesso tipo."""
+    folder = _doc_dir(doc_id)
+    folder.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=folder, prefix='.tmp-')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    target = folder / f'{kind}-{version}.pdf'
+    os.replace(tmp, target)
+    for old in folder.glob(f'{kind}-*.pdf'):
+        if old != target:
+            old.unlink(missing_ok=True)
+
+
+def cached_file(doc, kind, version=None):
+    """Percorso del PDF in cache se aggiornato, altrimenti None."""
+    path = _doc_dir(doc.id) / f'{kind}-{version or content_version(doc, kind)}.pdf'
+    return path if path.is_file() else None
+
+
+def store(doc, kind, data: bytes, version=None):
+    """Salva un PDF già generato (es. da un processo del pool di batch_pdf)."""
+    try:
+        _write(doc.id, kind, version or content_version(doc, kind), data)
+    except OSError as e:
+        current_app.logger.warning(f"Cache PDF non scritta per documento {doc.id}: {e}")
+
+
+def get_or_render(doc, kind, render) -> bytes:
+    version = content_version(doc, kind)
+    path = _doc_dir(doc.id) / f'{kind}-{version}.pdf'
+    try:
+        data = path.read_bytes()
+        _count('hits')
+        return data
+    except FileNotFoundError:
+        pass
+    _count('misses')
+    data = render()
+    store(doc, kind, data, version)
+    return data
+
+
+def document_pdf(doc) -> bytes:
+    """PDF del documento (pdf_export.export_document_pdf), dalla cache se aggiornato."""
+    return get_or_render(doc, 'ddt', lambda: export_document_pdf(doc))
+
+
+def _original_pdf(doc):
+    """PDF originale da accodare: allegato del DDT_IN o DDT_IN di origine del DDT_OUT."""
+    if doc.tipo == 'DDT_IN':
+        for allegato in doc.allegati:
+            if allegato.mime == 'application/pdf':
+                path = attachment_abs_path(allegato)
+                if path.exists():
+                    return path.read_bytes()
+    elif doc.tipo == 'DDT_OUT' and getattr(doc, 'documento_origine_id', None):
+        doc_in = db.session.get(Documento, doc.documento_origine_id)
+        if doc_in:
+            return document_pdf(doc_in)
+    return None
+
+
+def _render_combined(doc) -> bytes:
+    import pypdf
+
+    ddt_pdf = document_pdf(doc)
+    original_pdf = _original_pdf(doc)
+    if not original_pdf:
+        return ddt_pdf
+    merger = pypdf.PdfWriter()
+    merger.append(BytesIO(ddt_pdf))
+    merger.append(BytesIO(original_pdf))
+    output = BytesIO()
+    merger.write(output)
+    return output.getvalue()
+
+
+def combined_pdf(doc) -> bytes:
+    """DDT + documento originale in un unico PDF; riusa il PDF del DDT già in cache."""
+    return get_or_render(doc, 'completo', lambda: _render_combined(doc))
+
+
+def invalidate(doc_id):
+    """Rimuove tutti i PDF in cache del documento (es. bozza eliminata)."""
+    shutil.rmtree(_doc_dir(doc_id), ignore_errors=True)
+
+
+def prerender(doc):
+    document_pdf(doc)
+    combined_pdf(doc)
+
+
+def prerender_async(doc_id, app=None):
+    """Genera in un thread i PDF di un documento appena confermato (dopo il commit)."""
+    app = app or current_app._get_current_object()
+
+    def run():
+        with app.app_context():
+            try:
+                doc = db.session.get(Documento, doc_id)
+                if doc is not None:
+                    prerender(doc)
+            except Exception:
+                app.logger.exception(f"Pre-render PDF documento {doc_id} fallito")
+            finally:
+                db.session.remove()
+
+    t = threading.Thread(target=run, name=f"pdf-prerender-{doc_id}", daemon=True)
+    t.start()
+    return t
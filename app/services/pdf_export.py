@@ -8,7 +8,29 @@ from decimal import Decimal
 
 from ..models import Documento, RigaDocumento
 
+def document_snapshot(doc: Documento) -> dict:
+    """Dati del documento che finiscono nel PDF, come tipi semplici (serializzabili con pickle:
+    render_document_pdf può girare in un processo separato, vedi services/batch_pdf)."""
+    partner_type = "Cliente" if doc.tipo == "DDT_OUT" else "Fornitore"
+    return {
+        'title': f"Documento {doc.tipo} N. {doc.numero}/{doc.anno}" if doc.numero else f"Documento {doc.tipo} (Bozza)",
+        'header': [
+            ["Data Documento:", doc.data.strftime('%d/%m/%Y') if doc.data else "N/A"],
+            [f"{partner_type}:", doc.partner.nome if doc.partner else "N/A"],
+            ["Magazzino:", f"{doc.magazzino.codice} - {doc.magazzino.nome}" if doc.magazzino else "N/A"],
+        ],
+        'allegati': [a.filename for a in doc.allegati],
+        'righe': [
+            (r.articolo.codice_interno if r.articolo else '', r.descrizione or '',
+             r.quantita or Decimal('0'), r.prezzo or Decimal('0'), r.mastrino_codice or '')
+            for r in doc.righe.order_by(RigaDocumento.id).all()
+        ],
+    }
+
 def export_document_pdf(doc: Documento) -> bytes:
+    return render_document_pdf(document_snapshot(doc))
+
+def render_document_pdf(data: dict) -> bytes:
     buffer = BytesIO()
     doc_template = SimpleDocTemplate(buffer, pagesize=letter)
     
@@ -16,18 +38,11 @@ def export_document_pdf(doc: Documento) -> bytes:
     story = []
 
     # Titolo
-    title_str = f"Documento {doc.tipo} N. {doc.numero}/{doc.anno}" if doc.numero else f"Documento {doc.tipo} (Bozza)"
-    story.append(Paragraph(title_str, styles['h1']))
+    story.append(Paragraph(data['title'], styles['h1']))
     story.append(Spacer(1, 0.2*inch))
 
     # Dettagli intestazione
-    partner_type = "Cliente" if doc.tipo == "DDT_OUT" else "Fornitore"
-    header_data = [
-        ["Data Documento:", doc.data.strftime('%d/%m/%Y') if doc.data else "N/A"],
-        [f"{partner_type}:", doc.partner.nome if doc.partner else "N/A"],
-        ["Magazzino:", f"{doc.magazzino.codice} - {doc.magazzino.nome}" if doc.magazzino else "N/A"],
-    ]
-    header_table = Table(header_data, colWidths=[1.5*inch, 4*inch])
+    header_table = Table(data['header'], colWidths=[1.5*inch, 4*inch])
     header_table.setStyle(TableStyle([
         ('ALIGN', (0,0), (0,-1), 'RIGHT'),
         ('VALIGN', (0,0), (-1,-1), 'TOP'),
@@ -37,35 +52,30 @@ def export_document_pdf(doc: Documento) -> bytes:
     story.append(Spacer(1, 0.1*inch))
 
     # Info Allegati
-    if doc.allegati:
-        allegati_str = "Allegati: " + ", ".join([a.filename for a in doc.allegati])
+    if data['allegati']:
+        allegati_str = "Allegati: " + ", ".join(data['allegati'])
         story.append(Paragraph(allegati_str, styles['Normal']))
         story.append(Spacer(1, 0.2*inch))
     else:
         story.append(Spacer(1, 0.3*inch))
 
 
-    # Tabella righe
-    rows = doc.righe.order_by(RigaDocumento.id).all()
-    
     # Intestazioni tabella - Aggiunto Mastrino
     table_data = [
         ["Codice", "Descrizione", "Q.tà", "Prezzo", "Mastrino", "Totale"]
     ]
     
     # Dati righe - Aggiunto Mastrino
-    for r in rows:
+    for codice, descrizione, quantita, prezzo, mastrino in data['righe']:
         # Calcolo sicuro del totale
-        quantita = r.quantita or Decimal('0')
-        prezzo = r.prezzo or Decimal('0')
         totale_riga = quantita * prezzo
         
         table_data.append([
-            r.articolo.codice_interno if r.articolo else '',
-            Paragraph(r.descrizione or '', styles['Normal']),
+            codice,
+            Paragraph(descrizione, styles['Normal']),
             f"{quantita:.2f}",
             f"{prezzo:.2f}",
-            r.mastrino_codice or '',
+            mastrino,
             f"{totale_riga:.2f}"
         ])
 
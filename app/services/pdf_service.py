@@ -1,4 +1,105 @@
-"""Servizio per elaborazione PDF - placeholder"""
+"""Servizio per elaborazione PDF"""
+import logging
+import re
+import time
+
+from flask import current_app, has_app_context
+from pypdf import PdfReader
+
+from ..config import Config
+
+logger = logging.getLogger(__name__)
+
+_SPACES_RE = re.compile(r"[ \t]+")
+_BLANK_LINES_RE = re.compile(r"\n{2,}")
+
+
+def _limit(name, value):
+    if value is not None:
+        return value
+    if has_app_context():
+        return current_app.config.get(name, getattr(Config, name))
+    return getattr(Config, name)
+
+
+def iter_pdf_pages(source, start=0, max_pages=None, max_bytes=None, info=None):
+    """
+    Testo normalizzato di una pagina alla volta (FileStorage, file-like o percorso),
+    a partire dalla pagina `start` (0 = prima).
+    pypdf decodifica la pagina solo quando viene letta: chi smette di iterare
+    non paga le pagine successive (es. condizioni generali in coda ai DDT).
+    Si ferma oltre PDF_MAX_PAGES pagine o PDF_MAX_TEXT_BYTES byte di testo
+    (contati sulle pagine lette da questa chiamata).
+    info: dict facoltativo in cui viene scritto il numero di pagine del PDF ('pagine').
+    """
+    max_pages = int(_limit('PDF_MAX_PAGES', max_pages))
+    max_bytes = int(_limit('PDF_MAX_TEXT_BYTES', max_bytes))
+    if hasattr(source, "stream"):
+        source.stream.seek(0)
+        source = source.stream
+    reader = PdfReader(source)
+    total = len(reader.pages)
+    if info is not None:
+        info['pagine'] = total
+    size = 0
+    for i in range(start, total):
+        if max_pages and i >= max_pages:
+            logger.warning(f"PDF troncato: lette {max_pages} pagine su {total}")
+            return
+        t0 = time.perf_counter()
+        try:
+            text = reader.pages[i].extract_text() or ""
+        except Exception as e:
+            logger.warning(f"Pagina {i + 1}/{total} illeggibile: {e}")
+            text = ""
+        text = _BLANK_LINES_RE.sub("\n", _SPACES_RE.sub(" ", text)).strip()
+        logger.debug(f"Pagina {i + 1}/{total}: {len(text)} caratteri in {time.perf_counter() - t0:.3f}s")
+        size += len(text.encode("utf-8"))
+        if max_bytes and size > max_bytes:
+            logger.warning(f"PDF troncato: oltre {max_bytes} byte di testo alla pagina {i + 1} su {total}")
+            return
+        yield text
+
+
+def read_pages(source, until=None, pages=None, max_pages=None, max_bytes=None):
+    """
+    Legge le pagine dopo quelle già note (`pages`, es. dalla cache del testo)
+    finché until(pagine_lette) non ritorna True.
+    Ritorna (pagine, completo): completo=False se la lettura si è fermata prima
+    dell'ultima pagina del PDF, per until o per i limiti PDF_MAX_PAGES/PDF_MAX_TEXT_BYTES.
+    """
+    t0 = time.perf_counter()
+    pages = list(pages or [])
+    already = len(pages)
+    max_bytes = int(_limit('PDF_MAX_TEXT_BYTES', max_bytes))
+    if max_bytes:
+        # il limite vale sul testo complessivo, anche riprendendo dalle pagine già note
+        max_bytes -= sum(len(p.encode("utf-8")) for p in pages)
+        if max_bytes <= 0:
+            return pages, False
+    info = {}
+    for text in iter_pdf_pages(source, start=already, max_pages=max_pages, max_bytes=max_bytes, info=info):
+        pages.append(text)
+        if until is not None and until(pages):
+            break
+    complete = len(pages) >= info.get('pagine', 0)
+    logger.info(f"Testo PDF: {len(pages) - already} pagine in {time.perf_counter() - t0:.3f}s")
+    return pages, complete
+
+
+def join_pages(pages) -> str:
+    return "\n".join(p for p in pages if p)
+
+
+def extract_text_from_pdf(source, until=None, max_pages=None, max_bytes=None) -> str:
+    """
+    Estrae il testo delle pagine (FileStorage, file-like o percorso).
+    until(pagine_lette) -> True interrompe la lettura dopo l'ultima pagina
+    (es. supplier_parsers.ddt_complete: totale del DDT trovato).
+    Per i file già caricati services/text_cache evita di rileggere il PDF.
+    """
+    return join_pages(read_pages(source, until, max_pages=max_pages, max_bytes=max_bytes)[0])
+
 
 def parse_pdf_ddt(file_path):
     """Parse DDT PDF - da implementare"""
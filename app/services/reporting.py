@@ -0,0 +1,268 @@
+# app/services/reporting.py
+"""
+Report sulle righe dei documenti confermati, aggregati per colonne con pandas.
+
+Le righe del periodo arrivano in un DataFrame con quantità e prezzi già interi
+(millesimi e centesimi, convertiti in SQL): i group-by per mastrino, partner,
+mese e magazzino sommano interi senza passare riga per riga da Decimal a float,
+e solo i totali aggregati tornano Decimal.
+
+Cache per processo, per tipo di report e filtri. La chiave comprende la
+generazione dei dati (contatore 'report' in contatore_dashboard, vedi
+stock_summary.invalidate_reports), incrementata dal motore di conferma e
+quando un documento esce dallo stato 'Confermato': una conferma in un altro
+processo invalida anche la cache di questo. Senza contatore (nessuna conferma dopo un
+reset) la cache non viene usata.
+"""
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Callable, List, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select, func, cast, Integer
+
+from .stock_summary import CHIAVE_REPORT
+
+CACHE_SIZE = 32
+
+# raggruppamenti disponibili: nome -> colonne del DataFrame
+GROUPS = {
+    'mastrino': ['mastrino_codice'],
+    'partner': ['partner_id'],
+    'mese': ['mese'],
+    'magazzino': ['magazzino_id'],
+}
+
+STATS = {'hits': 0, 'misses': 0}
+
+_cache: "OrderedDict[tuple, list]" = OrderedDict()
+_lock = threading.Lock()
+
+_COLUMNS = ['documento_id', 'tipo', 'data', 'partner_id', 'magazzino_id', 'mastrino_codice',
+            'articolo_id', 'qta_m', 'prezzo_c']
+
+
+# --- caricamento e aggregazione ---
+
+def load_righe(session, tables, date_from: Optional[date] = None, date_to: Optional[date] = None) -> pd.DataFrame:
+    """
+    Righe dei documenti confermati nel periodo come DataFrame.
+    qta_m = quantità in millesimi, prezzo_c = prezzo in centesimi,
+    importo = qta_m * prezzo_c (1e-5 euro), mese = 'AAAA-MM'.
+    """
+    r, d = tables['riga_documento'], tables['documento']
+    q = (select(r.c.documento_id, d.c.tipo, d.c.data, d.c.partner_id, d.c.magazzino_id, r.c.mastrino_codice,
+                r.c.articolo_id,
+                cast(func.round(r.c.quantita * 1000), Integer).label('qta_m'),
+                cast(func.round(r.c.prezzo * 100), Integer).label('prezzo_c'))
+         .join(d, d.c.id == r.c.documento_id)
+         .where(d.c.status == 'Confermato', d.c.tipo.in_(('DDT_IN', 'DDT_OUT'))))
+    if date_from is not None:
+        q = q.where(d.c.data >= date_from)
+    if date_to is not None:
+        q = q.where(d.c.data <= date_to)
+    df = pd.DataFrame(session.execute(q).all(), columns=_COLUMNS)
+    df['qta_m'] = df['qta_m'].fillna(0).astype('int64')
+    df['prezzo_c'] = df['prezzo_c'].fillna(0).astype('int64')
+    df['importo'] = df['qta_m'] * df['prezzo_c']
+    df['mese'] = pd.to_datetime(df['data']).dt.strftime('%Y-%m')
+    return df
+
+
+def _money(x) -> Decimal:
+    return Decimal(int(x)).scaleb(-5).quantize(Decimal('0.01'))
+
+
+def _qty(x) -> Decimal:
+    return Decimal(int(x)).scaleb(-3).quantize(Decimal('0.001'))
+
+
+def _group(df: pd.DataFrame, cols: List[str]) -> pd.DataFrame:
+    """Somme intere per gruppo: n, q_in, q_out, acquisti, vendite."""
+    entrata = (df['tipo'] == 'DDT_IN').to_numpy()
+    work = df[cols].assign(
+        n=1,
+        q_in=np.where(entrata, df['qta_m'], 0),
+        q_out=np.where(entrata, 0, df['qta_m']),
+        acquisti=np.where(entrata, df['importo'], 0),
+        vendite=np.where(entrata, 0, df['importo']),
+    )
+    return work.groupby(cols, dropna=False, sort=True).sum()
+
+
+def aggregate(df: pd.DataFrame, by: str) -> List[dict]:
+    """
+    Totali per gruppo: num_righe, quantita_entrata/uscita, saldo_quantita,
+    totale_acquisti (DDT_IN), totale_vendite (DDT_OUT). Valori Decimal.
+    """
+    cols = GROUPS[by]
+    if df.empty:
+        return []
+    g = _group(df, cols)
+    out = []
+    for key, row in zip(g.index, g.itertuples(index=False)):
+        item = dict(zip(cols, key if isinstance(key, tuple) else (key,)))
+        item = {k: (None if pd.isna(v) else v.item() if hasattr(v, 'item') else v) for k, v in item.items()}
+        out.append(_item(item, row.n, row.q_in, row.q_out, row.acquisti, row.vendite))
+    return out
+
+
+def _item(item: dict, n, q_in, q_out, acquisti, vendite) -> dict:
+    """Riga di report dalle somme intere (millesimi, 1e-5 euro)."""
+    item.update({
+        'num_righe': int(n),
+        'quantita_entrata': _qty(q_in),
+        'quantita_uscita': _qty(q_out),
+        'saldo_quantita': _qty(q_in - q_out),
+        'totale_acquisti': _money(acquisti),
+        'totale_vendite': _money(vendite),
+    })
+    return item
+
+
+def totals(rows: List[dict]) -> dict:
+    """Totali generali di un report già aggregato (poche righe)."""
+    acquisti = sum((r['totale_acquisti'] for r in rows), Decimal('0.00'))
+    vendite = sum((r['totale_vendite'] for r in rows), Decimal('0.00'))
+    return {'totale_acquisti': acquisti, 'totale_vendite': vendite, 'margine_totale': vendite - acquisti,
+            'num_righe': sum(r['num_righe'] for r in rows)}
+
+
+# --- report ---
+
+def report_per(session, tables, by: str, date_from=None, date_to=None) -> List[dict]:
+    """Righe confermate del periodo aggregate per `by` (vedi GROUPS), con le etichette del gruppo."""
+    def build():
+        rows = aggregate(load_righe(session, tables, date_from, date_to), by)
+        _label(session, tables, by, rows)
+        return rows
+    return cached(session, tables, ('per', by, date_from, date_to), build)
+
+
+def _mesi_interi(date_from, date_to):
+    """Mesi (anno*12 + mese - 1) interamente nel periodo e tratti parziali da leggere dalle righe."""
+    lo = None if date_from is None else date_from.year * 12 + date_from.month - 1
+    hi = None if date_to is None else date_to.year * 12 + date_to.month - 1
+    parziali = []
+    if date_from is not None and date_from.day != 1:
+        fine_mese = date(date_from.year + (date_from.month == 12), date_from.month % 12 + 1, 1) - timedelta(days=1)
+        parziali.append((date_from, min(fine_mese, date_to) if date_to else fine_mese))
+        lo += 1
+    if date_to is not None and (date_to + timedelta(days=1)).day != 1 and (lo is None or lo <= hi):
+        parziali.append((max(date_to.replace(day=1), date_from) if date_from else date_to.replace(day=1), date_to))
+        hi -= 1
+    return lo, hi, parziali
+
+
+def _mastrini_da_riepilogo(session, tables, date_from, date_to) -> List[dict]:
+    """Totali per mastrino: mesi interi da riepilogo_mastrino, mesi parziali dalle righe."""
+    rm = tables['riepilogo_mastrino']
+    lo, hi, parziali = _mesi_interi(date_from, date_to)
+    somme = {}
+
+    def add(codice, n, q_in, q_out, acquisti, vendite):
+        acc = somme.setdefault(codice, [0, 0, 0, 0, 0])
+        for i, v in enumerate((n, q_in, q_out, acquisti, vendite)):
+            acc[i] += int(v)
+
+    if lo is None or hi is None or lo <= hi:
+        periodo = rm.c.anno * 12 + rm.c.mese - 1
+        q = (select(rm.c.mastrino_codice, rm.c.tipo_documento, func.sum(rm.c.num_righe),
+                    func.sum(rm.c.quantita_m), func.sum(rm.c.importo_e5))
+             .where(rm.c.tipo_documento.in_(('DDT_IN', 'DDT_OUT')))
+             .group_by(rm.c.mastrino_codice, rm.c.tipo_documento))
+        if lo is not None:
+            q = q.where(periodo >= lo)
+        if hi is not None:
+            q = q.where(periodo <= hi)
+        for codice, tipo, n, qta, importo in session.execute(q):
+            if tipo == 'DDT_IN':
+                add(codice, n, qta or 0, 0, importo or 0, 0)
+            else:
+                add(codice, n, 0, qta or 0, 0, importo or 0)
+    for dal, al in parziali:
+        df = load_righe(session, tables, dal, al)
+        df = df[df['mastrino_codice'].notna() & (df['mastrino_codice'] != '')]
+        if not df.empty:
+            for codice, row in _group(df, ['mastrino_codice']).iterrows():
+                add(codice, row['n'], row['q_in'], row['q_out'], row['acquisti'], row['vendite'])
+    rows = [_item({'mastrino_codice': c}, *v) for c, v in sorted(somme.items()) if v[0]]
+    _label(session, tables, 'mastrino', rows)
+    return rows
+
+
+def report_mastrini(session, tables, date_from=None, date_to=None, tipo: Optional[str] = None) -> List[dict]:
+    """Acquisti e vendite per mastrino (righe con mastrino assegnato); tipo = 'ACQUISTO' | 'RICAVO' | None.
+    Con riepilogo_mastrino (services/mastrino_rollup) somma al più 12 righe per mastrino e anno."""
+    if 'riepilogo_mastrino' in tables:
+        rows = cached(session, tables, ('mastrini', date_from, date_to),
+                      lambda: _mastrini_da_riepilogo(session, tables, date_from, date_to))
+    else:
+        rows = [r for r in report_per(session, tables, 'mastrino', date_from, date_to) if r['mastrino_codice']]
+    if tipo in ('ACQUISTO', 'RICAVO'):
+        rows = [r for r in rows if r['mastrino_tipo'] == tipo]
+    # RICAVO prima di ACQUISTO, come il report precedente
+    return sorted(rows, key=lambda r: (r['mastrino_tipo'] != 'RICAVO', r['mastrino_tipo'] is None, r['mastrino_codice']))
+
+
+def _label(session, tables, by, rows) -> None:
+    if by == 'mastrino':
+        m = tables['mastrino']
+        info = {c: (desc, tipo) for c, desc, tipo in session.execute(select(m.c.codice, m.c.descrizione, m.c.tipo))}
+        for r in rows:
+            desc, tipo = info.get(r['mastrino_codice'], (None, None))
+            r['mastrino_descrizione'], r['mastrino_tipo'] = desc, tipo
+            r['etichetta'] = r['mastrino_codice'] or '(senza mastrino)'
+    elif by == 'partner':
+        p = tables['partner']
+        nomi = dict(session.execute(select(p.c.id, p.c.nome)).all())
+        for r in rows:
+            r['etichetta'] = nomi.get(r['partner_id'], f"#{r['partner_id']}")
+    elif by == 'magazzino':
+        m = tables['magazzino']
+        codici = dict(session.execute(select(m.c.id, m.c.codice)).all())
+        for r in rows:
+            r['etichetta'] = codici.get(r['magazzino_id'], f"#{r['magazzino_id']}")
+    else:
+        for r in rows:
+            r['etichetta'] = r['mese'] or '(senza data)'
+
+
+# --- cache ---
+
+def generazione(session, tables) -> Optional[int]:
+    if 'contatore_dashboard' not in tables:
+        return None
+    c = tables['contatore_dashboard']
+    return session.execute(select(c.c.valore).where(c.c.chiave == CHIAVE_REPORT)).scalar()
+
+
+def cached(session, tables, key: tuple, build: Callable[[], list]) -> list:
+    gen = generazione(session, tables)
+    if gen is None:
+        STATS['misses'] += 1
+        return build()
+    full_key = (gen, str(session.get_bind().url)) + key
+    with _lock:
+        if full_key in _cache:
+            _cache.move_to_end(full_key)
+            STATS['hits'] += 1
+            return _cache[full_key]
+    rows = build()
+    with _lock:
+        STATS['misses'] += 1
+        _cache[full_key] = rows
+        # le generazioni precedenti non verranno più lette
+        for k in [k for k in _cache if k[0] != gen]:
+            del _cache[k]
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return rows
+
+
+def clear_cache() -> None:
+    with _lock:
+        _cache.clear()
@@ -0,0 +1,167 @@
+# app/services/stock_summary.py
+"""
+Riepilogo giacenze materializzato per la dashboard.
+- riepilogo_giacenza: una riga per articolo con giacenza totale e flag under_min
+  (indicizzato), ricalcolata solo per gli articoli toccati nella stessa
+  transazione che scrive Giacenza.
+- contatore_dashboard: contatori 'bozze' e 'movimenti:<giorno>' incrementati da
+  chi scrive; se la riga non esiste viene inizializzata con un COUNT alla prima lettura.
+  'report' conta le modifiche ai documenti confermati (cache di services/reporting).
+Lavora a livello di tabelle (Core), come il motore di conferma.
+"""
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Iterable, List
+
+from sqlalchemy import select, insert, update, delete, func, event, inspect
+
+from .numbering import ensure_counter, bump_counter
+
+CHIAVE_BOZZE = "bozze"
+CHIAVE_REPORT = "report"  # generazione dei dati di services/reporting
+
+
+def chiave_movimenti(giorno: date) -> str:
+    return f"movimenti:{giorno.isoformat()}"
+
+
+def _riepilogo_rows(session, tables, articolo_ids=None) -> List[dict]:
+    a, g = tables['articolo'], tables['giacenza']
+    totale = (select(func.coalesce(func.sum(g.c.quantita), 0))
+              .where(g.c.articolo_id == a.c.id)
+              .scalar_subquery())
+    q = select(a.c.id, totale, a.c.qta_scorta_minima)
+    if articolo_ids is not None:
+        q = q.where(a.c.id.in_(articolo_ids))
+    rows = []
+    for art_id, tot, minimo in session.execute(q):
+        tot = Decimal(str(tot or 0)).quantize(Decimal('0.001'))
+        minimo = Decimal(str(minimo or 0)).quantize(Decimal('0.001'))
+        rows.append({
+            "articolo_id": art_id,
+            "quantita_totale": tot,
+            "scorta_minima": minimo,
+            "under_min": minimo > 0 and tot < minimo,
+        })
+    return rows
+
+
+def refresh_riepilogo(session, tables, articolo_ids: Iterable[int]) -> None:
+    """Ricalcola il riepilogo dei soli articoli indicati (da chiamare dopo aver scritto Giacenza
+    o cambiato la scorta minima). Non esegue commit."""
+    if 'riepilogo_giacenza' not in tables:
+        return
+    ids = sorted({i for i in articolo_ids if i is not None})
+    if not ids:
+        return
+    r = tables['riepilogo_giacenza']
+    rows = _riepilogo_rows(session, tables, ids)
+    session.execute(delete(r).where(r.c.articolo_id.in_(ids)))
+    if rows:
+        session.execute(insert(r), rows)
+
+
+def rebuild_riepilogo(session, tables) -> int:
+    """Ricostruisce da zero riepilogo_giacenza e azzera i contatori della dashboard
+    (vengono reinizializzati alla prossima lettura). Returns: righe di riepilogo."""
+    r = tables['riepilogo_giacenza']
+    rows = _riepilogo_rows(session, tables)
+    session.execute(delete(r))
+    if rows:
+        session.execute(insert(r), rows)
+    reset_dashboard(session, tables)
+    return len(rows)
+
+
+def reset_dashboard(session, tables) -> None:
+    """Cancella i contatori 'bozze' e 'movimenti:<giorno>' (reinizializzati con un COUNT
+    alla prossima lettura), da chiamare dopo cancellazioni in blocco che saltano gli
+    eventi ORM. 'report' resta: è una generazione, deve solo crescere. Non esegue commit."""
+    if 'contatore_dashboard' not in tables:
+        return
+    c = tables['contatore_dashboard']
+    session.execute(delete(c).where((c.c.chiave == CHIAVE_BOZZE) | c.c.chiave.like('movimenti:%')))
+
+
+def verify_riepilogo(session, tables) -> List[str]:
+    """Confronta riepilogo_giacenza con Giacenza. Returns: descrizione delle differenze."""
+    r = tables['riepilogo_giacenza']
+    attesi = {row["articolo_id"]: row for row in _riepilogo_rows(session, tables)}
+    presenti = {row["articolo_id"]: dict(row) for row in session.execute(select(r)).mappings()}
+    errori = []
+    for art_id, exp in attesi.items():
+        got = presenti.get(art_id)
+        if got is None:
+            # riga assente = giacenza 0 e nessuna scorta minima (es. articoli da import)
+            if exp["quantita_totale"] != 0 or exp["under_min"]:
+                errori.append(f"articolo {art_id}: riga mancante (attesa {exp['quantita_totale']})")
+            continue
+        tot = Decimal(str(got["quantita_totale"])).quantize(Decimal('0.001'))
+        if tot != exp["quantita_totale"] or bool(got["under_min"]) != exp["under_min"]:
+            errori.append(f"articolo {art_id}: riepilogo {tot}/under_min={bool(got['under_min'])}, "
+                          f"atteso {exp['quantita_totale']}/under_min={exp['under_min']}")
+    for art_id in presenti.keys() - attesi.keys():
+        errori.append(f"articolo {art_id}: riga orfana")
+    return errori
+
+
+def bump_dashboard(conn, tables, chiave: str, delta: int) -> None:
+    """Incrementa un contatore se già inizializzato; altrimenti non fa nulla
+    (il COUNT alla prima lettura includerà anche questa scrittura)."""
+    if delta == 0 or 'contatore_dashboard' not in tables:
+        return
+    c = tables['contatore_dashboard']
+    conn.execute(update(c).where(c.c.chiave == chiave).values(valore=c.c.valore + delta))
+
+
+def read_dashboard(session, tables, chiave: str, seed_fn) -> int:
+    """Legge un contatore, inizializzandolo con seed_fn() (un COUNT) se manca."""
+    c = tables['contatore_dashboard']
+    ensure_counter(session, c, {"chiave": chiave}, "valore", seed_fn)
+    return session.execute(select(c.c.valore).where(c.c.chiave == chiave)).scalar_one()
+
+
+def invalidate_reports(session, tables) -> None:
+    """Nuova generazione dei dati di report (crea il contatore se manca). Non esegue commit."""
+    if 'contatore_dashboard' not in tables:
+        return
+    bump_counter(session, tables['contatore_dashboard'], {"chiave": CHIAVE_REPORT}, "valore")
+
+
+def register_dashboard_events(documento_cls, movimento_cls) -> None:
+    """Mantiene i contatori per le scritture ORM di Documento e Movimento.
+    I movimenti inseriti in blocco dal motore di conferma sono contati lì."""
+    tables = documento_cls.metadata.tables
+
+    # carica il valore precedente di status anche se scaduto, serve a after_update
+    event.listen(documento_cls.status, "set", lambda target, value, old, initiator: value,
+                 active_history=True, retval=True)
+
+    @event.listens_for(documento_cls, "after_insert")
+    def _doc_insert(mapper, conn, target):
+        if target.status == 'Bozza':
+            bump_dashboard(conn, tables, CHIAVE_BOZZE, 1)
+
+    @event.listens_for(documento_cls, "after_update")
+    def _doc_update(mapper, conn, target):
+        hist = inspect(target).attrs.status.history
+        if not hist.has_changes():
+            return
+        prima = 'Bozza' in (hist.deleted or ())
+        dopo = target.status == 'Bozza'
+        if prima != dopo:
+            bump_dashboard(conn, tables, CHIAVE_BOZZE, 1 if dopo else -1)
+        if 'Confermato' in (hist.deleted or ()):
+            bump_dashboard(conn, tables, CHIAVE_REPORT, 1)
+
+    @event.listens_for(documento_cls, "after_delete")
+    def _doc_delete(mapper, conn, target):
+        if target.status == 'Bozza':
+            bump_dashboard(conn, tables, CHIAVE_BOZZE, -1)
+        elif target.status == 'Confermato':
+            bump_dashboard(conn, tables, CHIAVE_REPORT, 1)
+
+    @event.listens_for(movimento_cls, "after_insert")
+    def _mov_insert(mapper, conn, target):
+        giorno = (target.data or datetime.now()).date()
+        bump_dashboard(conn, tables, chiave_movimenti(giorno), 1)
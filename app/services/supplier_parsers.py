@@ -1,2 +1,317 @@
-def parse_supplier_specific(text):
-    return {"righe": []}, "Parser disabilitato"
+# app/services/supplier_parsers.py
+"""
+Parser DDT specifici per fornitore, registrati con il decoratore register_supplier.
+
+Scelta del parser: solo dall'intestazione (primi FIRST_PAGE_CHARS caratteri,
+in pratica la prima pagina) si ricavano partite IVA e parole chiave; la
+partita IVA vince sulle parole chiave. Le parole chiave di tutti i parser
+stanno in un'unica regex ricompilata a ogni registrazione, così il costo del
+riconoscimento non cresce con il numero di fornitori.
+
+Le regex dei parser sono compilate all'import del modulo. Un fornitore
+riconosciuto non passa dall'LLM; per gli altri (o se il parser specifico
+non trova righe) si usa parse_generic.
+
+ddt_complete dice all'estrazione del testo (pdf_service) quando fermarsi: dopo
+la pagina con il totale del DDT (end_markers del fornitore, altrimenti
+END_MARKERS), saltando le pagine di condizioni generali in coda. Il piè di
+pagina ("merce venduta secondo le condizioni generali...") di solito è
+stampato su ogni pagina: FOOTER_MARKERS vale solo per i fornitori che lo
+scelgono, sapendo che lì compare solo sull'ultima.
+
+Ogni parser riceve il testo completo e ritorna
+{"fornitore", "numero_ddt"?, "data"?, "righe": [{"codice", "descrizione",
+"quantita", "um", "prezzo_unitario"}]}.
+"""
+import re
+from collections import namedtuple
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+FIRST_PAGE_CHARS = 3000
+
+SupplierParser = namedtuple('SupplierParser', 'name fornitore fn partite_iva keywords end_re')
+
+PARSERS: Dict[str, SupplierParser] = {}
+_BY_PIVA: Dict[str, str] = {}
+_KEYWORD_OWNER: Dict[str, str] = {}
+_KEYWORD_RE = None
+
+END_MARKERS = (r'TOTALE\s+(?:MERCE|DOCUMENTO|DDT|IMPONIBILE)',)
+FOOTER_MARKERS = (r'CONDIZIONI\s+GENERALI',)  # opzionale: end_markers=END_MARKERS + FOOTER_MARKERS
+_END_RE = re.compile('|'.join(END_MARKERS), re.IGNORECASE)
+
+_PIVA_RE = re.compile(r'(?<![0-9])(?:IT\s?)?([0-9]{11})(?![0-9])')
+_SPACES_RE = re.compile(r'[ \t]{2,}')
+_NUM = r'\d{1,3}(?:\.\d{3})*,\d+|\d+(?:[.,]\d+)?'
+_DATE_ISO_RE = re.compile(r'\b(\d{4})[-/.](\d{2})[-/.](\d{2})\b')
+_DATE_IT_RE = re.compile(r'\b(\d{2})[-/.](\d{2})[-/.](\d{4})\b')
+_UM = r'PZ|PCS|PEZZI|PEZZO|NR|N|KG|G|LT|L|ML|MT|M|CF|CONF'
+
+
+def register_supplier(name: str, fornitore: str, partite_iva=(), keywords=(), end_markers=END_MARKERS):
+    """Decoratore: registra fn(text) -> dict come parser del fornitore `name`.
+    end_markers: regex dell'ultima pagina utile del DDT (totali; piè di pagina solo se
+    il fornitore lo stampa unicamente sull'ultima, vedi FOOTER_MARKERS)."""
+    def deco(fn):
+        end_re = _END_RE if end_markers is END_MARKERS else re.compile('|'.join(end_markers), re.IGNORECASE)
+        PARSERS[name] = SupplierParser(name, fornitore, fn, tuple(partite_iva),
+                                       tuple(k.upper() for k in keywords), end_re)
+        _rebuild_index()
+        return fn
+    return deco
+
+
+def _rebuild_index():
+    global _KEYWORD_RE
+    _BY_PIVA.clear()
+    _KEYWORD_OWNER.clear()
+    for spec in PARSERS.values():
+        for piva in spec.partite_iva:
+            _BY_PIVA[piva] = spec.name
+        for kw in spec.keywords:
+            _KEYWORD_OWNER[kw] = spec.name
+    # parole chiave più lunghe prima: "ITALIA AUTOMAZIONI" non viene oscurata da un prefisso
+    kws = sorted(_KEYWORD_OWNER, key=len, reverse=True)
+    _KEYWORD_RE = re.compile('|'.join(re.escape(k) for k in kws)) if kws else None
+
+
+def fingerprint(text: str) -> Tuple[str, Tuple[str, ...]]:
+    """(intestazione in maiuscolo, partite IVA trovate) della prima pagina."""
+    header = (text or '')[:FIRST_PAGE_CHARS].upper()
+    return header, tuple(_PIVA_RE.findall(header))
+
+
+def detect_supplier(text: str) -> Optional[str]:
+    """Nome del parser per il testo, None se il fornitore non è noto."""
+    header, partite_iva = fingerprint(text)
+    for piva in partite_iva:
+        if piva in _BY_PIVA:
+            return _BY_PIVA[piva]
+    if _KEYWORD_RE is not None:
+        m = _KEYWORD_RE.search(header)
+        if m:
+            return _KEYWORD_OWNER[m.group(0)]
+    return None
+
+
+def ddt_complete(pages) -> bool:
+    """until per extract_text_from_pdf: True se l'ultima pagina letta chiude il DDT."""
+    name = detect_supplier(pages[0])
+    end_re = PARSERS[name].end_re if name is not None else _END_RE
+    return end_re.search(pages[-1]) is not None
+
+
+def parse_supplier_specific(text: str) -> Tuple[Dict, str]:
+    """(dati, metodo): parser del fornitore riconosciuto, altrimenti parser generico."""
+    name = detect_supplier(text)
+    note = ""
+    if name is not None:
+        spec = PARSERS[name]
+        try:
+            data = spec.fn(text)
+            data.setdefault("fornitore", spec.fornitore)
+            if data.get("righe"):
+                return data, f"Parser specifico {name.upper()}"
+            note = f": nessuna riga dal parser {name.upper()}"
+        except Exception as e:
+            note = f": errore parser {name.upper()} ({e})"
+    return parse_generic(text), f"Parser generico{note}"
+
+
+# --- utilità comuni ---
+
+def _lines(text):
+    return [_SPACES_RE.sub(' ', l.strip()) for l in (text or '').splitlines() if l.strip()]
+
+
+def _num(s) -> float:
+    """Numero in formato italiano ("1.234,50") o con punto decimale."""
+    s = s.strip()
+    if ',' in s:
+        s = s.replace('.', '').replace(',', '.')
+    return float(s)
+
+
+def _date(s) -> str:
+    try:
+        return datetime.strptime(s, '%d/%m/%Y').strftime('%Y-%m-%d')
+    except ValueError:
+        return s
+
+
+def _find_date(text):
+    m = _DATE_ISO_RE.search(text)
+    if m:
+        return f"{m.group(1)}-{m.group(2)}-{m.group(3)}"
+    m = _DATE_IT_RE.search(text)
+    if m:
+        return f"{m.group(3)}-{m.group(2)}-{m.group(1)}"
+    return None
+
+
+def _header(result, text, numero_re, data_re):
+    m = numero_re.search(text)
+    if m:
+        result["numero_ddt"] = m.group(1)
+    m = data_re.search(text)
+    if m:
+        result["data"] = _date(m.group(1))
+    return result
+
+
+def _riga(codice, descrizione, quantita, um, prezzo):
+    return {"codice": codice.strip(), "descrizione": descrizione.strip(), "quantita": quantita,
+            "um": (um or "PZ").upper(), "prezzo_unitario": prezzo}
+
+
+# --- DUOTERMICA ---
+
+_DUO_NUMERO_RE = re.compile(r'(?:DDT|DOCUMENTO|NUMERO)\D{0,10}(\d{6,})', re.IGNORECASE)
+_DUO_DATA_RE = re.compile(r'(\d{2}/\d{2}/\d{4})')
+_DUO_ROW_RE = re.compile(r'^(?P<cod>[A-Z0-9][A-Z0-9\-/.]{2,})\s+(?P<rest>.+)$', re.IGNORECASE)
+_DUO_NUM_RE = re.compile(r'(\d+(?:[.,]\d+)?)')
+_HAS_DIGIT_RE = re.compile(r'\d')
+_DUO_UM_RE = re.compile(rf'(?:^|\s)({_UM})\s*$', re.IGNORECASE)
+
+
+@register_supplier('duotermica', 'DUOTERMICA', partite_iva=('00499970036',), keywords=('DUOTERMICA',))
+def parse_duotermica(text: str) -> Dict:
+    """
+    Colonne QUANT. e NETTO CAD. lette da destra: ultimo numero = prezzo netto,
+    penultimo = quantità, prima l'eventuale UM, a sinistra la descrizione.
+    """
+    result = _header({"fornitore": "DUOTERMICA", "righe": []}, text, _DUO_NUMERO_RE, _DUO_DATA_RE)
+    for l in _lines(text):
+        m0 = _DUO_ROW_RE.match(l)
+        # i codici articolo hanno sempre cifre: esclude ragione sociale e indirizzi
+        if not m0 or not _HAS_DIGIT_RE.search(m0.group("cod")):
+            continue
+        rest = m0.group("rest")
+        nums = list(_DUO_NUM_RE.finditer(rest))
+        if len(nums) < 2:
+            continue
+        left = rest[:nums[-2].start()].rstrip()
+        m_um = _DUO_UM_RE.search(left)
+        descr = (left[:m_um.start()] if m_um else left).strip()
+        if not descr or _DATE_IT_RE.search(rest):
+            continue
+        result["righe"].append(_riga(m0.group("cod"), descr, _num(nums[-2].group(1)),
+                                     m_um.group(1) if m_um else None, _num(nums[-1].group(1))))
+    return result
+
+
+# --- CLERICI ---
+
+_CLERICI_NUMERO_RE = re.compile(r'(BL-VEN-\d+)')
+_CLERICI_DATA_RE = re.compile(r'Data\s+(\d{2}/\d{2}/\d{4})', re.IGNORECASE)
+# 251830 ST04581 FASCIA ADESIVA SP.3 CM.5XMT.10 GOMMA NR 10,00 3,962 22
+_CLERICI_ROW_RE = re.compile(
+    rf'^\d+\s+(?P<cod>[A-Z0-9][A-Z0-9.\-/]*)\s+(?P<desc>.+?)\s+(?P<um>{_UM})\s+'
+    rf'(?P<qty>{_NUM})\s+(?P<price>{_NUM})(?:\s+\d{{1,2}})?$')
+
+
+# la partita IVA di Clerici non è nel testo dei suoi DDT (solo nel logo): solo parola chiave
+@register_supplier('clerici', 'CLERICI SPA', keywords=('CLERICI',))
+def parse_clerici(text: str) -> Dict:
+    result = _header({"fornitore": "CLERICI SPA", "righe": []}, text, _CLERICI_NUMERO_RE, _CLERICI_DATA_RE)
+    for l in _lines(text):
+        m = _CLERICI_ROW_RE.match(l)
+        if m:
+            result["righe"].append(_riga(m.group("cod"), m.group("desc"), _num(m.group("qty")),
+                                         m.group("um"), _num(m.group("price"))))
+    return result
+
+
+# --- ITALIA AUTOMAZIONI E SICUREZZA ---
+
+_IAS_NUMERO_RE = re.compile(r'Numero\s+(\d+)', re.IGNORECASE)
+_IAS_DATA_RE = re.compile(r'Del\s+(\d{2}/\d{2}/\d{4})', re.IGNORECASE)
+# CBRCBC04GR CBC.4/GR MORSETTO PASSANTE PZ 100,00 1,150 35 74,750  (listino, sconto %, totale)
+_IAS_ROW_RE = re.compile(
+    rf'^(?P<cod>[A-Z0-9][A-Z0-9.\-/]*)\s+(?P<desc>.+?)\s+(?P<um>{_UM})\s+(?P<qty>{_NUM})\s+'
+    rf'(?P<price>{_NUM})(?:\s+(?P<sconto>\d+(?:[.,]\d+)?))?\s+(?P<tot>{_NUM})$')
+
+
+@register_supplier('ias', 'ITALIA AUTOMAZIONI E SICUREZZA S.R.L', partite_iva=('09119340967',),
+                   keywords=('ITALIA AUTOMAZIONI',))
+def parse_ias(text: str) -> Dict:
+    """Prezzo unitario netto = totale riga / quantità (il listino è prima dello sconto)."""
+    result = _header({"fornitore": "ITALIA AUTOMAZIONI E SICUREZZA S.R.L", "righe": []},
+                     text, _IAS_NUMERO_RE, _IAS_DATA_RE)
+    for l in _lines(text):
+        m = _IAS_ROW_RE.match(l)
+        if not m:
+            continue
+        qty, tot = _num(m.group("qty")), _num(m.group("tot"))
+        prezzo = round(tot / qty, 4) if qty else _num(m.group("price"))
+        result["righe"].append(_riga(m.group("cod"), m.group("desc"), qty, m.group("um"), prezzo))
+    return result
+
+
+# --- CAMBIELLI ---
+
+_CAMBIELLI_NUMERO_RE = re.compile(r'\b([A-Z]{2,4}/\d{4,})')
+_CAMBIELLI_DATA_RE = re.compile(r'(\d{2}/\d{2}/\d{4})')
+# 2493350 SERIE GIRAVITI 324 SH8PZ PZ 1 35,32
+_CAMBIELLI_ROW_RE = re.compile(
+    rf'^(?P<cod>\d{{5,}})\s+(?P<desc>.+?)\s+(?P<um>{_UM})\s+(?P<qty>{_NUM})\s+(?P<price>{_NUM})'
+    rf'(?:\s+{_NUM})*$')
+
+
+# come Clerici: nel testo del DDT c'è solo la partita IVA del cliente
+@register_supplier('cambielli', 'CAMBIELLI SPA', keywords=('CAMBIELLI',))
+def parse_cambielli(text: str) -> Dict:
+    result = _header({"fornitore": "CAMBIELLI SPA", "righe": []}, text, _CAMBIELLI_NUMERO_RE,
+                     _CAMBIELLI_DATA_RE)
+    for l in _lines(text):
+        m = _CAMBIELLI_ROW_RE.match(l)
+        if m:
+            result["righe"].append(_riga(m.group("cod"), m.group("desc"), _num(m.group("qty")),
+                                         m.group("um"), _num(m.group("price"))))
+    return result
+
+
+# --- parser generico (fornitori non registrati) ---
+
+_GEN_FORNITORE_RE = re.compile(r"fornitore[:\s]+([A-Z0-9 .,'&/()-]{3,})", re.IGNORECASE)
+_GEN_SOCIETA_RE = re.compile(r"\b(SRL|S\.R\.L\.|SPA|S\.P\.A\.)(?!\w)", re.IGNORECASE)
+# CODICE DESCRIZIONE ... QTA UM PREZZO
+_GEN_ROW_RE = re.compile(
+    r"^(?P<cod>[A-Z0-9\-/.]{5,})\s+(?P<desc>.+?)\s+(?P<qty>\d+(?:[.,]\d+)?)\s+(?P<um>[A-Z]{1,3})\s+"
+    r"(?P<price>\d+(?:[.,]\d+)?)$")
+# CODICE DESCRIZIONE ... PREZZO x QTA UM
+_GEN_ROW2_RE = re.compile(
+    r"^(?P<cod>[A-Z0-9\-/.]{5,})\s+(?P<desc>.+?)\s+(?P<price>\d+(?:[.,]\d+)?)\s*x\s*(?P<qty>\d+(?:[.,]\d+)?)\s*"
+    r"(?P<um>[A-Z]{1,3})\b")
+# colonne spezzate: CODICE DESCRIZIONE QTA UM (senza prezzo)
+_GEN_SIMPLE_RE = re.compile(
+    r"(?P<cod>\b[A-Z0-9\-/.]{5,})\s+(?P<desc>[^0-9]{3,})\s+(?P<qty>\d+(?:[.,]\d+)?)\s+(?P<um>[A-Z]{1,3})",
+    re.IGNORECASE)
+
+
+def parse_generic(text: str) -> Dict:
+    """Euristica a più pattern per fornitori senza parser: data, fornitore, righe."""
+    lines = _lines(text)
+    fornitore = None
+    m = _GEN_FORNITORE_RE.search(text or '')
+    if m:
+        fornitore = m.group(1).strip()
+    else:
+        fornitore = next((l for l in lines if _GEN_SOCIETA_RE.search(l)), None)
+    if fornitore:
+        fornitore = _SPACES_RE.sub(' ', fornitore).strip().upper()
+
+    righe = []
+    for l in lines:
+        m = _GEN_ROW_RE.match(l) or _GEN_ROW2_RE.match(l)
+        if m and len(m.group("desc")) >= 3:
+            righe.append(_riga(m.group("cod"), m.group("desc"), _num(m.group("qty")),
+                               m.group("um") if len(m.group("um")) <= 4 else None, _num(m.group("price"))))
+    if not righe:
+        for l in lines:
+            m = _GEN_SIMPLE_RE.search(l)
+            if m:
+                righe.append(_riga(m.group("cod"), m.group("desc"), _num(m.group("qty")), m.group("um"), 0.0))
+
+    return {"data": _find_date(text or ''), "fornitore": fornitore, "righe": righe}
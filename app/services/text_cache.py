@@ -0,0 +1,174 @@
+# app/services/text_cache.py
+"""
+Cache del testo dei PDF caricati, pagina per pagina, per hash del contenuto.
+
+Due livelli:
+- memoria: LRU limitata a TEXT_CACHE_MAX_BYTES byte di testo (per processo);
+- file accanto agli altri dati dell'upload: UPLOAD_FOLDER/pdf_text/<aa>/<sha256>.json,
+  per hash e non per percorso, così resta valido anche quando l'upload
+  viene spostato nell'archivio blob (services/blob_store) e vale per tutti i
+  processi (worker dei job, comando watch-inbox, CLI).
+
+Una voce può contenere solo le prime pagine (lettura fermata da until, es.
+supplier_parsers.ddt_complete): se serve di più si riprende dal PDF dalla
+prima pagina mancante e la voce viene completata.
+
+Chi ha bisogno del testo di un PDF già caricato (parser dei job, import
+multiplo, parsing_debug) passa da extract_text invece di riaprire il PDF.
+"""
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from flask import current_app
+
+from ..config import Config
+from .blob_store import upload_root
+from .file_service import get_file_hash
+from .pdf_service import join_pages, read_pages
+
+CACHE_DIR = 'pdf_text'
+
+STATS = {'hits': 0, 'misses': 0, 'sidecar': 0}
+_stats_lock = threading.Lock()
+
+
+def _count(name):
+    with _stats_lock:
+        STATS[name] += 1
+
+
+class PageTextCache:
+    """LRU thread-safe sha256 -> (pagine, completo), limitata per byte di testo."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, sha256):
+        with self._lock:
+            entry = self._data.get(sha256)
+            if entry is not None:
+                self._data.move_to_end(sha256)
+                return entry[0], entry[1]
+            return None
+
+    def put(self, sha256, pages, complete):
+        nbytes = sum(len(p.encode('utf-8')) for p in pages)
+        with self._lock:
+            old = self._data.pop(sha256, None)
+            if old is not None:
+                self.size -= old[2]
+            if nbytes > self.max_bytes:
+                return
+            self._data[sha256] = (tuple(pages), complete, nbytes)
+            self.size += nbytes
+            while self.size > self.max_bytes:
+                _, evicted = self._data.popitem(last=False)
+                self.size -= evicted[2]
+
+    def discard(self, sha256):
+        with self._lock:
+            old = self._data.pop(sha256, None)
+            if old is not None:
+                self.size -= old[2]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._data)
+
+
+_memory = None
+_memory_lock = threading.Lock()
+
+
+def memory_cache() -> PageTextCache:
+    global _memory
+    with _memory_lock:
+        if _memory is None:
+            _memory = PageTextCache(int(current_app.config.get('TEXT_CACHE_MAX_BYTES', Config.TEXT_CACHE_MAX_BYTES)))
+        return _memory
+
+
+def sidecar_path(sha256: str) -> Path:
+    return upload_root() / CACHE_DIR / sha256[:2] / f"{sha256}.json"
+
+
+def lookup(sha256):
+    """(pagine, completo) dalla memoria o dal file, None se il PDF non è mai stato letto."""
+    mem = memory_cache()
+    entry = mem.get(sha256)
+    if entry is not None:
+        return list(entry[0]), entry[1]
+    try:
+        data = json.loads(sidecar_path(sha256).read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return None
+    _count('sidecar')
+    mem.put(sha256, data['pages'], data['complete'])
+    return data['pages'], data['complete']
+
+
+def store(sha256, pages, complete):
+    memory_cache().put(sha256, pages, complete)
+    path = sidecar_path(sha256)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'sha256': sha256, 'pages': list(pages), 'complete': complete}, f, ensure_ascii=False)
+        os.replace(tmp, path)
+    except OSError as e:
+        current_app.logger.warning(f"Cache testo PDF non scritta per {sha256}: {e}")
+
+
+def discard(sha256):
+    memory_cache().discard(sha256)
+    sidecar_path(sha256).unlink(missing_ok=True)
+
+
+def cached_pages(sha256, until=None):
+    """(pagine, completo) dalla cache se bastano (complete o until soddisfatto), altrimenti None.
+    completo=False: la lettura si è fermata per until e nel PDF ci sono altre pagine."""
+    entry = lookup(sha256)
+    if entry is None:
+        return None
+    pages, complete = entry
+    for i in range(len(pages)):
+        if until is not None and until(pages[:i + 1]):
+            return pages[:i + 1], complete and i + 1 == len(pages)
+    return (pages, True) if complete else None
+
+
+def cached_text(sha256, until=None):
+    """Testo dalla cache se basta (completo o until soddisfatto), altrimenti None."""
+    entry = cached_pages(sha256, until)
+    return join_pages(entry[0]) if entry is not None else None
+
+
+def extract_pages(path, until=None, sha256=None):
+    """(pagine, completo) di un file su disco, passando dalla cache (vedi pdf_service.read_pages)."""
+    sha256 = sha256 or get_file_hash(str(path))
+    cached = cached_pages(sha256, until)
+    if cached is not None:
+        _count('hits')
+        return cached
+    _count('misses')
+    entry = lookup(sha256)
+    pages, complete = read_pages(str(path), until, pages=entry[0] if entry else None)
+    store(sha256, pages, complete)
+    return pages, complete
+
+
+def extract_text(path, until=None, sha256=None) -> str:
+    """Come pdf_service.extract_text_from_pdf per un file su disco, passando dalla cache."""
+    return join_pages(extract_pages(path, until, sha256)[0])
@@ -0,0 +1,223 @@
+# app/services/valuation.py
+"""
+Valorizzazione di magazzino per (articolo, magazzino), mantenuta alla conferma.
+
+- costo medio ponderato: ogni carico porta il valore a valore + q * costo e il
+  costo medio a valore / quantità; uno scarico toglie q * costo medio.
+- FIFO: ogni carico apre un lotto (lotto_fifo) al suo costo unitario, gli
+  scarichi consumano i lotti aperti dal più vecchio (data, id).
+  valore_fifo = somma residuo * costo dei lotti aperti.
+
+Il costo di un carico è il prezzo della riga DDT_IN (RigaDocumento.prezzo); per
+i carichi manuali senza prezzo vale il costo medio corrente della coppia, o
+Articolo.last_cost se la coppia è nuova. Un trasferimento sposta il valore al
+costo medio del magazzino di partenza e i lotti consumati con il loro costo.
+
+apply_movimenti è chiamata nella stessa transazione che scrive i movimenti
+(motore di conferma, movimenti manuali), quindi il report di valorizzazione è
+una sola lettura di `valorizzazione`. I lotti seguono l'ordine di conferma:
+rebuild_valorizzazione rifà tutto dal registro Movimento in ordine di data.
+Lavora a livello di tabelle (Core), come stock_summary e ledger.
+"""
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import select, insert, update, delete, bindparam
+
+Q3 = Decimal('0.001')
+Q4 = Decimal('0.0001')
+ZERO = Decimal('0')
+
+
+def _dec(x, q=Q3) -> Decimal:
+    return Decimal(str(x or 0)).quantize(q)
+
+
+def _load(session, tables, keys):
+    """Stato corrente delle coppie coinvolte: righe di valorizzazione e lotti aperti."""
+    v, lf, art = tables['valorizzazione'], tables['lotto_fifo'], tables['articolo']
+    art_ids = sorted({a for a, _ in keys})
+    stato, lotti = {}, {k: [] for k in keys}
+    for a, m, q, cm, vm, vf in session.execute(
+            select(v.c.articolo_id, v.c.magazzino_id, v.c.quantita, v.c.costo_medio,
+                   v.c.valore_medio, v.c.valore_fifo).where(v.c.articolo_id.in_(art_ids))):
+        if (a, m) in keys:
+            stato[(a, m)] = {"quantita": _dec(q), "costo_medio": _dec(cm, Q4), "valore_medio": _dec(vm, Q4),
+                             "valore_fifo": _dec(vf, Q4), "nuovo": False}
+    for row in session.execute(
+            select(lf.c.id, lf.c.articolo_id, lf.c.magazzino_id, lf.c.residuo, lf.c.costo_unitario, lf.c.data)
+            .where(lf.c.articolo_id.in_(art_ids), lf.c.aperto.is_(True))
+            .order_by(lf.c.data, lf.c.id)):
+        if (row.articolo_id, row.magazzino_id) in keys:
+            lotti[(row.articolo_id, row.magazzino_id)].append(
+                {"id": row.id, "residuo": _dec(row.residuo), "costo": _dec(row.costo_unitario, Q4),
+                 "data": row.data, "modificato": False})
+    last_costs = dict(session.execute(select(art.c.id, art.c.last_cost).where(art.c.id.in_(art_ids))).all())
+    return stato, lotti, last_costs
+
+
+def apply_movimenti(session, tables, movimenti: Sequence[dict],
+                    costi: Optional[Sequence[Optional[Decimal]]] = None) -> None:
+    """
+    Aggiorna costo medio e lotti FIFO per i movimenti dati (dict con le colonne
+    di Movimento); costi[i] è il costo unitario del carico i-esimo (None = costo
+    medio corrente). Non esegue commit.
+    """
+    if 'valorizzazione' not in tables or not movimenti:
+        return
+    v, lf = tables['valorizzazione'], tables['lotto_fifo']
+    keys = set()
+    for mv in movimenti:
+        for mag in (mv.get("magazzino_partenza_id"), mv.get("magazzino_arrivo_id")):
+            if mag is not None:
+                keys.add((mv["articolo_id"], mag))
+    stato, lotti, last_costs = _load(session, tables, keys)
+    nuovi_lotti: List[dict] = []
+
+    def coppia(key):
+        if key not in stato:
+            costo = _dec(last_costs.get(key[0]), Q4)
+            stato[key] = {"quantita": _dec(0), "costo_medio": costo, "valore_medio": _dec(0, Q4),
+                          "valore_fifo": _dec(0, Q4), "nuovo": True}
+        return stato[key]
+
+    def apri(key, q, costo, data, documento_id):
+        lotto = {"id": None, "articolo_id": key[0], "magazzino_id": key[1], "documento_id": documento_id,
+                 "data": data, "quantita": q, "residuo": q, "costo": costo, "modificato": False}
+        lotti[key].append(lotto)
+        nuovi_lotti.append(lotto)
+        s = coppia(key)
+        s["valore_fifo"] = (s["valore_fifo"] + q * costo).quantize(Q4)
+
+    for i, mv in enumerate(movimenti):
+        art_id, q = mv["articolo_id"], _dec(mv["quantita"])
+        data, documento_id = mv.get("data"), mv.get("documento_id")
+        partenza, arrivo = mv.get("magazzino_partenza_id"), mv.get("magazzino_arrivo_id")
+        consumati: List[Tuple[Decimal, Decimal]] = []
+        costo_uscita = None
+
+        if partenza is not None:
+            key = (art_id, partenza)
+            s = coppia(key)
+            costo_uscita = s["costo_medio"]
+            s["quantita"] -= q
+            s["valore_medio"] = (s["valore_medio"] - q * costo_uscita).quantize(Q4) if s["quantita"] > 0 else _dec(0, Q4)
+            resto = q
+            for lotto in lotti[key]:
+                if resto <= 0:
+                    break
+                if lotto["residuo"] <= 0:
+                    continue
+                preso = min(resto, lotto["residuo"])
+                lotto["residuo"] -= preso
+                lotto["modificato"] = True
+                resto -= preso
+                consumati.append((preso, lotto["costo"]))
+                s["valore_fifo"] = (s["valore_fifo"] - preso * lotto["costo"]).quantize(Q4)
+            if resto > 0:
+                # giacenza senza lotti (precedente alla valorizzazione): esce al costo medio
+                consumati.append((resto, costo_uscita))
+            s["valore_fifo"] = max(s["valore_fifo"], ZERO) if s["quantita"] > 0 else _dec(0, Q4)
+
+        if arrivo is not None:
+            key = (art_id, arrivo)
+            s = coppia(key)
+            if partenza is not None:
+                costo = costo_uscita
+                for preso, costo_lotto in consumati:
+                    apri(key, preso, costo_lotto, data, documento_id)
+            else:
+                c = costi[i] if costi is not None else None
+                costo = _dec(c, Q4) if c is not None else s["costo_medio"]
+                apri(key, q, costo, data, documento_id)
+            s["quantita"] += q
+            s["valore_medio"] = (s["valore_medio"] + q * costo).quantize(Q4)
+            if s["quantita"] > 0:
+                s["costo_medio"] = (s["valore_medio"] / s["quantita"]).quantize(Q4)
+
+    da_aggiornare = [{"b_art": a, "b_mag": m, "b_q": s["quantita"], "b_cm": s["costo_medio"],
+                      "b_vm": s["valore_medio"], "b_vf": s["valore_fifo"]}
+                     for (a, m), s in stato.items() if not s["nuovo"]]
+    da_inserire = [{"articolo_id": a, "magazzino_id": m, "quantita": s["quantita"], "costo_medio": s["costo_medio"],
+                    "valore_medio": s["valore_medio"], "valore_fifo": s["valore_fifo"]}
+                   for (a, m), s in stato.items() if s["nuovo"]]
+    if da_aggiornare:
+        session.execute(
+            update(v).where(v.c.articolo_id == bindparam("b_art"), v.c.magazzino_id == bindparam("b_mag"))
+            .values(quantita=bindparam("b_q"), costo_medio=bindparam("b_cm"),
+                    valore_medio=bindparam("b_vm"), valore_fifo=bindparam("b_vf")),
+            da_aggiornare,
+        )
+    if da_inserire:
+        session.execute(insert(v), da_inserire)
+
+    lotti_consumati = [{"b_id": l["id"], "b_res": l["residuo"], "b_aperto": l["residuo"] > 0}
+                       for ls in lotti.values() for l in ls if l["id"] is not None and l["modificato"]]
+    if lotti_consumati:
+        session.execute(
+            update(lf).where(lf.c.id == bindparam("b_id")).values(residuo=bindparam("b_res"), aperto=bindparam("b_aperto")),
+            lotti_consumati,
+        )
+    if nuovi_lotti:
+        session.execute(insert(lf), [
+            {"articolo_id": l["articolo_id"], "magazzino_id": l["magazzino_id"], "documento_id": l["documento_id"],
+             "data": l["data"], "quantita": l["quantita"], "residuo": l["residuo"],
+             "costo_unitario": l["costo"], "aperto": l["residuo"] > 0}
+            for l in nuovi_lotti])
+
+
+def _costi_righe(session, tables) -> Dict[Tuple[int, int], List[Decimal]]:
+    """Prezzi delle righe DDT_IN confermate per (documento, articolo), nell'ordine delle righe."""
+    r, d = tables['riga_documento'], tables['documento']
+    prezzi: Dict[Tuple[int, int], List[Decimal]] = {}
+    for doc_id, art_id, prezzo in session.execute(
+            select(r.c.documento_id, r.c.articolo_id, r.c.prezzo)
+            .join(d, d.c.id == r.c.documento_id)
+            .where(d.c.tipo == 'DDT_IN', r.c.quantita > 0)
+            .order_by(r.c.id)):
+        prezzi.setdefault((doc_id, art_id), []).append(prezzo)
+    return prezzi
+
+
+def rebuild_valorizzazione(session, tables) -> int:
+    """Ricalcola valorizzazione e lotti rigiocando Movimento in ordine di data. Non esegue commit.
+    Returns: coppie (articolo, magazzino) valorizzate."""
+    mv, v = tables['movimento'], tables['valorizzazione']
+    session.execute(delete(tables['lotto_fifo']))
+    session.execute(delete(v))
+    prezzi = _costi_righe(session, tables)
+    movimenti, costi = [], []
+    for row in session.execute(select(mv).order_by(mv.c.data, mv.c.id)).mappings():
+        movimenti.append(dict(row))
+        coda = prezzi.get((row["documento_id"], row["articolo_id"])) if row["magazzino_partenza_id"] is None else None
+        costi.append(coda.pop(0) if coda else None)
+    apply_movimenti(session, tables, movimenti, costi)
+    return len(session.execute(select(v.c.articolo_id)).all())
+
+
+def report_valorizzazione(session, tables, magazzino_id=None,
+                          articolo_ids: Optional[Iterable[int]] = None) -> List[dict]:
+    """Righe con quantità > 0: articolo, magazzino, quantità, costo medio, valore medio e FIFO."""
+    v, a, m = tables['valorizzazione'], tables['articolo'], tables['magazzino']
+    q = (select(v.c.articolo_id, a.c.codice_interno, a.c.descrizione, v.c.magazzino_id,
+                m.c.codice.label('magazzino_codice'), v.c.quantita, v.c.costo_medio,
+                v.c.valore_medio, v.c.valore_fifo)
+         .join(a, a.c.id == v.c.articolo_id)
+         .join(m, m.c.id == v.c.magazzino_id)
+         .where(v.c.quantita > 0)
+         .order_by(a.c.codice_interno, m.c.codice))
+    if magazzino_id is not None:
+        q = q.where(v.c.magazzino_id == magazzino_id)
+    if articolo_ids is not None:
+        q = q.where(v.c.articolo_id.in_(list(articolo_ids)))
+    return [{
+        "articolo_id": r.articolo_id,
+        "codice_interno": r.codice_interno,
+        "descrizione": r.descrizione,
+        "magazzino_id": r.magazzino_id,
+        "magazzino_codice": r.magazzino_codice,
+        "quantita": _dec(r.quantita),
+        "costo_medio": _dec(r.costo_medio, Q4),
+        "valore_medio": _dec(r.valore_medio, Q4),
+        "valore_fifo": _dec(r.valore_fifo, Q4),
+    } for r in session.execute(q)]
@@ -157,7 +157,8 @@ class DDTImportManager {
             this.loadingOverlay.show('Estrazione dati dal PDF in corso…');
             
             // Step 1: Parse PDF (nuovo endpoint)
-            this.parsedDDT = await this.apiClient.postForm('/importing/api/parse-ddt', formData);
+            const job = await this.apiClient.postForm('/importing/api/parse-ddt', formData);
+            this.parsedDDT = job.status === 'done' ? job.result : await this.waitParseJob(job.status_url);
             
             // Show parsing method note
             this.showParsingNote(this.parsedDDT);
@@ -182,6 +183,16 @@ class DDTImportManager {
         }
     }
     
+    async waitParseJob(statusUrl) {
+        // Il parsing gira in background: si interroga lo stato del job fino a conclusione
+        while (true) {
+            const st = await (await fetch(statusUrl)).json();
+            if (st.status === 'done') return st.result;
+            if (st.status === 'error') throw new Error(st.error || 'Parsing fallito');
+            await new Promise(resolve => setTimeout(resolve, 1000));
+        }
+    }
+    
     showParsingNote(parsedData) {
         if (!this.noteBox || !this.noteText || !parsedData.method) return;
         
@@ -3,7 +3,9 @@ from datetime import datetime, date, time
 from decimal import Decimal, InvalidOperation
 from sqlalchemy import func, and_
 from .extensions import db
-from .models import Articolo, Giacenza, Magazzino, Documento
+from .models import Articolo, Giacenza, Magazzino, Documento, SequenzaCodice
+from .services.numbering import alloc_doc_number, bump_counter
+from .services.stock_summary import refresh_riepilogo
 
 # --- Validazioni / parsing formali ---
 
@@ -61,15 +63,14 @@ def update_giacenza(articolo_id, magazzino_id, qty, session=None):
             raise ValueError("Impossibile creare giacenza negativa.")
         g = Giacenza(articolo_id=articolo_id, magazzino_id=magazzino_id, quantita=qty)
         db_session.add(g)
+    db_session.flush()
+    refresh_riepilogo(db_session, Giacenza.metadata.tables, [articolo_id])
     return g
 
 def next_doc_number(doc_type, year=None) -> int:
-    year = year or date.today().year
-    last = (Documento.query
-            .filter(Documento.tipo == doc_type, Documento.anno == year, Documento.numero != None)
-            .order_by(Documento.numero.desc())
-            .first())
-    return (last.numero + 1) if last and last.numero is not None else 1
+    """Numero successivo per (tipo, anno) dal contatore persistente.
+    Va chiamata nella stessa transazione che salva il documento: il rollback annulla l'incremento."""
+    return alloc_doc_number(db.session, Documento, doc_type, year)
 
 # --- Normalizzazione UM ---
 
@@ -108,40 +109,94 @@ def supplier_prefix(fornitore: str) -> str:
     base = (f[:3] or 'INT')
     return base
 
+def alloc_sequenza(ambito: str, prefisso: str, n: int = 1, seed_fn=lambda: 0) -> range:
+    """
+    Riserva atomicamente n valori consecutivi del contatore (ambito, prefisso).
+    L'UPDATE prende il lock di scrittura, quindi due import concorrenti non
+    possono ottenere lo stesso blocco. Returns: range dei valori riservati.
+    """
+    return bump_counter(db.session, SequenzaCodice.__table__,
+                        {"ambito": ambito, "prefisso": prefisso}, "ultimo", n, seed_fn)
+
+def _max_progressivo(pre: str) -> int:
+    """Massimo progressivo PRE + cifre già presente (usato solo per inizializzare il contatore)."""
+    pattern = re.compile(f"^{re.escape(pre)}(\\d+)$")
+    max_n = 0
+    for (code,) in db.session.query(Articolo.codice_interno).filter(Articolo.codice_interno.like(f"{pre}%")):
+        m = pattern.match(code or '')
+        if m:
+            max_n = max(max_n, int(m.group(1)))
+    return max_n
+
+def _codici_esistenti(codes) -> set:
+    codes = list(codes)
+    if not codes:
+        return set()
+    return {row[0] for row in db.session.query(Articolo.codice_interno)
+            .filter(Articolo.codice_interno.in_(codes)).all()}
+
 def gen_internal_code(prefix: str, supplier_code: str | None = None) -> str:
     """
     Genera un codice interno univoco:
     - se supplier_code è valorizzato e non crea collisioni: PREFIX + <supplier_code_clean>
     - altrimenti genera sequenza PREFIX + 6 cifre (progressivo)
     """
+    return reserve_internal_codes(prefix, [supplier_code])[0]
+
+def reserve_internal_codes(prefix: str, supplier_codes: list) -> list:
+    """
+    Versione a blocchi di gen_internal_code: riserva un codice per ogni elemento
+    di supplier_codes (None/'' = solo progressivo). I progressivi arrivano dal
+    contatore SequenzaCodice in un unico blocco.
+    """
     pre = _clean_token(prefix)[:6] or 'INT'
-    if supplier_code:
-        suff = _clean_token(supplier_code)[:20]
-        cand = f"{pre}{suff}"[:30]
-        if not Articolo.query.filter_by(codice_interno=cand).first():
-            return cand
-
-    # progressivo a 6 cifre
-    import re as _re
-    pattern = f"^{pre}(\\d+)$"
-    max_n = 0
-    for a in Articolo.query.filter(Articolo.codice_interno.like(f"{pre}%")).all():
-        m = _re.match(pattern, a.codice_interno or '')
+    candidates = []
+    for sc in supplier_codes:
+        suff = _clean_token(sc)[:20] if sc else ''
+        candidates.append(f"{pre}{suff}"[:30] if suff else None)
+
+    taken = _codici_esistenti({c for c in candidates if c})
+    out = [None] * len(candidates)
+    for i, cand in enumerate(candidates):
+        if cand and cand not in taken:
+            out[i] = cand
+            taken.add(cand)
+
+    missing = [i for i, c in enumerate(out) if c is None]
+    while missing:
+        block = [f"{pre}{n:06d}" for n in alloc_sequenza('interno', pre, len(missing),
+                                                         seed_fn=lambda: _max_progressivo(pre))]
+        # un codice da fornitore può coincidere con un progressivo: si salta
+        busy = _codici_esistenti(block) | (taken & set(block))
+        still = []
+        for i, code in zip(missing, block):
+            if code in busy:
+                still.append(i)
+            else:
+                out[i] = code
+                taken.add(code)
+        missing = still
+    return out
+
+def _max_suffisso_descr(base10: str) -> int:
+    pattern = re.compile(f"^{re.escape(base10)}(\\d{{2}})$")
+    max_n = 1
+    for (code,) in db.session.query(Articolo.codice_interno).filter(Articolo.codice_interno.like(f"{base10}%")):
+        m = pattern.match(code or '')
         if m:
-            try:
-                n = int(m.group(1))
-                if n > max_n: max_n = n
-            except:
-                pass
-    return f"{pre}{max_n + 1:06d}"
+            max_n = max(max_n, int(m.group(1)))
+    return max_n
 
 def gen_code_from_descr(descr: str) -> str:
     base = re.sub(r'[^A-Z0-9]', '', (descr or 'AUTO')[:12].upper())
     if not base:
         base = "AUTO"
-    code = base
-    i = 1
-    while Articolo.query.filter_by(codice_interno=code).first():
-        i += 1
-        code = f"{base[:10]}{i:02d}"
-    return code
+    if not _codici_esistenti([base]):
+        return base
+    # suffissi 02, 03, ... dal contatore invece di provare un codice alla volta
+    base10 = base[:10]
+    while True:
+        n = alloc_sequenza('descr', base10, seed_fn=lambda: _max_suffisso_descr(base10))[0]
+        code = f"{base10}{n:02d}"
+        if not _codici_esistenti([code]):
+            return code
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Aggiunge gli indici per le query calde (liste documenti, dashboard,
+# inventario, movimenti, lookup dell'import), poi ANALYZE.
+# Solo SQLite. Rieseguibile. tests/test_query_plans.py ne verifica l'uso.
+
+import os, re, sqlite3, sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(ROOT, os.pardir))
+
+def read_env_sqlite_uri():
+    env_path = os.path.join(PROJECT_ROOT, ".env")
+    uri = None
+    if os.path.exists(env_path):
+        with open(env_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip().startswith("SQLALCHEMY_DATABASE_URI"):
+                    try:
+                        _, val = line.split("=", 1)
+                        uri = val.strip()
+                    except ValueError:
+                        pass
+                    break
+    if not uri:
+        uri = "sqlite:///magazzino.db"
+    if not uri.lower().startswith("sqlite"):
+        return None, "Solo SQLite supportato da questo script. URI attuale: %s" % uri
+    m = re.match(r"sqlite:(?P<slashes>/{2,})(?P<path>.*)", uri, flags=re.I)
+    if not m:
+        return None, "URI SQLite non riconosciuto: %s" % uri
+    path = m.group("path")
+    if m.group("slashes") == "////":  # absolute
+        db_path = "/" + path if not path.startswith("/") else path
+    else:  # '///' relative to project root
+        db_path = os.path.join(PROJECT_ROOT, path)
+    db_path = os.path.normpath(db_path)
+    return db_path, None
+
+def table_exists(cur, name):
+    cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?;", (name,))
+    return cur.fetchone() is not None
+
+def index_exists(cur, name):
+    cur.execute("SELECT name FROM sqlite_master WHERE type='index' AND name=?;", (name,))
+    return cur.fetchone() is not None
+
+# (tabella, nome indice, colonne): stessi nomi di __table_args__ in app/models.py
+INDICI = [
+    ("documento", "ix_documento_status_tipo_anno_num", "status, tipo, anno, numero"),
+    ("documento", "ix_documento_partner_id", "partner_id"),
+    ("documento", "ix_documento_data", "data"),
+    ("riga_documento", "ix_riga_documento_documento_id", "documento_id"),
+    ("riga_documento", "ix_riga_documento_articolo_id", "articolo_id"),
+    ("movimento", "ix_movimento_articolo_data", "articolo_id, data"),
+    ("movimento", "ix_movimento_documento_id", "documento_id"),
+    ("giacenza", "ix_giacenza_magazzino_articolo", "magazzino_id, articolo_id, quantita"),
+    ("articolo", "ix_articolo_fornitore_codice", "fornitore, codice_fornitore"),
+]
+
+def main():
+    db_path, err = read_env_sqlite_uri()
+    if err:
+        print("[ERRORE]", err)
+        sys.exit(2)
+    print("[INFO] Database:", db_path)
+    if not os.path.exists(db_path):
+        print("[WARN] DB non trovato. Nulla da migrare.")
+        sys.exit(0)
+
+    conn = sqlite3.connect(db_path)
+    try:
+        cur = conn.cursor()
+        creati = 0
+        for tabella, nome, colonne in INDICI:
+            if not table_exists(cur, tabella):
+                print("[WARN] Tabella '%s' assente: salto %s" % (tabella, nome))
+                continue
+            if index_exists(cur, nome):
+                print("[OK] Indice '%s' già presente." % nome)
+                continue
+            print("[DDL] CREATE INDEX %s ON %s (%s)" % (nome, tabella, colonne))
+            cur.execute("CREATE INDEX IF NOT EXISTS %s ON %s (%s);" % (nome, tabella, colonne))
+            creati += 1
+        conn.commit()
+        if creati:
+            # statistiche aggiornate per il planner
+            print("[INFO] ANALYZE")
+            cur.execute("ANALYZE;")
+            conn.commit()
+        print("[DONE]")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
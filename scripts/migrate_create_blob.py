@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Crea la tabella 'blob' (archivio allegati per contenuto, services/blob_store)
+# e aggiunge 'allegato.blob_sha256'. Solo SQLite. Rieseguibile.
+# Poi: flask magazzino migrate-blobs
+
+import os, re, sqlite3, sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(ROOT, os.pardir))
+
+def read_env_sqlite_uri():
+    env_path = os.path.join(PROJECT_ROOT, ".env")
+    uri = None
+    if os.path.exists(env_path):
+        with open(env_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip().startswith("SQLALCHEMY_DATABASE_URI"):
+                    try:
+                        _, val = line.split("=", 1)
+                        uri = val.strip()
+                    except ValueError:
+                        pass
+                    break
+    if not uri:
+        uri = "sqlite:///magazzino.db"
+    if not uri.lower().startswith("sqlite"):
+        return None, "Solo SQLite supportato da questo script. URI attuale: %s" % uri
+    m = re.match(r"sqlite:(?P<slashes>/{2,})(?P<path>.*)", uri, flags=re.I)
+    if not m:
+        return None, "URI SQLite non riconosciuto: %s" % uri
+    path = m.group("path")
+    if m.group("slashes") == "////":  # absolute
+        db_path = "/" + path if not path.startswith("/") else path
+    else:  # '///' relative to project root
+        db_path = os.path.join(PROJECT_ROOT, path)
+    db_path = os.path.normpath(db_path)
+    return db_path, None
+
+def table_exists(cur, name):
+    cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?;", (name,))
+    return cur.fetchone() is not None
+
+def column_exists(cur, table, column):
+    cur.execute(f"PRAGMA table_info({table})")
+    return any(r[1] == column for r in cur.fetchall())
+
+def main():
+    db_path, err = read_env_sqlite_uri()
+    if err:
+        print("[ERRORE]", err)
+        sys.exit(2)
+    print("[INFO] Database:", db_path)
+    if not os.path.exists(db_path):
+        print("[WARN] DB non trovato. Nulla da migrare.")
+        sys.exit(0)
+
+    conn = sqlite3.connect(db_path)
+    try:
+        cur = conn.cursor()
+        if not table_exists(cur, "blob"):
+            print("[DDL] Crea tabella blob")
+            cur.executescript("""
+            CREATE TABLE blob (
+              sha256 VARCHAR(64) NOT NULL PRIMARY KEY,
+              size INTEGER NOT NULL DEFAULT 0,
+              refcount INTEGER NOT NULL DEFAULT 0,
+              created_at DATETIME NOT NULL
+            );
+            """)
+        else:
+            print("[OK] Tabella 'blob' già presente.")
+
+        if table_exists(cur, "allegato") and not column_exists(cur, "allegato", "blob_sha256"):
+            print("[DDL] Aggiunge colonna allegato.blob_sha256")
+            cur.execute("ALTER TABLE allegato ADD COLUMN blob_sha256 VARCHAR(64) REFERENCES blob (sha256)")
+            cur.execute("CREATE INDEX IF NOT EXISTS ix_allegato_blob_sha256 ON allegato (blob_sha256)")
+        conn.commit()
+        print("[DONE]")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Crea tabella 'numeratore_documento' (ultimo numero per tipo/anno) e la inizializza
+# da MAX(numero) dei documenti già numerati. Solo SQLite.
+# Rieseguibile: i contatori esistenti vengono solo alzati, mai abbassati.
+
+import os, re, sqlite3, sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(ROOT, os.pardir))
+
+def read_env_sqlite_uri():
+    env_path = os.path.join(PROJECT_ROOT, ".env")
+    uri = None
+    if os.path.exists(env_path):
+        with open(env_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip().startswith("SQLALCHEMY_DATABASE_URI"):
+                    try:
+                        _, val = line.split("=", 1)
+                        uri = val.strip()
+                    except ValueError:
+                        pass
+                    break
+    if not uri:
+        uri = "sqlite:///magazzino.db"
+    if not uri.lower().startswith("sqlite"):
+        return None, "Solo SQLite supportato da questo script. URI attuale: %s" % uri
+    m = re.match(r"sqlite:(?P<slashes>/{2,})(?P<path>.*)", uri, flags=re.I)
+    if not m:
+        return None, "URI SQLite non riconosciuto: %s" % uri
+    path = m.group("path")
+    if m.group("slashes") == "////":  # absolute
+        db_path = "/" + path if not path.startswith("/") else path
+    else:  # '///' relative to project root
+        db_path = os.path.join(PROJECT_ROOT, path)
+    db_path = os.path.normpath(db_path)
+    return db_path, None
+
+def table_exists(cur, name):
+    cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?;", (name,))
+    return cur.fetchone() is not None
+
+def main():
+    db_path, err = read_env_sqlite_uri()
+    if err:
+        print("[ERRORE]", err)
+        sys.exit(2)
+    print("[INFO] Database:", db_path)
+    if not os.path.exists(db_path):
+        print("[WARN] DB non trovato. Nulla da migrare.")
+        sys.exit(0)
+
+    conn = sqlite3.connect(db_path)
+    try:
+        cur = conn.cursor()
+        if not table_exists(cur, "numeratore_documento"):
+            print("[DDL] Crea tabella numeratore_documento")
+            cur.executescript("""
+            CREATE TABLE numeratore_documento (
+              id INTEGER PRIMARY KEY AUTOINCREMENT,
+              tipo VARCHAR(20) NOT NULL,
+              anno INTEGER NOT NULL,
+              ultimo_numero INTEGER NOT NULL DEFAULT 0,
+              CONSTRAINT uq_numeratore_documento_tipo_anno UNIQUE (tipo, anno)
+            );
+            """)
+        else:
+            print("[OK] Tabella 'numeratore_documento' già presente.")
+
+        if not table_exists(cur, "documento"):
+            print("[WARN] Tabella 'documento' non presente. Nessun contatore da inizializzare.")
+            conn.commit()
+            return
+
+        massimi = cur.execute(
+            "SELECT tipo, anno, MAX(numero) FROM documento "
+            "WHERE numero IS NOT NULL AND anno IS NOT NULL GROUP BY tipo, anno"
+        ).fetchall()
+        for tipo, anno, n in massimi:
+            cur.execute(
+                "INSERT INTO numeratore_documento (tipo, anno, ultimo_numero) VALUES (?, ?, ?) "
+                "ON CONFLICT(tipo, anno) DO UPDATE SET ultimo_numero = MAX(ultimo_numero, excluded.ultimo_numero)",
+                (tipo, anno, n),
+            )
+            print(f"[SEED] {tipo} {anno}: {n}")
+        conn.commit()
+        print(f"[DONE] Contatori inizializzati: {len(massimi)}")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Crea la tabella 'parse_cache' (risultati di parsing per SHA-256 del PDF, services/parse_cache)
+# e aggiunge 'parse_job.sha256'. Solo SQLite. Rieseguibile.
+
+import os, re, sqlite3, sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(ROOT, os.pardir))
+
+def read_env_sqlite_uri():
+    env_path = os.path.join(PROJECT_ROOT, ".env")
+    uri = None
+    if os.path.exists(env_path):
+        with open(env_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip().startswith("SQLALCHEMY_DATABASE_URI"):
+                    try:
+                        _, val = line.split("=", 1)
+                        uri = val.strip()
+                    except ValueError:
+                        pass
+                    break
+    if not uri:
+        uri = "sqlite:///magazzino.db"
+    if not uri.lower().startswith("sqlite"):
+        return None, "Solo SQLite supportato da questo script. URI attuale: %s" % uri
+    m = re.match(r"sqlite:(?P<slashes>/{2,})(?P<path>.*)", uri, flags=re.I)
+    if not m:
+        return None, "URI SQLite non riconosciuto: %s" % uri
+    path = m.group("path")
+    if m.group("slashes") == "////":  # absolute
+        db_path = "/" + path if not path.startswith("/") else path
+    else:  # '///' relative to project root
+        db_path = os.path.join(PROJECT_ROOT, path)
+    db_path = os.path.normpath(db_path)
+    return db_path, None
+
+def table_exists(cur, name):
+    cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?;", (name,))
+    return cur.fetchone() is not None
+
+def column_exists(cur, table, column):
+    cur.execute(f"PRAGMA table_info({table})")
+    return any(r[1] == column for r in cur.fetchall())
+
+def main():
+    db_path, err = read_env_sqlite_uri()
+    if err:
+        print("[ERRORE]", err)
+        sys.exit(2)
+    print("[INFO] Database:", db_path)
+    if not os.path.exists(db_path):
+        print("[WARN] DB non trovato. Nulla da migrare.")
+        sys.exit(0)
+
+    conn = sqlite3.connect(db_path)
+    try:
+        cur = conn.cursor()
+        if not table_exists(cur, "parse_cache"):
+            print("[DDL] Crea tabella parse_cache")
+            cur.executescript("""
+            CREATE TABLE parse_cache (
+              id INTEGER PRIMARY KEY AUTOINCREMENT,
+              sha256 VARCHAR(64) NOT NULL,
+              parser_key VARCHAR(60) NOT NULL,
+              result TEXT NOT NULL,
+              size INTEGER NOT NULL DEFAULT 0,
+              hits INTEGER NOT NULL DEFAULT 0,
+              created_at DATETIME NOT NULL,
+              last_hit_at DATETIME NOT NULL,
+              CONSTRAINT uq_parse_cache_sha_parser UNIQUE (sha256, parser_key)
+            );
+            CREATE INDEX ix_parse_cache_last_hit_at ON parse_cache (last_hit_at);
+            """)
+        else:
+            print("[OK] Tabella 'parse_cache' già presente.")
+
+        if table_exists(cur, "parse_job") and not column_exists(cur, "parse_job", "sha256"):
+            print("[DDL] Aggiunge colonna parse_job.sha256")
+            cur.execute("ALTER TABLE parse_job ADD COLUMN sha256 VARCHAR(64)")
+        conn.commit()
+        print("[DONE]")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Crea la tabella 'parse_job' (job di parsing PDF in background, services/parse_jobs).
+# Solo SQLite. Rieseguibile: se la tabella esiste non fa nulla.
+
+import os, re, sqlite3, sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(ROOT, os.pardir))
+
+def read_env_sqlite_uri():
+    env_path = os.path.join(PROJECT_ROOT, ".env")
+    uri = None
+    if os.path.exists(env_path):
+        with open(env_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip().startswith("SQLALCHEMY_DATABASE_URI"):
+                    try:
+                        _, val = line.split("=", 1)
+                        uri = val.strip()
+                    except ValueError:
+                        pass
+                    break
+    if not uri:
+        uri = "sqlite:///magazzino.db"
+    if not uri.lower().startswith("sqlite"):
+        return None, "Solo SQLite supportato da questo script. URI attuale: %s" % uri
+    m = re.match(r"sqlite:(?P<slashes>/{2,})(?P<path>.*)", uri, flags=re.I)
+    if not m:
+        return None, "URI SQLite non riconosciuto: %s" % uri
+    path = m.group("path")
+    if m.group("slashes") == "////":  # absolute
+        db_path = "/" + path if not path.startswith("/") else path
+    else:  # '///' relative to project root
+        db_path = os.path.join(PROJECT_ROOT, path)
+    db_path = os.path.normpath(db_path)
+    return db_path, None
+
+def table_exists(cur, name):
+    cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?;", (name,))
+    return cur.fetchone() is not None
+
+def main():
+    db_path, err = read_env_sqlite_uri()
+    if err:
+        print("[ERRORE]", err)
+        sys.exit(2)
+    print("[INFO] Database:", db_path)
+    if not os.path.exists(db_path):
+        print("[WARN] DB non trovato. Nulla da migrare.")
+        sys.exit(0)
+
+    conn = sqlite3.connect(db_path)
+    try:
+        cur = conn.cursor()
+        if table_exists(cur, "parse_job"):
+            print("[OK] Tabella 'parse_job' già presente.")
+            return
+        print("[DDL] Crea tabella parse_job")
+        cur.executescript("""
+        CREATE TABLE parse_job (
+          id VARCHAR(32) NOT NULL PRIMARY KEY,
+          kind VARCHAR(20) NOT NULL,
+          status VARCHAR(10) NOT NULL DEFAULT 'queued',
+          filename VARCHAR(255),
+          file_path VARCHAR(400) NOT NULL,
+          uploaded_file VARCHAR(400),
+          result TEXT,
+          error TEXT,
+          attempts INTEGER NOT NULL DEFAULT 0,
+          created_at DATETIME NOT NULL,
+          started_at DATETIME,
+          finished_at DATETIME
+        );
+        CREATE INDEX ix_parse_job_status_created ON parse_job (status, created_at);
+        """)
+        conn.commit()
+        print("[DONE] Tabella 'parse_job' creata")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Crea le tabelle 'riepilogo_giacenza' (giacenza totale per articolo + flag under_min)
+# e 'contatore_dashboard', poi ricostruisce il riepilogo da 'giacenza'. Solo SQLite.
+# Rieseguibile: il riepilogo viene ricalcolato da zero, i contatori svuotati
+# (la dashboard li reinizializza con un COUNT alla prima lettura).
+
+import os, re, sqlite3, sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(ROOT, os.pardir))
+
+def read_env_sqlite_uri():
+    env_path = os.path.join(PROJECT_ROOT, ".env")
+    uri = None
+    if os.path.exists(env_path):
+        with open(env_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip().startswith("SQLALCHEMY_DATABASE_URI"):
+                    try:
+                        _, val = line.split("=", 1)
+                        uri = val.strip()
+                    except ValueError:
+                        pass
+                    break
+    if not uri:
+        uri = "sqlite:///magazzino.db"
+    if not uri.lower().startswith("sqlite"):
+        return None, "Solo SQLite supportato da questo script. URI attuale: %s" % uri
+    m = re.match(r"sqlite:(?P<slashes>/{2,})(?P<path>.*)", uri, flags=re.I)
+    if not m:
+        return None, "URI SQLite non riconosciuto: %s" % uri
+    path = m.group("path")
+    if m.group("slashes") == "////":  # absolute
+        db_path = "/" + path if not path.startswith("/") else path
+    else:  # '///' relative to project root
+        db_path = os.path.join(PROJECT_ROOT, path)
+    db_path = os.path.normpath(db_path)
+    return db_path, None
+
+def table_exists(cur, name):
+    cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?;", (name,))
+    return cur.fetchone() is not None
+
+def main():
+    db_path, err = read_env_sqlite_uri()
+    if err:
+        print("[ERRORE]", err)
+        sys.exit(2)
+    print("[INFO] Database:", db_path)
+    if not os.path.exists(db_path):
+        print("[WARN] DB non trovato. Nulla da migrare.")
+        sys.exit(0)
+
+    conn = sqlite3.connect(db_path)
+    try:
+        cur = conn.cursor()
+        if not table_exists(cur, "riepilogo_giacenza"):
+            print("[DDL] Crea tabella riepilogo_giacenza")
+            cur.executescript("""
+            CREATE TABLE riepilogo_giacenza (
+              articolo_id INTEGER NOT NULL PRIMARY KEY REFERENCES articolo(id),
+              quantita_totale NUMERIC(14, 3) NOT NULL DEFAULT 0,
+              scorta_minima NUMERIC(14, 3) NOT NULL DEFAULT 0,
+              under_min BOOLEAN NOT NULL DEFAULT 0
+            );
+            CREATE INDEX ix_riepilogo_giacenza_under_min ON riepilogo_giacenza (under_min);
+            """)
+        else:
+            print("[OK] Tabella 'riepilogo_giacenza' già presente.")
+
+        if not table_exists(cur, "contatore_dashboard"):
+            print("[DDL] Crea tabella contatore_dashboard")
+            cur.executescript("""
+            CREATE TABLE contatore_dashboard (
+              id INTEGER PRIMARY KEY AUTOINCREMENT,
+              chiave VARCHAR(40) NOT NULL UNIQUE,
+              valore INTEGER NOT NULL DEFAULT 0
+            );
+            """)
+        else:
+            print("[OK] Tabella 'contatore_dashboard' già presente.")
+
+        if not table_exists(cur, "articolo") or not table_exists(cur, "giacenza"):
+            print("[WARN] Tabelle 'articolo'/'giacenza' non presenti. Riepilogo vuoto.")
+            conn.commit()
+            return
+
+        cur.execute("DELETE FROM riepilogo_giacenza")
+        cur.execute("DELETE FROM contatore_dashboard")
+        cur.execute("""
+            INSERT INTO riepilogo_giacenza (articolo_id, quantita_totale, scorta_minima, under_min)
+            SELECT a.id, COALESCE(SUM(g.quantita), 0), COALESCE(a.qta_scorta_minima, 0),
+                   COALESCE(a.qta_scorta_minima, 0) > 0
+                   AND COALESCE(SUM(g.quantita), 0) < COALESCE(a.qta_scorta_minima, 0)
+            FROM articolo a LEFT JOIN giacenza g ON g.articolo_id = a.id
+            GROUP BY a.id
+        """)
+        n = cur.execute("SELECT COUNT(*) FROM riepilogo_giacenza").fetchone()[0]
+        sotto = cur.execute("SELECT COUNT(*) FROM riepilogo_giacenza WHERE under_min").fetchone()[0]
+        conn.commit()
+        print(f"[DONE] Riepilogo: {n} articoli, {sotto} sotto scorta")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
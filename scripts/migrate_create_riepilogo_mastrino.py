@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Crea la tabella 'riepilogo_mastrino' (totali mensili per mastrino delle
+# righe confermate, services/mastrino_rollup). Solo SQLite. Rieseguibile.
+# Poi: flask magazzino rebuild-riepilogo-mastrini
+
+import os, re, sqlite3, sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(ROOT, os.pardir))
+
+def read_env_sqlite_uri():
+    env_path = os.path.join(PROJECT_ROOT, ".env")
+    uri = None
+    if os.path.exists(env_path):
+        with open(env_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip().startswith("SQLALCHEMY_DATABASE_URI"):
+                    try:
+                        _, val = line.split("=", 1)
+                        uri = val.strip()
+                    except ValueError:
+                        pass
+                    break
+    if not uri:
+        uri = "sqlite:///magazzino.db"
+    if not uri.lower().startswith("sqlite"):
+        return None, "Solo SQLite supportato da questo script. URI attuale: %s" % uri
+    m = re.match(r"sqlite:(?P<slashes>/{2,})(?P<path>.*)", uri, flags=re.I)
+    if not m:
+        return None, "URI SQLite non riconosciuto: %s" % uri
+    path = m.group("path")
+    if m.group("slashes") == "////":  # absolute
+        db_path = "/" + path if not path.startswith("/") else path
+    else:  # '///' relative to project root
+        db_path = os.path.join(PROJECT_ROOT, path)
+    db_path = os.path.normpath(db_path)
+    return db_path, None
+
+def table_exists(cur, name):
+    cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?;", (name,))
+    return cur.fetchone() is not None
+
+def main():
+    db_path, err = read_env_sqlite_uri()
+    if err:
+        print("[ERRORE]", err)
+        sys.exit(2)
+    print("[INFO] Database:", db_path)
+    if not os.path.exists(db_path):
+        print("[WARN] DB non trovato. Nulla da migrare.")
+        sys.exit(0)
+
+    conn = sqlite3.connect(db_path)
+    try:
+        cur = conn.cursor()
+        if not table_exists(cur, "riepilogo_mastrino"):
+            print("[DDL] Crea tabella riepilogo_mastrino")
+            cur.executescript("""
+            CREATE TABLE riepilogo_mastrino (
+              anno INTEGER NOT NULL,
+              mese INTEGER NOT NULL,
+              mastrino_codice VARCHAR(20) NOT NULL,
+              tipo_documento VARCHAR(20) NOT NULL,
+              num_righe INTEGER NOT NULL DEFAULT 0,
+              quantita_m BIGINT NOT NULL DEFAULT 0,
+              importo_e5 BIGINT NOT NULL DEFAULT 0,
+              PRIMARY KEY (anno, mese, mastrino_codice, tipo_documento)
+            );
+            """)
+        else:
+            print("[OK] Tabella 'riepilogo_mastrino' già presente.")
+        conn.commit()
+        print("[DONE]")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Crea tabella 'sequenza_codice' (contatori per codici articolo) e la inizializza
+# dai codici interni progressivi già presenti (PREFISSO + 6 cifre). Solo SQLite.
+# Rieseguibile: i contatori esistenti vengono solo alzati, mai abbassati.
+
+import os, re, sqlite3, sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(ROOT, os.pardir))
+
+PROGRESSIVO_RE = re.compile(r"^([A-Z0-9]{1,6})(\d{6})$")
+
+def read_env_sqlite_uri():
+    env_path = os.path.join(PROJECT_ROOT, ".env")
+    uri = None
+    if os.path.exists(env_path):
+        with open(env_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip().startswith("SQLALCHEMY_DATABASE_URI"):
+                    try:
+                        _, val = line.split("=", 1)
+                        uri = val.strip()
+                    except ValueError:
+                        pass
+                    break
+    if not uri:
+        uri = "sqlite:///magazzino.db"
+    if not uri.lower().startswith("sqlite"):
+        return None, "Solo SQLite supportato da questo script. URI attuale: %s" % uri
+    m = re.match(r"sqlite:(?P<slashes>/{2,})(?P<path>.*)", uri, flags=re.I)
+    if not m:
+        return None, "URI SQLite non riconosciuto: %s" % uri
+    path = m.group("path")
+    if m.group("slashes") == "////":  # absolute
+        db_path = "/" + path if not path.startswith("/") else path
+    else:  # '///' relative to project root
+        db_path = os.path.join(PROJECT_ROOT, path)
+    db_path = os.path.normpath(db_path)
+    return db_path, None
+
+def table_exists(cur, name):
+    cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?;", (name,))
+    return cur.fetchone() is not None
+
+def main():
+    db_path, err = read_env_sqlite_uri()
+    if err:
+        print("[ERRORE]", err)
+        sys.exit(2)
+    print("[INFO] Database:", db_path)
+    if not os.path.exists(db_path):
+        print("[WARN] DB non trovato. Nulla da migrare.")
+        sys.exit(0)
+
+    conn = sqlite3.connect(db_path)
+    try:
+        cur = conn.cursor()
+        if not table_exists(cur, "sequenza_codice"):
+            print("[DDL] Crea tabella sequenza_codice")
+            cur.executescript("""
+            CREATE TABLE sequenza_codice (
+              id INTEGER PRIMARY KEY AUTOINCREMENT,
+              ambito VARCHAR(10) NOT NULL,
+              prefisso VARCHAR(20) NOT NULL,
+              ultimo INTEGER NOT NULL DEFAULT 0,
+              CONSTRAINT uq_sequenza_codice_ambito_prefisso UNIQUE (ambito, prefisso)
+            );
+            """)
+        else:
+            print("[OK] Tabella 'sequenza_codice' già presente.")
+
+        if not table_exists(cur, "articolo"):
+            print("[WARN] Tabella 'articolo' non presente. Nessun contatore da inizializzare.")
+            conn.commit()
+            return
+
+        massimi = {}
+        for (code,) in cur.execute("SELECT codice_interno FROM articolo"):
+            m = PROGRESSIVO_RE.match(code or "")
+            if m:
+                pre, n = m.group(1), int(m.group(2))
+                if n > massimi.get(pre, 0):
+                    massimi[pre] = n
+
+        for pre, n in sorted(massimi.items()):
+            cur.execute(
+                "INSERT INTO sequenza_codice (ambito, prefisso, ultimo) VALUES ('interno', ?, ?) "
+                "ON CONFLICT(ambito, prefisso) DO UPDATE SET ultimo = MAX(ultimo, excluded.ultimo)",
+                (pre, n),
+            )
+            print(f"[SEED] {pre}: {n}")
+        conn.commit()
+        print(f"[DONE] Contatori inizializzati: {len(massimi)}")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
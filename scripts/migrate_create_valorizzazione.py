@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Crea le tabelle 'valorizzazione' e 'lotto_fifo' (costo medio ponderato e
+# lotti FIFO, services/valuation). Solo SQLite. Rieseguibile.
+# Poi: flask magazzino rebuild-valorizzazione
+
+import os, re, sqlite3, sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(ROOT, os.pardir))
+
+def read_env_sqlite_uri():
+    env_path = os.path.join(PROJECT_ROOT, ".env")
+    uri = None
+    if os.path.exists(env_path):
+        with open(env_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip().startswith("SQLALCHEMY_DATABASE_URI"):
+                    try:
+                        _, val = line.split("=", 1)
+                        uri = val.strip()
+                    except ValueError:
+                        pass
+                    break
+    if not uri:
+        uri = "sqlite:///magazzino.db"
+    if not uri.lower().startswith("sqlite"):
+        return None, "Solo SQLite supportato da questo script. URI attuale: %s" % uri
+    m = re.match(r"sqlite:(?P<slashes>/{2,})(?P<path>.*)", uri, flags=re.I)
+    if not m:
+        return None, "URI SQLite non riconosciuto: %s" % uri
+    path = m.group("path")
+    if m.group("slashes") == "////":  # absolute
+        db_path = "/" + path if not path.startswith("/") else path
+    else:  # '///' relative to project root
+        db_path = os.path.join(PROJECT_ROOT, path)
+    db_path = os.path.normpath(db_path)
+    return db_path, None
+
+def table_exists(cur, name):
+    cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?;", (name,))
+    return cur.fetchone() is not None
+
+def main():
+    db_path, err = read_env_sqlite_uri()
+    if err:
+        print("[ERRORE]", err)
+        sys.exit(2)
+    print("[INFO] Database:", db_path)
+    if not os.path.exists(db_path):
+        print("[WARN] DB non trovato. Nulla da migrare.")
+        sys.exit(0)
+
+    conn = sqlite3.connect(db_path)
+    try:
+        cur = conn.cursor()
+        if not table_exists(cur, "valorizzazione"):
+            print("[DDL] Crea tabella valorizzazione")
+            cur.executescript("""
+            CREATE TABLE valorizzazione (
+              articolo_id INTEGER NOT NULL REFERENCES articolo (id),
+              magazzino_id INTEGER NOT NULL REFERENCES magazzino (id),
+              quantita NUMERIC(14, 3) NOT NULL DEFAULT 0,
+              costo_medio NUMERIC(14, 4) NOT NULL DEFAULT 0,
+              valore_medio NUMERIC(16, 4) NOT NULL DEFAULT 0,
+              valore_fifo NUMERIC(16, 4) NOT NULL DEFAULT 0,
+              PRIMARY KEY (articolo_id, magazzino_id)
+            );
+            """)
+        else:
+            print("[OK] Tabella 'valorizzazione' già presente.")
+        if not table_exists(cur, "lotto_fifo"):
+            print("[DDL] Crea tabella lotto_fifo")
+            cur.executescript("""
+            CREATE TABLE lotto_fifo (
+              id INTEGER NOT NULL PRIMARY KEY,
+              articolo_id INTEGER NOT NULL REFERENCES articolo (id),
+              magazzino_id INTEGER NOT NULL REFERENCES magazzino (id),
+              documento_id INTEGER REFERENCES documento (id),
+              data DATETIME NOT NULL,
+              quantita NUMERIC(14, 3) NOT NULL,
+              residuo NUMERIC(14, 3) NOT NULL,
+              costo_unitario NUMERIC(14, 4) NOT NULL DEFAULT 0,
+              aperto BOOLEAN NOT NULL DEFAULT 1
+            );
+            CREATE INDEX IF NOT EXISTS ix_lotto_fifo_aperti
+              ON lotto_fifo (articolo_id, magazzino_id, aperto, data, id);
+            """)
+        else:
+            print("[OK] Tabella 'lotto_fifo' già presente.")
+        conn.commit()
+        print("[DONE]")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+import pytest
+from flask import Flask
+
+from app.extensions import db
+from app.models import Magazzino, Partner, Articolo
+
+
+@pytest.fixture
+def app():
+    """App minimale con DB SQLite in memoria (senza blueprint)."""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['TESTING'] = True
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def base_data(app):
+    """Un magazzino, un fornitore, un cliente e tre articoli."""
+    mag = Magazzino(codice='MAG1', nome='Magazzino Principale')
+    forn = Partner(nome='Fornitore Test', tipo='Fornitore')
+    cli = Partner(nome='Cliente Test', tipo='Cliente')
+    arts = [Articolo(codice_interno=f'ART{i:03d}', descrizione=f'Articolo {i}') for i in range(1, 4)]
+    db.session.add_all([mag, forn, cli, *arts])
+    db.session.commit()
+    return {'mag': mag, 'fornitore': forn, 'cliente': cli, 'articoli': arts}
+
+
+@pytest.fixture
+def file_app(tmp_path):
+    """App su DB SQLite file (condiviso tra thread), upload in tmp_path."""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'jobs.db'}"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['TESTING'] = True
+    app.config['UPLOAD_FOLDER'] = str(tmp_path / 'uploads')
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    yield app
+    queue = app.extensions.get('parse_jobs')
+    if queue:
+        queue.stop()
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
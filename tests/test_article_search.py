@@ -0,0 +1,89 @@
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import insert
+
+from app.extensions import db
+from app.models import Articolo, Giacenza
+from app.services.article_search import ensure_search_index, search_articolo_ids, fts_query
+
+
+@pytest.fixture
+def catalogo(app):
+    assert ensure_search_index(db.engine)
+    arts = [
+        Articolo(codice_interno='CAM12345', codice_fornitore='12345', descrizione='Tubo rame 12mm ricotto'),
+        Articolo(codice_interno='CAM22222', codice_fornitore='RAC-14', descrizione='Raccordo ottone 1/2"'),
+        Articolo(codice_interno='TUBORAME14', codice_fornitore=None, descrizione='Tubo rame 14mm'),
+        Articolo(codice_interno='WUR000001', codice_fornitore='0890', descrizione='Nastro isolante nero'),
+    ]
+    db.session.add_all(arts)
+    db.session.commit()
+    return arts
+
+
+def _codici(ids):
+    by_id = {a.id: a.codice_interno for a in Articolo.query.filter(Articolo.id.in_(ids))}
+    return [by_id[i] for i in ids]
+
+
+def test_fts_query():
+    assert fts_query('tubo  rame') == '"tubo"* AND "rame"*'
+    assert fts_query('RAC-14') == '"RAC"* AND "14"*'
+    assert fts_query('"; --') is None
+
+
+def test_prefisso_e_token_multipli(app, catalogo):
+    assert set(_codici(search_articolo_ids(db.session, 'tub ram', 10))) == {'CAM12345', 'TUBORAME14'}
+    assert _codici(search_articolo_ids(db.session, 'tubo 14', 10)) == ['TUBORAME14']
+    assert _codici(search_articolo_ids(db.session, 'rac-14', 10)) == ['CAM22222']
+    assert search_articolo_ids(db.session, 'inesistente', 10) == []
+
+
+def test_ranking_codice_prima_della_descrizione(app, catalogo):
+    db.session.add(Articolo(codice_interno='ALTRO', descrizione='Staffa per tuboramex'))
+    db.session.commit()
+    assert _codici(search_articolo_ids(db.session, 'tuborame', 10))[0] == 'TUBORAME14'
+
+
+def test_indice_allineato_su_insert_update_delete(app, catalogo):
+    # insert massivo Core (come l'import DDT)
+    db.session.execute(insert(Articolo.__table__), [
+        {"codice_interno": "SAB0001", "descrizione": "Valvola sfera 3/4"}])
+    db.session.commit()
+    assert _codici(search_articolo_ids(db.session, 'valvola', 10)) == ['SAB0001']
+
+    art = catalogo[3]
+    art.descrizione = 'Nastro teflon'
+    db.session.commit()
+    assert search_articolo_ids(db.session, 'isolante', 10) == []
+    assert _codici(search_articolo_ids(db.session, 'teflon', 10)) == ['WUR000001']
+
+    db.session.delete(art)
+    db.session.commit()
+    assert search_articolo_ids(db.session, 'teflon', 10) == []
+
+
+def test_endpoint_stessi_formati_json(app, catalogo, base_data):
+    from app.blueprints.docops import docops_bp
+    from app.blueprints.importing import importing_bp
+    app.register_blueprint(docops_bp, url_prefix='/docops')
+    app.register_blueprint(importing_bp, url_prefix='/importing')
+    db.session.add(Giacenza(articolo_id=catalogo[0].id, magazzino_id=base_data['mag'].id, quantita=7))
+    db.session.commit()
+    client = app.test_client()
+
+    res = client.get('/docops/api/articles/search?q=tubo rame&limit=5').get_json()
+    assert {r['codice_interno'] for r in res} == {'CAM12345', 'TUBORAME14'}
+    assert set(res[0]) == {'id', 'codice_interno', 'descrizione', 'last_cost'}
+
+    res = client.get(f"/importing/api/inventory/search?q=12345&magazzino_id={base_data['mag'].id}").get_json()
+    assert res[0]['codice_interno'] == 'CAM12345' and res[0]['giacenza'] == 7.0
+    assert set(res[0]) == {'articolo_id', 'codice_interno', 'codice_fornitore', 'descrizione', 'giacenza', 'last_cost'}
+
+    # senza ricerca: ordine per descrizione, numeri arrotondati nel DB e serializzati come numeri JSON
+    catalogo[1].last_cost = Decimal('1.23456')
+    db.session.commit()
+    res = client.get(f"/importing/api/inventory/search?magazzino_id={base_data['mag'].id}").get_json()
+    raccordo = next(r for r in res if r['codice_interno'] == 'CAM22222')
+    assert raccordo['last_cost'] == 1.23 and raccordo['giacenza'] == 0
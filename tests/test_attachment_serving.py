@@ -0,0 +1,66 @@
+import pytest
+
+from app.extensions import db
+from app.models import Allegato, Blob, Documento, Magazzino, Partner
+from app.services.blob_store import attach_upload
+
+from test_blob_store import _upload
+
+PDF = b'%PDF-1.4 ' + bytes(range(256)) * 40
+
+
+@pytest.fixture
+def client_allegato(file_app):
+    from app.blueprints.files import files_bp
+    from app.blueprints.importing import importing_bp
+    file_app.register_blueprint(files_bp, url_prefix='/files')
+    file_app.register_blueprint(importing_bp, url_prefix='/importing')
+    with file_app.app_context():
+        doc = Documento(tipo='DDT_IN', partner=Partner(nome='F', tipo='Fornitore'),
+                        magazzino=Magazzino(codice='MAG1', nome='Principale'))
+        db.session.add(doc)
+        db.session.flush()
+        a = attach_upload(db.session, Allegato, Blob, doc.id, _upload(file_app, 'bolla è.pdf', PDF))
+        db.session.commit()
+        ids = (a.id, a.blob_sha256)
+    return file_app.test_client(), ids
+
+
+def test_etag_forte_e_get_condizionale(client_allegato):
+    client, (aid, sha) = client_allegato
+    res = client.get(f'/files/download/{aid}')
+    assert res.status_code == 200 and res.data == PDF
+    assert res.headers['ETag'] == f'"{sha}"'
+    assert res.headers['Accept-Ranges'] == 'bytes'
+    assert 'attachment' in res.headers['Content-Disposition']
+    assert "filename*=UTF-8''bolla%20%C3%A8.pdf" in res.headers['Content-Disposition']
+    assert 'private' in res.headers['Cache-Control']
+
+    res = client.get(f'/files/download/{aid}', headers={'If-None-Match': f'"{sha}"'})
+    assert res.status_code == 304 and res.data == b''
+
+
+def test_range_per_il_viewer_pdf(client_allegato):
+    client, (aid, _) = client_allegato
+    res = client.get(f'/files/view/{aid}', headers={'Range': 'bytes=100-199'})
+    assert res.status_code == 206
+    assert res.data == PDF[100:200]
+    assert res.headers['Content-Range'] == f'bytes 100-199/{len(PDF)}'
+    assert res.headers['Content-Disposition'].startswith('inline')
+
+
+def test_vecchio_url_reindirizza(client_allegato):
+    client, (aid, _) = client_allegato
+    res = client.get(f'/importing/files/download/{aid}')
+    assert res.status_code == 301 and res.headers['Location'].endswith(f'/files/download/{aid}')
+    assert client.get('/files/download/999').status_code == 404
+
+
+def test_offload_x_accel_redirect(client_allegato, file_app):
+    client, (aid, sha) = client_allegato
+    file_app.config['ATTACHMENT_ACCEL_REDIRECT'] = '/_uploads/'
+    res = client.get(f'/files/view/{aid}')
+    assert res.status_code == 200 and res.data == b''
+    assert res.headers['X-Accel-Redirect'] == f'/_uploads/sha256/{sha[:2]}/{sha[2:4]}/{sha}'
+    assert res.headers['Content-Type'] == 'application/pdf'
+    assert client.get(f'/files/view/{aid}', headers={'If-None-Match': f'"{sha}"'}).status_code == 304
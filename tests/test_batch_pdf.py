@@ -0,0 +1,81 @@
+import io
+import zipfile
+from datetime import date
+from decimal import Decimal
+
+import pypdf
+import pytest
+
+from app.extensions import db
+from app.models import Articolo, Documento, Magazzino, Partner, RigaDocumento
+from app.services import batch_pdf, pdf_cache
+
+
+@pytest.fixture
+def docs(file_app):
+    with file_app.app_context():
+        mag = Magazzino(codice='MAG1', nome='Principale')
+        forn = Partner(nome='Fornitore', tipo='Fornitore')
+        art = Articolo(codice_interno='ART001', descrizione='Filtro')
+        db.session.add_all([mag, forn, art])
+        db.session.flush()
+        out = []
+        for i, (tipo, status, giorno) in enumerate([('DDT_IN', 'Confermato', 3), ('DDT_OUT', 'Confermato', 1),
+                                                    ('DDT_IN', 'Confermato', 2), ('DDT_IN', 'Bozza', 2),
+                                                    ('DDT_IN', 'Confermato', 28)]):
+            d = Documento(tipo=tipo, status=status, numero=i + 1 if status != 'Bozza' else None, anno=2025,
+                          data=date(2025, 3 if giorno != 28 else 2, giorno),
+                          partner_id=forn.id, magazzino_id=mag.id)
+            db.session.add(d)
+            db.session.flush()
+            db.session.add(RigaDocumento(documento_id=d.id, articolo_id=art.id, descrizione=f'Riga {i}',
+                                         quantita=Decimal('1'), prezzo=Decimal('2')))
+            out.append(d.id)
+        db.session.commit()
+    return out
+
+
+def _ids(**filters):
+    return [d.id for d in batch_pdf.documents_query(**filters)]
+
+
+def test_filtri_e_ordine_di_stampa(file_app, docs):
+    with file_app.app_context():
+        marzo = _ids(d_from=date(2025, 3, 1), d_to=date(2025, 3, 31))
+        assert marzo == [docs[1], docs[2], docs[0]]
+        assert _ids(d_from=date(2025, 3, 1), tipo='DDT_IN') == [docs[2], docs[0]]
+        assert docs[3] in _ids(status=None)
+
+
+def test_zip_un_pdf_per_documento(file_app, docs):
+    with file_app.app_context():
+        ids = _ids(d_from=date(2025, 3, 1))
+        data = b''.join(batch_pdf.iter_batch('zip', ids, workers=1))
+        zf = zipfile.ZipFile(io.BytesIO(data))
+        assert zf.namelist() == ['DDT_OUT_2025_00002.pdf', 'DDT_IN_2025_00003.pdf', 'DDT_IN_2025_00001.pdf']
+        assert all(zf.read(n).startswith(b'%PDF') for n in zf.namelist())
+        # i PDF generati restano in cache per la stampa successiva
+        assert all(pdf_cache.cached_file(db.session.get(Documento, i), 'completo') for i in ids)
+
+
+def test_pdf_unico_con_pool_di_processi(file_app, docs):
+    with file_app.app_context():
+        ids = _ids()
+        data = b''.join(batch_pdf.iter_batch('pdf', ids, workers=2))
+        reader = pypdf.PdfReader(io.BytesIO(data))
+        assert len(reader.pages) == len(ids)
+        assert [o.title for o in reader.outline][:2] == ['DDT_IN_2025_00005', 'DDT_OUT_2025_00002']
+        with pytest.raises(ValueError):
+            batch_pdf.iter_batch('docx', ids)
+
+
+def test_endpoint(file_app, docs):
+    from app.blueprints.exports import exports_bp
+    file_app.register_blueprint(exports_bp, url_prefix='/exports')
+    file_app.config['PDF_BATCH_WORKERS'] = 1
+    client = file_app.test_client()
+    res = client.get('/exports/documents-pdf.zip?from_date=01/03/2025&to_date=31/03/2025&tipo=DDT_IN')
+    assert res.status_code == 200 and res.mimetype == 'application/zip'
+    assert len(zipfile.ZipFile(io.BytesIO(res.data)).namelist()) == 2
+    assert client.get('/exports/documents-pdf.zip?from_date=01/01/2030').status_code == 404
+    assert client.get('/exports/documents-pdf.docx').status_code == 404
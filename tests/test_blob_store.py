@@ -0,0 +1,178 @@
+import os
+from pathlib import Path
+
+from flask import Flask
+from sqlalchemy import event
+
+from app.extensions import db
+from app.models import Allegato, Blob, Documento, Magazzino, Partner
+from app.services.blob_store import (attach_upload, blob_abs_path, discard_upload, gc_blobs,
+                                     migrate_attachments, remove_gc_files)
+from app.services.file_service import get_file_hash
+
+
+def _upload(app, name, content):
+    """Simula save_upload: file sotto UPLOAD_FOLDER, path relativo al suo padre."""
+    root = Path(app.config['UPLOAD_FOLDER'])
+    path = root / 'incoming_ddt' / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+    return str(path.relative_to(root.parent))
+
+
+def _documenti(n):
+    mag = Magazzino(codice='MAG1', nome='Magazzino Principale')
+    forn = Partner(nome='Fornitore Test', tipo='Fornitore')
+    docs = [Documento(tipo='DDT_IN', partner=forn, magazzino=mag) for _ in range(n)]
+    db.session.add_all([mag, forn, *docs])
+    db.session.commit()
+    return docs
+
+
+def test_stesso_contenuto_un_solo_file(file_app):
+    with file_app.app_context():
+        d1, d2 = _documenti(2)
+        rels = [_upload(file_app, 'a.pdf', b'%PDF-1.4 uguale'), _upload(file_app, 'b.pdf', b'%PDF-1.4 uguale')]
+        for doc, rel in zip((d1, d2), rels):
+            attach_upload(db.session, Allegato, Blob, doc.id, rel, filename=os.path.basename(rel))
+        db.session.commit()
+        for rel in rels:
+            discard_upload(rel)
+
+        blob = Blob.query.one()
+        assert blob.refcount == 2 and blob.size == len(b'%PDF-1.4 uguale')
+        assert {a.filename for a in Allegato.query} == {'a.pdf', 'b.pdf'}
+        assert blob_abs_path(blob.sha256).read_bytes() == b'%PDF-1.4 uguale'
+        assert not list((Path(file_app.config['UPLOAD_FOLDER']) / 'incoming_ddt').iterdir())
+
+
+def test_refcount_scende_e_gc_elimina_orfani(file_app):
+    with file_app.app_context():
+        d1, d2 = _documenti(2)
+        for doc in (d1, d2):
+            attach_upload(db.session, Allegato, Blob, doc.id, _upload(file_app, 'x.pdf', b'contenuto'))
+        db.session.commit()
+        sha = Blob.query.one().sha256
+
+        db.session.delete(Allegato.query.filter_by(documento_id=d1.id).one())
+        db.session.commit()
+        assert db.session.get(Blob, sha).refcount == 1
+        assert gc_blobs(db.session, Allegato, Blob, grace_seconds=0)['blob_eliminati'] == 0
+
+        db.session.delete(Allegato.query.filter_by(documento_id=d2.id).one())
+        db.session.commit()
+        assert db.session.get(Blob, sha).refcount == 0
+        # file senza riga (transazione fallita dopo la copia)
+        stray = blob_abs_path('ab' * 32)
+        stray.parent.mkdir(parents=True, exist_ok=True)
+        stray.write_bytes(b'orfano')
+
+        res = gc_blobs(db.session, Allegato, Blob, dry_run=True, grace_seconds=0)
+        db.session.rollback()
+        assert res['blob_eliminati'] == 1 and res['file_orfani'] == 1
+        assert blob_abs_path(sha).exists() and stray.exists()
+
+        res = gc_blobs(db.session, Allegato, Blob, grace_seconds=0)
+        # i file restano fino al commit: un rollback ritroverebbe le righe senza file
+        assert blob_abs_path(sha).exists() and stray.exists()
+        db.session.commit()
+        remove_gc_files(res)
+        assert res['byte_liberati'] == len(b'contenuto') + len(b'orfano')
+        assert Blob.query.count() == 0
+        assert not blob_abs_path(sha).exists() and not stray.exists()
+
+
+def test_gc_riallinea_refcount(file_app):
+    with file_app.app_context():
+        (doc,) = _documenti(1)
+        attach_upload(db.session, Allegato, Blob, doc.id, _upload(file_app, 'x.pdf', b'abc'))
+        db.session.commit()
+        # delete massivo: gli eventi ORM non scattano
+        Allegato.query.delete()
+        db.session.commit()
+        assert Blob.query.one().refcount == 1
+        res = gc_blobs(db.session, Allegato, Blob, grace_seconds=0)
+        assert res['refcount_riallineati'] == 1 and res['blob_eliminati'] == 1
+
+
+
+def test_gc_non_tocca_blob_ripreso_in_corsa(file_app):
+    with file_app.app_context():
+        (doc,) = _documenti(1)
+        rel = _upload(file_app, 'x.pdf', b'in corsa')
+        attach_upload(db.session, Allegato, Blob, doc.id, rel)
+        db.session.commit()
+        sha = Allegato.query.one().blob_sha256
+        db.session.delete(Allegato.query.one())
+        db.session.commit()
+
+        def _attach_concorrente(conn, cursor, statement, parameters, context, executemany):
+            # tra la select degli orfani e la DELETE il blob torna referenziato
+            if statement.lstrip().upper().startswith('DELETE FROM BLOB'):
+                cursor.connection.execute('UPDATE blob SET refcount = 1 WHERE sha256 = ?', (sha,))
+
+        event.listen(db.engine, 'before_cursor_execute', _attach_concorrente)
+        try:
+            res = gc_blobs(db.session, Allegato, Blob, grace_seconds=0)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', _attach_concorrente)
+        db.session.commit()
+        assert res['blob_eliminati'] == 0 and res['byte_liberati'] == 0
+        assert db.session.get(Blob, sha).refcount == 1
+        assert blob_abs_path(sha).exists()
+
+
+def test_gc_file_rimossi_dopo_il_commit(file_app):
+    with file_app.app_context():
+        d1, d2 = _documenti(2)
+        attach_upload(db.session, Allegato, Blob, d1.id, _upload(file_app, 'a.pdf', b'riuso'))
+        db.session.commit()
+        sha = Allegato.query.one().blob_sha256
+        db.session.delete(Allegato.query.one())
+        db.session.commit()
+
+        # commit fallito: la riga torna e il file c'è ancora
+        gc_blobs(db.session, Allegato, Blob, grace_seconds=0)
+        db.session.rollback()
+        assert db.session.get(Blob, sha) is not None and blob_abs_path(sha).exists()
+
+        # stesso contenuto ricaricato tra il commit del GC e la rimozione dei file
+        res = gc_blobs(db.session, Allegato, Blob, grace_seconds=0)
+        db.session.commit()
+        attach_upload(db.session, Allegato, Blob, d2.id, _upload(file_app, 'b.pdf', b'riuso'))
+        db.session.commit()
+        remove_gc_files(res)
+        assert db.session.get(Blob, sha).refcount == 1
+        assert blob_abs_path(sha).read_bytes() == b'riuso'
+
+
+def test_migrazione_percorsi_storici(tmp_path):
+    app = Flask(__name__, root_path=str(tmp_path / 'app'))
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    app.config['UPLOAD_FOLDER'] = str(tmp_path / 'app' / 'uploads')
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        d1, d2 = _documenti(2)
+        for doc in (d1, d2):
+            storico = tmp_path / 'app' / 'uploads' / 'documents' / str(doc.id) / 'ddt.pdf'
+            storico.parent.mkdir(parents=True)
+            storico.write_bytes(b'%PDF stesso ddt')
+            db.session.add(Allegato(documento_id=doc.id, filename='ddt.pdf', mime='application/pdf',
+                                    path=f'uploads/documents/{doc.id}/ddt.pdf', size=15))
+        db.session.add(Allegato(documento_id=d1.id, filename='perso.pdf', path='uploads/documents/x/perso.pdf'))
+        db.session.commit()
+
+        migrati, mancanti, risparmiati, originali = migrate_attachments(db.session, Allegato, Blob)
+        db.session.commit()
+        for p in originali:
+            p.unlink()
+
+        assert (migrati, mancanti, risparmiati) == (2, 1, 15)
+        sha = get_file_hash(str(blob_abs_path(Blob.query.one().sha256)))
+        assert Blob.query.one().refcount == 2
+        for a in Allegato.query.filter(Allegato.blob_sha256.isnot(None)):
+            assert a.path == f'uploads/sha256/{sha[:2]}/{sha[2:4]}/{sha}'
+            assert (Path(app.root_path) / a.path).read_bytes() == b'%PDF stesso ddt'
+        db.session.remove()
+        db.drop_all()
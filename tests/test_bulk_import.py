@@ -0,0 +1,102 @@
+import io
+import threading
+
+from reportlab.pdfgen import canvas
+from werkzeug.datastructures import FileStorage
+
+from app.services.bulk_import import parse_uploads
+from app.services.parse_jobs import ParseJobQueue, ParserSpec, TokenBucket
+
+
+def _pdf(text):
+    buf = io.BytesIO()
+    c = canvas.Canvas(buf)
+    c.drawString(72, 720, text)
+    c.save()
+    return buf.getvalue()
+
+
+class TextParser:
+    """Parser a testo: una riga per DDT con il codice letto dal PDF."""
+
+    def __init__(self):
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, raw_text, uploaded_file):
+        with self._lock:
+            self.calls.append(raw_text)
+        if 'VUOTO' in raw_text:
+            return {"ok": True, "type": "ddt", "data": {"fornitore": "X", "righe": []}}
+        codice = raw_text.split()[-1]
+        return {"ok": True, "type": "ddt", "method": "stub", "uploaded_file": uploaded_file,
+                "data": {"fornitore": "ACME", "righe": [{"codice": codice, "um": "pz"}]}}
+
+
+def _queue(app, parser, bucket=None):
+    spec = ParserSpec(lambda p, u: None, bucket is not None, True, '1', parser)
+    queue = ParseJobQueue(app, workers=1, parsers={'ddt': spec}, bucket=bucket)
+    app.extensions['parse_jobs'] = queue
+    return queue
+
+
+def _files(*items):
+    return [FileStorage(io.BytesIO(data), filename=name) for name, data in items]
+
+
+def test_un_file_rotto_non_blocca_gli_altri(file_app):
+    parser = TextParser()
+    _queue(file_app, parser)
+    with file_app.test_request_context():
+        out = parse_uploads('ddt', _files(('a.pdf', _pdf('DDT codice A1')), ('rotto.pdf', b'non un pdf'),
+                                          ('b.pdf', _pdf('DDT codice B2')), ('vuoto.pdf', _pdf('VUOTO'))),
+                            workers=2)
+    assert [o['filename'] for o in out] == ['a.pdf', 'rotto.pdf', 'b.pdf', 'vuoto.pdf']
+    a, rotto, b, vuoto = out
+    assert a['ok'] and a['preview']['righe'] == [{'codice': 'A1', 'um': 'PZ'}]
+    assert a['preview']['uploaded_file'].startswith('uploads/incoming_ddt/') and a['method'] == 'stub'
+    assert b['ok'] and b['preview']['righe'][0]['codice'] == 'B2'
+    assert not rotto['ok'] and 'illeggibile' in rotto['error']
+    assert not vuoto['ok'] and vuoto['error'] == 'Nessuna riga trovata'
+    assert len(parser.calls) == 3
+
+
+def test_duplicati_e_cache(file_app):
+    parser = TextParser()
+    _queue(file_app, parser)
+    pdf = _pdf('DDT codice C3')
+    with file_app.test_request_context():
+        out = parse_uploads('ddt', _files(('c.pdf', pdf), ('c_copia.pdf', pdf)), workers=1)
+        assert [o['ok'] for o in out] == [True, True] and len(parser.calls) == 1
+        assert out[0]['uploaded_file'] != out[1]['uploaded_file']
+        assert out[1]['preview']['uploaded_file'] == out[1]['uploaded_file']
+
+        again = parse_uploads('ddt', _files(('c_ancora.pdf', pdf)), workers=1)
+    assert again[0]['cached'] and again[0]['ok'] and len(parser.calls) == 1
+
+
+def test_llm_passa_dal_bucket(file_app):
+    acquired = []
+
+    class Bucket(TokenBucket):
+        def acquire(self, n=1.0):
+            acquired.append(n)
+
+    _queue(file_app, TextParser(), bucket=Bucket(rate=1))
+    with file_app.test_request_context():
+        out = parse_uploads('ddt', _files(*[(f'{i}.pdf', _pdf(f'DDT codice X{i}')) for i in range(4)]), workers=1)
+    assert all(o['ok'] for o in out) and len(acquired) == 4
+
+
+def test_endpoint(file_app):
+    from app.blueprints.importing import importing_bp
+    file_app.register_blueprint(importing_bp, url_prefix='/importing')
+    file_app.config['PDF_BATCH_WORKERS'] = 1
+    _queue(file_app, TextParser())
+    client = file_app.test_client()
+    res = client.post('/importing/api/parse-ddt-bulk', content_type='multipart/form-data', data={
+        'pdf_files': [(io.BytesIO(_pdf('DDT codice Z9')), 'z.pdf'), (io.BytesIO(b'xx'), 'no.pdf')]})
+    body = res.get_json()
+    assert res.status_code == 200 and body['count'] == 2 and body['errors'] == 1
+    assert body['results'][0]['preview']['fornitore'] == 'ACME'
+    assert client.post('/importing/api/parse-ddt-bulk').status_code == 400
@@ -0,0 +1,36 @@
+from app.extensions import db
+from app.models import Articolo, SequenzaCodice
+from app.utils import alloc_sequenza, gen_internal_code, gen_code_from_descr, reserve_internal_codes
+
+
+def test_contatore_inizializzato_dai_codici_esistenti(app):
+    db.session.add_all([Articolo(codice_interno='SAB000010', descrizione='a'),
+                        Articolo(codice_interno='SAB000003', descrizione='b')])
+    db.session.flush()
+
+    assert gen_internal_code('SAB') == 'SAB000011'
+    assert reserve_internal_codes('SAB', [None, None, None]) == ['SAB000012', 'SAB000013', 'SAB000014']
+    seq = SequenzaCodice.query.filter_by(ambito='interno', prefisso='SAB').one()
+    assert seq.ultimo == 14
+
+
+def test_alloc_sequenza_blocchi_consecutivi(app):
+    assert list(alloc_sequenza('interno', 'XYZ', 3)) == [1, 2, 3]
+    assert list(alloc_sequenza('interno', 'XYZ', 2)) == [4, 5]
+    assert list(alloc_sequenza('descr', 'XYZ')) == [1]
+
+
+def test_progressivo_salta_codici_gia_usati(app):
+    db.session.add(Articolo(codice_interno='WUR000001', descrizione='da codice fornitore'))
+    db.session.add(SequenzaCodice(ambito='interno', prefisso='WUR', ultimo=0))
+    db.session.flush()
+    assert gen_internal_code('WUR') == 'WUR000002'
+
+
+def test_gen_code_from_descr(app):
+    assert gen_code_from_descr('Tubo rame 12mm') == 'TUBORAME12'
+    db.session.add(Articolo(codice_interno='TUBORAME12', descrizione='x'))
+    db.session.add(Articolo(codice_interno='TUBORAME1204', descrizione='y'))
+    db.session.flush()
+    assert gen_code_from_descr('Tubo rame 12mm') == 'TUBORAME1205'
+    assert gen_code_from_descr('Tubo rame 12mm') == 'TUBORAME1206'
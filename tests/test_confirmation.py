@@ -0,0 +1,83 @@
+from decimal import Decimal
+
+import pytest
+
+from app.extensions import db
+from app.models import Documento, RigaDocumento, Giacenza, Movimento
+from app.services.confirmation import apply_document_movements
+from app.utils import get_giacenza
+
+
+def _draft(base_data, tipo, righe):
+    partner = base_data['fornitore'] if tipo == 'DDT_IN' else base_data['cliente']
+    doc = Documento(tipo=tipo, status='Bozza', partner_id=partner.id, magazzino_id=base_data['mag'].id)
+    db.session.add(doc)
+    db.session.flush()
+    for art, qty, prezzo in righe:
+        db.session.add(RigaDocumento(documento_id=doc.id, articolo_id=art.id,
+                                     quantita=Decimal(qty), prezzo=Decimal(prezzo)))
+    db.session.flush()
+    return doc
+
+
+def test_carico_aggrega_righe_stesso_articolo(base_data):
+    a1, a2, _ = base_data['articoli']
+    doc = _draft(base_data, 'DDT_IN', [(a1, '2', '1.50'), (a2, '5', '3.00'), (a1, '3', '1.70')])
+
+    n = apply_document_movements(doc, db.session, update_last_cost=True)
+    db.session.commit()
+
+    assert n == 3
+    assert doc.status == 'Confermato'
+    mag_id = base_data['mag'].id
+    assert get_giacenza(a1.id, mag_id) == Decimal('5.000')
+    assert get_giacenza(a2.id, mag_id) == Decimal('5.000')
+    assert Giacenza.query.count() == 2
+    movs = Movimento.query.filter_by(documento_id=doc.id).all()
+    assert all(m.tipo == 'carico' and m.quantita > 0 for m in movs)
+    assert a1.last_cost == Decimal('1.70')
+
+
+def test_scarico_insufficiente_non_applica_nulla(base_data):
+    a1, a2, _ = base_data['articoli']
+    carico = _draft(base_data, 'DDT_IN', [(a1, '10', '1'), (a2, '1', '1')])
+    apply_document_movements(carico, db.session)
+    db.session.commit()
+
+    scarico = _draft(base_data, 'DDT_OUT', [(a1, '4', '2'), (a2, '1', '2'), (a2, '1', '2')])
+    with pytest.raises(ValueError, match='ART002'):
+        apply_document_movements(scarico, db.session)
+    db.session.rollback()
+
+    assert get_giacenza(a1.id, base_data['mag'].id) == Decimal('10.000')
+    assert Movimento.query.filter_by(tipo='scarico').count() == 0
+
+
+def test_scarico_aggiorna_giacenze(base_data):
+    a1, _, _ = base_data['articoli']
+    apply_document_movements(_draft(base_data, 'DDT_IN', [(a1, '10', '1')]), db.session)
+    scarico = _draft(base_data, 'DDT_OUT', [(a1, '4', '2'), (a1, '6', '2')])
+    apply_document_movements(scarico, db.session)
+    db.session.commit()
+
+    assert get_giacenza(a1.id, base_data['mag'].id) == Decimal('0.000')
+    assert Movimento.query.filter_by(documento_id=scarico.id, tipo='scarico').count() == 2
+
+
+def test_documento_senza_righe(base_data):
+    doc = _draft(base_data, 'DDT_IN', [])
+    with pytest.raises(ValueError, match='Nessuna riga'):
+        apply_document_movements(doc, db.session)
+
+
+def test_righe_a_quantita_zero_saltate(base_data):
+    a1, a2, _ = base_data['articoli']
+    doc = _draft(base_data, 'DDT_IN', [(a1, '0', '1'), (a2, '2', '1')])
+    assert apply_document_movements(doc, db.session) == 1
+    # tutte a zero: confermato senza movimenti, come faceva docops
+    vuoto = _draft(base_data, 'DDT_OUT', [(a1, '0', '1')])
+    assert apply_document_movements(vuoto, db.session) == 0
+    db.session.commit()
+    assert vuoto.status == 'Confermato'
+    assert Movimento.query.filter_by(documento_id=vuoto.id).count() == 0
+    assert Giacenza.query.filter_by(articolo_id=a1.id).count() == 0
@@ -0,0 +1,95 @@
+import csv
+import io
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+from openpyxl import load_workbook
+
+from app.blueprints.exports import exports_bp
+from app.extensions import db
+from app.models import Documento, Giacenza, Movimento, RigaDocumento
+from app.services.export_service import iter_csv
+
+
+@pytest.fixture
+def client(app, base_data):
+    app.register_blueprint(exports_bp, url_prefix='/exports')
+    mag, forn, cli = base_data['mag'], base_data['fornitore'], base_data['cliente']
+    a1, a2, _ = base_data['articoli']
+    db.session.add_all([
+        Giacenza(articolo_id=a1.id, magazzino_id=mag.id, quantita=Decimal('12.5')),
+        Giacenza(articolo_id=a2.id, magazzino_id=mag.id, quantita=Decimal('0')),
+    ])
+    ddt_in = Documento(tipo='DDT_IN', status='Confermato', numero=1, anno=2025, data=date(2025, 3, 1),
+                       partner_id=forn.id, magazzino_id=mag.id)
+    ddt_out = Documento(tipo='DDT_OUT', status='Bozza', partner_id=cli.id, magazzino_id=mag.id)
+    db.session.add_all([ddt_in, ddt_out])
+    db.session.flush()
+    db.session.add_all([
+        RigaDocumento(documento_id=ddt_in.id, articolo_id=a1.id, descrizione='Riga 1',
+                      quantita=Decimal('12.5'), prezzo=Decimal('3.20')),
+        RigaDocumento(documento_id=ddt_in.id, articolo_id=a2.id, descrizione='Riga 2',
+                      quantita=Decimal('1'), prezzo=Decimal('0')),
+        Movimento(data=datetime(2025, 3, 1, 9, 0), articolo_id=a1.id, quantita=Decimal('12.5'),
+                  tipo='carico', magazzino_arrivo_id=mag.id, documento_id=ddt_in.id),
+        Movimento(data=datetime(2025, 4, 2, 17, 30), articolo_id=a1.id, quantita=Decimal('2'),
+                  tipo='scarico', magazzino_partenza_id=mag.id),
+    ])
+    db.session.commit()
+    return app.test_client()
+
+
+def _csv(res):
+    assert res.is_streamed
+    assert 'attachment' in res.headers['Content-Disposition']
+    text = res.get_data(as_text=True)
+    assert text.startswith('\ufeff')
+    return list(csv.reader(io.StringIO(text[1:]), delimiter=';'))
+
+
+def test_inventario_csv_con_filtri(client):
+    rows = _csv(client.get('/exports/inventory.csv'))
+    assert rows[0][:3] == ['Codice', 'Descrizione', 'Magazzino']
+    assert [r[0] for r in rows[1:]] == ['ART001', 'ART002', 'ART003']
+    assert rows[1][4] == '12,500'
+
+    rows = _csv(client.get('/exports/inventory.csv', query_string={'only_in_stock': '1'}))
+    assert [r[0] for r in rows[1:]] == ['ART001']
+
+
+def test_movimenti_csv_filtro_date(client):
+    rows = _csv(client.get('/exports/movements.csv'))
+    assert [r[2] for r in rows[1:]] == ['scarico', 'carico']
+    # carico da DDT_IN: la colonna "Da" mostra il fornitore
+    assert rows[2][6] == 'Fornitore Test' and rows[2][7] == 'MAG1'
+    assert rows[2][8] == 'DDT_IN 1/2025'
+
+    rows = _csv(client.get('/exports/movements.csv', query_string={'to_date': '2025-03-01'}))
+    assert [r[2] for r in rows[1:]] == ['carico']
+    rows = _csv(client.get('/exports/movements.csv', query_string={'from_date': '2025-04-02'}))
+    assert [r[2] for r in rows[1:]] == ['scarico']
+
+
+def test_documenti_xlsx(client):
+    res = client.get('/exports/documents.xlsx', query_string={'tipo': 'DDT_IN'})
+    assert res.is_streamed
+    assert res.mimetype.endswith('spreadsheetml.sheet')
+    ws = load_workbook(io.BytesIO(res.get_data())).active
+    values = list(ws.values)
+    assert values[0][0] == 'Tipo'
+    assert [(v[0], v[9], v[11]) for v in values[1:]] == [('DDT_IN', 'ART001', 12.5), ('DDT_IN', 'ART002', 1)]
+
+    res = client.get('/exports/documents.xlsx', query_string={'status': 'Bozza'})
+    values = list(load_workbook(io.BytesIO(res.get_data())).active.values)
+    assert [v[0] for v in values[1:]] == ['DDT_OUT']
+
+
+def test_formato_sconosciuto(client):
+    assert client.get('/exports/inventory.pdf').status_code == 404
+
+
+def test_csv_a_blocchi():
+    chunks = list(iter_csv(['n'], ([i] for i in range(1200)), chunk_rows=500))
+    assert len(chunks) == 3
+    assert ''.join(chunks).count('\r\n') == 1201
@@ -0,0 +1,47 @@
+from decimal import Decimal
+
+from app.extensions import db
+from app.models import Articolo, Documento, RigaDocumento
+from app.services.import_bulk import bulk_create_righe
+from app.utils import reserve_internal_codes
+
+
+def _line(codice, prezzo='1.00', qty='1'):
+    return {"codice": codice, "descrizione": f"Descr {codice or 'libera'}", "um": "PZ",
+            "quantita": Decimal(qty), "prezzo": Decimal(prezzo), "mastrino_codice": "0590001003"}
+
+
+def test_bulk_create_righe_risolve_e_crea_articoli(base_data):
+    forn = base_data['fornitore']
+    esistente = Articolo(codice_interno='FOR000007', codice_fornitore='X1', fornitore=forn.nome,
+                         descrizione='Esistente')
+    db.session.add(esistente)
+    doc = Documento(tipo='DDT_IN', status='Bozza', partner_id=forn.id, magazzino_id=base_data['mag'].id)
+    db.session.add(doc)
+    db.session.flush()
+
+    lines = [_line('X1', '2.00'), _line('N1', '3.00'), _line('N1', '3.50'), _line(''), _line('ART001')]
+    assert bulk_create_righe(doc.id, lines, forn.nome, 'FOR') == 5
+    db.session.commit()
+
+    righe = RigaDocumento.query.filter_by(documento_id=doc.id).order_by(RigaDocumento.id).all()
+    assert righe[0].articolo_id == esistente.id
+    assert righe[1].articolo_id == righe[2].articolo_id
+    assert righe[4].articolo_id == base_data['articoli'][0].id
+
+    nuovo = db.session.get(Articolo, righe[1].articolo_id)
+    assert nuovo.codice_interno == 'FORN1'
+    assert nuovo.codice_fornitore == 'N1'
+    assert nuovo.last_cost == Decimal('3.50')
+    assert db.session.get(Articolo, righe[3].articolo_id).codice_interno == 'FOR000008'
+    db.session.refresh(esistente)
+    assert esistente.last_cost == Decimal('2.00')
+
+
+def test_reserve_internal_codes_evita_collisioni(base_data):
+    db.session.add(Articolo(codice_interno='CAMA1', descrizione='x'))
+    db.session.add(Articolo(codice_interno='CAM000041', descrizione='y'))
+    db.session.flush()
+
+    codes = reserve_internal_codes('CAM', ['A1', 'B2', None, 'B-2'])
+    assert codes == ['CAM000042', 'CAMB2', 'CAM000043', 'CAM000044']
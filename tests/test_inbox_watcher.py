@@ -0,0 +1,146 @@
+import io
+import threading
+import time
+
+from reportlab.pdfgen import canvas
+
+from app.extensions import db
+from app.models import Allegato, Documento, Magazzino
+from app.services.inbox_watcher import InboxWatcher
+from app.services.parse_jobs import ParseJobQueue, ParserSpec
+
+
+def _pdf(text):
+    buf = io.BytesIO()
+    c = canvas.Canvas(buf)
+    c.drawString(72, 720, text)
+    c.save()
+    return buf.getvalue()
+
+
+def _magazzino(app):
+    with app.app_context():
+        mag = Magazzino(codice='MAG1', nome='Principale')
+        db.session.add(mag)
+        db.session.commit()
+        return mag.id
+
+
+def _watcher(app, inbox, **kw):
+    kw.setdefault('settle_seconds', 0)
+    kw.setdefault('log', lambda msg: None)
+    return InboxWatcher(app, inbox, **kw)
+
+
+def test_smista_importati_e_scartati(file_app, tmp_path):
+    inbox = tmp_path / 'inbox'
+    inbox.mkdir()
+    for name in ('a.pdf', 'rotto.pdf', 'b.PDF'):
+        (inbox / name).write_bytes(_pdf(name))
+    (inbox / 'note.txt').write_text('ignorato')
+
+    def importer(path):
+        if 'rotto' in path.name:
+            raise ValueError('PDF illeggibile')
+        return {'ok': True, 'document_id': 1}
+
+    stats = _watcher(file_app, inbox, importer=importer).run(once=True)
+    assert stats == {'importati': 2, 'duplicati': 0, 'scartati': 1}
+    assert sorted(p.name for p in (inbox / 'importati').iterdir()) == ['a.pdf', 'b.PDF']
+    assert (inbox / 'scartati' / 'rotto.pdf.txt').read_text() == 'PDF illeggibile'
+    assert sorted(p.name for p in inbox.iterdir() if p.is_file()) == ['note.txt']
+
+
+def test_backpressure_coda_limitata(file_app, tmp_path):
+    inbox = tmp_path / 'inbox'
+    inbox.mkdir()
+    for i in range(8):
+        (inbox / f'{i}.pdf').write_bytes(_pdf(f'DDT {i}'))
+    lock = threading.Lock()
+    attivi, picco, code = [0], [0], []
+    watcher = _watcher(file_app, inbox, workers=2, queue_size=1)
+
+    def importer(path):
+        with lock:
+            attivi[0] += 1
+            picco[0] = max(picco[0], attivi[0])
+            code.append(watcher.queue.qsize())
+        time.sleep(0.02)
+        with lock:
+            attivi[0] -= 1
+        return {'ok': True}
+
+    watcher.importer = importer
+    assert watcher.run(once=True)['importati'] == 8
+    assert picco[0] <= 2 and max(code) <= 1
+
+
+def test_import_reale_e_duplicati(file_app, tmp_path):
+    def parser(file_path, uploaded_file):
+        return {"ok": True, "type": "ddt", "method": "stub", "uploaded_file": uploaded_file,
+                "data": {"fornitore": "ACME", "righe": [{"codice": "X1", "descrizione": "Vite",
+                                                         "um": "pz", "quantita": 3, "prezzo": 1.5}]}}
+
+    file_app.extensions['parse_jobs'] = ParseJobQueue(
+        file_app, workers=1, parsers={'ddt': ParserSpec(parser, False, True)})
+    mag_id = _magazzino(file_app)
+    inbox = tmp_path / 'inbox'
+    inbox.mkdir()
+    pdf = _pdf('DDT ACME 1')
+    (inbox / 'acme.pdf').write_bytes(pdf)
+
+    stats = _watcher(file_app, inbox, magazzino_id=mag_id).run(once=True)
+    assert stats['importati'] == 1
+    with file_app.app_context():
+        doc = Documento.query.one()
+        assert doc.tipo == 'DDT_IN' and doc.status == 'Bozza' and doc.magazzino_id == mag_id
+        assert Allegato.query.filter_by(documento_id=doc.id).count() == 1
+
+    # lo stesso PDF ricopiato nella cartella non crea un secondo documento
+    (inbox / 'acme_copia.pdf').write_bytes(pdf)
+    stats = _watcher(file_app, inbox, magazzino_id=mag_id).run(once=True)
+    assert stats == {'importati': 0, 'duplicati': 1, 'scartati': 0}
+    assert (inbox / 'duplicati' / 'acme_copia.pdf').exists()
+    with file_app.app_context():
+        assert Documento.query.count() == 1
+
+
+def test_scan_ignora_file_spariti(file_app, tmp_path):
+    inbox = tmp_path / 'inbox'
+    inbox.mkdir()
+    (inbox / 'a.pdf').write_bytes(_pdf('a'))
+    watcher = _watcher(file_app, inbox)
+    # spostati da un worker tra il listing e lo stat: uno in lavorazione, uno no
+    watcher._in_progress.add('in_corso.pdf')
+    watcher._pending_files = lambda: [inbox / 'in_corso.pdf', inbox / 'sparito.pdf', inbox / 'a.pdf']
+    watcher.scan()
+    watcher.scan()
+    assert watcher.queue.get_nowait() == inbox / 'a.pdf'
+
+
+def test_duplicato_in_lavorazione_attende_esito(file_app, tmp_path):
+    inbox = tmp_path / 'inbox'
+    inbox.mkdir()
+    pdf = _pdf('DDT doppio')
+    (inbox / 'uno.pdf').write_bytes(pdf)
+    (inbox / 'due.pdf').write_bytes(pdf)
+    in_attesa = threading.Event()
+    chiamate = []
+
+    def importer(path):
+        chiamate.append(path.name)
+        if len(chiamate) == 1:
+            # la copia arriva mentre la prima è in lavorazione, poi la prima fallisce
+            in_attesa.wait(5)
+            return {'ok': False, 'error': 'fornitore non riconosciuto'}
+        return {'ok': True, 'document_id': 1}
+
+    def log(msg):
+        if msg.startswith('[ATTESA]'):
+            in_attesa.set()
+
+    stats = _watcher(file_app, inbox, workers=2, importer=importer, log=log).run(once=True)
+    assert in_attesa.is_set()
+    # il contenuto è stato importato dalla seconda copia, non scartato come duplicato
+    assert stats == {'importati': 1, 'duplicati': 0, 'scartati': 1}
+    assert len(chiamate) == 2
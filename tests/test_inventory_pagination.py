@@ -0,0 +1,88 @@
+from decimal import Decimal
+
+import pytest
+
+from app.blueprints.inventory import inventory_bp, fetch_page
+from app.extensions import db
+from app.models import Articolo, Giacenza, Magazzino
+
+
+@pytest.fixture
+def magazzino_pieno(app, base_data):
+    app.register_blueprint(inventory_bp, url_prefix='/inventory')
+    mag1 = base_data['mag']
+    mag2 = Magazzino(codice='FUR1', nome='Furgone')
+    db.session.add(mag2)
+    arts = [Articolo(codice_interno=f'X{i:03d}', descrizione=f'Tubo {i}', qta_scorta_minima=Decimal('5'))
+            for i in range(1, 8)]
+    db.session.add_all(arts)
+    db.session.flush()
+    for i, a in enumerate(arts):
+        if i % 3 != 2:  # un articolo su tre senza giacenza
+            db.session.add(Giacenza(articolo_id=a.id, magazzino_id=mag1.id, quantita=Decimal(i)))
+        if i % 2 == 0:
+            db.session.add(Giacenza(articolo_id=a.id, magazzino_id=mag2.id, quantita=Decimal(10)))
+    db.session.commit()
+    return {'mag1': mag1, 'mag2': mag2}
+
+
+def _filters(**kw):
+    f = {'magazzino_id': None, 'search': '', 'only_in_stock': False, 'under_min': False}
+    f.update(kw)
+    return f
+
+
+def _walk(client, limit, **params):
+    rows, cursor, pages = [], None, 0
+    while True:
+        q = dict(params, limit=limit)
+        if cursor:
+            q['cursor'] = cursor
+        res = client.get('/inventory/api/rows', query_string=q)
+        assert res.mimetype == 'application/json'
+        data = res.get_json()
+        rows += data['rows']
+        pages += 1
+        cursor = data['next']
+        if not cursor:
+            return rows, pages
+
+
+def test_pagine_keyset_coprono_tutto_senza_duplicati(app, magazzino_pieno):
+    tutte, _ = fetch_page(_filters(), limit=1000)
+    rows, pages = _walk(app.test_client(), 4)
+    assert pages > 1
+    chiavi = [(r['codice_interno'], r['magazzino_codice']) for r in rows]
+    assert chiavi == [(r.codice_interno, r.magazzino_codice) for r in tutte]
+    assert len(set(chiavi)) == len(chiavi)
+
+
+@pytest.mark.parametrize('params', [
+    {'only_in_stock': '1'},
+    {'under_min': '1'},
+    {'search': 'X00'},
+    {'magazzino_id': 'mag2'},
+])
+def test_filtri_preservati(app, magazzino_pieno, params):
+    if params.get('magazzino_id') == 'mag2':
+        params = {'magazzino_id': magazzino_pieno['mag2'].id}
+    filtri = _filters(
+        magazzino_id=params.get('magazzino_id'),
+        search=params.get('search', ''),
+        only_in_stock=params.get('only_in_stock') == '1',
+        under_min=params.get('under_min') == '1',
+    )
+    attese, _ = fetch_page(filtri, limit=1000)
+    rows, _ = _walk(app.test_client(), 2, **params)
+    assert [(r['codice_interno'], r['magazzino_codice']) for r in rows] == \
+           [(r.codice_interno, r.magazzino_codice) for r in attese]
+    if 'only_in_stock' in params:
+        assert all(r['giacenza'] > 0 for r in rows)
+    if 'under_min' in params:
+        assert rows and all(r['giacenza'] < r['qta_scorta_minima'] for r in rows)
+
+
+def test_cursore_non_valido_riparte_da_capo(app, magazzino_pieno):
+    first, _ = fetch_page(_filters(), limit=3)
+    again, _ = fetch_page(_filters(), cursor='abc', limit=3)
+    assert [r.codice_interno for r in first] == [r.codice_interno for r in again]
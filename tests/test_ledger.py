@@ -0,0 +1,133 @@
+from datetime import date, datetime
+from decimal import Decimal
+
+from app.cli import register_cli
+from app.extensions import db
+from app.models import Giacenza, GiacenzaSnapshot, Magazzino, Movimento
+from app.services.ledger import build_snapshots, giacenze_al, rebuild_giacenze, verify_giacenze
+
+
+def _mov(art, qty, giorno, tipo, partenza=None, arrivo=None):
+    m = Movimento(articolo_id=art.id, quantita=Decimal(qty), data=giorno, tipo=tipo,
+                  magazzino_partenza_id=partenza.id if partenza else None,
+                  magazzino_arrivo_id=arrivo.id if arrivo else None)
+    db.session.add(m)
+    db.session.commit()
+    return m
+
+
+def _storico(base_data):
+    """Carico, scarico e trasferimento su tre mesi (gen-mar 2025)."""
+    mag = base_data['mag']
+    mag2 = Magazzino(codice='MAG2', nome='Secondario')
+    db.session.add(mag2)
+    db.session.commit()
+    a1, a2 = base_data['articoli'][:2]
+    _mov(a1, '10', datetime(2025, 1, 10), 'carico', arrivo=mag)
+    _mov(a2, '5', datetime(2025, 1, 20), 'carico', arrivo=mag)
+    _mov(a1, '3', datetime(2025, 2, 5), 'scarico', partenza=mag)
+    _mov(a1, '4', datetime(2025, 2, 28, 18), 'trasferimento', partenza=mag, arrivo=mag2)
+    _mov(a2, '5', datetime(2025, 3, 2), 'scarico', partenza=mag)
+    _mov(a1, '1', datetime(2025, 3, 15), 'carico', arrivo=mag2)
+    return mag, mag2, a1, a2
+
+
+def _replay(giorno):
+    """Saldo sommando tutti i movimenti fino a fine giornata, senza snapshot."""
+    saldo = {}
+    for m in Movimento.query.all():
+        if m.data.date() > giorno:
+            continue
+        for mag_id, segno in ((m.magazzino_arrivo_id, 1), (m.magazzino_partenza_id, -1)):
+            if mag_id is not None:
+                key = (m.articolo_id, mag_id)
+                saldo[key] = saldo.get(key, 0) + segno * m.quantita
+    return {k: q for k, q in saldo.items() if q != 0}
+
+
+def test_giacenza_a_data_con_snapshot(app, base_data):
+    mag, mag2, a1, a2 = _storico(base_data)
+    tables = db.metadata.tables
+
+    # mesi chiusi prima di aprile: gennaio, febbraio, marzo
+    assert build_snapshots(db.session, tables, until=date(2025, 4, 1)) > 0
+    db.session.commit()
+    mesi = {s.mese for s in GiacenzaSnapshot.query.all()}
+    assert mesi == {date(2025, 1, 1), date(2025, 2, 1), date(2025, 3, 1)}
+    # a2 a zero a marzo senza movimenti successivi: fuori dagli snapshot seguenti
+    assert db.session.get(GiacenzaSnapshot, (a2.id, mag.id, date(2025, 3, 1))).quantita == 0
+    assert build_snapshots(db.session, tables, until=date(2025, 4, 1)) == 0
+
+    assert giacenze_al(db.session, tables, date(2025, 2, 28)) == {
+        (a1.id, mag.id): Decimal('3.000'), (a1.id, mag2.id): Decimal('4.000'), (a2.id, mag.id): Decimal('5.000')}
+    for giorno in (date(2025, 1, 15), date(2025, 2, 27), date(2025, 3, 1), date(2025, 3, 31), date(2025, 6, 1)):
+        assert giacenze_al(db.session, tables, giorno) == _replay(giorno), giorno
+    assert giacenze_al(db.session, tables, date(2025, 3, 31), magazzino_id=mag2.id) == {(a1.id, mag2.id): Decimal('5.000')}
+
+
+def test_movimento_retrodatato_invalida_snapshot(app, base_data):
+    mag, mag2, a1, a2 = _storico(base_data)
+    tables = db.metadata.tables
+    build_snapshots(db.session, tables, until=date(2025, 4, 1))
+    db.session.commit()
+
+    m = _mov(a1, '2', datetime(2025, 2, 10), 'carico', arrivo=mag)
+    assert {s.mese for s in GiacenzaSnapshot.query.all()} == {date(2025, 1, 1)}
+    build_snapshots(db.session, tables, until=date(2025, 4, 1))
+    db.session.commit()
+    assert giacenze_al(db.session, tables, date(2025, 3, 31)) == _replay(date(2025, 3, 31))
+
+    # spostare un movimento invalida anche dal mese della data precedente
+    m.data = datetime(2025, 3, 20)
+    db.session.commit()
+    assert {s.mese for s in GiacenzaSnapshot.query.all()} == {date(2025, 1, 1)}
+    assert giacenze_al(db.session, tables, date(2025, 2, 28)) == _replay(date(2025, 2, 28))
+
+
+def test_verifica_e_ricostruzione_giacenze(app, base_data):
+    mag, mag2, a1, a2 = _storico(base_data)
+    tables = db.metadata.tables
+    db.session.add_all([Giacenza(articolo_id=a1.id, magazzino_id=mag.id, quantita=Decimal('9')),
+                        Giacenza(articolo_id=a2.id, magazzino_id=mag.id, quantita=Decimal('1'))])
+    db.session.commit()
+
+    drift = verify_giacenze(db.session, tables)
+    assert {(d['articolo_id'], d['magazzino_id']) for d in drift} == {
+        (a1.id, mag.id), (a1.id, mag2.id), (a2.id, mag.id)}
+
+    runner = app.test_cli_runner()
+    register_cli(app)
+    result = runner.invoke(args=['magazzino', 'rebuild-giacenze', '--dry-run'])
+    assert result.exit_code == 1 and '[DIFF]' in result.output
+    assert rebuild_giacenze(db.session, tables) == []
+    db.session.commit()
+    assert verify_giacenze(db.session, tables) == []
+    assert Giacenza.query.filter_by(articolo_id=a1.id, magazzino_id=mag2.id).one().quantita == Decimal('5.000')
+    assert Giacenza.query.filter_by(articolo_id=a2.id, magazzino_id=mag.id).one().quantita == 0
+    result = runner.invoke(args=['magazzino', 'rebuild-giacenze'])
+    assert result.exit_code == 0 and 'allineate' in result.output
+
+
+def test_movimenti_senza_data_e_snapshot(app, base_data):
+    mag, mag2, a1, a2 = _storico(base_data)
+    tables = db.metadata.tables
+    # righe storiche senza data (l'ORM metterebbe datetime.now)
+    db.session.execute(Movimento.__table__.insert().values(articolo_id=a2.id, quantita=Decimal('7'), data=None,
+                                                           tipo='carico', magazzino_arrivo_id=mag.id))
+    db.session.commit()
+    senza_snapshot = {g: giacenze_al(db.session, tables, g) for g in (date(2025, 1, 25), date(2025, 3, 31), None)}
+    assert senza_snapshot[date(2025, 1, 25)][(a2.id, mag.id)] == Decimal('12.000')
+    for (a, m), q in senza_snapshot[None].items():
+        db.session.add(Giacenza(articolo_id=a, magazzino_id=m, quantita=q))
+    db.session.commit()
+
+    build_snapshots(db.session, tables, until=date(2025, 4, 1))
+    db.session.commit()
+    # il movimento senza data entra nel primo mese e non viene perso né contato due volte
+    assert {g: giacenze_al(db.session, tables, g) for g in senza_snapshot} == senza_snapshot
+    assert verify_giacenze(db.session, tables) == []
+
+    m = Movimento.query.filter_by(articolo_id=a1.id, magazzino_arrivo_id=mag2.id, tipo='carico').one()
+    m.data = None
+    db.session.commit()
+    assert GiacenzaSnapshot.query.count() == 0
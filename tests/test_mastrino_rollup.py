@@ -0,0 +1,106 @@
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+from app.cli import register_cli
+from app.extensions import db
+from app.models import Documento, Mastrino, RiepilogoMastrino, RigaDocumento
+from app.services import reporting
+from app.services.confirmation import apply_document_movements
+from app.services.mastrino_rollup import rebuild_rollup, verify_rollup
+
+
+@pytest.fixture(autouse=True)
+def cache_vuota():
+    reporting.clear_cache()
+    yield
+    reporting.clear_cache()
+
+
+def _conferma(base_data, tipo, righe, giorno):
+    partner = base_data['fornitore'] if tipo == 'DDT_IN' else base_data['cliente']
+    doc = Documento(tipo=tipo, status='Bozza', partner_id=partner.id, magazzino_id=base_data['mag'].id, data=giorno)
+    for art, qty, prezzo, mastrino in righe:
+        doc.righe.append(RigaDocumento(articolo_id=art.id, descrizione=art.descrizione, quantita=Decimal(qty),
+                                       prezzo=Decimal(prezzo), mastrino_codice=mastrino))
+    db.session.add(doc)
+    db.session.commit()
+    apply_document_movements(doc, db.session)
+    db.session.commit()
+    return doc
+
+
+def _raw_mastrini(date_from=None, date_to=None):
+    """Stesso report calcolato solo dalle righe grezze."""
+    rows = reporting.report_per(db.session, db.metadata.tables, 'mastrino', date_from, date_to)
+    return {r['mastrino_codice']: (r['num_righe'], r['totale_acquisti'], r['totale_vendite'], r['saldo_quantita'])
+            for r in rows if r['mastrino_codice']}
+
+
+def _mastrini(date_from=None, date_to=None):
+    rows = reporting.report_mastrini(db.session, db.metadata.tables, date_from, date_to)
+    return {r['mastrino_codice']: (r['num_righe'], r['totale_acquisti'], r['totale_vendite'], r['saldo_quantita'])
+            for r in rows}
+
+
+@pytest.fixture
+def storico(app, base_data):
+    db.session.add_all([Mastrino(codice='AC01', descrizione='Acquisti', tipo='ACQUISTO'),
+                        Mastrino(codice='RI01', descrizione='Ricavi', tipo='RICAVO')])
+    db.session.commit()
+    a1, a2 = base_data['articoli'][:2]
+    docs = [
+        _conferma(base_data, 'DDT_IN', [(a1, '10', '1.25', 'AC01'), (a2, '4', '3.00', 'AC01')], date(2025, 1, 20)),
+        _conferma(base_data, 'DDT_IN', [(a1, '2.5', '1.10', 'AC01')], date(2025, 2, 14)),
+        _conferma(base_data, 'DDT_OUT', [(a1, '3', '2.00', 'RI01'), (a2, '1', '5.00', None)], date(2025, 2, 28)),
+        _conferma(base_data, 'DDT_OUT', [(a1, '1.5', '2.20', 'RI01')], date(2025, 3, 5)),
+    ]
+    return docs
+
+
+def test_riepilogo_aggiornato_alla_conferma(app, storico):
+    tables = db.metadata.tables
+    assert verify_rollup(db.session, tables) == []
+    feb_in = db.session.get(RiepilogoMastrino, (2025, 2, 'AC01', 'DDT_IN'))
+    assert (feb_in.num_righe, feb_in.quantita_m, feb_in.importo_e5) == (1, 2500, 2500 * 110)
+
+    # mesi interi dal riepilogo, mesi parziali dalle righe: stesso risultato del calcolo grezzo
+    for periodo in [(None, None), (date(2025, 2, 1), date(2025, 2, 28)), (date(2025, 1, 21), date(2025, 3, 4)),
+                    (date(2025, 2, 10), None), (None, date(2025, 2, 27)), (date(2025, 3, 1), date(2025, 3, 5))]:
+        assert _mastrini(*periodo) == _raw_mastrini(*periodo), periodo
+
+
+def test_storno_e_cancellazione_tolgono_dal_riepilogo(app, storico):
+    tables = db.metadata.tables
+    storico[2].status = 'Stornato'
+    db.session.commit()
+    assert db.session.get(RiepilogoMastrino, (2025, 2, 'RI01', 'DDT_OUT')).num_righe == 0
+    assert verify_rollup(db.session, tables) == []
+
+    db.session.delete(storico[1])
+    db.session.commit()
+    assert verify_rollup(db.session, tables) == []
+    assert _mastrini() == _raw_mastrini()
+
+    # documento confermato spostato di mese
+    storico[3].data = date(2025, 4, 1)
+    db.session.commit()
+    assert verify_rollup(db.session, tables) == []
+
+
+def test_verifica_e_ricostruzione(app, storico):
+    tables = db.metadata.tables
+    db.session.query(RiepilogoMastrino).filter_by(mese=1).delete()
+    db.session.commit()
+    errori = verify_rollup(db.session, tables)
+    assert errori and errori[0].startswith('2025-01 AC01 DDT_IN')
+
+    runner = app.test_cli_runner()
+    register_cli(app)
+    result = runner.invoke(args=['magazzino', 'verify-riepilogo-mastrini'])
+    assert result.exit_code == 1
+    result = runner.invoke(args=['magazzino', 'verify-riepilogo-mastrini', '--fix'])
+    assert result.exit_code == 0, result.output
+    assert verify_rollup(db.session, tables) == []
+    assert rebuild_rollup(db.session, tables) == 4
@@ -0,0 +1,100 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import event
+
+from app.blueprints.movements import fetch_movimenti, decode_cursor, _label_da, _label_a
+from app.extensions import db
+from app.models import Documento, Movimento
+
+
+@pytest.fixture
+def storico(app, base_data):
+    mag, forn, cli = base_data['mag'], base_data['fornitore'], base_data['cliente']
+    art = base_data['articoli'][0]
+    ddt_in = Documento(tipo='DDT_IN', status='Confermato', partner_id=forn.id, magazzino_id=mag.id)
+    ddt_out = Documento(tipo='DDT_OUT', status='Confermato', partner_id=cli.id, magazzino_id=mag.id)
+    db.session.add_all([ddt_in, ddt_out])
+    db.session.flush()
+    t0 = datetime(2025, 1, 1, 8, 0)
+    rows = []
+    for i in range(130):
+        # movimenti a coppie con la stessa data: l'id fa da spareggio nella chiave
+        data = t0 + timedelta(minutes=i // 2)
+        scarico = bool(i % 2)
+        rows.append(dict(data=data, articolo_id=art.id, quantita=Decimal('1'),
+                         tipo='scarico' if scarico else 'carico',
+                         magazzino_partenza_id=mag.id if scarico else None,
+                         magazzino_arrivo_id=None if scarico else mag.id,
+                         documento_id=ddt_out.id if scarico else ddt_in.id))
+    db.session.execute(Movimento.__table__.insert(), rows)
+    db.session.commit()
+    return rows
+
+
+def _ids(movs):
+    return [m.id for m in movs]
+
+
+def test_keyset_avanti_e_indietro(app, storico):
+    attesi = _ids(Movimento.query.order_by(Movimento.data.desc(), Movimento.id.desc()).all())
+
+    p1, prev1, next1 = fetch_movimenti()
+    assert prev1 is None and next1
+    p2, prev2, next2 = fetch_movimenti(before=decode_cursor(next1))
+    p3, prev3, next3 = fetch_movimenti(before=decode_cursor(next2))
+    assert next3 is None and prev3
+    assert _ids(p1) + _ids(p2) + _ids(p3) == attesi
+
+    back2, _, _ = fetch_movimenti(after=decode_cursor(prev3))
+    assert _ids(back2) == _ids(p2)
+    back1, prev_back1, _ = fetch_movimenti(after=decode_cursor(prev2))
+    assert _ids(back1) == _ids(p1) and prev_back1 is None
+
+
+def test_una_sola_query_per_pagina(app, storico):
+    db.session.expunge_all()
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db.engine, "before_cursor_execute", listener)
+    try:
+        movs, _, _ = fetch_movimenti()
+        labels = [(_label_da(m), _label_a(m), m.articolo.codice_interno) for m in movs]
+    finally:
+        event.remove(db.engine, "before_cursor_execute", listener)
+    assert len(statements) == 1
+    assert ('🏪 Fornitore Test', 'MAG1', 'ART001') in labels
+    assert ('MAG1', '👤 Cliente Test', 'ART001') in labels
+
+
+def test_cursore_non_valido():
+    assert decode_cursor(None) is None
+    assert decode_cursor('abc') is None
+    assert decode_cursor('2025-13-01T00:00:00|5') is None
+
+
+def test_movimenti_senza_data_in_fondo(app, storico, base_data):
+    art, mag = base_data['articoli'][0], base_data['mag']
+    db.session.execute(Movimento.__table__.insert(), [
+        dict(data=None, articolo_id=art.id, quantita=Decimal('1'), tipo='carico', magazzino_arrivo_id=mag.id)
+        for _ in range(7)])
+    db.session.commit()
+    datati = _ids(Movimento.query.filter(Movimento.data.isnot(None))
+                  .order_by(Movimento.data.desc(), Movimento.id.desc()).all())
+    senza_data = _ids(Movimento.query.filter(Movimento.data.is_(None)).order_by(Movimento.id.desc()).all())
+
+    # pagine da 4: il confine tra datati e senza data cade a metà pagina
+    pagine, cursore = [], None
+    while True:
+        rows, _, cursore = fetch_movimenti(before=decode_cursor(cursore), per_page=4)
+        pagine.append(rows)
+        if cursore is None:
+            break
+    assert sum((_ids(p) for p in pagine), []) == datati + senza_data
+    assert decode_cursor(f'|{senza_data[0]}') == (None, senza_data[0])
+
+    # all'indietro dall'ultima pagina (solo movimenti senza data)
+    _, prev, _ = fetch_movimenti(before=decode_cursor(f'|{senza_data[2]}'), per_page=4)
+    indietro, _, _ = fetch_movimenti(after=decode_cursor(prev), per_page=4)
+    assert _ids(indietro) == (datati + senza_data)[len(datati) - 1:len(datati) + 3]
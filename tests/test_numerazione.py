@@ -0,0 +1,91 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from decimal import Decimal
+
+from flask import Flask
+
+from app.extensions import db
+from app.models import (Articolo, Magazzino, Partner, Documento, RigaDocumento, Giacenza,
+                        Movimento, NumeratoreDocumento)
+from app.utils import next_doc_number
+
+
+def test_numerazione_progressiva_per_tipo_e_anno(app, base_data):
+    assert next_doc_number('DDT_IN', 2025) == 1
+    assert next_doc_number('DDT_IN', 2025) == 2
+    assert next_doc_number('DDT_OUT', 2025) == 1
+    assert next_doc_number('DDT_IN', 2026) == 1
+    db.session.commit()
+    c = NumeratoreDocumento.query.filter_by(tipo='DDT_IN', anno=2025).one()
+    assert c.ultimo_numero == 2
+
+
+def test_contatore_inizializzato_dai_documenti_esistenti(app, base_data):
+    db.session.add(Documento(tipo='DDT_OUT', anno=2025, numero=41, status='Confermato',
+                             partner_id=base_data['cliente'].id, magazzino_id=base_data['mag'].id))
+    db.session.commit()
+    assert next_doc_number('DDT_OUT', 2025) == 42
+
+
+def test_rollback_non_consuma_numeri(app, base_data):
+    assert next_doc_number('DDT_IN', 2025) == 1
+    db.session.commit()
+    assert next_doc_number('DDT_IN', 2025) == 2
+    db.session.rollback()
+    assert next_doc_number('DDT_IN', 2025) == 2
+
+
+def _file_app(db_path):
+    from app.blueprints.docops import docops_bp
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{db_path}"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['TESTING'] = True
+    db.init_app(app)
+    app.register_blueprint(docops_bp, url_prefix='/docops')
+    return app
+
+
+def test_conferme_concorrenti_senza_collisioni(tmp_path):
+    """Molti thread confermano bozze DDT_IN e DDT_OUT in parallelo sullo stesso DB file:
+    nessuna conferma deve fallire e i numeri devono essere 1..N senza buchi."""
+    n_in, n_out = 12, 12
+    app = _file_app(tmp_path / "numerazione.db")
+    with app.app_context():
+        db.create_all()
+        mag = Magazzino(codice='MAG1', nome='Magazzino Principale')
+        forn = Partner(nome='Fornitore Test', tipo='Fornitore')
+        cli = Partner(nome='Cliente Test', tipo='Cliente')
+        art = Articolo(codice_interno='ART001', descrizione='Articolo 1')
+        db.session.add_all([mag, forn, cli, art])
+        db.session.flush()
+        db.session.add(Giacenza(articolo_id=art.id, magazzino_id=mag.id, quantita=Decimal('100')))
+        ids = []
+        for tipo, partner, n in (('DDT_IN', forn, n_in), ('DDT_OUT', cli, n_out)):
+            for _ in range(n):
+                doc = Documento(tipo=tipo, status='Bozza', partner_id=partner.id, magazzino_id=mag.id)
+                doc.righe.append(RigaDocumento(articolo_id=art.id, descrizione='Articolo 1',
+                                               quantita=Decimal('2'), prezzo=Decimal('1.00')))
+                db.session.add(doc)
+                db.session.flush()
+                ids.append(doc.id)
+        db.session.commit()
+
+    def confirm(doc_id):
+        with app.test_client() as client:
+            return client.post(f"/docops/api/documents/{doc_id}/confirm").get_json()
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(confirm, ids))
+
+    assert all(r["ok"] for r in results), [r for r in results if not r["ok"]]
+    anno = date.today().year
+    with app.app_context():
+        for tipo, n in (('DDT_IN', n_in), ('DDT_OUT', n_out)):
+            numeri = sorted(d.numero for d in Documento.query.filter_by(tipo=tipo, anno=anno))
+            assert numeri == list(range(1, n + 1))
+            assert NumeratoreDocumento.query.filter_by(tipo=tipo, anno=anno).one().ultimo_numero == n
+        assert Giacenza.query.one().quantita == Decimal('100')
+        assert Movimento.query.count() == n_in + n_out
+        db.session.remove()
+        db.drop_all()
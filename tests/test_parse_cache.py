@@ -0,0 +1,106 @@
+import io
+import time
+from datetime import datetime, timedelta
+
+from app.extensions import db
+from app.models import ParseCache
+from app.services import parse_cache
+from app.services.parse_jobs import ParseJobQueue, ParserSpec, job_status
+
+from test_parse_jobs import StubParser, _wait
+
+
+def _queue(app, stub, version='1', **kw):
+    queue = ParseJobQueue(app, workers=1, parsers={'ddt': ParserSpec(stub, False, True, version)},
+                          poll_interval=0.05, **kw)
+    app.extensions['parse_jobs'] = queue
+    return queue
+
+
+def test_stesso_pdf_non_viene_riparsato(file_app):
+    stub = StubParser()
+    queue = _queue(file_app, stub)
+    with file_app.app_context():
+        first = queue.enqueue('ddt', '/tmp/a.pdf', uploaded_file='up/a1.pdf', sha256='f' * 64)
+    _wait(file_app, [first])
+
+    with file_app.app_context():
+        hits = parse_cache.STATS['hits']
+        second = queue.enqueue('ddt', '/tmp/a.pdf', uploaded_file='up/a2.pdf', sha256='f' * 64)
+        st = job_status(second)
+        # job chiuso già all'accodamento, con l'upload del secondo caricamento
+        assert st['status'] == 'done'
+        assert st['result']['uploaded_file'] == 'up/a2.pdf'
+        assert st['result']['data'] == job_status(first)['result']['data']
+        assert parse_cache.STATS['hits'] == hits + 1
+        assert ParseCache.query.one().hits == 1
+    assert len(stub.calls) == 1
+
+
+def test_versione_parser_nella_chiave(file_app):
+    stub = StubParser(delay=0.1)
+    queue = _queue(file_app, stub, version='1')
+    with file_app.app_context():
+        _wait(file_app, [queue.enqueue('ddt', '/tmp/a.pdf', sha256='a' * 64)])
+    queue.stop()
+    queue = _queue(file_app, stub, version='2')
+    with file_app.app_context():
+        job = queue.enqueue('ddt', '/tmp/a.pdf', sha256='a' * 64)
+        assert job_status(job)['status'] != 'done'
+    _wait(file_app, [job])
+    assert len(stub.calls) == 2
+
+
+def test_duplicato_in_coda_usa_la_cache_del_primo(file_app):
+    stub = StubParser(delay=0.2)
+    queue = _queue(file_app, stub)
+    with file_app.app_context():
+        ids = [queue.enqueue('ddt', '/tmp/b.pdf', sha256='b' * 64) for _ in range(3)]
+    _wait(file_app, ids)
+    assert len(stub.calls) == 1
+
+
+def test_eviction_per_eta_e_dimensione(app):
+    vecchio = datetime.utcnow() - timedelta(days=200)
+    for i in range(5):
+        parse_cache.store(db.session, f'{i:064d}', 'ddt:1', {'data': 'x' * 100})
+    db.session.query(ParseCache).filter(ParseCache.sha256 == f'{0:064d}').update({'last_hit_at': vecchio})
+    db.session.commit()
+
+    # la riga 0 scade per età; con 250 byte restano solo le 2 usate più di recente
+    assert parse_cache.lookup(db.session, f'{4:064d}', 'ddt:1') is not None
+    n = parse_cache.evict(db.session, max_bytes=250, max_age_days=90)
+    db.session.commit()
+    rimaste = sorted(int(c.sha256) for c in ParseCache.query)
+    assert n == 3 and rimaste == [3, 4]
+    st = parse_cache.cache_stats(db.session)
+    assert st['entries'] == 2 and st['stored_hits'] == 1
+
+
+def test_reupload_identico_endpoint(file_app):
+    from app.blueprints.importing import importing_bp
+    file_app.register_blueprint(importing_bp, url_prefix='/importing')
+    stub = StubParser()
+    _queue(file_app, stub)
+    client = file_app.test_client()
+    pdf = b'%PDF-1.4 stesso contenuto'
+
+    def upload():
+        return client.post('/importing/api/parse-ddt', data={'pdf_file': (io.BytesIO(pdf), 'bolla.pdf')},
+                           content_type='multipart/form-data')
+
+    first = upload()
+    assert first.status_code == 202
+    _wait(file_app, [first.get_json()['job_id']])
+
+    t0 = time.perf_counter()
+    second = upload()
+    elapsed = time.perf_counter() - t0
+    body = second.get_json()
+    assert second.status_code == 200 and body['status'] == 'done'
+    assert body['result']['uploaded_file'].startswith('uploads/incoming_ddt/')
+    assert elapsed < 0.5
+    assert len(stub.calls) == 1
+    stats = client.get('/importing/api/parse-cache/stats').get_json()
+    assert stats['entries'] == 1 and stats['hits'] >= 1
+
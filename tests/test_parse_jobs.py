@@ -0,0 +1,149 @@
+import io
+import threading
+import time
+
+import pytest
+
+from app.extensions import db
+from app.models import ParseJob
+from app.services.parse_jobs import ParseJobQueue, ParserSpec, TokenBucket, job_status
+
+
+class StubParser:
+    """Parser finto: registra le chiamate e l'istante in cui partono."""
+
+    def __init__(self, fail_on=None, delay=0.0):
+        self.calls, self.times = [], []
+        self.fail_on = fail_on
+        self.delay = delay
+        self._lock = threading.Lock()
+
+    def __call__(self, file_path, uploaded_file):
+        with self._lock:
+            self.calls.append(file_path)
+            self.times.append(time.monotonic())
+        time.sleep(self.delay)
+        if self.fail_on and self.fail_on in file_path:
+            raise RuntimeError("PDF illeggibile")
+        return {"ok": True, "type": "ddt", "data": {"righe": [{"codice": file_path}]},
+                "uploaded_file": uploaded_file}
+
+
+def _wait(app, job_ids, timeout=10):
+    deadline = time.monotonic() + timeout
+    with app.app_context():
+        while time.monotonic() < deadline:
+            db.session.expire_all()
+            st = [job_status(j) for j in job_ids]
+            if all(s['status'] in ('done', 'error') for s in st):
+                return st
+            db.session.commit()
+            time.sleep(0.02)
+    raise AssertionError("job non conclusi entro il timeout")
+
+
+def test_token_bucket_rispetta_intervallo():
+    now = [0.0]
+    sleeps = []
+
+    def sleep(s):
+        sleeps.append(s)
+        now[0] += s
+
+    bucket = TokenBucket(rate=1 / 1.2, capacity=1, clock=lambda: now[0], sleep=sleep)
+    for _ in range(5):
+        bucket.acquire()
+    # il primo token è già disponibile, gli altri 4 arrivano ogni 1.2 s
+    assert now[0] == pytest.approx(4 * 1.2)
+
+
+def test_worker_eseguono_ogni_job_una_volta(file_app):
+    stub = StubParser(fail_on='rotto', delay=0.01)
+    queue = ParseJobQueue(file_app, workers=3, parsers={'ddt': ParserSpec(stub, False, True)},
+                          poll_interval=0.05)
+    file_app.extensions['parse_jobs'] = queue
+    with file_app.app_context():
+        ids = [queue.enqueue('ddt', f'/tmp/ddt_{i}.pdf', uploaded_file=f'up/ddt_{i}.pdf') for i in range(8)]
+        ids.append(queue.enqueue('ddt', '/tmp/rotto.pdf'))
+
+    stati = _wait(file_app, ids)
+    assert sorted(stub.calls) == sorted([f'/tmp/ddt_{i}.pdf' for i in range(8)] + ['/tmp/rotto.pdf'])
+    ok, ko = stati[:-1], stati[-1]
+    assert all(s['status'] == 'done' and s['result']['uploaded_file'].startswith('up/') for s in ok)
+    assert ko['status'] == 'error' and 'illeggibile' in ko['error']
+    with file_app.app_context():
+        assert {j.attempts for j in ParseJob.query} == {1}
+
+
+def test_throughput_limitato_dal_bucket(file_app):
+    interval = 0.1
+    stub = StubParser()
+    queue = ParseJobQueue(file_app, workers=4,
+                          parsers={'ticket': ParserSpec(stub, True, False)},
+                          bucket=TokenBucket(rate=1 / interval, capacity=1), poll_interval=0.05)
+    with file_app.app_context():
+        ids = [queue.enqueue('ticket', f'/tmp/t{i}.pdf') for i in range(5)]
+    _wait(file_app, ids)
+    queue.stop()
+    t = sorted(stub.times)
+    assert all(b - a >= interval * 0.9 for a, b in zip(t, t[1:]))
+
+
+def test_endpoint_risponde_subito_con_job_id(file_app):
+    from app.blueprints.importing import importing_bp
+    file_app.register_blueprint(importing_bp, url_prefix='/importing')
+    stub = StubParser()
+    file_app.extensions['parse_jobs'] = ParseJobQueue(
+        file_app, workers=1, parsers={'ddt': ParserSpec(stub, False, True)}, poll_interval=0.05)
+    client = file_app.test_client()
+
+    res = client.post('/importing/api/parse-ddt',
+                      data={'pdf_file': (io.BytesIO(b'%PDF-1.4 finto'), 'bolla.pdf')},
+                      content_type='multipart/form-data')
+    assert res.status_code == 202
+    body = res.get_json()
+    assert body['ok'] and body['status'] in ('queued', 'running')
+
+    _wait(file_app, [body['job_id']])
+    st = client.get(body['status_url']).get_json()
+    assert st['status'] == 'done' and st['filename'] == 'bolla.pdf'
+    assert st['result']['uploaded_file'].startswith('uploads/incoming_ddt/')
+
+    events = client.get(body['events_url']).get_data(as_text=True)
+    assert events.startswith('event: status\n') and '"status": "done"' in events
+
+    assert client.get('/importing/api/jobs/inesistente').status_code == 404
+    assert client.post('/importing/api/parse-ddt').status_code == 400
+
+
+def test_riaccoda_solo_job_abbandonati(file_app):
+    from datetime import datetime, timedelta
+    stub = StubParser()
+    queue = ParseJobQueue(file_app, workers=1, parsers={'ddt': ParserSpec(stub, False, True)},
+                          poll_interval=0.05, job_timeout=600)
+    adesso = datetime.utcnow()
+    with file_app.app_context():
+        # uno preso ora da un altro processo web, uno rimasto da un processo terminato
+        db.session.add_all([ParseJob(id='altro', kind='ddt', status='running', file_path='/tmp/altro.pdf',
+                                     started_at=adesso, attempts=1),
+                            ParseJob(id='morto', kind='ddt', status='running', file_path='/tmp/morto.pdf',
+                                     started_at=adesso - timedelta(hours=1), attempts=1)])
+        db.session.commit()
+    queue.start()
+    (morto,) = _wait(file_app, ['morto'])
+    queue.stop()
+    assert morto['status'] == 'done' and stub.calls == ['/tmp/morto.pdf']
+    with file_app.app_context():
+        assert db.session.get(ParseJob, 'altro').status == 'running'
+
+
+def test_parse_non_committa_la_sessione_del_chiamante(file_app):
+    from app.models import Magazzino, ParseCache
+    queue = ParseJobQueue(file_app, workers=1, parsers={'ddt': ParserSpec(StubParser(), False, True)})
+    with file_app.app_context():
+        db.session.add(Magazzino(codice='TMP', nome='in sospeso'))
+        assert queue.parse('ddt', '/tmp/c.pdf', sha256='c' * 64)['ok']
+        assert queue.parse('ddt', '/tmp/c.pdf', sha256='c' * 64)['ok']
+        db.session.rollback()
+        assert Magazzino.query.count() == 0
+        assert ParseCache.query.one().hits == 1
@@ -0,0 +1,98 @@
+from decimal import Decimal
+from io import BytesIO
+
+import pypdf
+
+from app.extensions import db
+from app.models import Allegato, Articolo, Blob, Documento, Magazzino, Partner, RigaDocumento
+from app.services import pdf_cache
+from app.services.blob_store import attach_upload
+from app.services.pdf_export import export_document_pdf
+
+from test_blob_store import _upload
+
+
+def _doc():
+    art = Articolo(codice_interno='ART001', descrizione='Filtro')
+    doc = Documento(tipo='DDT_IN', partner=Partner(nome='Fornitore', tipo='Fornitore'),
+                    magazzino=Magazzino(codice='MAG1', nome='Principale'))
+    db.session.add_all([art, doc])
+    db.session.flush()
+    db.session.add(RigaDocumento(documento_id=doc.id, articolo_id=art.id, descrizione='Filtro',
+                                 quantita=Decimal('2'), prezzo=Decimal('3.50')))
+    db.session.commit()
+    return doc, art
+
+
+def _counting(monkeypatch):
+    calls = []
+
+    def render(doc):
+        calls.append(doc.id)
+        return export_document_pdf(doc)
+
+    monkeypatch.setattr(pdf_cache, 'export_document_pdf', render)
+    return calls
+
+
+def test_pdf_generato_una_volta(file_app, monkeypatch):
+    calls = _counting(monkeypatch)
+    with file_app.app_context():
+        doc, _ = _doc()
+        first = pdf_cache.document_pdf(doc)
+        assert pdf_cache.document_pdf(doc) == first
+        assert calls == [doc.id]
+        assert first.startswith(b'%PDF')
+
+
+def test_modifica_righe_invalida(file_app, monkeypatch):
+    calls = _counting(monkeypatch)
+    with file_app.app_context():
+        doc, art = _doc()
+        pdf_cache.document_pdf(doc)
+        v1 = pdf_cache.content_version(doc)
+
+        riga = doc.righe.first()
+        riga.quantita = Decimal('5')
+        db.session.commit()
+        assert pdf_cache.content_version(doc) != v1
+        pdf_cache.document_pdf(doc)
+        assert len(calls) == 2
+        # resta solo la versione corrente
+        files = list((pdf_cache.cache_root() / str(doc.id)).glob('ddt-*.pdf'))
+        assert [f.name for f in files] == [f'ddt-{pdf_cache.content_version(doc)}.pdf']
+
+        pdf_cache.invalidate(doc.id)
+        assert not (pdf_cache.cache_root() / str(doc.id)).exists()
+
+
+def test_combinato_riusa_il_ddt_in_cache(file_app, monkeypatch):
+    calls = _counting(monkeypatch)
+    with file_app.app_context():
+        doc, _ = _doc()
+        buf = BytesIO()
+        writer = pypdf.PdfWriter()
+        writer.add_blank_page(100, 100)
+        writer.add_blank_page(100, 100)
+        writer.write(buf)
+        attach_upload(db.session, Allegato, Blob, doc.id, _upload(file_app, 'orig.pdf', buf.getvalue()))
+        db.session.commit()
+
+        pdf_cache.document_pdf(doc)
+        combined = pdf_cache.combined_pdf(doc)
+        assert pdf_cache.combined_pdf(doc) == combined
+        assert len(calls) == 1
+        ddt_pages = len(pypdf.PdfReader(BytesIO(pdf_cache.document_pdf(doc))).pages)
+        assert len(pypdf.PdfReader(BytesIO(combined)).pages) == ddt_pages + 2
+
+
+def test_prerender_in_background(file_app, monkeypatch):
+    calls = _counting(monkeypatch)
+    with file_app.app_context():
+        doc, _ = _doc()
+        doc_id = doc.id
+        pdf_cache.prerender_async(doc_id).join(10)
+        folder = pdf_cache.cache_root() / str(doc_id)
+        assert {f.name.split('-')[0] for f in folder.glob('*.pdf')} == {'ddt', 'completo'}
+        pdf_cache.combined_pdf(db.session.get(Documento, doc_id))
+    assert calls == [doc_id]
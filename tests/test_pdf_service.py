@@ -0,0 +1,65 @@
+import io
+import logging
+
+import pypdf
+from reportlab.pdfgen import canvas
+
+from app.services.pdf_service import extract_text_from_pdf, iter_pdf_pages, read_pages
+from app.services.supplier_parsers import ddt_complete
+
+
+def _pdf(pages):
+    buf = io.BytesIO()
+    c = canvas.Canvas(buf)
+    for lines in pages:
+        for i, line in enumerate(lines):
+            c.drawString(72, 720 - 16 * i, line)
+        c.showPage()
+    c.save()
+    buf.seek(0)
+    return buf
+
+
+DDT = [
+    ['DUOTERMICA SRL', 'DDT n. 250804919 del 08/08/2025', '249.TSP0092 GOMITO 90 MF 2 NR 9 4,93'],
+    ['310.VAL045 VALVOLA SFERA 3/4 NR 2 12,75', 'Totale merce 69,87'],
+] + [[f'Condizioni generali di vendita art. {i}', 'Foro competente Milano'] for i in range(12)]
+
+
+def test_si_ferma_al_totale_del_ddt(monkeypatch):
+    lette = []
+    orig = pypdf.PageObject.extract_text
+
+    def extract_text(self, *a, **kw):
+        lette.append(1)
+        return orig(self, *a, **kw)
+
+    monkeypatch.setattr(pypdf.PageObject, 'extract_text', extract_text)
+    text = extract_text_from_pdf(_pdf(DDT), until=ddt_complete)
+    assert '310.VAL045' in text and 'Totale merce' in text
+    assert 'Condizioni' not in text and len(lette) == 2
+    # senza until si leggono tutte le pagine
+    assert 'art. 11' in extract_text_from_pdf(_pdf(DDT))
+
+
+def test_limiti_di_pagine_e_byte(caplog):
+    assert len(list(iter_pdf_pages(_pdf(DDT), max_pages=3))) == 3
+    with caplog.at_level(logging.DEBUG, logger='app.services.pdf_service'):
+        pages = list(iter_pdf_pages(_pdf(DDT), max_pages=0, max_bytes=300))
+    assert 1 <= len(pages) < len(DDT) and sum(len(p.encode()) for p in pages) <= 300
+    messages = [r.getMessage() for r in caplog.records]
+    assert any(m.startswith('Pagina 1/14:') for m in messages)
+    assert any('PDF troncato' in m for m in messages)
+
+    # troncato dai limiti: non completo, e riprendendo il limite di byte resta quello complessivo
+    assert read_pages(_pdf(DDT), max_pages=3) == (list(iter_pdf_pages(_pdf(DDT), max_pages=3)), False)
+    letti, completo = read_pages(_pdf(DDT), max_pages=0, max_bytes=300)
+    assert not completo and read_pages(_pdf(DDT), pages=letti, max_pages=0, max_bytes=300) == (letti, False)
+    assert read_pages(_pdf(DDT[:2]), max_pages=0, max_bytes=0)[1]
+
+
+def test_limiti_da_config(app):
+    app.config['PDF_MAX_PAGES'] = 2
+    with app.app_context():
+        assert 'VALVOLA' in extract_text_from_pdf(_pdf(DDT))
+        assert 'Condizioni' not in extract_text_from_pdf(_pdf(DDT))
@@ -0,0 +1,143 @@
+"""
+EXPLAIN QUERY PLAN delle query calde: fallisce se una torna a una scansione
+completa della tabella (SCAN <tabella> senza indice).
+Le query sono quelle emesse davvero dal codice, catturate dal cursore.
+"""
+from contextlib import contextmanager
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import event, select
+
+from app.blueprints.documents import _apply_filters
+from app.blueprints.inventory import fetch_page
+from app.blueprints.movements import fetch_movimenti
+from app.extensions import db
+from app.models import Documento, Giacenza, Movimento, RigaDocumento
+from app.services.import_bulk import resolve_articoli
+
+
+@contextmanager
+def catturate():
+    """SELECT eseguite nel blocco, con i parametri: [(sql, params)]"""
+    stmts = []
+
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            stmts.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', _before)
+    try:
+        yield stmts
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', _before)
+
+
+def piano(statement, params=()):
+    cur = db.session.connection().connection.cursor()
+    try:
+        cur.execute('EXPLAIN QUERY PLAN ' + statement, params)
+        return [row[-1] for row in cur.fetchall()]
+    finally:
+        cur.close()
+
+
+def scansioni_complete(plan):
+    # "SCAN t USING [COVERING] INDEX ..." legge un indice: va bene; "SCAN t" da solo no
+    return [d for d in plan if d.startswith('SCAN ') and ' USING ' not in d and 'CONSTANT ROW' not in d]
+
+
+def assert_indicizzate(stmts):
+    assert stmts, 'nessuna query catturata'
+    for statement, params in stmts:
+        plan = piano(statement, params)
+        assert not scansioni_complete(plan), f"{statement}\n{plan}"
+
+
+def assert_usa(statement, params, indice):
+    plan = piano(statement, params)
+    assert any(indice in d for d in plan), f"{indice} non usato: {plan}"
+
+
+@pytest.fixture
+def dati(app, base_data):
+    mag, forn = base_data['mag'], base_data['fornitore']
+    for i, art in enumerate(base_data['articoli']):
+        art.fornitore = forn.nome
+        art.codice_fornitore = f'F{i}'
+        db.session.add(Giacenza(articolo_id=art.id, magazzino_id=mag.id, quantita=i + 1))
+    for n in range(1, 6):
+        doc = Documento(tipo='DDT_IN', anno=2025, numero=n, status='Bozza' if n % 2 else 'Confermato',
+                        partner_id=forn.id, magazzino_id=mag.id, data=date(2025, 1, n))
+        doc.righe.append(RigaDocumento(articolo_id=base_data['articoli'][0].id, descrizione='x', quantita=1))
+        db.session.add(doc)
+        db.session.flush()
+        db.session.add(Movimento(data=datetime(2025, 1, n), articolo_id=base_data['articoli'][0].id,
+                                 quantita=1, tipo='carico', magazzino_arrivo_id=mag.id, documento_id=doc.id))
+    db.session.commit()
+    return base_data
+
+
+def test_liste_documenti(app, dati):
+    filtri = [{}, {'status': 'Bozza'}, {'d_from': date(2025, 1, 2), 'd_to': date(2025, 1, 4)},
+              {'status': 'Confermato', 'd_from': date(2025, 1, 2)}]
+    for tipo in ('DDT_IN', 'DDT_OUT'):
+        for f in filtri:
+            with catturate() as stmts:
+                _apply_filters(Documento.query.filter(Documento.tipo == tipo), **f).limit(50).all()
+            assert_indicizzate(stmts)
+
+
+def test_dashboard_bozze_e_movimenti(app, dati):
+    with catturate() as stmts:
+        assert Documento.query.filter_by(status='Bozza').count() == 3
+        Movimento.query.filter(Movimento.data >= datetime(2025, 1, 2), Movimento.data < datetime(2025, 1, 3)).count()
+    assert_indicizzate(stmts)
+    assert_usa(*stmts[0], 'COVERING INDEX ix_documento_status_tipo_anno_num')
+    assert_usa(*stmts[1], 'ix_movimento_data')
+
+
+def test_inventario(app, dati):
+    mag = dati['mag']
+    for filtri in ({'magazzino_id': mag.id, 'search': None, 'only_in_stock': False, 'under_min': False},
+                   {'magazzino_id': None, 'search': None, 'only_in_stock': False, 'under_min': False}):
+        with catturate() as stmts:
+            rows, _ = fetch_page(filtri)
+        assert rows
+        assert_indicizzate(stmts)
+
+
+def test_movimenti(app, dati):
+    with catturate() as stmts:
+        rows, _, _ = fetch_movimenti(per_page=2)
+        fetch_movimenti(before=(rows[-1].data, rows[-1].id), per_page=2)
+    assert_indicizzate(stmts)
+    art_id = dati['articoli'][0].id
+    with catturate() as stmts:
+        Movimento.query.filter_by(articolo_id=art_id).order_by(Movimento.data).all()
+        Movimento.query.filter_by(documento_id=1).all()
+    assert_indicizzate(stmts)
+    assert_usa(*stmts[0], 'ix_movimento_articolo_data')
+    assert_usa(*stmts[1], 'ix_movimento_documento_id')
+
+
+def test_righe_documento_e_partner(app, dati):
+    doc = Documento.query.first()
+    with catturate() as stmts:
+        assert len(doc.righe.all()) == 1
+        db.session.execute(select(RigaDocumento.id).where(RigaDocumento.articolo_id == dati['articoli'][0].id)).all()
+        Documento.query.filter_by(partner_id=dati['fornitore'].id).all()
+    assert_indicizzate(stmts)
+    for filtro, indice in (('riga_documento.documento_id', 'ix_riga_documento_documento_id'),
+                           ('riga_documento.articolo_id = ?', 'ix_riga_documento_articolo_id'),
+                           ('documento.partner_id = ?', 'ix_documento_partner_id')):
+        statement, params = next((st, p) for st, p in stmts if filtro in st.split('WHERE')[-1])
+        assert_usa(statement, params, indice)
+
+
+def test_lookup_import(app, dati):
+    with catturate() as stmts:
+        per_fornitore, per_interno = resolve_articoli('Fornitore Test', ['F0', 'F2', 'ART002'])
+    assert set(per_fornitore) == {'F0', 'F2'} and set(per_interno) == {'ART002'}
+    assert_indicizzate(stmts)
+    assert_usa(*stmts[0], 'ix_articolo_fornitore_codice')
@@ -0,0 +1,102 @@
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+from app.extensions import db
+from app.models import Documento, Mastrino, RigaDocumento
+from app.services import reporting
+from app.services.confirmation import apply_document_movements
+
+
+@pytest.fixture(autouse=True)
+def cache_vuota():
+    reporting.clear_cache()
+    yield
+    reporting.clear_cache()
+
+
+def _conferma(base_data, tipo, righe, giorno):
+    partner = base_data['fornitore'] if tipo == 'DDT_IN' else base_data['cliente']
+    doc = Documento(tipo=tipo, status='Bozza', partner_id=partner.id, magazzino_id=base_data['mag'].id, data=giorno)
+    for art, qty, prezzo, mastrino in righe:
+        doc.righe.append(RigaDocumento(articolo_id=art.id, descrizione=art.descrizione, quantita=Decimal(qty),
+                                       prezzo=Decimal(prezzo), mastrino_codice=mastrino))
+    db.session.add(doc)
+    db.session.commit()
+    apply_document_movements(doc, db.session)
+    db.session.commit()
+    return doc
+
+
+@pytest.fixture
+def storico(app, base_data):
+    db.session.add_all([Mastrino(codice='AC01', descrizione='Acquisti ricambi', tipo='ACQUISTO'),
+                        Mastrino(codice='RI01', descrizione='Vendite ricambi', tipo='RICAVO')])
+    db.session.commit()
+    a1, a2 = base_data['articoli'][:2]
+    _conferma(base_data, 'DDT_IN', [(a1, '3.333', '0.10', 'AC01'), (a2, '10', '1.15', 'AC01')], date(2025, 1, 10))
+    _conferma(base_data, 'DDT_OUT', [(a1, '1', '0.30', 'RI01'), (a2, '2.5', '2.00', None)], date(2025, 2, 3))
+    # bozza: esclusa dai report
+    db.session.add(Documento(tipo='DDT_IN', status='Bozza', partner_id=base_data['fornitore'].id,
+                             magazzino_id=base_data['mag'].id, data=date(2025, 2, 4)))
+    db.session.commit()
+    return base_data
+
+
+def test_aggregazione_per_mese_e_mastrino(app, storico):
+    tables = db.metadata.tables
+    mesi = reporting.report_per(db.session, tables, 'mese')
+    assert [(r['etichetta'], r['num_righe'], r['totale_acquisti'], r['totale_vendite']) for r in mesi] == [
+        ('2025-01', 2, Decimal('11.83'), Decimal('0.00')),
+        ('2025-02', 2, Decimal('0.00'), Decimal('5.30')),
+    ]
+    assert mesi[0]['quantita_entrata'] == Decimal('13.333') and mesi[1]['saldo_quantita'] == Decimal('-3.500')
+
+    mastrini = reporting.report_mastrini(db.session, tables)
+    assert [(r['mastrino_codice'], r['mastrino_tipo']) for r in mastrini] == [('RI01', 'RICAVO'), ('AC01', 'ACQUISTO')]
+    assert reporting.report_mastrini(db.session, tables, tipo='ACQUISTO')[0]['totale_acquisti'] == Decimal('11.83')
+    tot = reporting.totals(mastrini)
+    assert tot['margine_totale'] == Decimal('0.30') - Decimal('11.83')
+
+    partner = reporting.report_per(db.session, tables, 'partner', date_from=date(2025, 2, 1))
+    assert [r['etichetta'] for r in partner] == ['Cliente Test']
+
+
+def test_cache_invalidata_dalla_conferma(app, storico):
+    tables = db.metadata.tables
+    prima = reporting.report_per(db.session, tables, 'magazzino')
+    hits = reporting.STATS['hits']
+    assert reporting.report_per(db.session, tables, 'magazzino') is prima
+    assert reporting.STATS['hits'] == hits + 1
+
+    _conferma(storico, 'DDT_IN', [(storico['articoli'][2], '1', '5.00', None)], date(2025, 3, 1))
+    dopo = reporting.report_per(db.session, tables, 'magazzino')
+    assert dopo[0]['totale_acquisti'] == prima[0]['totale_acquisti'] + Decimal('5.00')
+
+    # un documento che esce da 'Confermato' invalida anche lui
+    doc = Documento.query.filter_by(tipo='DDT_OUT').one()
+    doc.status = 'Annullato'
+    db.session.commit()
+    assert reporting.report_per(db.session, tables, 'magazzino')[0]['totale_vendite'] == Decimal('0.00')
+
+
+def test_cache_dopo_reset_dati(app, base_data):
+    from app.blueprints.core import core_bp
+    from app.models import Articolo
+    app.register_blueprint(core_bp)
+    app.secret_key = 'test'
+    tables = db.metadata.tables
+    _conferma(base_data, 'DDT_IN', [(base_data['articoli'][0], '1', '5.00', None)], date(2025, 1, 10))
+    prima = reporting.report_per(db.session, tables, 'magazzino')
+    assert prima[0]['totale_acquisti'] == Decimal('5.00')
+
+    # il reset non deve far ripartire la generazione: la conferma successiva
+    # riprenderebbe il numero delle voci in cache calcolate prima del reset
+    app.test_client().post('/reset-all-data')
+    art = Articolo(codice_interno='NUOVO', descrizione='Dopo il reset')
+    db.session.add(art)
+    db.session.commit()
+    _conferma(base_data, 'DDT_IN', [(art, '1', '7.00', None)], date(2025, 1, 10))
+    dopo = reporting.report_per(db.session, tables, 'magazzino')
+    assert dopo is not prima and dopo[0]['totale_acquisti'] == Decimal('7.00')
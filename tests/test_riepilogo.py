@@ -0,0 +1,125 @@
+from datetime import date
+from decimal import Decimal
+
+from app.cli import register_cli
+from app.extensions import db
+from app.models import Documento, RigaDocumento, RiepilogoGiacenza, Giacenza
+from app.services.confirmation import apply_document_movements
+from app.services.stock_summary import (read_dashboard, rebuild_riepilogo, verify_riepilogo,
+                                        chiave_movimenti, CHIAVE_BOZZE)
+from app.utils import update_giacenza
+
+
+def _draft(base_data, tipo, righe):
+    partner = base_data['fornitore'] if tipo == 'DDT_IN' else base_data['cliente']
+    doc = Documento(tipo=tipo, status='Bozza', partner_id=partner.id, magazzino_id=base_data['mag'].id)
+    for art, qty in righe:
+        doc.righe.append(RigaDocumento(articolo_id=art.id, descrizione=art.descrizione,
+                                       quantita=Decimal(qty), prezzo=Decimal('1.00')))
+    db.session.add(doc)
+    db.session.commit()
+    return doc
+
+
+def _riepilogo(art):
+    return db.session.get(RiepilogoGiacenza, art.id)
+
+
+def test_conferma_aggiorna_riepilogo_e_flag_under_min(app, base_data):
+    art = base_data['articoli'][0]
+    art.qta_scorta_minima = Decimal('5')
+    db.session.commit()
+
+    apply_document_movements(_draft(base_data, 'DDT_IN', [(art, '8')]), db.session)
+    db.session.commit()
+    r = _riepilogo(art)
+    assert r.quantita_totale == Decimal('8.000') and r.under_min is False
+
+    apply_document_movements(_draft(base_data, 'DDT_OUT', [(art, '4')]), db.session)
+    db.session.commit()
+    db.session.expire_all()
+    r = _riepilogo(art)
+    assert r.quantita_totale == Decimal('4.000') and r.under_min is True
+    assert verify_riepilogo(db.session, db.metadata.tables) == []
+
+
+def test_update_giacenza_aggiorna_riepilogo(app, base_data):
+    art = base_data['articoli'][1]
+    update_giacenza(art.id, base_data['mag'].id, Decimal('3'))
+    db.session.commit()
+    assert _riepilogo(art).quantita_totale == Decimal('3.000')
+
+
+def test_contatori_dashboard_incrementali(app, base_data):
+    tables = db.metadata.tables
+    oggi = chiave_movimenti(date.today())
+    seed_calls = []
+
+    def count_bozze():
+        seed_calls.append(1)
+        return Documento.query.filter_by(status='Bozza').count()
+
+    assert read_dashboard(db.session, tables, CHIAVE_BOZZE, count_bozze) == 0
+    assert read_dashboard(db.session, tables, oggi, lambda: 0) == 0
+    db.session.commit()
+
+    art = base_data['articoli'][0]
+    doc = _draft(base_data, 'DDT_IN', [(art, '2'), (base_data['articoli'][1], '1')])
+    _draft(base_data, 'DDT_IN', [(art, '1')])
+    assert read_dashboard(db.session, tables, CHIAVE_BOZZE, count_bozze) == 2
+
+    apply_document_movements(doc, db.session, mov_time=None)
+    doc.data = date.today()
+    db.session.commit()
+    assert read_dashboard(db.session, tables, CHIAVE_BOZZE, count_bozze) == 1
+    assert read_dashboard(db.session, tables, oggi, lambda: -1) == 2
+    assert len(seed_calls) == 1
+
+
+def test_rebuild_e_verify(app, base_data):
+    art = base_data['articoli'][0]
+    apply_document_movements(_draft(base_data, 'DDT_IN', [(art, '5')]), db.session)
+    db.session.commit()
+
+    # riepilogo disallineato da una scrittura diretta su Giacenza
+    Giacenza.query.filter_by(articolo_id=art.id).update({"quantita": Decimal('7')})
+    db.session.commit()
+    errori = verify_riepilogo(db.session, db.metadata.tables)
+    assert len(errori) == 1 and f"articolo {art.id}" in errori[0]
+
+    runner = app.test_cli_runner()
+    register_cli(app)
+    result = runner.invoke(args=['magazzino', 'verify-riepilogo'])
+    assert result.exit_code == 1
+    result = runner.invoke(args=['magazzino', 'rebuild-riepilogo'])
+    assert result.exit_code == 0, result.output
+    assert verify_riepilogo(db.session, db.metadata.tables) == []
+    assert rebuild_riepilogo(db.session, db.metadata.tables) == len(base_data['articoli'])
+
+
+def test_pulizia_in_blocco_riallinea_contatori(app, base_data):
+    from app.blueprints.importing import _clear_docs_by_type, clear_articles
+    from app.models import ContatoreDashboard
+    tables = db.metadata.tables
+    oggi = chiave_movimenti(date.today())
+    art = base_data['articoli'][0]
+    apply_document_movements(_draft(base_data, 'DDT_IN', [(art, '4')]), db.session)
+    for _ in range(3):
+        _draft(base_data, 'DDT_IN', [(art, '1')])
+    conta_bozze = lambda: Documento.query.filter_by(status='Bozza').count()
+    conta_oggi = lambda: 1
+    assert read_dashboard(db.session, tables, CHIAVE_BOZZE, conta_bozze) == 3
+    assert read_dashboard(db.session, tables, oggi, conta_oggi) == 1
+    db.session.commit()
+
+    # le delete in blocco saltano gli eventi ORM: i contatori si reinizializzano dal COUNT
+    assert _clear_docs_by_type('DDT_IN') == 4
+    assert read_dashboard(db.session, tables, CHIAVE_BOZZE, conta_bozze) == 0
+    assert read_dashboard(db.session, tables, oggi, lambda: 0) == 0
+    assert ContatoreDashboard.query.filter_by(chiave='report').count() == 1
+
+    update_giacenza(art.id, base_data['mag'].id, Decimal('2'))
+    db.session.commit()
+    assert _riepilogo(art) is not None
+    clear_articles()
+    assert RiepilogoGiacenza.query.count() == 0
@@ -0,0 +1,77 @@
+from pathlib import Path
+
+import pytest
+
+from app.services import supplier_parsers
+from app.services.parser_corpus import evaluate_corpus
+from app.services.supplier_parsers import ddt_complete, detect_supplier, parse_supplier_specific, register_supplier
+
+CORPUS = Path(__file__).parent / 'parser_corpus'
+
+
+def test_corpus_tutti_i_parser():
+    res = evaluate_corpus(CORPUS, repeat=3)
+    assert res['errori'] == []
+    assert set(res['parsers']) == {'duotermica', 'clerici', 'ias', 'cambielli', 'generico'}
+    for row in res['parsers'].values():
+        assert row['riconosciuti'] == row['documenti'] and row['accuratezza'] == 1.0
+        assert row['doc_al_secondo'] > 0
+
+
+def test_metodo_e_fallback_generico():
+    text = (CORPUS / 'ias_01035086.txt').read_text(encoding='utf-8')
+    data, method = parse_supplier_specific(text)
+    assert method == 'Parser specifico IAS'
+    assert data['numero_ddt'] == '01035086' and data['data'] == '2025-07-31'
+
+    # fornitore riconosciuto ma nessuna riga nel formato atteso: parser generico
+    data, method = parse_supplier_specific('CLERICI SPA\nABC-12345 RACCORDO OTTONE 4 PZ 2,50')
+    assert method == 'Parser generico: nessuna riga dal parser CLERICI'
+    assert data['righe'][0]['codice'] == 'ABC-12345'
+
+
+@pytest.fixture
+def parser_temporaneo():
+    yield
+    supplier_parsers.PARSERS.pop('acme', None)
+    supplier_parsers._rebuild_index()
+
+
+def test_partita_iva_prima_delle_parole_chiave(parser_temporaneo):
+    @register_supplier('acme', 'ACME SRL', partite_iva=('01234567890',), keywords=('ACME',),
+                       end_markers=(r'FINE\s+BOLLA',))
+    def parse_acme(text):
+        return {"righe": [{"codice": "A1", "quantita": 1, "prezzo_unitario": 1}]}
+
+    # il DDT ACME cita anche Clerici (destinatario): decide la partita IVA
+    assert detect_supplier('Spett. CLERICI SPA\nMittente P.IVA IT01234567890') == 'acme'
+    assert detect_supplier('CLERICI SPA\nP.IVA 09999999999') == 'clerici'
+    # solo la prima pagina conta per il riconoscimento
+    assert detect_supplier('x' * supplier_parsers.FIRST_PAGE_CHARS + ' ACME') is None
+    data, method = parse_supplier_specific('ACME\n...')
+    assert method == 'Parser specifico ACME' and data['fornitore'] == 'ACME SRL'
+    # fine del DDT: marcatori del fornitore, altrimenti quelli comuni
+    assert ddt_complete(['ACME', 'Fine bolla']) and not ddt_complete(['ACME', 'Totale merce'])
+    assert ddt_complete(['ROSSI SRL', 'Totale documento 10,00'])
+
+
+def test_riconoscimento_dalla_sola_partita_iva():
+    # logo senza testo e un destinatario che cita un altro fornitore: decide la partita IVA
+    text = (CORPUS / 'duotermica_solo_piva.txt').read_text(encoding='utf-8')
+    assert 'DUOTERMICA' not in text.upper() and 'CLERICI' in text.upper()
+    assert detect_supplier(text) == 'duotermica'
+    assert detect_supplier('P.I. e C.F. 09119340967 - Tel e Fax 0371/753195') == 'ias'
+
+
+def test_piede_di_pagina_solo_su_richiesta(parser_temporaneo):
+    piede = 'Merce venduta secondo le CONDIZIONI GENERALI di vendita'
+    # comune: il piede su ogni pagina non chiude il DDT, il totale sì
+    assert not ddt_complete(['ROSSI SRL\n' + piede])
+    assert ddt_complete(['ROSSI SRL\n' + piede, 'Totale documento 10,00\n' + piede])
+
+    @register_supplier('acme', 'ACME SRL', keywords=('ACME',),
+                       end_markers=supplier_parsers.END_MARKERS + supplier_parsers.FOOTER_MARKERS)
+    def parse_acme(text):
+        return {"righe": []}
+
+    assert ddt_complete(['ACME\n' + piede])
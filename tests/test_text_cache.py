@@ -0,0 +1,106 @@
+import io
+import shutil
+
+import pypdf
+import pytest
+from reportlab.pdfgen import canvas
+
+from app.services import text_cache
+from app.services.supplier_parsers import ddt_complete
+from app.services.text_cache import PageTextCache, extract_text, memory_cache
+
+
+def _pdf(path, pages):
+    c = canvas.Canvas(str(path))
+    for lines in pages:
+        for i, line in enumerate(lines):
+            c.drawString(72, 720 - 16 * i, line)
+        c.showPage()
+    c.save()
+    return path
+
+
+DDT = [['ROSSI SRL', 'VITE-M6X20 VITE TESTA ESAGONALE 100 PZ 0,12'], ['Totale documento 12,00']] + \
+      [[f'Condizioni generali art. {i}'] for i in range(6)]
+
+
+@pytest.fixture
+def letture(monkeypatch, file_app):
+    calls = []
+    orig = pypdf.PageObject.extract_text
+
+    def extract_text(self, *a, **kw):
+        calls.append(1)
+        return orig(self, *a, **kw)
+
+    monkeypatch.setattr(pypdf.PageObject, 'extract_text', extract_text)
+    with file_app.app_context():
+        memory_cache().clear()
+    return calls
+
+
+def test_pagine_lette_una_volta(file_app, tmp_path, letture):
+    pdf = _pdf(tmp_path / 'ddt.pdf', DDT)
+    with file_app.app_context():
+        first = extract_text(pdf, until=ddt_complete)
+        assert 'Totale documento' in first and 'Condizioni' not in first and len(letture) == 2
+        assert extract_text(pdf, until=ddt_complete) == first and len(letture) == 2
+        # serve tutto il testo: si riprende dalla terza pagina
+        full = extract_text(pdf)
+        assert 'art. 5' in full and len(letture) == len(DDT)
+        assert extract_text(pdf) == full and extract_text(pdf, until=ddt_complete) == first
+        assert len(letture) == len(DDT)
+
+
+def test_file_su_disco_per_hash(file_app, tmp_path, letture):
+    pdf = _pdf(tmp_path / 'ddt.pdf', DDT)
+    with file_app.app_context():
+        text = extract_text(pdf, until=ddt_complete)
+        memory_cache().clear()
+        sidecar = text_cache.STATS['sidecar']
+        # stesso contenuto in un altro percorso (es. dopo lo spostamento nei blob)
+        copia = shutil.copy(pdf, tmp_path / 'copia.pdf')
+        assert extract_text(copia, until=ddt_complete) == text
+        assert text_cache.STATS['sidecar'] == sidecar + 1 and len(letture) == 2
+        assert text_cache.sidecar_path(text_cache.get_file_hash(str(pdf))).exists()
+
+
+def test_lru_limitata_in_byte():
+    cache = PageTextCache(max_bytes=10)
+    cache.put('a', ['aaaa'], True)
+    cache.put('b', ['bbbb'], True)
+    assert cache.get('a') == (('aaaa',), True)
+    cache.put('c', ['cccc'], False)          # esce 'b', usato meno di recente
+    assert cache.get('b') is None and cache.get('c') == (('cccc',), False)
+    cache.put('d', ['x' * 11], True)         # più grande dell'intera cache: non entra
+    assert cache.get('d') is None and len(cache) == 2 and cache.size == 8
+
+
+def test_piede_condizioni_generali_su_ogni_pagina(file_app, tmp_path, letture):
+    from app.services.parse_jobs import _parse_ddt
+    piede = 'Merce venduta secondo le condizioni generali di vendita'
+    ddt = [['DUOTERMICA SRL', '249.TSP0092 GOMITO 90 MF 2 NR 9 4,93', piede],
+           ['310.VAL045 VALVOLA SFERA 3/4 NR 2 12,75', 'Totale merce 69,87', piede],
+           ['Condizioni generali di vendita art. 1'], ['Condizioni generali di vendita art. 2']]
+    with file_app.app_context():
+        res = _parse_ddt(str(_pdf(tmp_path / 'ddt.pdf', ddt)), 'incoming_ddt/ddt.pdf')
+        # il piede della prima pagina non ferma la lettura: le righe di pagina 2 ci sono
+        assert {r['codice'] for r in res['data']['righe']} == {'249.TSP0092', '310.VAL045'}
+        assert res['pagine_lette'] == 2 and 'fino a pagina 2' in res['method'] and len(letture) == 2
+
+        # totale sull'ultima pagina: nessuna pagina saltata, nessuna annotazione
+        res = _parse_ddt(str(_pdf(tmp_path / 'corto.pdf', ddt[:2])), 'incoming_ddt/corto.pdf')
+        assert 'pagine_lette' not in res and 'saltate' not in res['method']
+
+
+def test_testo_troncato_dai_limiti_non_e_completo(file_app, tmp_path, letture):
+    from app.services.parse_jobs import _parse_ddt
+    file_app.config['PDF_MAX_PAGES'] = 2
+    lungo = [['DUOTERMICA SRL', f'249.TSP009{i} GOMITO 90 MF 2 NR 1 4,93'] for i in range(4)]
+    path = _pdf(tmp_path / 'lungo.pdf', lungo)
+    with file_app.app_context():
+        res = _parse_ddt(str(path), 'incoming_ddt/lungo.pdf')
+        assert res['pagine_lette'] == 2 and 'limite di lettura' in res['method']
+        # in cache resta una voce parziale, non un testo completo
+        assert text_cache.cached_pages(text_cache.get_file_hash(str(path))) is None
+        assert len(letture) == 2
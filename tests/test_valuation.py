@@ -0,0 +1,78 @@
+from datetime import date
+from decimal import Decimal
+
+from app.cli import register_cli
+from app.extensions import db
+from app.models import Documento, LottoFifo, RigaDocumento, Valorizzazione
+from app.services.confirmation import apply_document_movements
+from app.services.valuation import rebuild_valorizzazione, report_valorizzazione
+
+
+def _conferma(base_data, tipo, righe, giorno):
+    partner = base_data['fornitore'] if tipo == 'DDT_IN' else base_data['cliente']
+    doc = Documento(tipo=tipo, status='Bozza', partner_id=partner.id, magazzino_id=base_data['mag'].id, data=giorno)
+    for art, qty, prezzo in righe:
+        doc.righe.append(RigaDocumento(articolo_id=art.id, descrizione=art.descrizione,
+                                       quantita=Decimal(qty), prezzo=Decimal(prezzo)))
+    db.session.add(doc)
+    db.session.commit()
+    apply_document_movements(doc, db.session)
+    db.session.commit()
+    return doc
+
+
+def _valore(art, mag):
+    db.session.expire_all()
+    return db.session.get(Valorizzazione, (art.id, mag.id))
+
+
+def test_costo_medio_e_fifo_alla_conferma(app, base_data):
+    art, mag = base_data['articoli'][0], base_data['mag']
+    _conferma(base_data, 'DDT_IN', [(art, '10', '2.00')], date(2025, 1, 10))
+    _conferma(base_data, 'DDT_IN', [(art, '10', '4.00')], date(2025, 2, 10))
+    v = _valore(art, mag)
+    assert v.quantita == Decimal('20.000') and v.costo_medio == Decimal('3.0000')
+    assert v.valore_medio == v.valore_fifo == Decimal('60.0000')
+
+    # scarico di 15: medio 15 * 3, FIFO tutto il lotto a 2 + 5 a 4
+    _conferma(base_data, 'DDT_OUT', [(art, '15', '9.00')], date(2025, 3, 1))
+    v = _valore(art, mag)
+    assert v.quantita == Decimal('5.000') and v.costo_medio == Decimal('3.0000')
+    assert v.valore_medio == Decimal('15.0000') and v.valore_fifo == Decimal('20.0000')
+    aperti = LottoFifo.query.filter_by(aperto=True).all()
+    assert [(l.residuo, l.costo_unitario) for l in aperti] == [(Decimal('5.000'), Decimal('4.0000'))]
+
+    # nuovo carico: il medio riparte dal valore residuo
+    _conferma(base_data, 'DDT_IN', [(art, '5', '6.00')], date(2025, 3, 5))
+    v = _valore(art, mag)
+    assert v.costo_medio == Decimal('4.5000') and v.valore_fifo == Decimal('50.0000')
+
+    righe = report_valorizzazione(db.session, db.metadata.tables)
+    assert [(r['codice_interno'], r['quantita'], r['valore_medio']) for r in righe] == [
+        ('ART001', Decimal('10.000'), Decimal('45.0000'))]
+
+
+def test_rebuild_uguale_al_mantenimento_incrementale(app, base_data):
+    a1, a2 = base_data['articoli'][:2]
+    _conferma(base_data, 'DDT_IN', [(a1, '3', '1.50'), (a2, '7', '10.00'), (a1, '2', '2.00')], date(2025, 1, 5))
+    _conferma(base_data, 'DDT_OUT', [(a1, '4', '5.00'), (a2, '1', '20.00')], date(2025, 1, 20))
+    _conferma(base_data, 'DDT_IN', [(a2, '3', '12.00')], date(2025, 2, 1))
+
+    def stato():
+        db.session.expire_all()
+        return ({(v.articolo_id, v.magazzino_id): (v.quantita, v.costo_medio, v.valore_medio, v.valore_fifo)
+                 for v in Valorizzazione.query.all()},
+                sorted((l.articolo_id, l.residuo, l.costo_unitario) for l in LottoFifo.query.filter_by(aperto=True)))
+
+    prima = stato()
+    assert prima[1] == [(a1.id, Decimal('1.000'), Decimal('2.0000')),
+                        (a2.id, Decimal('3.000'), Decimal('12.0000')),
+                        (a2.id, Decimal('6.000'), Decimal('10.0000'))]
+    assert rebuild_valorizzazione(db.session, db.metadata.tables) == 2
+    db.session.commit()
+    assert stato() == prima
+
+    runner = app.test_cli_runner()
+    register_cli(app)
+    result = runner.invoke(args=['magazzino', 'valorizzazione'])
+    assert result.exit_code == 0 and 'ART002' in result.output
@@ -0,0 +1,102 @@
+# tools/bench_confirm.py
+# Uso: py tools\bench_confirm.py [--lines 10,50,100,300,1000] [--repeat 3]
+# Confronta la latenza di conferma di un DDT_IN al crescere del numero di righe:
+# - "riga per riga": get_giacenza/update_giacenza + Movimento per ogni riga (vecchio flusso)
+# - "set-based": app.services.confirmation.apply_document_movements
+import argparse
+import os
+import sys
+import tempfile
+import time
+from decimal import Decimal
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+from flask import Flask
+from app.extensions import db
+from app.models import Articolo, Magazzino, Partner, Documento, RigaDocumento, Movimento
+from app.services.confirmation import apply_document_movements
+from app.utils import update_giacenza
+
+
+def _make_app(db_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{db_path}"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+
+def _seed(n_articoli):
+    mag = Magazzino(codice='MAG1', nome='Magazzino Principale')
+    forn = Partner(nome='Fornitore Bench', tipo='Fornitore')
+    db.session.add_all([mag, forn])
+    db.session.flush()
+    db.session.execute(
+        Articolo.__table__.insert(),
+        [{"codice_interno": f"B{i:06d}", "descrizione": f"Articolo bench {i}",
+          "qta_scorta_minima": 0, "qta_riordino": 0, "last_cost": 0} for i in range(n_articoli)],
+    )
+    db.session.commit()
+    return mag.id, forn.id
+
+
+def _draft(n_lines, mag_id, forn_id):
+    doc = Documento(tipo='DDT_IN', status='Bozza', partner_id=forn_id, magazzino_id=mag_id)
+    db.session.add(doc)
+    db.session.flush()
+    db.session.execute(
+        RigaDocumento.__table__.insert(),
+        [{"documento_id": doc.id, "articolo_id": i + 1, "quantita": Decimal('2'),
+          "prezzo": Decimal('1.00')} for i in range(n_lines)],
+    )
+    db.session.commit()
+    return doc
+
+
+def _confirm_row_by_row(doc):
+    for r in doc.righe.order_by(RigaDocumento.id).all():
+        update_giacenza(r.articolo_id, doc.magazzino_id, r.quantita)
+        db.session.add(Movimento(articolo_id=r.articolo_id, quantita=r.quantita, tipo='carico',
+                                 magazzino_arrivo_id=doc.magazzino_id, documento_id=doc.id))
+    doc.status = 'Confermato'
+    db.session.commit()
+
+
+def _confirm_set_based(doc):
+    apply_document_movements(doc, db.session)
+    db.session.commit()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--lines', default='10,50,100,300,1000')
+    ap.add_argument('--repeat', type=int, default=3)
+    args = ap.parse_args()
+    sizes = [int(x) for x in args.lines.split(',') if x.strip()]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = _make_app(os.path.join(tmp, 'bench.db'))
+        with app.app_context():
+            db.create_all()
+            mag_id, forn_id = _seed(max(sizes))
+            print(f"{'righe':>6} | {'riga per riga (ms)':>18} | {'set-based (ms)':>14} | {'speedup':>7}")
+            for n in sizes:
+                timings = {}
+                for label, fn in (('row', _confirm_row_by_row), ('set', _confirm_set_based)):
+                    best = None
+                    for _ in range(args.repeat):
+                        doc = _draft(n, mag_id, forn_id)
+                        db.session.expire_all()
+                        t0 = time.perf_counter()
+                        fn(doc)
+                        dt = (time.perf_counter() - t0) * 1000
+                        best = dt if best is None else min(best, dt)
+                    timings[label] = best
+                print(f"{n:>6} | {timings['row']:>18.1f} | {timings['set']:>14.1f} | "
+                      f"{timings['row'] / timings['set']:>6.1f}x")
+            db.session.remove()
+
+
+if __name__ == "__main__":
+    main()
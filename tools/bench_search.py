@@ -0,0 +1,111 @@
+# tools/bench_search.py
+# Uso: py tools\bench_search.py [--articoli 50000] [--repeat 50]
+# Latenza p50/p99 della ricerca articoli per l'autocomplete:
+# - "ILIKE": filtro '%tok%' su codice_interno/codice_fornitore/descrizione (vecchio flusso)
+# - "FTS5": app.services.article_search.search_articolo_ids + caricamento articoli
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+from flask import Flask
+from sqlalchemy import or_
+from app.extensions import db
+from app.models import Articolo
+from app.services.article_search import ensure_search_index, search_articolo_ids
+
+PAROLE = ["tubo", "rame", "raccordo", "ottone", "valvola", "sfera", "curva", "manicotto", "nastro",
+          "teflon", "staffa", "vite", "tassello", "guarnizione", "filtro", "flessibile", "isolante",
+          "pressfitting", "multistrato", "riduzione", "nipplo", "collettore", "termostato", "sonda"]
+MISURE = ["1/2", "3/4", "1", "12mm", "14mm", "16mm", "20mm", "26mm", "2m", "5m", "M8", "M10"]
+FORNITORI = ["CAM", "SAB", "WUR", "FER", "DUO"]
+
+QUERIES = ["tubo", "tubo rame", "tubo rame 14", "racc ott", "valvola sfera 3", "CAM0012",
+           "12345", "guarn", "filtro aria", "press multi 20"]
+
+
+def _make_app(db_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{db_path}"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+
+def _seed(n):
+    rnd = random.Random(42)
+    rows = []
+    for i in range(n):
+        forn = rnd.choice(FORNITORI)
+        descr = " ".join(rnd.sample(PAROLE, 3) + [rnd.choice(MISURE)])
+        rows.append({"codice_interno": f"{forn}{i:06d}", "codice_fornitore": str(rnd.randint(10000, 99999)),
+                     "descrizione": descr.capitalize(), "fornitore": forn,
+                     "qta_scorta_minima": 0, "qta_riordino": 0, "last_cost": 0})
+    for i in range(0, n, 5000):
+        db.session.execute(Articolo.__table__.insert(), rows[i:i + 5000])
+    db.session.commit()
+
+
+def _search_ilike(q, limit):
+    qry = Articolo.query
+    for t in q.split():
+        like = f"%{t}%"
+        qry = qry.filter(or_(Articolo.codice_interno.ilike(like),
+                             Articolo.codice_fornitore.ilike(like),
+                             Articolo.descrizione.ilike(like)))
+    return qry.order_by(Articolo.descrizione.asc()).limit(limit).all()
+
+
+def _search_fts(q, limit):
+    ids = search_articolo_ids(db.session, q, limit)
+    by_id = {a.id: a for a in Articolo.query.filter(Articolo.id.in_(ids))} if ids else {}
+    return [by_id[i] for i in ids if i in by_id]
+
+
+def _percentili(samples):
+    samples = sorted(samples)
+    p99 = samples[min(len(samples) - 1, int(round(0.99 * (len(samples) - 1))))]
+    return statistics.median(samples), p99
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--articoli', type=int, default=50000)
+    ap.add_argument('--repeat', type=int, default=50)
+    ap.add_argument('--limit', type=int, default=25)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = _make_app(os.path.join(tmp, 'bench.db'))
+        with app.app_context():
+            db.create_all()
+            t0 = time.perf_counter()
+            _seed(args.articoli)
+            print(f"Articoli: {args.articoli} (seed {time.perf_counter() - t0:.1f}s)")
+            t0 = time.perf_counter()
+            ensure_search_index(db.engine)
+            print(f"Indice FTS5 costruito in {time.perf_counter() - t0:.1f}s")
+
+            print(f"{'query':<18} | {'ILIKE p50/p99 (ms)':>19} | {'FTS5 p50/p99 (ms)':>18} | {'speedup p50':>11}")
+            for q in QUERIES:
+                res = {}
+                for label, fn in (('ilike', _search_ilike), ('fts', _search_fts)):
+                    samples = []
+                    for _ in range(args.repeat):
+                        db.session.expire_all()
+                        t0 = time.perf_counter()
+                        fn(q, args.limit)
+                        samples.append((time.perf_counter() - t0) * 1000)
+                    res[label] = _percentili(samples)
+                (i50, i99), (f50, f99) = res['ilike'], res['fts']
+                print(f"{q:<18} | {i50:>8.2f} / {i99:>8.2f} | {f50:>7.2f} / {f99:>8.2f} | {i50 / f50:>10.1f}x")
+            db.session.remove()
+
+
+if __name__ == "__main__":
+    main()
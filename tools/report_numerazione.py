@@ -0,0 +1,90 @@
+# tools/report_numerazione.py
+# Uso: py tools\report_numerazione.py [--tipo DDT_OUT] [--anno 2025]
+# Per ogni (tipo, anno) confronta i numeri assegnati con il contatore numeratore_documento:
+# - buchi nella sequenza 1..max (es. bozze confermate e poi eliminate a mano)
+# - numeri duplicati (non dovrebbero esistere: vincolo uq_documento_tipo_anno_numero)
+# - contatore indietro rispetto a MAX(numero): la prossima conferma andrebbe in collisione
+# Esce con codice 1 se trova anomalie.
+import argparse
+import os
+import sys
+from collections import defaultdict
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+from sqlalchemy import select
+
+from app import create_app
+from app.extensions import db
+from app.models import Documento, NumeratoreDocumento
+
+
+def _ranges(nums):
+    """[3, 4, 5, 9] -> '3-5, 9'"""
+    out, start, prev = [], None, None
+    for n in nums:
+        if start is None:
+            start = prev = n
+        elif n == prev + 1:
+            prev = n
+        else:
+            out.append(f"{start}-{prev}" if prev != start else str(start))
+            start = prev = n
+    if start is not None:
+        out.append(f"{start}-{prev}" if prev != start else str(start))
+    return ", ".join(out)
+
+
+def report(tipo=None, anno=None):
+    d = Documento.__table__
+    q = select(d.c.tipo, d.c.anno, d.c.numero).where(d.c.numero.isnot(None))
+    if tipo:
+        q = q.where(d.c.tipo == tipo)
+    if anno:
+        q = q.where(d.c.anno == anno)
+    numeri = defaultdict(list)
+    for t, a, n in db.session.execute(q.order_by(d.c.tipo, d.c.anno, d.c.numero)):
+        numeri[(t, a)].append(n)
+
+    c = NumeratoreDocumento.__table__
+    qc = select(c.c.tipo, c.c.anno, c.c.ultimo_numero)
+    if tipo:
+        qc = qc.where(c.c.tipo == tipo)
+    if anno:
+        qc = qc.where(c.c.anno == anno)
+    contatori = {(t, a): u for t, a, u in db.session.execute(qc)}
+
+    anomalie = 0
+    for key in sorted(set(numeri) | set(contatori), key=lambda k: (k[0], k[1] or 0)):
+        nums = numeri.get(key, [])
+        ultimo = contatori.get(key)
+        massimo = nums[-1] if nums else 0
+        presenti = set(nums)
+        buchi = [n for n in range(1, massimo + 1) if n not in presenti]
+        duplicati = sorted(n for n in presenti if nums.count(n) > 1)
+        print(f"{key[0]} {key[1]}: documenti={len(nums)} max={massimo} "
+              f"contatore={ultimo if ultimo is not None else '-'}")
+        if buchi:
+            print(f"  [BUCHI] {_ranges(buchi)}")
+        if duplicati:
+            print(f"  [DUPLICATI] {_ranges(duplicati)}")
+        if ultimo is not None and ultimo < massimo:
+            print(f"  [CONTATORE] indietro di {massimo - ultimo}: rieseguire scripts/migrate_create_numeratore_documento.py")
+        anomalie += bool(buchi) + bool(duplicati) + bool(ultimo is not None and ultimo < massimo)
+    return anomalie
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--tipo")
+    ap.add_argument("--anno", type=int)
+    args = ap.parse_args()
+    app = create_app()
+    with app.app_context():
+        anomalie = report(args.tipo, args.anno)
+    print(f"Anomalie: {anomalie}")
+    sys.exit(1 if anomalie else 0)
+
+
+if __name__ == "__main__":
+    main()